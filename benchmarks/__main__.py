@@ -0,0 +1,71 @@
+"""
+Runs the benchmarks of the request hot path and writes the results as JSON, so
+that results of different SDK releases can be compared.
+
+Run from the repository root:
+
+    python -m benchmarks --output results.json
+    python -m benchmarks --only headers
+"""
+
+import argparse
+import datetime
+import json
+import platform
+import sys
+from typing import Any, Callable, Dict, List
+
+from upstash_workflow import __version__
+from benchmarks import (
+    asgi,
+    handler,
+    headers,
+    import_time,
+    parse_payload,
+    replay_memory,
+)
+
+BENCHMARKS: Dict[str, Callable[[], List[Dict[str, Any]]]] = {
+    "parse_payload": parse_payload.run,
+    "replay_memory": replay_memory.run,
+    "headers": headers.run,
+    "handler": handler.run,
+    "asgi": asgi.run,
+    "import_time": import_time.run,
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--output", help="file to write the results to")
+    parser.add_argument(
+        "--only",
+        action="append",
+        choices=sorted(BENCHMARKS),
+        help="benchmark to run, can be repeated. All benchmarks run by default",
+    )
+    args = parser.parse_args()
+
+    results = []
+    for name in args.only or BENCHMARKS:
+        print(f"running {name}", file=sys.stderr)
+        results.extend(BENCHMARKS[name]())
+
+    report = {
+        "sdk_version": __version__,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Measures requests per second of the ASGI application of `upstash_workflow.asgi`
+and of the FastAPI decorator serving the same workflow.
+
+Both applications are called in-process with ASGI messages, without a server
+and with a stub QStash client, so only the time spent handling a request is
+measured. The FastAPI decorator is skipped if FastAPI is not installed.
+
+Run from the repository root:
+
+    python -m benchmarks.asgi
+"""
+
+import asyncio
+import json
+from typing import Any, Awaitable, Callable, Dict, List, Optional, cast
+
+from qstash import AsyncQStash
+from upstash_workflow import AsyncWorkflowContext
+from upstash_workflow.asgi import app as workflow_app
+from benchmarks.handler import HEADERS, WORKFLOW_URL, _AsyncStubQStash, _build_body
+from benchmarks.utils import measure
+
+STEP_COUNTS = [1, 10, 100]
+NUMBER = 200
+
+ASGIApp = Callable[[Dict[str, Any], Any, Any], Awaitable[None]]
+
+
+def _route(step_count: int) -> Any:
+    async def route(context: AsyncWorkflowContext[str]) -> None:
+        # one more step than the history, so that each request submits a step
+        for step_id in range(1, step_count + 2):
+
+            async def step() -> Dict[str, int]:
+                return {"value": step_id}
+
+            await context.run(f"step-{step_id}", step)
+
+    return route
+
+
+def _fastapi_app(step_count: int) -> Optional[ASGIApp]:
+    try:
+        from fastapi import FastAPI
+        from upstash_workflow.fastapi import Serve
+    except ImportError:
+        return None
+
+    app = FastAPI()
+    Serve(app).post(
+        "/api/workflow",
+        qstash_client=cast(AsyncQStash, _AsyncStubQStash()),
+        url=WORKFLOW_URL,
+        env={},
+        inline_authentication=True,
+    )(_route(step_count))
+    return cast(ASGIApp, app)
+
+
+def _asgi_app(step_count: int) -> ASGIApp:
+    return cast(
+        ASGIApp,
+        workflow_app(
+            _route(step_count),
+            qstash_client=cast(AsyncQStash, _AsyncStubQStash()),
+            url=WORKFLOW_URL,
+            env={},
+            inline_authentication=True,
+        ),
+    )
+
+
+async def _call(app: ASGIApp, body: bytes) -> None:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "https",
+        "path": "/api/workflow",
+        "raw_path": b"/api/workflow",
+        "root_path": "",
+        "query_string": b"",
+        "server": ("example.com", 443),
+        "headers": [(b"host", b"example.com")]
+        + [(name.lower().encode(), value.encode()) for name, value in HEADERS.items()],
+    }
+    received = False
+
+    async def receive() -> Dict[str, Any]:
+        nonlocal received
+        if received:
+            return {"type": "http.disconnect"}
+        received = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message: Dict[str, Any]) -> None:
+        if message["type"] == "http.response.start":
+            assert message["status"] == 200, message
+
+    await app(scope, receive, send)
+
+
+def run() -> List[Dict[str, Any]]:
+    results = []
+    loop = asyncio.new_event_loop()
+    try:
+        for step_count in STEP_COUNTS:
+            body = _build_body(step_count).encode()
+            apps = {"asgi": _asgi_app(step_count)}
+            fastapi_app = _fastapi_app(step_count)
+            if fastapi_app is not None:
+                apps["fastapi"] = fastapi_app
+
+            for name, app in apps.items():
+                result = measure(
+                    "asgi_request",
+                    lambda: loop.run_until_complete(_call(app, body)),
+                    number=NUMBER,
+                    params={"app": name, "steps": step_count},
+                )
+                result["requests_per_second"] = 1 / result["best"]
+                results.append(result)
+    finally:
+        loop.close()
+    return results
+
+
+def main() -> None:
+    print(json.dumps(run(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
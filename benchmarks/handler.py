@@ -0,0 +1,250 @@
+"""
+Measures full invocations of the sync and async workflow handlers.
+
+Each invocation parses a step history, replays the steps and submits the next
+step to a stub QStash client which answers immediately, so only the time spent
+in the SDK is measured. Workflow runs per second are also measured end to end
+with the in-process QStash emulator of `upstash_workflow.testing`.
+
+Run from the repository root:
+
+    python -m benchmarks.handler
+"""
+
+import asyncio
+import base64
+import json
+import time
+from typing import Any, Dict, List, cast
+
+from qstash import AsyncQStash, QStash
+from upstash_workflow import (
+    AsyncWorkflowContext,
+    WorkflowContext,
+    async_serve,
+    serve,
+)
+from upstash_workflow.constants import (
+    WORKFLOW_ID_HEADER,
+    WORKFLOW_PROTOCOL_VERSION,
+    WORKFLOW_PROTOCOL_VERSION_HEADER,
+)
+from upstash_workflow.workflow_types import _AsyncRequest, _SyncRequest
+from benchmarks.utils import measure
+from upstash_workflow.testing import QStashEmulator
+
+WORKFLOW_URL = "https://example.com/api/workflow"
+STEP_COUNTS = [1, 10, 100]
+NUMBER = 200
+RUN_COUNT = 500
+
+
+class _StubMessageApi:
+    def publish_json(self, **kwargs: Any) -> Dict[str, str]:
+        return {"messageId": "msg"}
+
+    def batch_json(self, messages: List[Any]) -> List[Dict[str, str]]:
+        return [{"messageId": "msg"} for _ in messages]
+
+
+class _StubHttp:
+    def request(self, **kwargs: Any) -> str:
+        return ""
+
+
+class _StubQStash:
+    def __init__(self) -> None:
+        self.message = _StubMessageApi()
+        self.http = _StubHttp()
+
+
+class _AsyncStubMessageApi:
+    async def publish_json(self, **kwargs: Any) -> Dict[str, str]:
+        return {"messageId": "msg"}
+
+    async def batch_json(self, messages: List[Any]) -> List[Dict[str, str]]:
+        return [{"messageId": "msg"} for _ in messages]
+
+
+class _AsyncStubHttp:
+    async def request(self, **kwargs: Any) -> str:
+        return ""
+
+
+class _AsyncStubQStash:
+    def __init__(self) -> None:
+        self.message = _AsyncStubMessageApi()
+        self.http = _AsyncStubHttp()
+
+
+def _encode(value: str) -> str:
+    return base64.b64encode(value.encode()).decode()
+
+
+def _build_body(step_count: int) -> str:
+    raw_steps = [
+        {"messageId": "msg-0", "body": _encode('"initial"'), "callType": "step"}
+    ]
+    for step_id in range(1, step_count + 1):
+        step = {
+            "stepId": step_id,
+            "stepName": f"step-{step_id}",
+            "stepType": "Run",
+            "out": json.dumps({"value": step_id}),
+            "concurrent": 1,
+        }
+        raw_steps.append(
+            {
+                "messageId": f"msg-{step_id}",
+                "body": _encode(json.dumps(step)),
+                "callType": "step",
+            }
+        )
+    return json.dumps(raw_steps)
+
+
+HEADERS = {
+    WORKFLOW_PROTOCOL_VERSION_HEADER: WORKFLOW_PROTOCOL_VERSION,
+    WORKFLOW_ID_HEADER: "wfr_benchmark",
+    "Content-Type": "application/json",
+}
+
+
+def _sync_handler(step_count: int) -> Any:
+    def route(context: WorkflowContext[str]) -> None:
+        # one more step than the history, so that each invocation submits a step
+        for step_id in range(1, step_count + 2):
+            context.run(f"step-{step_id}", lambda: {"value": step_id})
+
+    return serve(
+        route,
+        qstash_client=cast(QStash, _StubQStash()),
+        url=WORKFLOW_URL,
+        env={},
+        inline_authentication=True,
+    )["handler"]
+
+
+def _async_handler(step_count: int) -> Any:
+    async def route(context: AsyncWorkflowContext[str]) -> None:
+        for step_id in range(1, step_count + 2):
+
+            async def step() -> Dict[str, int]:
+                return {"value": step_id}
+
+            await context.run(f"step-{step_id}", step)
+
+    return async_serve(
+        route,
+        qstash_client=cast(AsyncQStash, _AsyncStubQStash()),
+        url=WORKFLOW_URL,
+        env={},
+        inline_authentication=True,
+    )["handler"]
+
+
+def _runs_per_second_sync() -> float:
+    emulator = QStashEmulator()
+
+    def route(context: WorkflowContext[int]) -> None:
+        value = context.run("step-1", lambda: context.request_payload + 1)
+        context.run("step-2", lambda: value + 1)
+
+    emulator.register(
+        WORKFLOW_URL,
+        serve(route, qstash_client=cast(QStash, emulator.client), env={})["handler"],
+    )
+    for index in range(RUN_COUNT):
+        emulator.trigger(WORKFLOW_URL, index)
+
+    start = time.perf_counter()
+    emulator.run()
+    return RUN_COUNT / (time.perf_counter() - start)
+
+
+async def _runs_per_second_async() -> float:
+    emulator = QStashEmulator()
+
+    async def route(context: AsyncWorkflowContext[int]) -> None:
+        async def increment() -> int:
+            return context.request_payload + 1
+
+        await context.run("step-1", increment)
+        await context.run("step-2", increment)
+
+    emulator.register(
+        WORKFLOW_URL,
+        async_serve(
+            route, qstash_client=cast(AsyncQStash, emulator.async_client), env={}
+        )["handler"],
+    )
+    for index in range(RUN_COUNT):
+        emulator.trigger(WORKFLOW_URL, index)
+
+    start = time.perf_counter()
+    await emulator.arun(concurrency=50)
+    return RUN_COUNT / (time.perf_counter() - start)
+
+
+def run() -> List[Dict[str, Any]]:
+    results = []
+    loop = asyncio.new_event_loop()
+    try:
+        for step_count in STEP_COUNTS:
+            body = _build_body(step_count)
+            params = {"steps": step_count}
+
+            sync_handler = _sync_handler(step_count)
+            sync_request = _SyncRequest(
+                body=body, headers=HEADERS, method="POST", url=WORKFLOW_URL
+            )
+            results.append(
+                measure(
+                    "sync_handler",
+                    lambda: sync_handler(sync_request),
+                    number=NUMBER,
+                    params=params,
+                )
+            )
+
+            async_handler = _async_handler(step_count)
+            async_request = _AsyncRequest(
+                _body=body.encode(), headers=HEADERS, method="POST", url=WORKFLOW_URL
+            )
+            results.append(
+                measure(
+                    "async_handler",
+                    lambda: loop.run_until_complete(async_handler(async_request)),
+                    number=NUMBER,
+                    params=params,
+                )
+            )
+
+        sync_runs = _runs_per_second_sync()
+        async_runs = loop.run_until_complete(_runs_per_second_async())
+    finally:
+        loop.close()
+
+    results.append(
+        {
+            "name": "emulated_runs",
+            "params": {"serve": "sync"},
+            "runs_per_second": sync_runs,
+        }
+    )
+    results.append(
+        {
+            "name": "emulated_runs",
+            "params": {"serve": "async"},
+            "runs_per_second": async_runs,
+        }
+    )
+    return results
+
+
+def main() -> None:
+    print(json.dumps(run(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Measures building the headers of step messages and filtering the headers of
+incoming requests.
+
+`_get_headers` is timed for each kind of step, with and without a failure url,
+next to the headers template used by the executor, which is created for each
+request from the cached headers of the workflow options. `_recreate_user_headers`
+is timed with the headers a request has after going through common proxies.
+
+Run from the repository root:
+
+    python -m benchmarks.headers
+"""
+
+import json
+from typing import Any, Dict, List, Literal, Optional
+
+from upstash_workflow.types import DefaultStep, Step
+from upstash_workflow.workflow_requests import (
+    _get_headers,
+    _get_headers_template,
+    _recreate_user_headers,
+)
+from benchmarks.utils import measure
+
+WORKFLOW_URL = "https://example.com/api/workflow"
+FAILURE_URL = "https://example.com/api/failure"
+WORKFLOW_RUN_ID = "wfr_benchmark"
+USER_HEADERS = {"Authorization": "Bearer token", "X-Tenant": "tenant"}
+NUMBER = 10_000
+
+STEPS: Dict[str, Optional[DefaultStep]] = {
+    "init": None,
+    "run": Step(step_id=1, step_name="run", step_type="Run", concurrent=1),
+    "sleep": Step(
+        step_id=1, step_name="sleep", step_type="SleepFor", concurrent=1, sleep_for=10
+    ),
+    "wait": Step(
+        step_id=1,
+        step_name="wait",
+        step_type="Wait",
+        concurrent=1,
+        wait_event_id="event",
+        wait_timeout="7d",
+    ),
+    "call": Step(
+        step_id=1,
+        step_name="call",
+        step_type="Call",
+        concurrent=1,
+        call_url="https://third-party.com",
+        call_method="POST",
+        call_headers={"Content-Type": "application/json"},
+    ),
+    "invoke": Step(
+        step_id=1,
+        step_name="invoke",
+        step_type="Invoke",
+        concurrent=1,
+        invoke_url="https://example.com/api/other",
+        invoke_headers={"X-Invoked": "true"},
+    ),
+}
+
+PROXY_HEADERS = {
+    "vercel": {
+        "x-vercel-id": "fra1::iad1::abc",
+        "x-vercel-deployment-url": "app.vercel.app",
+        "x-vercel-forwarded-for": "1.2.3.4",
+        "x-vercel-ip-country": "DE",
+        "x-vercel-proxied-for": "1.2.3.4",
+        "x-forwarded-for": "1.2.3.4",
+        "x-forwarded-host": "app.vercel.app",
+        "x-forwarded-proto": "https",
+        "x-real-ip": "1.2.3.4",
+    },
+    "cloudflare": {
+        "cf-connecting-ip": "1.2.3.4",
+        "cf-ipcountry": "DE",
+        "cf-ray": "abc-FRA",
+        "cf-visitor": '{"scheme":"https"}',
+        "cdn-loop": "cloudflare",
+        "cf-ew-via": "15",
+        "x-forwarded-for": "1.2.3.4",
+        "x-forwarded-proto": "https",
+    },
+    "render": {
+        "render-proxy-ttl": "4",
+        "rndr-id": "abc",
+        "x-forwarded-for": "1.2.3.4",
+        "x-forwarded-proto": "https",
+        "x-request-start": "1700000000",
+    },
+}
+
+QSTASH_HEADERS = {
+    "content-type": "application/json",
+    "user-agent": "Upstash-QStash",
+    "upstash-message-id": "msg_benchmark",
+    "upstash-retried": "0",
+    "upstash-signature": "eyJhbGciOiJIUzI1NiJ9." + "a" * 200,
+    "upstash-workflow-runid": WORKFLOW_RUN_ID,
+    "upstash-workflow-url": WORKFLOW_URL,
+    "upstash-workflow-sdk-version": "1",
+    "authorization": "Bearer token",
+    "x-tenant": "tenant",
+}
+
+
+def run() -> List[Dict[str, Any]]:
+    results = []
+    for failure_url in (None, FAILURE_URL):
+        for kind, step in STEPS.items():
+            init: Literal["true", "false"] = "true" if step is None else "false"
+            params = {"step": kind, "failure_url": failure_url is not None}
+            results.append(
+                measure(
+                    "get_headers",
+                    lambda: _get_headers(
+                        init,
+                        WORKFLOW_RUN_ID,
+                        WORKFLOW_URL,
+                        USER_HEADERS,
+                        step,
+                        3,
+                        workflow_failure_url=failure_url,
+                    ),
+                    number=NUMBER,
+                    params=params,
+                )
+            )
+            results.append(
+                measure(
+                    "headers_template",
+                    lambda: _get_headers_template(
+                        WORKFLOW_URL, USER_HEADERS, 3, failure_url
+                    ).get_headers(init, WORKFLOW_RUN_ID, step),
+                    number=NUMBER,
+                    params=params,
+                )
+            )
+
+    for proxy, proxy_headers in PROXY_HEADERS.items():
+        headers = {**QSTASH_HEADERS, **proxy_headers}
+        results.append(
+            measure(
+                "recreate_user_headers",
+                lambda: _recreate_user_headers(headers),
+                number=NUMBER,
+                params={"proxy": proxy, "headers": len(headers)},
+            )
+        )
+    return results
+
+
+def main() -> None:
+    print(json.dumps(run(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Measures the cold import time of `upstash_workflow` and of its serve
+functions, which are imported on first access.
+
+Each measurement imports the package in a new interpreter, so nothing is
+cached in `sys.modules`. Only the import statement is timed, not the startup
+of the interpreter.
+
+Run from the repository root:
+
+    python -m benchmarks.import_time
+"""
+
+import json
+import statistics
+import subprocess
+import sys
+from typing import Any, Dict, List
+
+REPEAT = 10
+
+_SCRIPT = """
+import time
+start = time.perf_counter()
+{statement}
+print(time.perf_counter() - start)
+"""
+
+
+def _time_statement(statement: str) -> List[float]:
+    return [
+        float(
+            subprocess.run(
+                [sys.executable, "-c", _SCRIPT.format(statement=statement)],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+        )
+        for _ in range(REPEAT)
+    ]
+
+
+def run() -> List[Dict[str, Any]]:
+    results = []
+    for statement in (
+        "import upstash_workflow",
+        "from upstash_workflow import serve",
+        "from upstash_workflow import async_serve",
+    ):
+        timings = _time_statement(statement)
+        results.append(
+            {
+                "name": "import_time",
+                "params": {"statement": statement},
+                "best": min(timings),
+                "median": statistics.median(timings),
+                "number": 1,
+                "repeat": REPEAT,
+            }
+        )
+    return results
+
+
+def main() -> None:
+    print(json.dumps(run(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Measures the throughput of sending notifications to a local stub server.
+
+The stub answers every notify request after a fixed latency, like a remote
+QStash would. This benchmark reports notifications per second when calling
+`Client.notify` in a loop and when using `Client.notify_many` with increasing
+concurrency.
+
+Run from the repository root:
+
+    python -m benchmarks.notify_many
+"""
+
+import http.server
+import socketserver
+import threading
+import time
+from typing import Any, Iterator, Optional, Tuple
+
+from upstash_workflow import Client
+
+NOTIFICATION_COUNT = 500
+LATENCY = 0.005
+CONCURRENCY_LEVELS = [1, 4, 16, 64]
+
+
+class _StubServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class _StubHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self) -> None:
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(LATENCY)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"[]")
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+def _notifications() -> Iterator[Tuple[str, Any, Optional[str]]]:
+    for index in range(NOTIFICATION_COUNT):
+        yield f"event-{index}", {"index": index}, None
+
+
+def main() -> None:
+    server = _StubServer(("localhost", 0), _StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://localhost:{server.server_address[1]}"
+
+    try:
+        with Client(token="benchmark-token", base_url=base_url) as client:
+            print(f"{'method':>24} {'notifications/s':>16}")
+
+            start = time.perf_counter()
+            for event_id, event_data, workflow_run_id in _notifications():
+                client.notify(event_id, event_data, workflow_run_id)
+            elapsed = time.perf_counter() - start
+            print(f"{'notify loop':>24} {NOTIFICATION_COUNT / elapsed:>16.1f}")
+
+            for concurrency in CONCURRENCY_LEVELS:
+                start = time.perf_counter()
+                for result in client.notify_many(
+                    _notifications(), concurrency=concurrency
+                ):
+                    assert result.error is None, result.error
+                elapsed = time.perf_counter() - start
+                label = f"notify_many({concurrency})"
+                print(f"{label:>24} {NOTIFICATION_COUNT / elapsed:>16.1f}")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
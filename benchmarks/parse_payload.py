@@ -0,0 +1,177 @@
+"""
+Measures the cost of parsing the request body QStash sends on each step.
+
+Each invocation of a workflow receives the full step history. This benchmark
+reports the time spent in `_parse_payload` alone and the time spent parsing
+and replaying every step, for histories of increasing length with small and
+large step outputs. The replay is also measured with a warm replay cache, as
+in a process which handled the earlier requests of the run, and with a warm
+shared replay cache, as in another worker process of the same server.
+
+Run from the repository root:
+
+    python -m benchmarks.parse_payload
+"""
+
+import base64
+import json
+import os
+import tempfile
+import timeit
+from typing import Any, Dict, List, Optional
+
+from upstash_workflow.replay_cache import (
+    InMemoryReplayCache,
+    ReplayCache,
+    SharedReplayCache,
+)
+from upstash_workflow.workflow_parser import _parse_payload
+from benchmarks.utils import measure
+
+STEP_COUNTS = [10, 100, 300, 1000]
+REPEAT = 5
+OUTPUTS = {
+    "small": {"items": list(range(20)), "name": "output"},
+    "large": {"data": "a" * 10_000},
+}
+
+
+def _encode(value: str) -> str:
+    return base64.b64encode(value.encode()).decode()
+
+
+def build_payload(step_count: int, out: Any) -> str:
+    raw_steps: List[Dict[str, Any]] = [
+        {"messageId": "msg-0", "body": _encode('"initial"'), "callType": "step"}
+    ]
+    for step_id in range(1, step_count + 1):
+        body = {
+            "stepId": step_id,
+            "stepName": f"step-{step_id}",
+            "stepType": "Run",
+            "out": json.dumps(out),
+            "concurrent": 1,
+        }
+        raw_steps.append(
+            {
+                "messageId": f"msg-{step_id}",
+                "body": _encode(json.dumps(body)),
+                "callType": "step",
+            }
+        )
+    return json.dumps(raw_steps)
+
+
+def _replay(payload: str, replay_cache: Optional[ReplayCache] = None) -> None:
+    _, steps = _parse_payload(
+        payload, workflow_run_id="wfr_benchmark", replay_cache=replay_cache
+    )
+    for step in steps:
+        step.out
+
+
+def _warm_cache(
+    payload: str, replay_cache: Optional[ReplayCache] = None
+) -> ReplayCache:
+    replay_cache = replay_cache or InMemoryReplayCache()
+    _replay(payload, replay_cache)
+    return replay_cache
+
+
+def _warm_shared_cache(payload: str, directory: str) -> ReplayCache:
+    path = os.path.join(directory, "replay-cache")
+    if os.path.exists(path):
+        os.unlink(path)
+    _warm_cache(payload, SharedReplayCache(path))
+    # read with another instance, like another worker process would
+    return SharedReplayCache(path)
+
+
+def run() -> List[Dict[str, Any]]:
+    with tempfile.TemporaryDirectory() as directory:
+        return _run(directory)
+
+
+def _run(directory: str) -> List[Dict[str, Any]]:
+    results = []
+    for output_size, out in OUTPUTS.items():
+        for step_count in (10, 100, 1000):
+            payload = build_payload(step_count, out)
+            params = {"steps": step_count, "output": output_size}
+            number = max(1, 1000 // step_count)
+            results.append(
+                measure(
+                    "parse_payload",
+                    lambda: _parse_payload(payload),
+                    number=number,
+                    params=params,
+                )
+            )
+            results.append(
+                measure(
+                    "parse_payload_replay",
+                    lambda: _replay(payload),
+                    number=number,
+                    params=params,
+                )
+            )
+            replay_cache = _warm_cache(payload)
+            results.append(
+                measure(
+                    "parse_payload_replay_cached",
+                    lambda: _replay(payload, replay_cache),
+                    number=number,
+                    params=params,
+                )
+            )
+            shared_cache = _warm_shared_cache(payload, directory)
+            results.append(
+                measure(
+                    "parse_payload_replay_shared_cache",
+                    lambda: _replay(payload, shared_cache),
+                    number=number,
+                    params=params,
+                )
+            )
+    return results
+
+
+def main() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        _main(directory)
+
+
+def _main(directory: str) -> None:
+    print(
+        f"{'output':>6} {'steps':>6} {'parse (ms)':>12} {'parse + replay (ms)':>20}"
+        f" {'cached replay (ms)':>20} {'shared cache (ms)':>20}"
+    )
+    for output_size, out in OUTPUTS.items():
+        for step_count in STEP_COUNTS:
+            payload = build_payload(step_count, out)
+            parse = min(
+                timeit.repeat(lambda: _parse_payload(payload), number=10, repeat=REPEAT)
+            )
+            replay = min(
+                timeit.repeat(lambda: _replay(payload), number=10, repeat=REPEAT)
+            )
+            replay_cache = _warm_cache(payload)
+            cached = min(
+                timeit.repeat(
+                    lambda: _replay(payload, replay_cache), number=10, repeat=REPEAT
+                )
+            )
+            shared_cache = _warm_shared_cache(payload, directory)
+            shared = min(
+                timeit.repeat(
+                    lambda: _replay(payload, shared_cache), number=10, repeat=REPEAT
+                )
+            )
+            print(
+                f"{output_size:>6} {step_count:>6} {parse * 100:>12.3f}"
+                f" {replay * 100:>20.3f} {cached * 100:>20.3f} {shared * 100:>20.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Measures the memory used to replay the step history QStash sends on each step.
+
+The request body is parsed and every step is replayed, as the route function
+does in the last invocation of a run. The peak is the most memory allocated
+at once while replaying, and the retained memory is what is still held by the
+replayed steps afterwards. The payload itself is created before measuring.
+The memory of a single step is also reported for `Step` and for the compact
+`_ReplayStep` the request parser creates.
+
+Run from the repository root:
+
+    python -m benchmarks.replay_memory
+"""
+
+import tracemalloc
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+from upstash_workflow.types import Step, _ReplayStep
+from upstash_workflow.workflow_parser import _parse_payload
+from benchmarks.parse_payload import OUTPUTS, build_payload
+
+STEP_COUNT = 1000
+
+
+def _replay(payload: str) -> Sequence[Any]:
+    _, steps = _parse_payload(payload)
+    for step in steps:
+        step.out
+    return steps
+
+
+def _measure_memory(function: Callable[[], Any]) -> Tuple[int, int]:
+    """
+    Calls the function while tracing allocations
+
+    :param function: function to measure
+    :return: bytes still allocated while the result is referenced and the peak
+    """
+    tracemalloc.start()
+    try:
+        start, _ = tracemalloc.get_traced_memory()
+        result = function()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return current - start, peak - start
+
+
+def _step_size(step_class: Callable[..., Any]) -> float:
+    count = 10_000
+    retained, _ = _measure_memory(
+        lambda: [
+            step_class(
+                step_id=step_id,
+                step_name="step",
+                step_type="Run",
+                concurrent=1,
+                out=None,
+            )
+            for step_id in range(count)
+        ]
+    )
+    return retained / count
+
+
+def run() -> List[Dict[str, Any]]:
+    results = []
+    for output_size, out in OUTPUTS.items():
+        payload = build_payload(STEP_COUNT, out)
+        retained, peak = _measure_memory(lambda: _replay(payload))
+        results.append(
+            {
+                "name": "replay_memory",
+                "params": {"steps": STEP_COUNT, "output": output_size},
+                "retained_bytes": retained,
+                "peak_bytes": peak,
+            }
+        )
+    for step_class in (Step, _ReplayStep):
+        results.append(
+            {
+                "name": "step_memory",
+                "params": {"representation": step_class.__name__},
+                "bytes_per_step": _step_size(step_class),
+            }
+        )
+    return results
+
+
+def main() -> None:
+    print(f"{'output':>8} {'retained (KiB)':>16} {'peak (KiB)':>12}")
+    results = run()
+    for result in results:
+        if result["name"] == "replay_memory":
+            print(
+                f"{result['params']['output']:>8}"
+                f" {result['retained_bytes'] / 1024:>16.1f}"
+                f" {result['peak_bytes'] / 1024:>12.1f}"
+            )
+    print()
+    for result in results:
+        if result["name"] == "step_memory":
+            print(
+                f"{result['params']['representation']:>12}:"
+                f" {result['bytes_per_step']:.0f} bytes per step"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+import statistics
+import timeit
+from typing import Any, Callable, Dict, Optional
+
+
+def measure(
+    name: str,
+    function: Callable[[], Any],
+    *,
+    number: int,
+    repeat: int = 5,
+    params: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Times the function and returns a result in the format written by the suite
+
+    :param name: name of the benchmark
+    :param function: function to time
+    :param number: number of calls per measurement
+    :param repeat: number of measurements
+    :param params: parameters of the benchmark, like the number of steps
+    :return: best and median time per call in seconds
+    """
+    timings = [
+        timing / number
+        for timing in timeit.repeat(function, number=number, repeat=repeat)
+    ]
+    return {
+        "name": name,
+        "params": params or {},
+        "best": min(timings),
+        "median": statistics.median(timings),
+        "number": number,
+        "repeat": repeat,
+    }
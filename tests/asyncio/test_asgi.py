@@ -0,0 +1,224 @@
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple, cast
+from urllib.parse import urlsplit
+import pytest
+from qstash import AsyncQStash
+from upstash_workflow import AsyncWorkflowContext
+from upstash_workflow.asgi import ASGIApp, Message, _get_url, app
+from upstash_workflow.asyncio.delete_queue import AsyncDeleteQueue
+from upstash_workflow.types import create_async_workflow
+from upstash_workflow.workflow_types import _AsyncRequest
+from upstash_workflow.testing import QStashEmulator
+from tests.utils import WORKFLOW_ENDPOINT
+
+
+@dataclass
+class _AsgiResponse:
+    status: int
+    headers: Dict[str, str]
+    body: str
+
+
+async def _call(
+    asgi_app: ASGIApp,
+    url: str,
+    body: bytes = b"",
+    headers: Optional[Dict[str, str]] = None,
+    method: str = "POST",
+    root_path: str = "",
+    chunk_size: Optional[int] = None,
+) -> _AsgiResponse:
+    split_url = urlsplit(url)
+    scope = {
+        "type": "http",
+        "method": method,
+        "scheme": split_url.scheme,
+        "root_path": root_path,
+        "path": split_url.path,
+        "query_string": split_url.query.encode(),
+        "headers": [
+            (b"host", split_url.netloc.encode()),
+            *(
+                (name.lower().encode(), value.encode())
+                for name, value in (headers or {}).items()
+            ),
+        ],
+    }
+
+    chunk_size = chunk_size or max(len(body), 1)
+    chunks = [body[i : i + chunk_size] for i in range(0, len(body), chunk_size)]
+    messages: List[Message] = [
+        {"type": "http.request", "body": chunk, "more_body": i < len(chunks) - 1}
+        for i, chunk in enumerate(chunks or [b""])
+    ]
+    sent: List[Message] = []
+
+    async def receive() -> Message:
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message: Message) -> None:
+        sent.append(message)
+
+    await asgi_app(scope, receive, send)
+
+    start, response_body = sent
+    return _AsgiResponse(
+        status=start["status"],
+        headers={name.decode(): value.decode() for name, value in start["headers"]},
+        body=response_body["body"].decode(),
+    )
+
+
+def _register(emulator: QStashEmulator, url: str, asgi_app: ASGIApp) -> None:
+    async def handler(request: _AsyncRequest) -> _AsgiResponse:
+        return await _call(asgi_app, request.url, await request.body(), request.headers)
+
+    emulator.register(url, handler)
+
+
+@pytest.mark.asyncio
+async def test_route_function_runs_to_completion() -> None:
+    emulator = QStashEmulator()
+    results: List[Any] = []
+
+    async def route(context: AsyncWorkflowContext[Dict[str, int]]) -> None:
+        async def add() -> int:
+            return context.request_payload["a"] + 1
+
+        results.append(await context.run("add", add))
+
+    asgi_app = app(route, qstash_client=cast(AsyncQStash, emulator.async_client))
+    _register(emulator, WORKFLOW_ENDPOINT, asgi_app)
+    workflow_run_id = emulator.trigger(WORKFLOW_ENDPOINT, {"a": 1})
+    await emulator.arun()
+
+    assert results == [2]
+    assert emulator.runs[workflow_run_id].state == "RUN_SUCCESS"
+    assert emulator.failed == []
+
+
+@pytest.mark.asyncio
+async def test_first_invocation_response() -> None:
+    emulator = QStashEmulator()
+
+    async def route(context: AsyncWorkflowContext[str]) -> None:
+        async def step() -> str:
+            return "result"
+
+        await context.run("step", step)
+
+    asgi_app = app(route, qstash_client=cast(AsyncQStash, emulator.async_client))
+    response = await _call(
+        asgi_app,
+        WORKFLOW_ENDPOINT,
+        b'"payload"',
+        {"Content-Type": "application/json"},
+        chunk_size=3,
+    )
+
+    assert response.status == 200
+    assert response.headers["content-type"] == "application/json"
+    assert response.headers["content-length"] == str(len(response.body))
+    assert json.loads(response.body)["workflowRunId"].startswith("wfr_")
+
+
+@pytest.mark.asyncio
+async def test_workflows_are_routed_by_path() -> None:
+    emulator = QStashEmulator()
+    results: List[str] = []
+
+    async def first(context: AsyncWorkflowContext[str]) -> None:
+        async def step() -> str:
+            return "first"
+
+        results.append(await context.run("step", step))
+
+    async def second(context: AsyncWorkflowContext[str]) -> None:
+        async def step() -> str:
+            return "second"
+
+        results.append(await context.run("step", step))
+
+    asgi_app = app(
+        {
+            "first": create_async_workflow(first),
+            "second": create_async_workflow(second),
+        },
+        qstash_client=cast(AsyncQStash, emulator.async_client),
+    )
+    base_url = "https://requestcatcher.com/workflows"
+    _register(emulator, f"{base_url}/second", asgi_app)
+    emulator.trigger(f"{base_url}/second", "payload")
+    await emulator.arun()
+
+    assert results == ["second"]
+
+    response = await _call(asgi_app, f"{base_url}/unknown", b'"payload"')
+    assert response.status == 404
+
+
+@pytest.mark.asyncio
+async def test_only_post_is_allowed() -> None:
+    async def route(context: AsyncWorkflowContext[str]) -> None:
+        pass
+
+    asgi_app = app(route, env={"QSTASH_TOKEN": "token"})
+    response = await _call(asgi_app, WORKFLOW_ENDPOINT, method="GET")
+
+    assert response.status == 405
+
+
+def test_url_of_request() -> None:
+    def scope(**values: Any) -> Dict[str, Any]:
+        return {"scheme": "http", "path": "/workflow", "headers": [], **values}
+
+    host_header: List[Tuple[bytes, bytes]] = [(b"host", b"example.com:8080")]
+    assert _get_url(scope(headers=host_header)) == "http://example.com:8080/workflow"
+    assert _get_url(scope(server=("127.0.0.1", 80))) == "http://127.0.0.1/workflow"
+    assert (
+        _get_url(scope(server=("127.0.0.1", 8000), query_string=b"a=1"))
+        == "http://127.0.0.1:8000/workflow?a=1"
+    )
+    # mounted apps receive the path with or without the mount path
+    assert (
+        _get_url(scope(headers=host_header, root_path="/api"))
+        == "http://example.com:8080/api/workflow"
+    )
+    assert (
+        _get_url(scope(headers=host_header, root_path="/api", path="/api/workflow"))
+        == "http://example.com:8080/api/workflow"
+    )
+
+
+@pytest.mark.asyncio
+async def test_lifespan_drains_delete_queue() -> None:
+    drained: List[bool] = []
+
+    class _DeleteQueue(AsyncDeleteQueue):
+        async def drain(self) -> None:
+            drained.append(True)
+
+    async def route(context: AsyncWorkflowContext[str]) -> None:
+        pass
+
+    asgi_app = app(route, env={"QSTASH_TOKEN": "token"}, delete_queue=_DeleteQueue())
+    messages: List[Message] = [
+        {"type": "lifespan.startup"},
+        {"type": "lifespan.shutdown"},
+    ]
+    sent: List[Message] = []
+
+    async def receive() -> Message:
+        return messages.pop(0)
+
+    async def send(message: Message) -> None:
+        sent.append(message)
+
+    await asgi_app({"type": "lifespan"}, receive, send)
+
+    assert [message["type"] for message in sent] == [
+        "lifespan.startup.complete",
+        "lifespan.shutdown.complete",
+    ]
+    assert drained == [True]
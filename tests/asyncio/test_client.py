@@ -0,0 +1,177 @@
+import asyncio
+import weakref
+from typing import Any, List
+import httpx
+import pytest
+from aiohttp import web
+from upstash_workflow import AsyncClient, WorkflowError
+from tests.utils import (
+    MOCK_QSTASH_SERVER_PORT,
+    MOCK_QSTASH_SERVER_URL,
+    WORKFLOW_ENDPOINT,
+)
+
+
+@pytest.mark.asyncio
+async def test_connections_are_reused() -> None:
+    client_addresses: List[Any] = []
+
+    async def handler(request: web.Request) -> web.Response:
+        assert request.transport is not None
+        client_addresses.append(request.transport.get_extra_info("peername"))
+        return web.json_response(data=[], status=200)
+
+    app = web.Application()
+    app.router.add_route("POST", "/v2/notify/{event_id}", handler)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "localhost", MOCK_QSTASH_SERVER_PORT)
+
+    try:
+        await site.start()
+        async with AsyncClient(
+            token="test-token", base_url=MOCK_QSTASH_SERVER_URL
+        ) as client:
+            for _ in range(3):
+                assert await client.notify("event-id", event_data="data") == []
+
+        assert client.is_closed
+    finally:
+        await runner.cleanup()
+
+    assert len(client_addresses) == 3
+    assert len(set(client_addresses)) == 1
+
+
+@pytest.mark.asyncio
+async def test_default_client(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(AsyncClient, "_defaults", weakref.WeakKeyDictionary())
+    monkeypatch.delenv("QSTASH_TOKEN", raising=False)
+    with pytest.raises(WorkflowError, match="QSTASH_TOKEN"):
+        AsyncClient.default()
+
+    monkeypatch.setenv("QSTASH_TOKEN", "env-token")
+    client = AsyncClient.default()
+
+    assert client is AsyncClient.default()
+    assert client._base_url == "https://qstash.upstash.io"
+
+    await client.aclose()
+    assert AsyncClient.default() is not client
+    await AsyncClient.default().aclose()
+
+
+def test_default_client_per_event_loop(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(AsyncClient, "_defaults", weakref.WeakKeyDictionary())
+    monkeypatch.setenv("QSTASH_TOKEN", "env-token")
+
+    async def get_default() -> AsyncClient:
+        client = AsyncClient.default()
+        assert client is AsyncClient.default()
+        return client
+
+    loop = asyncio.new_event_loop()
+    other_loop = asyncio.new_event_loop()
+    try:
+        client = loop.run_until_complete(get_default())
+        other_client = other_loop.run_until_complete(get_default())
+
+        assert client is not other_client
+        assert loop.run_until_complete(get_default()) is client
+        loop.run_until_complete(client.aclose())
+        other_loop.run_until_complete(other_client.aclose())
+    finally:
+        loop.close()
+        other_loop.close()
+
+    with pytest.raises(WorkflowError, match="running event loop"):
+        AsyncClient.default()
+
+
+@pytest.mark.asyncio
+async def test_notify_many() -> None:
+    running = 0
+    peak = 0
+
+    async def handler(request: web.Request) -> web.Response:
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        if request.match_info["event_id"] == "failing-event":
+            return web.Response(status=500)
+        return web.json_response(data=[], status=200)
+
+    app = web.Application()
+    app.router.add_route("POST", "/v2/notify/{event_id}", handler)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "localhost", MOCK_QSTASH_SERVER_PORT)
+
+    notifications = [
+        ("failing-event" if index == 3 else f"event-{index}", index, None)
+        for index in range(8)
+    ]
+    try:
+        await site.start()
+        async with AsyncClient(
+            token="test-token", base_url=MOCK_QSTASH_SERVER_URL
+        ) as client:
+            results = [
+                result
+                async for result in client.notify_many(notifications, concurrency=2)
+            ]
+    finally:
+        await runner.cleanup()
+
+    assert peak == 2
+    assert sorted(result.index for result in results) == list(range(8))
+    failed = [result for result in results if result.error is not None]
+    assert [result.event_id for result in failed] == ["failing-event"]
+    assert isinstance(failed[0].error, httpx.HTTPStatusError)
+
+
+@pytest.mark.asyncio
+async def test_trigger_many() -> None:
+    batches: List[Any] = []
+    failures = 1
+
+    async def handler(request: web.Request) -> web.Response:
+        nonlocal failures
+        messages = await request.json()
+        if failures:
+            failures -= 1
+            return web.Response(status=503)
+        batches.append(messages)
+        return web.json_response(data=[{"messageId": "msg-id"} for _ in messages])
+
+    app = web.Application()
+    app.router.add_route("POST", "/v2/batch", handler)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "localhost", MOCK_QSTASH_SERVER_PORT)
+
+    try:
+        await site.start()
+        async with AsyncClient(
+            token="test-token", base_url=MOCK_QSTASH_SERVER_URL
+        ) as client:
+            workflow_run_ids = await client.trigger_many(
+                WORKFLOW_ENDPOINT, range(3), batch_size=2
+            )
+    finally:
+        await runner.cleanup()
+
+    assert [len(batch) for batch in batches] == [2, 1]
+    messages = [message for batch in batches for message in batch]
+    assert [message["body"] for message in messages] == ["0", "1", "2"]
+    assert [
+        message["headers"]["Upstash-Workflow-RunId"] for message in messages
+    ] == workflow_run_ids
+    assert all(
+        message["headers"]["Upstash-Workflow-Init"] == "true" for message in messages
+    )
@@ -0,0 +1,66 @@
+import logging
+from typing import cast
+import pytest
+from qstash import AsyncQStash
+from upstash_workflow.asyncio.delete_queue import AsyncDeleteQueue
+from upstash_workflow.asyncio.workflow_requests import _trigger_workflow_delete
+from tests.asyncio.utils import AsyncRecordingQStash, create_context
+
+
+@pytest.mark.asyncio
+async def test_runs_are_deleted() -> None:
+    qstash_client = AsyncRecordingQStash()
+    queue = AsyncDeleteQueue()
+
+    for index in range(10):
+        queue.enqueue(
+            cast(AsyncQStash, qstash_client), f"wfr-{index}", cancel=index == 0
+        )
+    await queue.drain()
+
+    assert sorted(qstash_client.http.requests) == sorted(
+        [("DELETE", "/v2/workflows/runs/wfr-0?cancel=true")]
+        + [
+            ("DELETE", f"/v2/workflows/runs/wfr-{index}?cancel=false")
+            for index in range(1, 10)
+        ]
+    )
+
+
+@pytest.mark.asyncio
+async def test_concurrency_is_bounded() -> None:
+    qstash_client = AsyncRecordingQStash(delay=0.01)
+    queue = AsyncDeleteQueue(concurrency=2)
+
+    for index in range(8):
+        queue.enqueue(cast(AsyncQStash, qstash_client), f"wfr-{index}")
+    await queue.drain()
+
+    assert len(qstash_client.http.requests) == 8
+    assert qstash_client.http.max_in_flight == 2
+
+
+@pytest.mark.asyncio
+async def test_errors_are_logged(caplog: pytest.LogCaptureFixture) -> None:
+    qstash_client = AsyncRecordingQStash(error=RuntimeError("delete failed"))
+    queue = AsyncDeleteQueue()
+
+    with caplog.at_level(logging.ERROR):
+        queue.enqueue(cast(AsyncQStash, qstash_client), "wfr-id")
+        await queue.drain()
+
+    assert "Failed to delete workflow run wfr-id" in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_trigger_workflow_delete_with_queue() -> None:
+    queue = AsyncDeleteQueue()
+    context, qstash_client = create_context()
+
+    await _trigger_workflow_delete(context, delete_queue=queue)
+    assert qstash_client.http.requests == []
+
+    await queue.drain()
+    assert qstash_client.http.requests == [
+        ("DELETE", "/v2/workflows/runs/wfr-id?cancel=false")
+    ]
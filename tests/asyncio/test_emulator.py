@@ -0,0 +1,98 @@
+import asyncio
+from typing import Any, Dict, List, cast
+import pytest
+from qstash import AsyncQStash
+from upstash_workflow import AsyncWorkflowContext, async_serve
+from upstash_workflow.asyncio.outbox import BatchOutbox
+from upstash_workflow.testing import QStashEmulator
+from tests.utils import WORKFLOW_ENDPOINT
+
+
+def _serve(emulator: QStashEmulator, route: Any, **kwargs: Any) -> None:
+    handler = async_serve(
+        route, qstash_client=cast(AsyncQStash, emulator.async_client), env={}, **kwargs
+    )["handler"]
+    emulator.register(WORKFLOW_ENDPOINT, handler)
+
+
+@pytest.mark.asyncio
+async def test_steps_run_to_completion() -> None:
+    emulator = QStashEmulator()
+    results: List[Any] = []
+
+    async def route(context: AsyncWorkflowContext[Dict[str, int]]) -> None:
+        async def add() -> int:
+            return context.request_payload["a"] + 1
+
+        total = await context.run("add", add)
+        await context.sleep("sleep", 60)
+        results.append(total)
+
+    _serve(emulator, route)
+    workflow_run_id = emulator.trigger(WORKFLOW_ENDPOINT, {"a": 1})
+    await emulator.arun()
+
+    assert results == [2]
+    assert emulator.runs[workflow_run_id].state == "RUN_SUCCESS"
+
+
+@pytest.mark.asyncio
+async def test_parallel_steps() -> None:
+    emulator = QStashEmulator()
+    results: List[Any] = []
+
+    async def route(context: AsyncWorkflowContext[str]) -> None:
+        async def step(value: str) -> str:
+            return value
+
+        outputs = await asyncio.gather(
+            context.run("step-1", lambda: step("one")),
+            context.run("step-2", lambda: step("two")),
+        )
+        results.append(outputs)
+
+    _serve(emulator, route)
+    emulator.trigger(WORKFLOW_ENDPOINT, "payload")
+    await emulator.arun()
+
+    assert results == [["one", "two"]]
+
+
+@pytest.mark.asyncio
+async def test_wait_for_event() -> None:
+    emulator = QStashEmulator()
+    results: List[Any] = []
+
+    async def route(context: AsyncWorkflowContext[str]) -> None:
+        result = cast(Dict[str, Any], await context.wait_for_event("wait", "event-id"))
+        results.append(result["event_data"])
+
+    _serve(emulator, route)
+    emulator.trigger(WORKFLOW_ENDPOINT, "payload")
+    await emulator.arun(until=emulator.clock.now)
+
+    emulator.notify("event-id", "data")
+    await emulator.arun()
+
+    assert results == ["data"]
+
+
+@pytest.mark.asyncio
+async def test_many_runs_with_batch_outbox() -> None:
+    emulator = QStashEmulator()
+    finished: List[int] = []
+
+    async def route(context: AsyncWorkflowContext[int]) -> None:
+        async def increment() -> int:
+            return context.request_payload + 1
+
+        value = await context.run("step-1", increment)
+        finished.append(value)
+
+    _serve(emulator, route, batch_outbox=BatchOutbox())
+    for index in range(200):
+        emulator.trigger(WORKFLOW_ENDPOINT, index)
+    await emulator.arun(concurrency=50)
+
+    assert sorted(finished) == [index + 1 for index in range(200)]
+    assert emulator.failed == []
@@ -0,0 +1,74 @@
+import json
+from typing import Any
+import pytest
+from qstash import AsyncQStash
+from upstash_workflow import AsyncWorkflowContext
+from upstash_workflow.codec import JSONCodec
+from upstash_workflow.constants import (
+    WORKFLOW_ID_HEADER,
+    WORKFLOW_PROTOCOL_VERSION,
+    WORKFLOW_PROTOCOL_VERSION_HEADER,
+)
+from tests.utils import encode_message
+from tests.asyncio.utils import AsyncRecordingQStash
+
+fastapi = pytest.importorskip("fastapi")
+pytest.importorskip("httpx")
+
+from fastapi.testclient import TestClient  # noqa: E402
+from upstash_workflow.fastapi import Serve  # noqa: E402
+
+
+class _IndentedCodec(JSONCodec):
+    def dumps(self, value: Any) -> str:
+        return json.dumps(value, indent=2)
+
+
+STEP_1 = json.dumps(
+    {
+        "stepId": 1,
+        "stepName": "step-1",
+        "stepType": "Run",
+        "out": json.dumps("result-1"),
+        "concurrent": 1,
+    }
+)
+
+
+def test_response_is_encoded_with_serve_codec(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    app = fastapi.FastAPI()
+    serve = Serve(app)
+    # the decorator only accepts AsyncQStash clients
+    qstash_client = AsyncQStash("mock-token")
+    recording_client = AsyncRecordingQStash()
+    monkeypatch.setattr(qstash_client, "message", recording_client.message)
+
+    @serve.post(
+        "/workflow",
+        qstash_client=qstash_client,
+        env={},
+        json_codec=_IndentedCodec(),
+    )
+    async def workflow(context: AsyncWorkflowContext[str]) -> None:
+        await context.run("step-1", lambda: "result-1")
+        await context.run("step-2", lambda: "result-2")
+
+    response = TestClient(app).post(
+        "/workflow",
+        content=json.dumps([encode_message('"initial"'), encode_message(STEP_1)]),
+        headers={
+            WORKFLOW_PROTOCOL_VERSION_HEADER: WORKFLOW_PROTOCOL_VERSION,
+            WORKFLOW_ID_HEADER: "wfr-id",
+        },
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/json"
+    assert response.headers[WORKFLOW_PROTOCOL_VERSION_HEADER] == (
+        WORKFLOW_PROTOCOL_VERSION
+    )
+    assert response.text == json.dumps({"workflowRunId": "wfr-id"}, indent=2)
+    (message,) = recording_client.message.batches[0]
+    assert message["body"]["stepName"] == "step-2"
@@ -0,0 +1,167 @@
+import base64
+import json
+from typing import Any, Dict, List
+import pytest
+from qstash import AsyncQStash
+from qstash.errors import QStashError
+from upstash_workflow.error import WorkflowError
+from upstash_workflow.asyncio.workflow_parser import _parse_request
+from tests.utils import (
+    RequestFields,
+    ResponseFields,
+    MOCK_QSTASH_SERVER_URL,
+)
+from tests.asyncio.utils import mock_qstash_server
+
+
+@pytest.fixture
+def qstash_client() -> AsyncQStash:
+    return AsyncQStash("mock-token", base_url=MOCK_QSTASH_SERVER_URL, retry=False)
+
+
+def _message(message_id: str, value: str, call_type: str = "step") -> Dict[str, Any]:
+    return {
+        "messageId": message_id,
+        "body": base64.b64encode(value.encode()).decode(),
+        "callType": call_type,
+    }
+
+
+def _step(step_id: int) -> str:
+    return json.dumps(
+        {
+            "stepId": step_id,
+            "stepName": f"step-{step_id}",
+            "stepType": "Run",
+            "out": json.dumps(f"result-{step_id}"),
+            "concurrent": 1,
+        }
+    )
+
+
+RUN_STEPS: List[Dict[str, Any]] = [
+    _message("msg-0", "initial"),
+    _message("msg-1", _step(1)),
+    _message("msg-2", _step(2)),
+]
+
+STEPS_REQUEST = RequestFields(
+    method="GET",
+    url=f"{MOCK_QSTASH_SERVER_URL}/v2/workflows/runs/wfr-id",
+    token="mock-token",
+)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("request_payload", ["", '[{"messageId": "msg-0", "bo'])
+async def test_steps_are_fetched(
+    qstash_client: AsyncQStash, request_payload: str
+) -> None:
+    async def execute() -> None:
+        response = await _parse_request(
+            request_payload,
+            False,
+            workflow_run_id="wfr-id",
+            message_id="msg-1",
+            qstash_client=qstash_client,
+        )
+
+        assert not response.workflow_run_ended
+        assert response.raw_initial_payload == "initial"
+        # steps after the delivered message are dropped
+        assert [(step.step_id, step.out) for step in response.steps] == [
+            (0, "initial"),
+            (1, "result-1"),
+        ]
+
+    await mock_qstash_server(
+        execute=execute,
+        response_fields=ResponseFields(status=200, body=RUN_STEPS),
+        receives_request=STEPS_REQUEST,
+    )
+
+
+@pytest.mark.asyncio
+async def test_ended_workflow_run(qstash_client: AsyncQStash) -> None:
+    async def execute() -> None:
+        response = await _parse_request(
+            "",
+            False,
+            workflow_run_id="wfr-id",
+            message_id="msg-1",
+            qstash_client=qstash_client,
+        )
+
+        assert response.workflow_run_ended
+        assert list(response.steps) == []
+
+    await mock_qstash_server(
+        execute=execute,
+        response_fields=ResponseFields(status=404, body="not found"),
+        receives_request=STEPS_REQUEST,
+    )
+
+
+@pytest.mark.asyncio
+async def test_body_is_used_when_present(qstash_client: AsyncQStash) -> None:
+    async def execute() -> None:
+        response = await _parse_request(
+            json.dumps(RUN_STEPS),
+            False,
+            workflow_run_id="wfr-id",
+            message_id="msg-2",
+            qstash_client=qstash_client,
+        )
+
+        assert len(response.steps) == 3
+
+    await mock_qstash_server(
+        execute=execute,
+        response_fields=ResponseFields(status=200, body=RUN_STEPS),
+        receives_request=False,
+    )
+
+
+@pytest.mark.asyncio
+async def test_message_missing_from_fetched_steps(qstash_client: AsyncQStash) -> None:
+    async def execute() -> None:
+        with pytest.raises(WorkflowError, match="Message 'msg-9' .* run 'wfr-id'"):
+            await _parse_request(
+                "",
+                False,
+                workflow_run_id="wfr-id",
+                message_id="msg-9",
+                qstash_client=qstash_client,
+            )
+
+    await mock_qstash_server(
+        execute=execute,
+        response_fields=ResponseFields(status=200, body=RUN_STEPS),
+        receives_request=STEPS_REQUEST,
+    )
+
+
+@pytest.mark.asyncio
+async def test_failed_fetch_is_raised(qstash_client: AsyncQStash) -> None:
+    async def execute() -> None:
+        # only a 404 status means that the run has ended, not a 404 in the body
+        with pytest.raises(QStashError, match="status: 500"):
+            await _parse_request(
+                "",
+                False,
+                workflow_run_id="wfr-id",
+                message_id="msg-1",
+                qstash_client=qstash_client,
+            )
+
+    await mock_qstash_server(
+        execute=execute,
+        response_fields=ResponseFields(status=500, body="status: 404"),
+        receives_request=STEPS_REQUEST,
+    )
+
+
+@pytest.mark.asyncio
+async def test_empty_body_without_client() -> None:
+    with pytest.raises(WorkflowError, match="Only first call can have an empty body"):
+        await _parse_request("", False)
@@ -0,0 +1,64 @@
+import asyncio
+from typing import cast
+import pytest
+from qstash import AsyncQStash
+from upstash_workflow import AsyncWorkflowContext, async_serve
+from upstash_workflow.metrics import (
+    REPLAYED_STEPS,
+    STEP_FUNCTION_SECONDS,
+    QSTASH_PUBLISH_SECONDS,
+    InMemoryMetrics,
+)
+from upstash_workflow.testing import QStashEmulator
+from tests.utils import WORKFLOW_ENDPOINT
+
+
+@pytest.mark.asyncio
+async def test_workflow_run_is_measured() -> None:
+    emulator = QStashEmulator()
+    metrics = InMemoryMetrics()
+
+    async def route(context: AsyncWorkflowContext[str]) -> None:
+        async def step(value: str) -> str:
+            return value
+
+        await asyncio.gather(
+            context.run("step-1", lambda: step("one")),
+            context.run("step-2", lambda: step("two")),
+        )
+
+    handler = async_serve(
+        route,
+        qstash_client=cast(AsyncQStash, emulator.async_client),
+        env={},
+        metrics=metrics,
+    )["handler"]
+    emulator.register(WORKFLOW_ENDPOINT, handler)
+    # a plain request to the endpoint is a first invocation
+    emulator.publish(WORKFLOW_ENDPOINT, '"payload"', {})
+    await emulator.arun()
+
+    for step_name in ["step-1", "step-2"]:
+        histogram = metrics.get(
+            STEP_FUNCTION_SECONDS,
+            workflow_url=WORKFLOW_ENDPOINT,
+            step_name=step_name,
+            step_type="Run",
+        )
+        assert histogram is not None
+        assert histogram.count == 1
+
+    initial = metrics.get(
+        QSTASH_PUBLISH_SECONDS,
+        workflow_url=WORKFLOW_ENDPOINT,
+        step_name="init",
+        step_type="Initial",
+    )
+    assert initial is not None
+
+    replayed_steps = metrics.get(REPLAYED_STEPS, workflow_url=WORKFLOW_ENDPOINT)
+    assert replayed_steps is not None
+    assert replayed_steps.count > 0
+    assert "upstash_workflow_step_function_seconds_bucket" in (
+        metrics.export_prometheus()
+    )
@@ -0,0 +1,188 @@
+import asyncio
+import json
+from typing import Any, List, cast
+import pytest
+from qstash import AsyncQStash
+from qstash.message import convert_to_batch_messages, prepare_batch_message_body
+from upstash_workflow import AsyncWorkflowContext
+from upstash_workflow.asyncio.outbox import BatchOutbox, _get_message_size
+from upstash_workflow.error import WorkflowAbort
+from tests.asyncio.utils import (
+    AsyncRecordingMessageApi,
+    AsyncRecordingQStash,
+    create_context,
+)
+
+
+def _message(body: Any, **kwargs: Any) -> Any:
+    return {"url": "https://requestcatcher.com/api", "body": body, **kwargs}
+
+
+def _context(
+    qstash_client: AsyncRecordingQStash, workflow_run_id: str, outbox: BatchOutbox
+) -> AsyncWorkflowContext[str]:
+    context, _ = create_context(
+        qstash_client=qstash_client,
+        workflow_run_id=workflow_run_id,
+        batch_outbox=outbox,
+    )
+    return context
+
+
+async def _run_step(context: AsyncWorkflowContext[str]) -> None:
+    with pytest.raises(WorkflowAbort):
+        await context.run("step", lambda: context.workflow_run_id)
+
+
+@pytest.mark.asyncio
+async def test_steps_of_concurrent_runs_are_batched() -> None:
+    qstash_client = AsyncRecordingQStash()
+    outbox = BatchOutbox(window=0.01)
+
+    await asyncio.gather(
+        *[
+            _run_step(_context(qstash_client, f"wfr-{index}", outbox))
+            for index in range(3)
+        ]
+    )
+
+    (batch,) = qstash_client.message.batches
+    assert [json.loads(message["body"]["out"]) for message in batch] == [
+        "wfr-0",
+        "wfr-1",
+        "wfr-2",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_full_batch_is_sent_before_window() -> None:
+    qstash_client = AsyncRecordingQStash()
+    outbox = BatchOutbox(window=60, max_messages=2)
+    messages: List[Any] = [_message(index) for index in range(5)]
+
+    await asyncio.wait_for(
+        asyncio.gather(
+            *[
+                outbox.submit(cast(AsyncQStash, qstash_client), [message])
+                for message in messages[:4]
+            ]
+        ),
+        timeout=5,
+    )
+    pending = asyncio.ensure_future(
+        outbox.submit(cast(AsyncQStash, qstash_client), [messages[4]])
+    )
+    # let the submission add its message to the pending batch
+    await asyncio.sleep(0)
+    await outbox.flush()
+    await asyncio.wait_for(pending, timeout=5)
+
+    assert qstash_client.message.batches == [
+        messages[:2],
+        messages[2:4],
+        messages[4:],
+    ]
+
+
+@pytest.mark.asyncio
+async def test_submissions_are_not_split() -> None:
+    qstash_client = AsyncRecordingQStash()
+    outbox = BatchOutbox(window=60, max_messages=2)
+    messages: List[Any] = [_message(index) for index in range(6)]
+
+    first = asyncio.ensure_future(
+        outbox.submit(cast(AsyncQStash, qstash_client), messages[:1])
+    )
+    await asyncio.sleep(0)
+    # doesn't fit in the pending batch, which is sent first
+    second = asyncio.ensure_future(
+        outbox.submit(cast(AsyncQStash, qstash_client), messages[1:3])
+    )
+    await asyncio.sleep(0)
+    # more messages than max_messages are sent in a batch of their own
+    third = asyncio.ensure_future(
+        outbox.submit(cast(AsyncQStash, qstash_client), messages[3:])
+    )
+    await asyncio.sleep(0)
+    await outbox.flush()
+    await asyncio.wait_for(asyncio.gather(first, second, third), timeout=5)
+
+    assert qstash_client.message.batches == [
+        messages[:1],
+        messages[1:3],
+        messages[3:],
+    ]
+
+
+@pytest.mark.asyncio
+async def test_batches_are_split_by_size() -> None:
+    qstash_client = AsyncRecordingQStash()
+    messages: List[Any] = [
+        _message("a" * 3),
+        _message("b" * 3),
+        _message("c" * 3, headers={"Upstash-Forward-Large": "d" * 100}),
+    ]
+    outbox = BatchOutbox(window=0.01, max_bytes=_get_message_size(messages[0]) * 2 + 50)
+
+    await asyncio.gather(
+        *[
+            outbox.submit(cast(AsyncQStash, qstash_client), [message])
+            for message in messages
+        ]
+    )
+
+    # headers count against the limit, and a message larger than the limit is
+    # sent on its own
+    assert qstash_client.message.batches == [messages[:2], messages[2:]]
+
+
+def test_message_size_is_the_size_in_the_batch_request() -> None:
+    messages: List[Any] = [
+        _message("body", headers={"Upstash-Workflow-RunId": "wfr-1"}),
+        _message({"key": "välue"}),
+    ]
+
+    assert sum(_get_message_size(message) for message in messages) == len(
+        prepare_batch_message_body(convert_to_batch_messages(messages)).encode()
+    )
+
+
+@pytest.mark.asyncio
+async def test_batch_failure_is_raised_in_the_failed_run() -> None:
+    class _RejectingMessageApi(AsyncRecordingMessageApi):
+        async def batch_json(self, messages: List[Any]) -> List[Any]:
+            if any(message["body"] == "bad" for message in messages):
+                raise RuntimeError("batch failed")
+            return await super().batch_json(messages)
+
+    qstash_client = AsyncRecordingQStash()
+    qstash_client.message = _RejectingMessageApi()
+    outbox = BatchOutbox(window=0.01)
+
+    results = await asyncio.gather(
+        *[
+            outbox.submit(cast(AsyncQStash, qstash_client), [_message(body)])
+            for body in ("good", "bad")
+        ],
+        return_exceptions=True,
+    )
+
+    assert results[0] is None
+    assert str(results[1]) == "batch failed"
+    assert qstash_client.message.batches == [[_message("good")]]
+
+
+@pytest.mark.asyncio
+async def test_batch_failure_is_raised_in_every_run() -> None:
+    qstash_client = AsyncRecordingQStash(error=RuntimeError("batch failed"))
+    outbox = BatchOutbox(window=0.01)
+
+    results = await asyncio.gather(
+        *[
+            _context(qstash_client, f"wfr-{index}", outbox).run("step", lambda: 1)
+            for index in range(2)
+        ],
+        return_exceptions=True,
+    )
+
+    assert [str(result) for result in results] == ["batch failed", "batch failed"]
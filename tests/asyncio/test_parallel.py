@@ -0,0 +1,162 @@
+import asyncio
+import json
+from typing import Any, List, Optional
+import pytest
+from upstash_workflow.error import WorkflowAbort, WorkflowError
+from upstash_workflow.types import DefaultStep, Step
+from tests.asyncio.utils import create_context
+
+
+def _step(
+    step_id: int,
+    step_name: str,
+    out: Any = None,
+    concurrent: int = 2,
+    target_step: Optional[int] = None,
+) -> DefaultStep:
+    return Step(
+        step_id=step_id,
+        step_name=step_name,
+        step_type="Run",
+        out=out,
+        concurrent=concurrent,
+        target_step=target_step,
+    )
+
+
+INITIAL_STEP = _step(0, "init", out="payload", concurrent=1)
+PLAN_STEPS = [
+    _step(0, "step-a", target_step=1),
+    _step(0, "step-b", target_step=2),
+]
+
+
+class TestAsyncParallelSteps:
+    @pytest.mark.asyncio
+    async def test_first_call_submits_plan_steps(self) -> None:
+        context, qstash_client = create_context([INITIAL_STEP])
+        called: List[str] = []
+
+        async def step_a() -> str:
+            called.append("a")
+            return "result-a"
+
+        with pytest.raises(WorkflowAbort):
+            await asyncio.gather(
+                context.run("step-a", step_a),
+                context.run("step-b", lambda: "result-b"),
+            )
+
+        assert called == []
+        assert len(qstash_client.message.batches) == 1
+        bodies = [message["body"] for message in qstash_client.message.batches[0]]
+        assert [body["stepName"] for body in bodies] == ["step-a", "step-b"]
+        assert [body["targetStep"] for body in bodies] == [1, 2]
+        assert [body["stepId"] for body in bodies] == [0, 0]
+        assert [body["concurrent"] for body in bodies] == [2, 2]
+
+    @pytest.mark.asyncio
+    async def test_partial_call_runs_targeted_step(self) -> None:
+        context, qstash_client = create_context([INITIAL_STEP, *PLAN_STEPS])
+        called: List[str] = []
+
+        def step_a() -> str:
+            called.append("a")
+            return "result-a"
+
+        def step_b() -> str:
+            called.append("b")
+            return "result-b"
+
+        with pytest.raises(WorkflowAbort):
+            await asyncio.gather(
+                context.run("step-a", step_a),
+                context.run("step-b", step_b),
+            )
+
+        assert called == ["b"]
+        (message,) = qstash_client.message.batches[0]
+        assert message["body"]["stepId"] == 2
+        assert message["body"]["concurrent"] == 2
+        assert json.loads(message["body"]["out"]) == "result-b"
+
+    @pytest.mark.asyncio
+    async def test_result_before_all_steps_finish_is_discarded(self) -> None:
+        context, qstash_client = create_context(
+            [INITIAL_STEP, *PLAN_STEPS, _step(2, "step-b", out="result-b")]
+        )
+
+        with pytest.raises(WorkflowAbort) as excinfo:
+            await asyncio.gather(
+                context.run("step-a", lambda: "result-a"),
+                context.run("step-b", lambda: "result-b"),
+            )
+
+        assert excinfo.value.step_name == "discarded parallel"
+        assert qstash_client.message.batches == []
+
+    @pytest.mark.asyncio
+    async def test_last_call_returns_results_and_continues(self) -> None:
+        context, qstash_client = create_context(
+            [
+                INITIAL_STEP,
+                *PLAN_STEPS,
+                _step(2, "step-b", out="result-b"),
+                _step(1, "step-a", out="result-a"),
+            ]
+        )
+
+        results = await asyncio.gather(
+            context.run("step-a", lambda: "result-a"),
+            context.run("step-b", lambda: "result-b"),
+        )
+        assert results == ["result-a", "result-b"]
+
+        with pytest.raises(WorkflowAbort):
+            await context.run("step-c", lambda: "result-c")
+
+        (message,) = qstash_client.message.batches[0]
+        assert message["body"]["stepId"] == 3
+        assert message["body"]["stepName"] == "step-c"
+        assert message["body"]["concurrent"] == 1
+
+    @pytest.mark.asyncio
+    async def test_sequential_steps_after_parallel_steps_are_replayed(self) -> None:
+        context, _ = create_context(
+            [
+                INITIAL_STEP,
+                *PLAN_STEPS,
+                _step(1, "step-a", out="result-a"),
+                _step(2, "step-b", out="result-b"),
+                _step(3, "step-c", out="result-c", concurrent=1),
+            ]
+        )
+
+        await asyncio.gather(
+            context.run("step-a", lambda: "result-a"),
+            context.run("step-b", lambda: "result-b"),
+        )
+        assert await context.run("step-c", lambda: "other") == "result-c"
+
+    @pytest.mark.asyncio
+    async def test_incompatible_parallel_step_count_raises(self) -> None:
+        context, _ = create_context([INITIAL_STEP, *PLAN_STEPS])
+
+        with pytest.raises(WorkflowError, match="Incompatible number of parallel"):
+            await asyncio.gather(
+                context.run("step-a", lambda: "result-a"),
+                context.run("step-b", lambda: "result-b"),
+                context.run("step-c", lambda: "result-c"),
+            )
+
+    @pytest.mark.asyncio
+    async def test_plan_step_targeting_other_step_raises(self) -> None:
+        context, _ = create_context(
+            [INITIAL_STEP, *PLAN_STEPS, _step(0, "step-c", target_step=5)]
+        )
+
+        with pytest.raises(WorkflowError, match="targets step 5"):
+            await asyncio.gather(
+                context.run("step-a", lambda: "result-a"),
+                context.run("step-b", lambda: "result-b"),
+            )
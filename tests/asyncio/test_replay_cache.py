@@ -0,0 +1,43 @@
+from typing import List, cast
+import pytest
+from qstash import AsyncQStash
+from upstash_workflow import AsyncWorkflowContext, async_serve
+from upstash_workflow.metrics import REPLAY_CACHE_HITS, InMemoryMetrics
+from upstash_workflow.replay_cache import InMemoryReplayCache
+from upstash_workflow.testing import QStashEmulator
+from tests.utils import WORKFLOW_ENDPOINT
+
+
+@pytest.mark.asyncio
+async def test_workflow_run_uses_replay_cache() -> None:
+    emulator = QStashEmulator()
+    cache = InMemoryReplayCache()
+    metrics = InMemoryMetrics()
+    results: List[str] = []
+
+    async def route(context: AsyncWorkflowContext[str]) -> None:
+        async def step(value: str) -> str:
+            return value
+
+        first = await context.run("step-1", lambda: step("one"))
+        second = await context.run("step-2", lambda: step(f"{first}-two"))
+        results.append(await context.run("step-3", lambda: step(f"{second}-three")))
+
+    handler = async_serve(
+        route,
+        qstash_client=cast(AsyncQStash, emulator.async_client),
+        env={},
+        replay_cache=cache,
+        metrics=metrics,
+    )["handler"]
+    emulator.register(WORKFLOW_ENDPOINT, handler)
+    run_id = emulator.trigger(WORKFLOW_ENDPOINT, '"payload"')
+    await emulator.arun()
+
+    assert emulator.runs[run_id].state == "RUN_SUCCESS"
+    assert results == ["one-two-three"]
+    assert cache.misses == 3
+    assert cache.hits == 3
+
+    hits = metrics.get(REPLAY_CACHE_HITS, workflow_url=WORKFLOW_ENDPOINT)
+    assert hits is not None and hits.sum == 3
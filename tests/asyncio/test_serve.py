@@ -0,0 +1,91 @@
+import json
+from typing import Any, Dict, List, cast
+import pytest
+from qstash import AsyncQStash
+from upstash_workflow import async_serve, AsyncWorkflowContext
+from upstash_workflow.asyncio.serve.authorization import _get_disabled_qstash_client
+from upstash_workflow.constants import (
+    WORKFLOW_ID_HEADER,
+    WORKFLOW_PROTOCOL_VERSION,
+    WORKFLOW_PROTOCOL_VERSION_HEADER,
+)
+from upstash_workflow.workflow_types import _AsyncRequest, _Response
+from tests.utils import WORKFLOW_ENDPOINT, encode_message
+from tests.asyncio.utils import AsyncRecordingQStash
+
+
+def _replay_request(*steps: Dict[str, Any]) -> _AsyncRequest:
+    return _AsyncRequest(
+        _body=json.dumps(
+            [encode_message('"initial"')]
+            + [encode_message(json.dumps(step)) for step in steps]
+        ).encode(),
+        headers={
+            WORKFLOW_PROTOCOL_VERSION_HEADER: WORKFLOW_PROTOCOL_VERSION,
+            WORKFLOW_ID_HEADER: "wfr-id",
+        },
+        method="POST",
+        url=WORKFLOW_ENDPOINT,
+    )
+
+
+STEP_1 = {
+    "stepId": 1,
+    "stepName": "step-1",
+    "stepType": "Run",
+    "out": json.dumps("result-1"),
+    "concurrent": 1,
+}
+
+
+def _handler(
+    qstash_client: AsyncRecordingQStash, calls: List[str], authenticated: bool
+) -> Any:
+    async def route(context: AsyncWorkflowContext[str]) -> None:
+        calls.append("preamble")
+        if not authenticated:
+            return
+        await context.run("step-1", lambda: "result-1")
+        await context.run("step-2", lambda: "result-2")
+
+    return async_serve(
+        route,
+        qstash_client=cast(AsyncQStash, qstash_client),
+        env={},
+        inline_authentication=True,
+    )["handler"]
+
+
+class TestAsyncInlineAuthentication:
+    @pytest.mark.asyncio
+    async def test_route_function_runs_once(self) -> None:
+        qstash_client = AsyncRecordingQStash()
+        calls: List[str] = []
+
+        response = cast(
+            _Response,
+            await _handler(qstash_client, calls, True)(_replay_request(STEP_1)),
+        )
+
+        assert response.status == 200
+        assert calls == ["preamble"]
+        (message,) = qstash_client.message.batches[0]
+        assert message["body"]["stepName"] == "step-2"
+
+    @pytest.mark.asyncio
+    async def test_return_before_step_fails_authentication(self) -> None:
+        qstash_client = AsyncRecordingQStash()
+        calls: List[str] = []
+
+        response = cast(
+            _Response,
+            await _handler(qstash_client, calls, False)(_replay_request(STEP_1)),
+        )
+
+        assert response.status == 400
+        assert calls == ["preamble"]
+        assert qstash_client.http.requests == []
+
+
+def test_disabled_qstash_client_is_shared() -> None:
+    assert _get_disabled_qstash_client() is _get_disabled_qstash_client()
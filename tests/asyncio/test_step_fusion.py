@@ -0,0 +1,118 @@
+import json
+from typing import Any, Dict, List, cast
+import pytest
+from qstash import AsyncQStash
+from upstash_workflow import AsyncWorkflowContext, async_serve
+from upstash_workflow.error import WorkflowAbort
+from upstash_workflow.workflow_parser import _parse_payload
+from upstash_workflow.testing import QStashEmulator
+from tests.utils import WORKFLOW_ENDPOINT, encode_message
+from tests.asyncio.utils import create_context
+
+
+def _payload(bodies: List[Dict[str, Any]]) -> str:
+    """
+    Creates a request body from the bodies of the messages sent to QStash
+    """
+    return json.dumps(
+        [encode_message("initial")]
+        + [encode_message(json.dumps(body)) for body in bodies]
+    )
+
+
+async def _route(context: AsyncWorkflowContext[str], called: List[str]) -> None:
+    def step(name: str) -> Any:
+        async def _step() -> Any:
+            called.append(name)
+            return {"name": name}
+
+        return _step
+
+    for name in ("step-1", "step-2", "step-3"):
+        await context.run(name, step(name))
+    await context.sleep("sleep", 10)
+
+
+class TestAsyncStepFusion:
+    @pytest.mark.asyncio
+    async def test_run_steps_are_sent_in_one_message(self) -> None:
+        context, qstash_client = create_context(invocation_time_budget=60)
+        called: List[str] = []
+
+        with pytest.raises(WorkflowAbort):
+            await _route(context, called)
+
+        assert called == ["step-1", "step-2", "step-3"]
+        (message,) = qstash_client.message.batches[0]
+        assert message["body"]["stepId"] == 3
+        assert [step["stepId"] for step in message["body"]["fusedSteps"]] == [1, 2]
+
+    @pytest.mark.asyncio
+    async def test_fused_steps_are_replayed(self) -> None:
+        context, qstash_client = create_context(invocation_time_budget=60)
+        with pytest.raises(WorkflowAbort):
+            await _route(context, [])
+        (message,) = qstash_client.message.batches[0]
+
+        _, steps = _parse_payload(_payload([message["body"]]))
+        context, qstash_client = create_context(steps, invocation_time_budget=60)
+        called: List[str] = []
+
+        with pytest.raises(WorkflowAbort):
+            await _route(context, called)
+
+        assert called == []
+        (sleep_message,) = qstash_client.message.batches[0]
+        assert sleep_message["body"]["stepId"] == 4
+        assert "fusedSteps" not in sleep_message["body"]
+
+    @pytest.mark.asyncio
+    async def test_exhausted_budget_sends_each_step(self) -> None:
+        context, qstash_client = create_context(invocation_time_budget=0)
+        called: List[str] = []
+
+        with pytest.raises(WorkflowAbort):
+            await _route(context, called)
+
+        assert called == ["step-1"]
+        (message,) = qstash_client.message.batches[0]
+        assert "fusedSteps" not in message["body"]
+
+
+@pytest.mark.asyncio
+async def test_kept_steps_are_sent_when_a_later_step_fails(
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    emulator = QStashEmulator()
+    called: List[str] = []
+
+    async def route(context: AsyncWorkflowContext[str]) -> None:
+        def step(name: str) -> Any:
+            async def _step() -> str:
+                called.append(name)
+                if name == "step-3" and called.count(name) == 1:
+                    raise ValueError("step failed")
+                return name
+
+            return _step
+
+        for name in ("step-1", "step-2", "step-3"):
+            await context.run(name, step(name))
+
+    handler = async_serve(
+        route,
+        qstash_client=cast(AsyncQStash, emulator.async_client),
+        env={},
+        invocation_time_budget=60,
+    )["handler"]
+    emulator.register(WORKFLOW_ENDPOINT, handler)
+    workflow_run_id = emulator.trigger(WORKFLOW_ENDPOINT, "payload")
+    await emulator.arun()
+
+    # the first two steps are not executed again when the third is retried
+    assert called == ["step-1", "step-2", "step-3", "step-3"]
+    assert emulator.runs[workflow_run_id].state == "RUN_SUCCESS"
+    # the error of the failed step is logged
+    (record,) = [record for record in caplog.records if "failed" in record.getMessage()]
+    assert record.exc_info is not None
+    assert str(record.exc_info[1]) == "step failed"
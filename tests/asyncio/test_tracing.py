@@ -0,0 +1,56 @@
+import asyncio
+from typing import cast
+import pytest
+from qstash import AsyncQStash
+from upstash_workflow import AsyncWorkflowContext, async_serve
+from upstash_workflow.tracing import InMemoryTracer
+from upstash_workflow.testing import QStashEmulator
+from tests.utils import WORKFLOW_ENDPOINT
+
+
+@pytest.mark.asyncio
+async def test_parallel_steps_are_traced() -> None:
+    emulator = QStashEmulator()
+    tracer = InMemoryTracer()
+
+    async def route(context: AsyncWorkflowContext[str]) -> None:
+        async def step(value: str) -> str:
+            return value
+
+        await asyncio.gather(
+            context.run("step-1", lambda: step("one")),
+            context.run("step-2", lambda: step("two")),
+        )
+
+    handler = async_serve(
+        route,
+        qstash_client=cast(AsyncQStash, emulator.async_client),
+        env={},
+        tracer=tracer,
+    )["handler"]
+    emulator.register(WORKFLOW_ENDPOINT, handler)
+    # a plain request to the endpoint is a first invocation
+    emulator.publish(WORKFLOW_ENDPOINT, '"payload"', {})
+    await emulator.arun()
+
+    spans = tracer.spans
+    spans_by_id = {span.context.span_id: span for span in spans}
+    invocations = [span for span in spans if span.name == "workflow.invocation"]
+
+    # all invocations of the run are in the trace started by the first one
+    assert len({span.context.trace_id for span in spans}) == 1
+    assert invocations[0].parent_span_id is None
+    for invocation in invocations[1:]:
+        assert invocation.parent_span_id is not None
+        assert spans_by_id[invocation.parent_span_id].name in (
+            "qstash.publish",
+            "qstash.batch",
+        )
+
+    steps = sorted(
+        str(span.attributes["workflow.step.name"])
+        for span in spans
+        if span.name == "workflow.step"
+    )
+    assert steps == ["step-1", "step-2"]
+    assert all(span.error is None for span in spans)
@@ -1,7 +1,16 @@
+import asyncio
 import json
 from aiohttp import web
-from typing import Any, Union, Callable
-from tests.utils import MOCK_QSTASH_SERVER_PORT, RequestFields, ResponseFields
+from typing import Any, List, Optional, Sequence, Tuple, Union, Callable, cast
+from qstash import AsyncQStash
+from upstash_workflow import AsyncWorkflowContext
+from upstash_workflow.types import DefaultStep
+from tests.utils import (
+    MOCK_QSTASH_SERVER_PORT,
+    WORKFLOW_ENDPOINT,
+    RequestFields,
+    ResponseFields,
+)
 
 
 async def mock_qstash_server(
@@ -51,8 +60,11 @@ async def mock_qstash_server(
                 text=f"assertion in mock QStash failed: {str(error)}", status=400
             )
 
+        # lists are returned as they are, like the steps of a workflow run
         return web.json_response(
-            data=[{"messageId": response_fields.body, "deduplicated": False}],
+            data=response_fields.body
+            if isinstance(response_fields.body, list)
+            else [{"messageId": response_fields.body, "deduplicated": False}],
             status=response_fields.status,
         )
 
@@ -69,3 +81,73 @@ async def mock_qstash_server(
         assert called == should_be_called
     finally:
         await runner.cleanup()
+
+
+class AsyncRecordingMessageApi:
+    def __init__(self, error: Optional[Exception] = None) -> None:
+        self.batches: List[List[Any]] = []
+        self.error = error
+
+    async def batch_json(self, messages: List[Any]) -> List[Any]:
+        await asyncio.sleep(0)
+        if self.error:
+            raise self.error
+        self.batches.append(messages)
+        return []
+
+
+class AsyncRecordingHttp:
+    def __init__(self, error: Optional[Exception] = None, delay: float = 0) -> None:
+        self.error = error
+        self.delay = delay
+        self.requests: List[Tuple[str, str]] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def request(self, path: str, method: str, **kwargs: Any) -> Any:
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(self.delay)
+        self.in_flight -= 1
+        self.requests.append((method, path))
+        if self.error:
+            raise self.error
+        return ""
+
+
+class AsyncRecordingQStash:
+    """
+    Async QStash client which records the batches and requests sent by the
+    SDK instead of sending them
+
+    :param error: error raised by every batch and request
+    :param delay: seconds each request takes
+    """
+
+    def __init__(self, error: Optional[Exception] = None, delay: float = 0) -> None:
+        self.message = AsyncRecordingMessageApi(error)
+        self.http = AsyncRecordingHttp(error, delay)
+
+
+def create_context(
+    steps: Sequence[DefaultStep] = (),
+    qstash_client: Optional[AsyncRecordingQStash] = None,
+    **kwargs: Any,
+) -> Tuple[AsyncWorkflowContext[str], AsyncRecordingQStash]:
+    """
+    Creates a context of the run "wfr-id" sending its steps to a recording
+    client. Keyword arguments are passed to the context.
+    """
+    if qstash_client is None:
+        qstash_client = AsyncRecordingQStash()
+    context = AsyncWorkflowContext(
+        qstash_client=cast(AsyncQStash, qstash_client),
+        workflow_run_id=kwargs.pop("workflow_run_id", "wfr-id"),
+        headers={},
+        steps=steps,
+        url=WORKFLOW_ENDPOINT,
+        initial_payload="initial",
+        failure_url=None,
+        **kwargs,
+    )
+    return context, qstash_client
@@ -0,0 +1,238 @@
+import http.server
+import json
+import socketserver
+import threading
+import time
+from typing import Any, Iterator, List, Tuple
+import httpx
+import pytest
+from upstash_workflow import Client, WorkflowError
+from upstash_workflow.workflow_requests import _get_headers
+from tests.utils import (
+    MOCK_QSTASH_SERVER_PORT,
+    MOCK_QSTASH_SERVER_URL,
+    WORKFLOW_ENDPOINT,
+)
+
+
+class _ThreadedServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+@pytest.fixture
+def client_addresses() -> Iterator[List[Tuple[str, int]]]:
+    """
+    Runs a keep-alive server and yields the addresses of the clients it serves
+    """
+    addresses: List[Tuple[str, int]] = []
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self) -> None:
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            addresses.append(self.client_address)
+            if "failing" in self.path:
+                self.send_response(500)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-type", "application/json")
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"[]")
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+    server = _ThreadedServer(("localhost", MOCK_QSTASH_SERVER_PORT), Handler)
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+    try:
+        yield addresses
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_connections_are_reused(client_addresses: List[Tuple[str, int]]) -> None:
+    with Client(token="test-token", base_url=MOCK_QSTASH_SERVER_URL) as client:
+        for _ in range(3):
+            assert client.notify("event-id", event_data={"approved": True}) == []
+
+    assert len(client_addresses) == 3
+    assert len(set(client_addresses)) == 1
+
+
+def test_close() -> None:
+    client = Client(token="test-token")
+    assert not client.is_closed
+
+    with client:
+        pass
+
+    assert client.is_closed
+
+
+def test_default_client(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(Client, "_default", None)
+    monkeypatch.delenv("QSTASH_TOKEN", raising=False)
+    with pytest.raises(WorkflowError, match="QSTASH_TOKEN"):
+        Client.default()
+
+    monkeypatch.setenv("QSTASH_TOKEN", "env-token")
+    monkeypatch.setenv("QSTASH_URL", "https://custom.qstash.io")
+    client = Client.default()
+
+    assert client is Client.default()
+    assert client._base_url == "https://custom.qstash.io"
+
+    # a closed default client is replaced
+    client.close()
+    assert Client.default() is not client
+    Client.default().close()
+
+
+def test_notify_many(client_addresses: List[Tuple[str, int]]) -> None:
+    notifications = [
+        ("event-0", {"index": 0}, None),
+        ("failing-event", None, None),
+        ("event-2", "data", "wfr-id"),
+    ]
+
+    with Client(token="test-token", base_url=MOCK_QSTASH_SERVER_URL) as client:
+        results = sorted(
+            client.notify_many(notifications, concurrency=2),
+            key=lambda result: result.index,
+        )
+
+    assert [(result.event_id, result.workflow_run_id) for result in results] == [
+        ("event-0", None),
+        ("failing-event", None),
+        ("event-2", "wfr-id"),
+    ]
+    assert results[0].error is None and results[0].responses == []
+    assert isinstance(results[1].error, httpx.HTTPStatusError)
+    assert results[2].error is None
+
+
+def test_notify_many_bounds_concurrency(monkeypatch: pytest.MonkeyPatch) -> None:
+    client = Client(token="test-token")
+    lock = threading.Lock()
+    running = [0]
+    peak = [0]
+
+    def notify(*args: Any) -> List[Any]:
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.01)
+        with lock:
+            running[0] -= 1
+        return []
+
+    monkeypatch.setattr(client, "notify", notify)
+    results = list(
+        client.notify_many(
+            ((f"event-{index}", None, None) for index in range(10)), concurrency=3
+        )
+    )
+
+    assert sorted(result.index for result in results) == list(range(10))
+    assert peak[0] == 3
+
+    with pytest.raises(WorkflowError, match="concurrency"):
+        list(client.notify_many([], concurrency=0))
+
+
+@pytest.fixture
+def batch_requests() -> Iterator[Tuple[List[Any], List[int]]]:
+    """
+    Runs a server accepting batch requests. Yields the received batches and a
+    list with the number of requests to fail before accepting them.
+    """
+    batches: List[Any] = []
+    failures = [0]
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_POST(self) -> None:
+            messages = json.loads(
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            )
+            if failures[0]:
+                failures[0] -= 1
+                self.send_response(500)
+                self.end_headers()
+                return
+
+            batches.append(messages)
+            self.send_response(200)
+            self.send_header("Content-type", "application/json")
+            self.end_headers()
+            self.wfile.write(
+                json.dumps([{"messageId": "msg-id"} for _ in messages]).encode()
+            )
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+    server = _ThreadedServer(("localhost", MOCK_QSTASH_SERVER_PORT), Handler)
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+    try:
+        yield batches, failures
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_trigger_many(batch_requests: Tuple[List[Any], List[int]]) -> None:
+    batches, failures = batch_requests
+    failures[0] = 1
+
+    with Client(token="test-token", base_url=MOCK_QSTASH_SERVER_URL) as client:
+        workflow_run_ids = client.trigger_many(
+            WORKFLOW_ENDPOINT,
+            [{"index": index} for index in range(5)],
+            headers={"my-header": "my-value"},
+            batch_size=2,
+        )
+
+    # the failed batch is retried
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    messages = [message for batch in batches for message in batch]
+    assert len(set(workflow_run_ids)) == 5
+    assert all(run_id.startswith("wfr_") for run_id in workflow_run_ids)
+    assert [json.loads(message["body"]) for message in messages] == [
+        {"index": index} for index in range(5)
+    ]
+
+    for message, workflow_run_id in zip(messages, workflow_run_ids):
+        assert message["destination"] == WORKFLOW_ENDPOINT
+        assert message["headers"] == {
+            "Content-Type": "application/json",
+            "Upstash-Deduplication-Id": workflow_run_id,
+            **_get_headers(
+                "true",
+                workflow_run_id,
+                WORKFLOW_ENDPOINT,
+                {"my-header": "my-value"},
+                None,
+                3,
+            ).headers,
+        }
+
+
+def test_trigger_many_fails_after_retries(
+    batch_requests: Tuple[List[Any], List[int]],
+) -> None:
+    batches, failures = batch_requests
+    failures[0] = 2
+
+    with Client(token="test-token", base_url=MOCK_QSTASH_SERVER_URL) as client:
+        with pytest.raises(WorkflowError, match="0 runs were triggered"):
+            client.trigger_many(WORKFLOW_ENDPOINT, ["a", "b"], chunk_retries=1)
+
+    assert batches == []
@@ -0,0 +1,168 @@
+import base64
+import json
+import math
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Union, cast
+import pytest
+from qstash import QStash
+from upstash_workflow import WorkflowContext, serve
+from upstash_workflow.client import _get_trigger_chunks
+from upstash_workflow.codec import (
+    JSONCodec,
+    MsgspecCodec,
+    OrjsonCodec,
+    _get_default_json_codec,
+)
+from upstash_workflow.workflow_parser import _parse_payload
+from upstash_workflow.testing import QStashEmulator
+from tests.utils import WORKFLOW_ENDPOINT
+
+
+def _codecs() -> List[JSONCodec]:
+    codecs = [JSONCodec()]
+    for codec_class in (OrjsonCodec, MsgspecCodec):
+        try:
+            codecs.append(codec_class())
+        except ImportError:
+            pass
+    return codecs
+
+
+def _encode(value: str) -> str:
+    return base64.b64encode(value.encode()).decode()
+
+
+PAYLOAD = json.dumps(
+    [
+        {"messageId": "msg-0", "body": _encode('"initial"'), "callType": "step"},
+        {
+            "messageId": "msg-1",
+            "body": _encode(
+                json.dumps(
+                    {
+                        "stepId": 1,
+                        "stepName": "step-1",
+                        "stepType": "Run",
+                        "out": json.dumps("result"),
+                        "concurrent": 1,
+                    }
+                )
+            ),
+            "callType": "step",
+        },
+    ]
+)
+
+
+class _CountingCodec(JSONCodec):
+    def __init__(self) -> None:
+        self.loads_count = 0
+        self.dumps_count = 0
+
+    def dumps(self, value: Any) -> str:
+        self.dumps_count += 1
+        return super().dumps(value)
+
+    def loads(self, value: Union[str, bytes]) -> Any:
+        self.loads_count += 1
+        return super().loads(value)
+
+
+class TestJSONCodec:
+    @pytest.mark.parametrize("codec", _codecs(), ids=lambda codec: type(codec).__name__)
+    def test_round_trip(self, codec: JSONCodec) -> None:
+        value = {"key": ["value", 1, 2.5, True, None], "nested": {"a": "ü"}}
+
+        assert json.loads(codec.dumps(value)) == value
+        assert codec.loads(codec.dumps(value)) == value
+        assert codec.loads(codec.dumps(value).encode()) == value
+
+    @pytest.mark.parametrize("codec", _codecs(), ids=lambda codec: type(codec).__name__)
+    def test_falls_back_to_standard_library(self, codec: JSONCodec) -> None:
+        assert codec.dumps(2**70) == json.dumps(2**70)
+        assert json.loads(codec.dumps({1: "a"})) == {"1": "a"}
+
+    @pytest.mark.parametrize(
+        "codec", _codecs()[1:], ids=lambda codec: type(codec).__name__
+    )
+    def test_differences_from_standard_library(self, codec: JSONCodec) -> None:
+        @dataclass
+        class Point:
+            x: int
+
+        assert codec.dumps(math.nan) == "null"
+        assert json.loads(codec.dumps(datetime(2024, 1, 2))) == "2024-01-02T00:00:00"
+        assert json.loads(codec.dumps(Point(1))) == {"x": 1}
+
+    @pytest.mark.parametrize("codec", _codecs(), ids=lambda codec: type(codec).__name__)
+    def test_invalid_json_raises_decode_error(self, codec: JSONCodec) -> None:
+        with pytest.raises(json.JSONDecodeError):
+            codec.loads("not-json")
+
+    def test_default_codec(self) -> None:
+        codec = _get_default_json_codec()
+
+        assert codec is _get_default_json_codec()
+        try:
+            import orjson  # noqa: F401
+        except ImportError:
+            pass
+        else:
+            assert isinstance(codec, OrjsonCodec)
+
+    def test_parser_uses_codec(self) -> None:
+        codec = _CountingCodec()
+        _, steps = _parse_payload(PAYLOAD, codec)
+
+        assert codec.loads_count == 1
+        assert steps[1].out == "result"
+        # body and output of the step
+        assert codec.loads_count == 3
+
+    def test_trigger_many_uses_codec(self) -> None:
+        codec = _CountingCodec()
+        ((_, body),) = _get_trigger_chunks(
+            WORKFLOW_ENDPOINT, [{"a": 1}, {"b": 2}], None, 3, None, 10, codec
+        )
+
+        assert codec.dumps_count == 2
+        assert [json.loads(message["body"]) for message in json.loads(body)] == [
+            {"a": 1},
+            {"b": 2},
+        ]
+
+    def test_failure_function_uses_codec(self) -> None:
+        emulator = QStashEmulator()
+        codec = _CountingCodec()
+        failure_codecs: List[JSONCodec] = []
+
+        def route(context: WorkflowContext[str]) -> None:
+            def fail() -> None:
+                raise ValueError("step failed")
+
+            context.run("fail", fail)
+
+        def failure_function(
+            context: WorkflowContext[str],
+            status: int,
+            response: str,
+            headers: Dict[str, str],
+        ) -> None:
+            failure_codecs.append(context.json_codec)
+
+        handler = serve(
+            route,
+            qstash_client=cast(QStash, emulator.client),
+            env={},
+            retries=0,
+            failure_function=failure_function,
+            json_codec=codec,
+        )["handler"]
+        emulator.register(WORKFLOW_ENDPOINT, handler)
+        emulator.trigger(
+            WORKFLOW_ENDPOINT, "payload", retries=0, failure_url=WORKFLOW_ENDPOINT
+        )
+        emulator.run()
+
+        assert failure_codecs == [codec]
@@ -0,0 +1,76 @@
+import base64
+import json
+import zlib
+import pytest
+from upstash_workflow.compression import (
+    _compress_step_output,
+    _decompress_step_output,
+    _get_zstandard,
+)
+from upstash_workflow.error import WorkflowAbort, WorkflowError
+from upstash_workflow.store import InMemoryStepOutputStore
+from upstash_workflow.workflow_parser import _parse_payload
+from tests.utils import create_context, encode_message
+
+
+class TestCompression:
+    def test_round_trip(self) -> None:
+        out = json.dumps({"data": "a" * 1000})
+        compressed = _compress_step_output(out, 100)
+
+        assert compressed.startswith(("@zlib:", "@zstd:"))
+        assert len(compressed) < len(out)
+        assert _decompress_step_output(compressed) == out
+
+    def test_threshold(self) -> None:
+        out = json.dumps("a" * 1000)
+
+        assert _compress_step_output(out, None) == out
+        assert _compress_step_output(out, len(out)) == out
+        assert _compress_step_output(out, len(out) - 1) != out
+
+    def test_incompressible_output_is_kept(self) -> None:
+        out = json.dumps(base64.b64encode(bytes(range(256))).decode())
+
+        assert _compress_step_output(out, 0) == out
+
+    def test_uncompressed_output_is_returned(self) -> None:
+        assert _decompress_step_output('"value"') == '"value"'
+
+    def test_zlib_output_is_decompressed(self) -> None:
+        out = json.dumps("a" * 1000)
+        compressed = "@zlib:" + base64.b64encode(zlib.compress(out.encode())).decode()
+
+        assert _decompress_step_output(compressed) == out
+
+    @pytest.mark.skipif(_get_zstandard() is not None, reason="zstandard is installed")
+    def test_zstd_output_without_zstandard(self) -> None:
+        with pytest.raises(WorkflowError, match="zstandard is not installed"):
+            _decompress_step_output("@zstd:AAAA")
+
+    def test_outputs_are_compressed_and_decompressed(self) -> None:
+        store = InMemoryStepOutputStore(threshold=10)
+        context, qstash_client = create_context(
+            step_output_store=store,
+            compression_threshold=100,
+        )
+        large_output = {"data": "a" * 1000}
+
+        with pytest.raises(WorkflowAbort):
+            context.run("step-1", lambda: large_output)
+
+        # output is compressed first, then offloaded since it's still large
+        (message,) = qstash_client.message.batches[0]
+        reference = message["body"]["out"]
+        assert reference.startswith("@store:wfr-id/1-")
+        assert store.get("wfr-id", reference.rsplit("/", 1)[1]).startswith(
+            ("@zlib:", "@zstd:")
+        )
+
+        payload = json.dumps(
+            [encode_message('"initial"'), encode_message(json.dumps(message["body"]))]
+        )
+        _, steps = _parse_payload(
+            payload, step_output_store=store, workflow_run_id="wfr-id"
+        )
+        assert steps[1].out == large_output
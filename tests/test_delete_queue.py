@@ -0,0 +1,73 @@
+import logging
+from typing import cast
+import pytest
+from qstash import QStash
+from upstash_workflow.delete_queue import DeleteQueue
+from upstash_workflow.workflow_requests import _trigger_workflow_delete
+from tests.utils import RecordingQStash, create_context
+
+
+def test_runs_are_deleted() -> None:
+    qstash_client = RecordingQStash()
+    queue = DeleteQueue()
+
+    for index in range(10):
+        queue.enqueue(cast(QStash, qstash_client), f"wfr-{index}", cancel=index == 0)
+    queue.drain()
+
+    assert sorted(qstash_client.http.requests) == sorted(
+        [("DELETE", "/v2/workflows/runs/wfr-0?cancel=true")]
+        + [
+            ("DELETE", f"/v2/workflows/runs/wfr-{index}?cancel=false")
+            for index in range(1, 10)
+        ]
+    )
+    queue.close()
+
+
+def test_concurrency_is_bounded() -> None:
+    qstash_client = RecordingQStash(delay=0.01)
+    queue = DeleteQueue(max_workers=2)
+
+    for index in range(8):
+        queue.enqueue(cast(QStash, qstash_client), f"wfr-{index}")
+    queue.close()
+
+    assert len(qstash_client.http.requests) == 8
+    assert qstash_client.http.max_in_flight == 2
+
+
+def test_errors_are_logged(caplog: pytest.LogCaptureFixture) -> None:
+    qstash_client = RecordingQStash(error=RuntimeError("delete failed"))
+    queue = DeleteQueue()
+
+    with caplog.at_level(logging.ERROR):
+        queue.enqueue(cast(QStash, qstash_client), "wfr-id")
+        queue.drain()
+
+    assert "Failed to delete workflow run wfr-id" in caplog.text
+    queue.close()
+
+
+def test_runs_are_deleted_inline_after_close() -> None:
+    qstash_client = RecordingQStash()
+    queue = DeleteQueue()
+    queue.close()
+
+    queue.enqueue(cast(QStash, qstash_client), "wfr-id")
+
+    assert qstash_client.http.requests == [
+        ("DELETE", "/v2/workflows/runs/wfr-id?cancel=false")
+    ]
+
+
+def test_trigger_workflow_delete_with_queue() -> None:
+    queue = DeleteQueue()
+    context, qstash_client = create_context()
+
+    _trigger_workflow_delete(context, delete_queue=queue)
+    queue.close()
+
+    assert qstash_client.http.requests == [
+        ("DELETE", "/v2/workflows/runs/wfr-id?cancel=false")
+    ]
@@ -0,0 +1,224 @@
+import time
+from typing import Any, Dict, List, cast
+from qstash import QStash
+from upstash_workflow import Client, WorkflowContext, serve
+from upstash_workflow.workflow_types import _Response, _SyncRequest
+from upstash_workflow.testing import QStashEmulator, VirtualClock
+from tests.utils import WORKFLOW_ENDPOINT
+
+THIRD_PARTY_ENDPOINT = "https://third-party.com/api"
+
+
+def _serve(emulator: QStashEmulator, route: Any, **kwargs: Any) -> None:
+    handler = serve(
+        route, qstash_client=cast(QStash, emulator.client), env={}, **kwargs
+    )["handler"]
+    emulator.register(WORKFLOW_ENDPOINT, handler)
+
+
+def test_steps_run_to_completion() -> None:
+    emulator = QStashEmulator()
+    results: List[Any] = []
+
+    def route(context: WorkflowContext[Dict[str, int]]) -> None:
+        total = context.run("add", lambda: context.request_payload["a"] + 1)
+        doubled = context.run("double", lambda: total * 2)
+        results.append(doubled)
+
+    _serve(emulator, route)
+    workflow_run_id = emulator.trigger(WORKFLOW_ENDPOINT, {"a": 1})
+    emulator.run()
+
+    run = emulator.runs[workflow_run_id]
+    assert run.state == "RUN_SUCCESS"
+    # initial payload and two steps
+    assert len(run.history) == 3
+    assert results == [4]
+    assert emulator.failed == []
+
+
+def test_sleep_uses_virtual_clock() -> None:
+    emulator = QStashEmulator(VirtualClock(1_000_000))
+    start = emulator.clock.now
+    woke_up: List[float] = []
+
+    def route(context: WorkflowContext[str]) -> None:
+        context.sleep("sleep", "1d")
+        context.sleep_until("sleep-until", start + 2 * 86400)
+        context.run("after", lambda: woke_up.append(emulator.clock.now))
+
+    _serve(emulator, route)
+    emulator.trigger(WORKFLOW_ENDPOINT, "payload")
+
+    wall_clock_start = time.monotonic()
+    emulator.run()
+
+    assert time.monotonic() - wall_clock_start < 5
+    assert woke_up == [start + 2 * 86400]
+
+
+def test_wait_for_event() -> None:
+    emulator = QStashEmulator()
+    results: List[Any] = []
+
+    def route(context: WorkflowContext[str]) -> None:
+        result = cast(
+            Dict[str, Any],
+            context.wait_for_event("wait", "event-id", timeout="1h"),
+        )
+        results.append((result["event_data"], result["timeout"]))
+
+    _serve(emulator, route)
+    workflow_run_id = emulator.trigger(WORKFLOW_ENDPOINT, "payload")
+    emulator.run(until=emulator.clock.now)
+
+    (response,) = emulator.notify("event-id", '{"approved": true}')
+    assert response["waiter"]["url"] == WORKFLOW_ENDPOINT
+    emulator.run()
+
+    assert results == [('{"approved": true}', False)]
+    assert emulator.runs[workflow_run_id].state == "RUN_SUCCESS"
+
+
+def test_wait_for_event_timeout() -> None:
+    emulator = QStashEmulator()
+    start = emulator.clock.now
+    results: List[Any] = []
+
+    def route(context: WorkflowContext[str]) -> None:
+        result = cast(
+            Dict[str, Any],
+            context.wait_for_event("wait", "event-id", timeout="1h"),
+        )
+        results.append((result["event_data"], result["timeout"]))
+
+    _serve(emulator, route)
+    emulator.trigger(WORKFLOW_ENDPOINT, "payload")
+    emulator.run()
+
+    assert results == [(None, True)]
+    assert emulator.clock.now == start + 3600
+    assert emulator.notify("event-id", "late") == []
+
+
+def test_parallel_steps() -> None:
+    emulator = QStashEmulator()
+    results: List[Any] = []
+
+    def route(context: WorkflowContext[str]) -> None:
+        outputs = context.parallel(
+            [
+                ("step-1", lambda: "one"),
+                ("step-2", lambda: "two"),
+                ("step-3", lambda: "three"),
+            ]
+        )
+        results.append(outputs)
+
+    _serve(emulator, route)
+    workflow_run_id = emulator.trigger(WORKFLOW_ENDPOINT, "payload")
+    emulator.run()
+
+    assert results == [["one", "two", "three"]]
+    assert emulator.runs[workflow_run_id].state == "RUN_SUCCESS"
+
+
+def test_third_party_call() -> None:
+    emulator = QStashEmulator()
+    results: List[Any] = []
+    calls: List[_SyncRequest] = []
+
+    def third_party(request: _SyncRequest) -> _Response:
+        calls.append(request)
+        return _Response({"greeting": "hello"}, status=201)
+
+    def route(context: WorkflowContext[str]) -> None:
+        response = context.call(
+            "call", url=THIRD_PARTY_ENDPOINT, method="POST", body={"name": "world"}
+        )
+        results.append((response.status, response.body))
+
+    _serve(emulator, route)
+    emulator.register(THIRD_PARTY_ENDPOINT, third_party)
+    emulator.trigger(WORKFLOW_ENDPOINT, "payload")
+    emulator.run()
+
+    (call,) = calls
+    assert call.body == '{"name": "world"}'
+    assert results == [(201, {"greeting": "hello"})]
+
+
+def test_failed_step_is_retried_then_sent_to_failure_function() -> None:
+    emulator = QStashEmulator()
+    attempts: List[int] = []
+    failures: List[Any] = []
+
+    def route(context: WorkflowContext[str]) -> None:
+        def fail() -> None:
+            attempts.append(1)
+            raise ValueError("step failed")
+
+        context.run("ok", lambda: "ok")
+        context.run("fail", fail)
+
+    def failure_function(
+        context: WorkflowContext[str],
+        status: int,
+        response: str,
+        headers: Dict[str, str],
+    ) -> None:
+        failures.append((context.request_payload, status))
+
+    _serve(emulator, route, retries=2, failure_function=failure_function)
+    workflow_run_id = emulator.trigger(
+        WORKFLOW_ENDPOINT, "payload", retries=2, failure_url=WORKFLOW_ENDPOINT
+    )
+    emulator.run()
+
+    assert len(attempts) == 3
+    assert failures == [("payload", 500)]
+    assert emulator.runs[workflow_run_id].state == "RUN_CANCELED"
+
+
+def test_many_runs() -> None:
+    emulator = QStashEmulator()
+    finished: List[int] = []
+
+    def route(context: WorkflowContext[int]) -> None:
+        value = context.run("step-1", lambda: context.request_payload + 1)
+        value = context.run("step-2", lambda: value + 1)
+        finished.append(value)
+
+    _serve(emulator, route)
+    for index in range(200):
+        emulator.trigger(WORKFLOW_ENDPOINT, index)
+    emulator.run()
+
+    assert sorted(finished) == [index + 2 for index in range(200)]
+
+
+def test_http_api() -> None:
+    emulator = QStashEmulator()
+    results: List[Any] = []
+
+    def route(context: WorkflowContext[str]) -> None:
+        result = cast(
+            Dict[str, Any],
+            context.wait_for_event("wait", f"event-{context.request_payload}"),
+        )
+        results.append(result["event_data"])
+
+    _serve(emulator, route)
+    base_url = emulator.start_http()
+    try:
+        with Client(token="token", base_url=base_url) as client:
+            client.trigger_many(WORKFLOW_ENDPOINT, ["a", "b"])
+            emulator.run(until=emulator.clock.now)
+
+            (response,) = client.notify("event-a", "data-a")
+            assert response.waiter.url == WORKFLOW_ENDPOINT
+            emulator.run(until=emulator.clock.now)
+    finally:
+        emulator.stop_http()
+
+    assert results == ["data-a"]
@@ -0,0 +1,155 @@
+import itertools
+from typing import Any, Dict, List, Optional, cast
+import pytest
+from qstash import QStash
+from upstash_workflow import WorkflowContext, serve
+from upstash_workflow.types import DefaultStep, Step
+from upstash_workflow.workflow_requests import (
+    _get_base_headers,
+    _get_headers,
+    _get_headers_template,
+)
+from upstash_workflow.testing import QStashEmulator
+from tests.utils import WORKFLOW_ENDPOINT
+
+USER_HEADERS: List[Optional[Dict[str, str]]] = [
+    None,
+    {},
+    {"my-header": "my-value", "Content-Type": "text/plain"},
+]
+RETRIES: List[Optional[int]] = [None, 3, 0, 5]
+FAILURE_URLS: List[Optional[str]] = [None, "https://www.my-website.com/failure"]
+
+STEPS: List[Dict[str, Any]] = [
+    {"step": None},
+    {
+        "step": Step(
+            step_id=2, step_name="run", step_type="Run", concurrent=1, out='"out"'
+        )
+    },
+    {
+        "step": Step(
+            step_id=3,
+            step_name="call",
+            step_type="Call",
+            concurrent=1,
+            call_url="https://api.example.com",
+            call_method="POST",
+            call_headers={"call-header": "call-value"},
+        ),
+        "call_retries": 2,
+        "call_timeout": "30s",
+    },
+    {
+        "step": Step(
+            step_id=4,
+            step_name="invoke",
+            step_type="Invoke",
+            concurrent=1,
+            invoke_url="https://www.my-website.com/api/child",
+            invoke_headers={"invoke-header": "invoke-value"},
+        ),
+        "invoke_retries": 1,
+    },
+]
+
+
+@pytest.mark.parametrize(
+    "user_headers,retries,failure_url",
+    list(itertools.product(USER_HEADERS, RETRIES, FAILURE_URLS)),
+)
+def test_template_matches_get_headers(
+    user_headers: Optional[Dict[str, str]],
+    retries: Optional[int],
+    failure_url: Optional[str],
+) -> None:
+    template = _get_headers_template(
+        WORKFLOW_ENDPOINT, user_headers, retries, failure_url
+    )
+
+    for init_header_value, workflow_run_id, options in itertools.product(
+        ("true", "false"), ("wfr-1", "wfr-2"), STEPS
+    ):
+        step: Optional[DefaultStep] = options["step"]
+        expected = _get_headers(
+            init_header_value,
+            workflow_run_id,
+            WORKFLOW_ENDPOINT,
+            user_headers,
+            step,
+            retries,
+            options.get("call_retries"),
+            options.get("call_timeout"),
+            failure_url,
+            options.get("invoke_retries"),
+        )
+        actual = template.get_headers(
+            init_header_value,
+            workflow_run_id,
+            step,
+            options.get("call_retries"),
+            options.get("call_timeout"),
+            options.get("invoke_retries"),
+        )
+
+        assert actual == expected
+
+
+def test_headers_are_shared_by_requests_with_other_user_headers() -> None:
+    _get_base_headers.cache_clear()
+
+    first = _get_headers_template(
+        WORKFLOW_ENDPOINT, {"a": "b", "Upstash-Message-Id": "msg-1"}, 3, None
+    )
+    second = _get_headers_template(
+        WORKFLOW_ENDPOINT, {"a": "b", "Upstash-Message-Id": "msg-2"}, 3, None
+    )
+
+    assert _get_base_headers.cache_info().misses == 1
+    assert _get_base_headers.cache_info().hits == 1
+    assert (
+        first.get_headers("false", "wfr-1").headers[
+            "Upstash-Forward-Upstash-Message-Id"
+        ]
+        == "msg-1"
+    )
+    assert (
+        second.get_headers("false", "wfr-1").headers[
+            "Upstash-Forward-Upstash-Message-Id"
+        ]
+        == "msg-2"
+    )
+
+
+def test_headers_are_cached_across_deliveries_of_a_run() -> None:
+    emulator = QStashEmulator()
+
+    def route(context: WorkflowContext[str]) -> None:
+        context.run("step-1", lambda: "one")
+        context.run("step-2", lambda: "two")
+
+    handler = serve(
+        route, qstash_client=cast(QStash, emulator.client), env={}, retries=2
+    )["handler"]
+    emulator.register(WORKFLOW_ENDPOINT, handler)
+    workflow_run_id = emulator.trigger(
+        WORKFLOW_ENDPOINT, "payload", headers={"my-header": "my-value"}, retries=2
+    )
+    _get_base_headers.cache_clear()
+    emulator.run()
+
+    assert emulator.runs[workflow_run_id].state == "RUN_SUCCESS"
+    # each delivery has a new message id, the headers are built once
+    assert _get_base_headers.cache_info().misses == 1
+    assert _get_base_headers.cache_info().hits == 1
+
+
+def test_filled_headers_are_copies() -> None:
+    template = _get_headers_template(WORKFLOW_ENDPOINT, None, None, None)
+
+    headers = template.get_headers("false", "wfr-1").headers
+    headers["Upstash-Workflow-RunId"] = "changed"
+
+    assert template.get_headers("false", "wfr-2").headers["Upstash-Workflow-RunId"] == (
+        "wfr-2"
+    )
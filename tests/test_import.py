@@ -0,0 +1,83 @@
+import json
+import subprocess
+import sys
+from typing import Any, Dict
+import upstash_workflow
+from upstash_workflow.serve import options
+
+_SCRIPT = """
+import json
+import sys
+import time
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"elapsed": elapsed, "modules": sorted(sys.modules)}}))
+"""
+
+# generous for slow machines, importing the package takes a few milliseconds
+IMPORT_BUDGET = 0.1
+
+
+def _import(statement: str) -> Dict[str, Any]:
+    output = subprocess.run(
+        [sys.executable, "-c", _SCRIPT.format(statement=statement)],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return dict(json.loads(output))
+
+
+def test_package_import_is_lazy() -> None:
+    result = _import("import upstash_workflow")
+
+    assert result["elapsed"] < IMPORT_BUDGET
+    assert not {
+        "qstash",
+        "httpx",
+        "upstash_workflow.context.context",
+        "upstash_workflow.serve.serve",
+        "upstash_workflow.asyncio.context.context",
+        "upstash_workflow.asyncio.serve.serve",
+        "upstash_workflow.client",
+    } & set(result["modules"])
+
+
+def test_async_serve_does_not_import_sync_stack() -> None:
+    modules = set(_import("from upstash_workflow import async_serve")["modules"])
+
+    assert "upstash_workflow.asyncio.serve.serve" in modules
+    assert (
+        not {
+            "upstash_workflow.context.context",
+            "upstash_workflow.serve.serve",
+            "upstash_workflow.serve.authorization",
+            "upstash_workflow.client",
+        }
+        & modules
+    )
+
+
+def test_serve_does_not_import_async_stack() -> None:
+    modules = set(_import("from upstash_workflow import serve")["modules"])
+
+    assert "upstash_workflow.serve.serve" in modules
+    assert (
+        not {
+            "upstash_workflow.asyncio.context.context",
+            "upstash_workflow.asyncio.serve.serve",
+            "upstash_workflow.client",
+        }
+        & modules
+    )
+
+
+def test_public_names() -> None:
+    for name in upstash_workflow.__all__:
+        assert getattr(upstash_workflow, name) is not None
+        assert name in dir(upstash_workflow)
+
+    # importing the serve subpackage doesn't hide the serve function
+    assert options is not None
+    assert callable(upstash_workflow.serve)
@@ -0,0 +1,117 @@
+from typing import Dict, List, Tuple, cast
+from qstash import QStash
+from upstash_workflow import WorkflowContext, serve
+from upstash_workflow.metrics import (
+    AUTH_DRY_RUN_SECONDS,
+    DELETE_SECONDS,
+    HEADER_BUILD_SECONDS,
+    QSTASH_PUBLISH_SECONDS,
+    REPLAY_BYTES,
+    REPLAYED_STEPS,
+    REQUEST_PARSE_SECONDS,
+    STEP_FUNCTION_SECONDS,
+    Histogram,
+    InMemoryMetrics,
+    MetricsSink,
+)
+from upstash_workflow.testing import QStashEmulator
+from tests.utils import WORKFLOW_ENDPOINT
+
+
+class _RecordingMetrics(MetricsSink):
+    def __init__(self) -> None:
+        self.observations: List[Tuple[str, float, Dict[str, str]]] = []
+
+    def observe(self, name: str, value: float, tags: Dict[str, str]) -> None:
+        self.observations.append((name, value, tags))
+
+
+def test_histogram_buckets() -> None:
+    histogram = Histogram([1, 5, 10])
+
+    for value in [0.5, 1, 3, 10, 20]:
+        histogram.observe(value)
+
+    assert histogram.counts == [2, 1, 1]
+    assert histogram.count == 5
+    assert histogram.sum == 34.5
+
+
+def test_in_memory_metrics_group_by_tags() -> None:
+    metrics = InMemoryMetrics(buckets={"custom": [1, 2]})
+
+    metrics.observe("custom", 1, {"workflow_url": "a"})
+    metrics.observe("custom", 3, {"workflow_url": "a"})
+    metrics.observe("custom", 2, {"workflow_url": "b"})
+
+    histogram = metrics.get("custom", workflow_url="a")
+    assert histogram is not None
+    assert histogram.counts == [1, 0]
+    assert histogram.count == 2
+    assert metrics.get("custom", workflow_url="c") is None
+
+    metrics.clear()
+    assert metrics.get("custom", workflow_url="a") is None
+
+
+def test_export_prometheus() -> None:
+    metrics = InMemoryMetrics(buckets={REPLAYED_STEPS: [1, 10]})
+    metrics.observe(REPLAYED_STEPS, 3, {"workflow_url": 'https://a.com/"x"'})
+
+    assert metrics.export_prometheus() == (
+        "# HELP upstash_workflow_replayed_steps Number of steps replayed from the history in a request\n"
+        "# TYPE upstash_workflow_replayed_steps histogram\n"
+        'upstash_workflow_replayed_steps_bucket{workflow_url="https://a.com/\\"x\\"",le="1.0"} 0\n'
+        'upstash_workflow_replayed_steps_bucket{workflow_url="https://a.com/\\"x\\"",le="10.0"} 1\n'
+        'upstash_workflow_replayed_steps_bucket{workflow_url="https://a.com/\\"x\\"",le="+Inf"} 1\n'
+        'upstash_workflow_replayed_steps_sum{workflow_url="https://a.com/\\"x\\""} 3.0\n'
+        'upstash_workflow_replayed_steps_count{workflow_url="https://a.com/\\"x\\""} 1\n'
+    )
+    assert InMemoryMetrics().export_prometheus() == ""
+
+
+def test_workflow_run_is_measured() -> None:
+    emulator = QStashEmulator()
+    metrics = _RecordingMetrics()
+
+    def route(context: WorkflowContext[str]) -> None:
+        context.run("step-1", lambda: "one")
+        context.run("step-2", lambda: "two")
+
+    handler = serve(
+        route,
+        qstash_client=cast(QStash, emulator.client),
+        env={},
+        metrics=metrics,
+    )["handler"]
+    emulator.register(WORKFLOW_ENDPOINT, handler)
+    emulator.trigger(WORKFLOW_ENDPOINT, "payload")
+    emulator.run()
+
+    names = {name for name, _, _ in metrics.observations}
+    assert names == {
+        REQUEST_PARSE_SECONDS,
+        REPLAY_BYTES,
+        REPLAYED_STEPS,
+        AUTH_DRY_RUN_SECONDS,
+        STEP_FUNCTION_SECONDS,
+        HEADER_BUILD_SECONDS,
+        QSTASH_PUBLISH_SECONDS,
+        DELETE_SECONDS,
+    }
+    assert all(
+        tags["workflow_url"] == WORKFLOW_ENDPOINT for _, _, tags in metrics.observations
+    )
+
+    step_functions = [
+        tags["step_name"]
+        for name, _, tags in metrics.observations
+        if name == STEP_FUNCTION_SECONDS
+    ]
+    assert step_functions == ["step-1", "step-2"]
+
+    # the history grows by one step per request
+    replayed_steps = [
+        value for name, value, _ in metrics.observations if name == REPLAYED_STEPS
+    ]
+    assert replayed_steps == [0, 1, 2]
@@ -0,0 +1,214 @@
+import json
+import threading
+from typing import Any, List, Optional
+import pytest
+from upstash_workflow.error import WorkflowAbort, WorkflowError
+from upstash_workflow.types import DefaultStep, Step
+from tests.utils import create_context
+
+
+def _step(
+    step_id: int,
+    step_name: str,
+    out: Any = None,
+    concurrent: int = 2,
+    target_step: Optional[int] = None,
+) -> DefaultStep:
+    return Step(
+        step_id=step_id,
+        step_name=step_name,
+        step_type="Run",
+        out=out,
+        concurrent=concurrent,
+        target_step=target_step,
+    )
+
+
+INITIAL_STEP = _step(0, "init", out="payload", concurrent=1)
+PLAN_STEPS = [
+    _step(0, "step-a", target_step=1),
+    _step(0, "step-b", target_step=2),
+]
+
+
+class TestParallelSteps:
+    def test_first_call_submits_plan_steps(self) -> None:
+        context, qstash_client = create_context([INITIAL_STEP])
+        called: List[str] = []
+
+        def step_a() -> str:
+            called.append("a")
+            return "result-a"
+
+        with pytest.raises(WorkflowAbort):
+            context.parallel([("step-a", step_a), ("step-b", lambda: "result-b")])
+
+        assert called == []
+        assert len(qstash_client.message.batches) == 1
+        bodies = [message["body"] for message in qstash_client.message.batches[0]]
+        assert [
+            (body["stepId"], body["stepName"], body["targetStep"], body["concurrent"])
+            for body in bodies
+        ] == [(0, "step-a", 1, 2), (0, "step-b", 2, 2)]
+
+    def test_partial_call_runs_targeted_step(self) -> None:
+        context, qstash_client = create_context([INITIAL_STEP, *PLAN_STEPS])
+        called: List[str] = []
+
+        def step_a() -> str:
+            called.append("a")
+            return "result-a"
+
+        def step_b() -> str:
+            called.append("b")
+            return "result-b"
+
+        with pytest.raises(WorkflowAbort):
+            context.parallel([("step-a", step_a), ("step-b", step_b)])
+
+        assert called == ["b"]
+        (message,) = qstash_client.message.batches[0]
+        assert message["body"]["stepId"] == 2
+        assert message["body"]["concurrent"] == 2
+        assert json.loads(message["body"]["out"]) == "result-b"
+
+    def test_max_workers_bounds_threads(self) -> None:
+        step_names = ["step-a", "step-b", "step-c"]
+        plan_steps = [
+            _step(0, step_name, concurrent=3, target_step=index + 1)
+            for index, step_name in enumerate(step_names)
+        ]
+        # without the bound, the step functions of all deliveries meet here
+        barrier = threading.Barrier(len(step_names), timeout=0.5)
+        lock = threading.Lock()
+        running = [0]
+        peak = [0]
+        errors: List[BaseException] = []
+
+        def step() -> None:
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            try:
+                barrier.wait()
+            except threading.BrokenBarrierError:
+                pass
+            with lock:
+                running[0] -= 1
+
+        def deliver(index: int) -> None:
+            # each plan step is delivered with the history up to itself
+            context, _ = create_context([INITIAL_STEP, *plan_steps[: index + 1]])
+            try:
+                context.parallel(
+                    [(step_name, step) for step_name in step_names], max_workers=1
+                )
+            except WorkflowAbort:
+                pass
+            except BaseException as error:
+                errors.append(error)
+
+        threads = [
+            threading.Thread(target=deliver, args=(index,))
+            for index in range(len(step_names))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert errors == []
+        assert peak[0] == 1
+
+    def test_concurrent_deliveries_run_steps_in_parallel(self) -> None:
+        barrier = threading.Barrier(2, timeout=5)
+        results: List[Any] = []
+
+        def step() -> str:
+            barrier.wait()
+            return "result"
+
+        def deliver(history: List[DefaultStep]) -> None:
+            context, qstash_client = create_context(history)
+            with pytest.raises(WorkflowAbort):
+                context.parallel([("step-a", step), ("step-b", step)], max_workers=2)
+            results.append(qstash_client.message.batches[0][0]["body"]["stepId"])
+
+        threads = [
+            threading.Thread(target=deliver, args=([INITIAL_STEP, *PLAN_STEPS[:1]],)),
+            threading.Thread(target=deliver, args=([INITIAL_STEP, *PLAN_STEPS],)),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert sorted(results) == [1, 2]
+
+    def test_partial_results_are_discarded(self) -> None:
+        context, qstash_client = create_context(
+            [INITIAL_STEP, *PLAN_STEPS, _step(2, "step-b", out="result-b")]
+        )
+
+        with pytest.raises(WorkflowAbort) as error:
+            context.parallel([("step-a", lambda: 1), ("step-b", lambda: 2)])
+
+        assert error.value.step_name == "discarded parallel"
+        assert qstash_client.message.batches == []
+
+    def test_last_call_returns_results_and_continues(self) -> None:
+        context, qstash_client = create_context(
+            [
+                INITIAL_STEP,
+                *PLAN_STEPS,
+                _step(2, "step-b", out="result-b"),
+                _step(1, "step-a", out="result-a"),
+            ]
+        )
+
+        results = context.parallel(
+            [("step-a", lambda: "unused"), ("step-b", lambda: "unused")]
+        )
+        assert results == ["result-a", "result-b"]
+
+        with pytest.raises(WorkflowAbort):
+            context.run("step-c", lambda: "result-c")
+
+        bodies = [message["body"] for message in qstash_client.message.batches[0]]
+        assert [(body["stepId"], body["stepName"]) for body in bodies] == [
+            (3, "step-c")
+        ]
+
+    def test_steps_after_parallel_are_replayed(self) -> None:
+        context, qstash_client = create_context(
+            [
+                INITIAL_STEP,
+                *PLAN_STEPS,
+                _step(1, "step-a", out="result-a"),
+                _step(2, "step-b", out="result-b"),
+                _step(3, "step-c", out="result-c", concurrent=1),
+            ]
+        )
+
+        assert context.parallel([("step-a", lambda: 1), ("step-b", lambda: 2)]) == [
+            "result-a",
+            "result-b",
+        ]
+        assert context.run("step-c", lambda: "unused") == "result-c"
+        assert qstash_client.message.batches == []
+
+    def test_incompatible_parallel_step_count(self) -> None:
+        context, _ = create_context([INITIAL_STEP, *PLAN_STEPS])
+
+        with pytest.raises(WorkflowError, match="Expected 3, got 2"):
+            context.parallel(
+                [("step-a", lambda: 1), ("step-b", lambda: 2), ("step-c", lambda: 3)]
+            )
+
+    def test_plan_step_targeting_other_step_raises(self) -> None:
+        context, _ = create_context(
+            [INITIAL_STEP, *PLAN_STEPS, _step(0, "step-c", target_step=5)]
+        )
+
+        with pytest.raises(WorkflowError, match="targets step 5"):
+            context.parallel([("step-a", lambda: 1), ("step-b", lambda: 2)])
@@ -0,0 +1,365 @@
+import base64
+import json
+import math
+import multiprocessing
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, cast
+import pytest
+from qstash import QStash
+from upstash_workflow import WorkflowContext, serve
+from upstash_workflow.codec import JSONCodec, OrjsonCodec
+from upstash_workflow.error import WorkflowError
+from upstash_workflow.metrics import (
+    REPLAY_CACHE_HITS,
+    REPLAY_CACHE_MISSES,
+    InMemoryMetrics,
+)
+from upstash_workflow.replay_cache import (
+    CachedStep,
+    InMemoryReplayCache,
+    ReplayCache,
+    ReplayCacheKey,
+    SharedReplayCache,
+)
+from upstash_workflow.store import InMemoryStepOutputStore, _offload_step_output
+from upstash_workflow.workflow_parser import _parse_payload
+from upstash_workflow.testing import QStashEmulator
+from tests.utils import WORKFLOW_ENDPOINT
+
+
+def _step(step_id: int) -> CachedStep:
+    return CachedStep(
+        step_id=step_id,
+        step_name=f"step-{step_id}",
+        step_type="Run",
+        concurrent=1,
+        out=str(step_id),
+    )
+
+
+def _payload(outs: List[Any], serialize: bool = True) -> str:
+    def encode(value: str) -> str:
+        return base64.b64encode(value.encode()).decode()
+
+    raw_steps: List[Dict[str, Any]] = [
+        {"messageId": "msg-0", "body": encode('"initial"'), "callType": "step"}
+    ]
+    for step_id, out in enumerate(outs, start=1):
+        body = {
+            "stepId": step_id,
+            "stepName": f"step-{step_id}",
+            "stepType": "Run",
+            "out": json.dumps(out) if serialize else out,
+            "concurrent": 1,
+        }
+        raw_steps.append(
+            {
+                "messageId": f"msg-{step_id}",
+                "body": encode(json.dumps(body)),
+                "callType": "step",
+            }
+        )
+    return json.dumps(raw_steps)
+
+
+def test_entries_are_evicted_by_count() -> None:
+    cache = InMemoryReplayCache(max_entries=2)
+    keys = [cache.key("run", f"msg-{index}", "body") for index in range(3)]
+
+    cache.put(keys[0], [_step(0)], 10)
+    cache.put(keys[1], [_step(1)], 10)
+    # the first entry becomes the most recently used one
+    assert cache.get(keys[0]) == [_step(0)]
+    cache.put(keys[2], [_step(2)], 10)
+
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) == [_step(0)]
+    assert cache.get(keys[2]) == [_step(2)]
+    assert len(cache) == 2
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_entries_are_evicted_by_size() -> None:
+    cache = InMemoryReplayCache(max_bytes=25)
+    keys = [cache.key("run", f"msg-{index}", "body") for index in range(3)]
+
+    for index, key in enumerate(keys):
+        cache.put(key, [_step(index)], 10)
+
+    assert cache.get(keys[0]) is None
+    assert cache.size == 20
+
+    cache.put(cache.key("run", "large", "body"), [_step(3)], 30)
+    assert cache.size == 20
+
+
+def test_entries_expire() -> None:
+    cache = InMemoryReplayCache(ttl=0.05)
+    key = cache.key("run", "msg-1", "body")
+    cache.put(key, [_step(1)], 10)
+
+    assert cache.get(key) == [_step(1)]
+    time.sleep(0.1)
+    assert cache.get(key) is None
+
+    cache.put(cache.key("run", "msg-2", "body"), [_step(2)], 5)
+    assert len(cache) == 1
+    assert cache.size == 5
+
+
+def test_max_entries_is_validated() -> None:
+    with pytest.raises(WorkflowError):
+        InMemoryReplayCache(max_entries=0)
+
+
+def test_cached_outputs_are_decoded_in_each_request() -> None:
+    cache = InMemoryReplayCache()
+    payload = _payload([{"items": [1]}])
+
+    _, first = _parse_payload(payload, workflow_run_id="run", replay_cache=cache)
+    cast(Dict[str, List[int]], first[1].out)["items"].append(2)
+    _, second = _parse_payload(payload, workflow_run_id="run", replay_cache=cache)
+
+    assert second[1].out == {"items": [1]}
+    assert second[1].out is not first[1].out
+    assert cache.hits == 1
+
+
+def test_cached_steps_are_not_read_from_the_store_again() -> None:
+    store = InMemoryStepOutputStore(threshold=0)
+    reads: List[str] = []
+    get = store.get
+
+    def counting_get(workflow_run_id: str, key: str) -> str:
+        reads.append(key)
+        return get(workflow_run_id, key)
+
+    store.get = counting_get  # type: ignore[method-assign]
+    reference = _offload_step_output(store, "run", 1, json.dumps({"key": "value"}))
+    cache = InMemoryReplayCache()
+    payload = _payload([reference], serialize=False)
+
+    for _ in range(2):
+        _, steps = _parse_payload(
+            payload, workflow_run_id="run", step_output_store=store, replay_cache=cache
+        )
+        assert steps[1].out == {"key": "value"}
+
+    assert len(reads) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_keys_use_a_digest_of_the_body() -> None:
+    cache = InMemoryReplayCache()
+    key = cache.key("run", "msg", "body")
+
+    assert key[:2] == ("run", "msg")
+    assert len(key[2]) == 16
+    assert cache.key("run", "msg", "body") == key
+    assert cache.key("run", "msg", "other body") != key
+
+
+def test_cache_must_implement_get_and_put() -> None:
+    class _IncompleteCache(ReplayCache):
+        def get(self, key: ReplayCacheKey) -> Optional[List[CachedStep]]:
+            return None
+
+    with pytest.raises(TypeError):
+        _IncompleteCache()  # type: ignore[abstract]
+
+
+def test_parse_payload_reuses_cached_steps() -> None:
+    cache = InMemoryReplayCache()
+
+    _, first = _parse_payload(
+        _payload(["one"]), workflow_run_id="run", replay_cache=cache
+    )
+    assert [step.out for step in first] == ['"initial"', "one"]
+
+    _, second = _parse_payload(
+        _payload(["one", "two"]), workflow_run_id="run", replay_cache=cache
+    )
+    assert [step.out for step in second] == ['"initial"', "one", "two"]
+    assert second[1] == first[1]
+    assert (cache.hits, cache.misses) == (1, 2)
+
+    # the same message id with different content is decoded again
+    _, changed = _parse_payload(
+        _payload(["changed"]), workflow_run_id="run", replay_cache=cache
+    )
+    assert changed[1].out == "changed"
+
+    # steps of other runs are not reused
+    _, other = _parse_payload(
+        _payload(["one"]), workflow_run_id="other", replay_cache=cache
+    )
+    assert other[1] is not first[1]
+
+
+def test_workflow_run_uses_replay_cache() -> None:
+    emulator = QStashEmulator()
+    cache = InMemoryReplayCache()
+    metrics = InMemoryMetrics()
+    results: List[str] = []
+
+    def route(context: WorkflowContext[str]) -> None:
+        first = context.run("step-1", lambda: "one")
+        second = context.run("step-2", lambda: f"{first}-two")
+        results.append(context.run("step-3", lambda: f"{second}-three"))
+
+    handler = serve(
+        route,
+        qstash_client=cast(QStash, emulator.client),
+        env={},
+        replay_cache=cache,
+        metrics=metrics,
+    )["handler"]
+    emulator.register(WORKFLOW_ENDPOINT, handler)
+    run_id = emulator.trigger(WORKFLOW_ENDPOINT, '"payload"')
+    emulator.run()
+
+    assert emulator.runs[run_id].state == "RUN_SUCCESS"
+    assert results == ["one-two-three"]
+    # every step is decoded once and taken from the cache in later requests
+    assert cache.misses == 3
+    assert cache.hits == 3
+
+    hits = metrics.get(REPLAY_CACHE_HITS, workflow_url=WORKFLOW_ENDPOINT)
+    misses = metrics.get(REPLAY_CACHE_MISSES, workflow_url=WORKFLOW_ENDPOINT)
+    assert hits is not None and hits.sum == 3
+    assert misses is not None and misses.sum == 3
+
+
+def _read_in_other_process(path: str, key: ReplayCacheKey) -> Any:
+    cache = SharedReplayCache(path)
+    steps = cache.get(key)
+    cache.close()
+    return None if steps is None else steps[0].out
+
+
+def test_shared_cache_is_shared_by_processes(tmp_path: Path) -> None:
+    path = str(tmp_path / "replay-cache")
+    cache = SharedReplayCache(path)
+    key = cache.key("run", "msg-1", "body")
+    step = _step(1)._replace(out='{"key": "välue"}')
+    cache.put(key, [step], 10)
+
+    other = SharedReplayCache(path)
+    assert other.get(key) == [step]
+    assert other.get(cache.key("run", "msg-2", "body")) is None
+    assert (other.hits, other.misses) == (1, 1)
+
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1) as pool:
+        assert pool.apply(_read_in_other_process, (path, key)) == '{"key": "välue"}'
+
+    other.close()
+    cache.close()
+
+
+def _parse_codecs() -> List[JSONCodec]:
+    codecs = [JSONCodec()]
+    try:
+        codecs.append(OrjsonCodec())
+    except ImportError:
+        pass
+    return codecs
+
+
+@pytest.mark.parametrize(
+    "codec", _parse_codecs(), ids=lambda codec: type(codec).__name__
+)
+def test_shared_cache_steps_equal_decoded_steps(
+    tmp_path: Path, codec: JSONCodec
+) -> None:
+    payload = _payload(
+        [{"value": math.inf, "large": 2**70, "text": "välue"}, [1.5, None], "text"]
+    )
+    _, decoded = _parse_payload(payload, codec, workflow_run_id="run")
+
+    path = str(tmp_path / "replay-cache")
+    writer = SharedReplayCache(path)
+    _, first = _parse_payload(
+        payload, codec, workflow_run_id="run", replay_cache=writer
+    )
+    assert list(first) == list(decoded)
+    writer.close()
+
+    cache = SharedReplayCache(path)
+    _, cached = _parse_payload(
+        payload, codec, workflow_run_id="run", replay_cache=cache
+    )
+    assert list(cached) == list(decoded)
+    assert (cache.hits, cache.misses) == (3, 0)
+    cache.close()
+
+
+def test_shared_cache_evicts_least_recently_used_slot(tmp_path: Path) -> None:
+    cache = SharedReplayCache(str(tmp_path / "replay-cache"), max_entries=8)
+    keys = [cache.key("run", f"msg-{index}", "body") for index in range(9)]
+
+    for index, key in enumerate(keys[:8]):
+        cache.put(key, [_step(index)], 10)
+    assert cache.get(keys[0]) == [_step(0)]
+    cache.put(keys[8], [_step(8)], 10)
+
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) == [_step(0)]
+    assert cache.get(keys[8]) == [_step(8)]
+    cache.close()
+
+
+def test_shared_cache_drops_overwritten_entries(tmp_path: Path) -> None:
+    cache = SharedReplayCache(str(tmp_path / "replay-cache"), max_bytes=512)
+    keys = [cache.key("run", f"msg-{index}", "body") for index in range(40)]
+
+    for index, key in enumerate(keys):
+        cache.put(key, [_step(index)], 10)
+
+    assert cache.get(keys[0]) is None
+    assert cache.get(keys[39]) == [_step(39)]
+    cache.close()
+
+
+def test_shared_cache_entries_expire(tmp_path: Path) -> None:
+    cache = SharedReplayCache(str(tmp_path / "replay-cache"), ttl=0.05)
+    key = cache.key("run", "msg-1", "body")
+    cache.put(key, [_step(1)], 10)
+
+    assert cache.get(key) == [_step(1)]
+    time.sleep(0.1)
+    assert cache.get(key) is None
+    cache.close()
+
+
+def test_shared_cache_is_reset_after_interrupted_write(tmp_path: Path) -> None:
+    path = tmp_path / "replay-cache"
+    cache = SharedReplayCache(str(path))
+    key = cache.key("run", "msg-1", "body")
+    cache.put(key, [_step(1)], 10)
+    cache.close()
+
+    # a process died while adding an entry
+    with open(path, "r+b") as file:
+        file.seek(8)
+        file.write((1).to_bytes(4, "little"))
+
+    cache = SharedReplayCache(str(path))
+    assert cache.get(key) is None
+    cache.put(key, [_step(1)], 10)
+    assert cache.get(key) == [_step(1)]
+    cache.close()
+
+
+def test_shared_cache_options_are_validated(tmp_path: Path) -> None:
+    path = str(tmp_path / "replay-cache")
+    SharedReplayCache(path, max_entries=8).close()
+
+    with pytest.raises(WorkflowError):
+        SharedReplayCache(path, max_entries=16)
+
+    other_file = tmp_path / "other"
+    other_file.write_bytes(b"not a replay cache")
+    with pytest.raises(WorkflowError):
+        SharedReplayCache(str(other_file))
@@ -0,0 +1,138 @@
+import json
+from typing import Any, Dict, List, cast
+from qstash import QStash
+from upstash_workflow import serve, WorkflowContext
+from upstash_workflow.codec import JSONCodec
+from upstash_workflow.constants import (
+    WORKFLOW_ID_HEADER,
+    WORKFLOW_PROTOCOL_VERSION,
+    WORKFLOW_PROTOCOL_VERSION_HEADER,
+)
+from upstash_workflow.serve.authorization import _get_disabled_qstash_client
+from upstash_workflow.workflow_types import _Response, _SyncRequest
+from tests.utils import WORKFLOW_ENDPOINT, RecordingQStash, encode_message
+
+
+def _replay_request(*steps: Dict[str, Any]) -> _SyncRequest:
+    return _SyncRequest(
+        body=json.dumps(
+            [encode_message('"initial"')]
+            + [encode_message(json.dumps(step)) for step in steps]
+        ),
+        headers={
+            WORKFLOW_PROTOCOL_VERSION_HEADER: WORKFLOW_PROTOCOL_VERSION,
+            WORKFLOW_ID_HEADER: "wfr-id",
+        },
+        method="POST",
+        url=WORKFLOW_ENDPOINT,
+    )
+
+
+STEP_1 = {
+    "stepId": 1,
+    "stepName": "step-1",
+    "stepType": "Run",
+    "out": json.dumps("result-1"),
+    "concurrent": 1,
+}
+
+
+def _handler(
+    qstash_client: RecordingQStash, calls: List[str], authenticated: bool
+) -> Any:
+    def route(context: WorkflowContext[str]) -> None:
+        calls.append("preamble")
+        if not authenticated:
+            return
+        context.run("step-1", lambda: "result-1")
+        context.run("step-2", lambda: "result-2")
+
+    return serve(
+        route,
+        qstash_client=cast(QStash, qstash_client),
+        env={},
+        inline_authentication=True,
+    )["handler"]
+
+
+class TestInlineAuthentication:
+    def test_route_function_runs_once(self) -> None:
+        qstash_client = RecordingQStash()
+        calls: List[str] = []
+
+        response = cast(
+            _Response, _handler(qstash_client, calls, True)(_replay_request(STEP_1))
+        )
+
+        assert response.status == 200
+        assert calls == ["preamble"]
+        (message,) = qstash_client.message.batches[0]
+        assert message["body"]["stepName"] == "step-2"
+
+    def test_return_before_step_fails_authentication(self) -> None:
+        qstash_client = RecordingQStash()
+        calls: List[str] = []
+
+        response = cast(
+            _Response, _handler(qstash_client, calls, False)(_replay_request(STEP_1))
+        )
+
+        assert response.status == 400
+        assert calls == ["preamble"]
+        # the workflow run is not deleted
+        assert qstash_client.http.requests == []
+
+    def test_workflow_is_deleted_after_last_step(self) -> None:
+        qstash_client = RecordingQStash()
+        step_2 = {**STEP_1, "stepId": 2, "stepName": "step-2"}
+
+        response = cast(
+            _Response,
+            _handler(qstash_client, [], True)(_replay_request(STEP_1, step_2)),
+        )
+
+        assert response.status == 200
+        ((method, _),) = qstash_client.http.requests
+        assert method == "DELETE"
+
+    def test_dry_run_without_inline_authentication(self) -> None:
+        qstash_client = RecordingQStash()
+        calls: List[str] = []
+
+        def route(context: WorkflowContext[str]) -> None:
+            calls.append("preamble")
+            context.run("step-1", lambda: "result-1")
+
+        serve(route, qstash_client=cast(QStash, qstash_client), env={})["handler"](
+            _replay_request(STEP_1)
+        )
+
+        assert calls == ["preamble", "preamble"]
+
+
+def test_disabled_qstash_client_is_shared() -> None:
+    assert _get_disabled_qstash_client() is _get_disabled_qstash_client()
+
+
+class _IndentedCodec(JSONCodec):
+    def dumps(self, value: Any) -> str:
+        return json.dumps(value, indent=2)
+
+
+def test_response_is_encoded_with_serve_codec() -> None:
+    qstash_client = RecordingQStash()
+    step_2 = {**STEP_1, "stepId": 2, "stepName": "step-2"}
+
+    def route(context: WorkflowContext[str]) -> None:
+        context.run("step-1", lambda: "result-1")
+        context.run("step-2", lambda: "result-2")
+
+    handler = serve(
+        route,
+        qstash_client=cast(QStash, qstash_client),
+        env={},
+        json_codec=_IndentedCodec(),
+    )["handler"]
+    response = cast(_Response, handler(_replay_request(STEP_1, step_2)))
+
+    assert response.body == json.dumps({"workflowRunId": "wfr-id"}, indent=2)
@@ -0,0 +1,142 @@
+import json
+from typing import Any, Dict, List, cast
+import pytest
+from qstash import QStash
+from upstash_workflow import WorkflowContext, serve
+from upstash_workflow.error import WorkflowAbort
+from upstash_workflow.workflow_parser import _parse_payload
+from upstash_workflow.testing import QStashEmulator
+from tests.utils import WORKFLOW_ENDPOINT, create_context, encode_message
+
+
+def _payload(bodies: List[Dict[str, Any]]) -> str:
+    """
+    Creates a request body from the bodies of the messages sent to QStash
+    """
+    return json.dumps(
+        [encode_message("initial")]
+        + [encode_message(json.dumps(body)) for body in bodies]
+    )
+
+
+def _route(context: WorkflowContext[str], called: List[str]) -> None:
+    def step(name: str) -> Any:
+        def _step() -> Any:
+            called.append(name)
+            return {"name": name}
+
+        return _step
+
+    for name in ("step-1", "step-2", "step-3"):
+        context.run(name, step(name))
+    context.sleep("sleep", 10)
+
+
+class TestStepFusion:
+    def test_run_steps_are_sent_in_one_message(self) -> None:
+        context, qstash_client = create_context(invocation_time_budget=60)
+        called: List[str] = []
+
+        with pytest.raises(WorkflowAbort):
+            _route(context, called)
+
+        # sleep step is not executed before the kept steps are sent
+        assert called == ["step-1", "step-2", "step-3"]
+        assert len(qstash_client.message.batches) == 1
+        (message,) = qstash_client.message.batches[0]
+        assert message["body"]["stepId"] == 3
+        assert json.loads(message["body"]["out"]) == {"name": "step-3"}
+        assert [
+            (step["stepId"], step["stepName"], json.loads(step["out"]))
+            for step in message["body"]["fusedSteps"]
+        ] == [(1, "step-1", {"name": "step-1"}), (2, "step-2", {"name": "step-2"})]
+
+    def test_fused_steps_are_replayed(self) -> None:
+        context, qstash_client = create_context(invocation_time_budget=60)
+        with pytest.raises(WorkflowAbort):
+            _route(context, [])
+        (message,) = qstash_client.message.batches[0]
+
+        _, steps = _parse_payload(_payload([message["body"]]))
+        context, qstash_client = create_context(steps, invocation_time_budget=60)
+        called: List[str] = []
+
+        with pytest.raises(WorkflowAbort):
+            _route(context, called)
+
+        assert called == []
+        (sleep_message,) = qstash_client.message.batches[0]
+        assert sleep_message["body"]["stepId"] == 4
+        assert sleep_message["body"]["stepType"] == "SleepFor"
+        assert "fusedSteps" not in sleep_message["body"]
+
+    def test_exhausted_budget_sends_each_step(self) -> None:
+        context, qstash_client = create_context(invocation_time_budget=0)
+        called: List[str] = []
+
+        with pytest.raises(WorkflowAbort):
+            _route(context, called)
+
+        assert called == ["step-1"]
+        (message,) = qstash_client.message.batches[0]
+        assert message["body"]["stepId"] == 1
+        assert "fusedSteps" not in message["body"]
+
+    def test_kept_steps_are_sent_when_route_ends(self) -> None:
+        context, qstash_client = create_context(invocation_time_budget=60)
+
+        assert context.run("step-1", lambda: ("a", 1)) == ["a", 1]
+        assert qstash_client.message.batches == []
+
+        with pytest.raises(WorkflowAbort):
+            context._executor.submit_fused_steps()
+
+        (message,) = qstash_client.message.batches[0]
+        assert message["body"]["stepId"] == 1
+        assert json.loads(message["body"]["out"]) == ["a", 1]
+
+    def test_without_budget_each_step_is_sent(self) -> None:
+        context, qstash_client = create_context(invocation_time_budget=None)
+
+        with pytest.raises(WorkflowAbort):
+            context.run("step-1", lambda: "a")
+
+        assert len(qstash_client.message.batches) == 1
+
+
+def test_kept_steps_are_sent_when_a_later_step_fails(
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    emulator = QStashEmulator()
+    called: List[str] = []
+
+    def route(context: WorkflowContext[str]) -> None:
+        def step(name: str) -> Any:
+            def _step() -> str:
+                called.append(name)
+                if name == "step-3" and called.count(name) == 1:
+                    raise ValueError("step failed")
+                return name
+
+            return _step
+
+        for name in ("step-1", "step-2", "step-3"):
+            context.run(name, step(name))
+
+    handler = serve(
+        route,
+        qstash_client=cast(QStash, emulator.client),
+        env={},
+        invocation_time_budget=60,
+    )["handler"]
+    emulator.register(WORKFLOW_ENDPOINT, handler)
+    workflow_run_id = emulator.trigger(WORKFLOW_ENDPOINT, "payload")
+    emulator.run()
+
+    # the first two steps are not executed again when the third is retried
+    assert called == ["step-1", "step-2", "step-3", "step-3"]
+    assert emulator.runs[workflow_run_id].state == "RUN_SUCCESS"
+    # the error of the failed step is logged
+    (record,) = [record for record in caplog.records if "failed" in record.getMessage()]
+    assert record.exc_info is not None
+    assert str(record.exc_info[1]) == "step failed"
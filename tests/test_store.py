@@ -0,0 +1,166 @@
+import json
+from pathlib import Path
+from typing import Dict, List, cast
+import pytest
+from qstash import QStash
+from upstash_workflow import WorkflowContext, serve
+from upstash_workflow.error import WorkflowAbort, WorkflowError
+from upstash_workflow.store import (
+    InMemoryStepOutputStore,
+    LocalStepOutputStore,
+    StepOutputStore,
+    _load_step_output,
+    _offload_step_output,
+)
+from upstash_workflow.workflow_parser import _parse_payload
+from upstash_workflow.testing import QStashEmulator
+from tests.utils import WORKFLOW_ENDPOINT, create_context, encode_message
+
+
+@pytest.fixture(params=["memory", "local"])
+def store(request: pytest.FixtureRequest, tmp_path: Path) -> StepOutputStore:
+    if request.param == "memory":
+        return InMemoryStepOutputStore(threshold=10)
+    return LocalStepOutputStore(str(tmp_path), threshold=10)
+
+
+class TestStepOutputStore:
+    def test_put_get_delete(self, store: StepOutputStore) -> None:
+        store.put("wfr/id", "1-key", '"value"')
+        store.put("other-id", "1-key", '"other"')
+
+        assert store.get("wfr/id", "1-key") == '"value"'
+
+        store.delete("wfr/id")
+        with pytest.raises(KeyError):
+            store.get("wfr/id", "1-key")
+        assert store.get("other-id", "1-key") == '"other"'
+
+    def test_offload_above_threshold(self, store: StepOutputStore) -> None:
+        assert _offload_step_output(store, "wfr-id", 1, '"short"') == '"short"'
+
+        out = json.dumps("a" * 20)
+        reference = _offload_step_output(store, "wfr-id", 1, out)
+
+        assert reference.startswith("@store:wfr-id/1-")
+        assert _load_step_output(store, reference, "wfr-id") == out
+        assert _load_step_output(store, out, "wfr-id") == out
+
+    def test_missing_output(self, store: StepOutputStore) -> None:
+        with pytest.raises(WorkflowError, match="not found"):
+            _load_step_output(store, "@store:wfr-id/1-missing", "wfr-id")
+        with pytest.raises(WorkflowError, match="not provided"):
+            _load_step_output(None, "@store:wfr-id/1-missing", "wfr-id")
+
+    def test_outputs_of_other_runs_are_rejected(self, store: StepOutputStore) -> None:
+        reference = _offload_step_output(store, "wfr-other", 1, json.dumps("a" * 20))
+
+        with pytest.raises(WorkflowError, match="another workflow run"):
+            _load_step_output(store, reference, "wfr-id")
+        with pytest.raises(WorkflowError, match="another workflow run"):
+            _load_step_output(store, reference, None)
+
+    def test_large_outputs_are_offloaded_and_resolved(
+        self, store: StepOutputStore
+    ) -> None:
+        context, qstash_client = create_context(
+            step_output_store=store,
+        )
+        large_output = {"data": "a" * 100}
+
+        with pytest.raises(WorkflowAbort):
+            context.run("step-1", lambda: large_output)
+
+        (message,) = qstash_client.message.batches[0]
+        assert message["body"]["out"].startswith("@store:wfr-id/1-")
+
+        payload = json.dumps(
+            [encode_message('"initial"'), encode_message(json.dumps(message["body"]))]
+        )
+        _, steps = _parse_payload(
+            payload, step_output_store=store, workflow_run_id="wfr-id"
+        )
+        assert steps[1].out == large_output
+
+        # references are not resolved for other runs
+        _, steps = _parse_payload(
+            payload, step_output_store=store, workflow_run_id="wfr-other"
+        )
+        with pytest.raises(WorkflowError, match="another workflow run"):
+            steps[1]
+
+
+class TestLocalStepOutputStore:
+    @pytest.mark.parametrize("name", ["", ".", ".."])
+    def test_names_outside_the_run_directory_are_rejected(
+        self, tmp_path: Path, name: str
+    ) -> None:
+        directory = tmp_path / "outputs"
+        store = LocalStepOutputStore(str(directory), threshold=10)
+        store.put("wfr-id", "1-key", '"value"')
+
+        with pytest.raises(WorkflowError):
+            store.delete(name)
+        with pytest.raises(WorkflowError):
+            store.put(name, "1-key", '"value"')
+        with pytest.raises(WorkflowError):
+            store.get("wfr-id", name)
+
+        assert directory.is_dir()
+        assert store.get("wfr-id", "1-key") == '"value"'
+
+    def test_separators_are_escaped(self, tmp_path: Path) -> None:
+        store = LocalStepOutputStore(str(tmp_path / "outputs"), threshold=10)
+        store.put("../wfr-id", "../1-key", '"value"')
+
+        assert [path.name for path in tmp_path.iterdir()] == ["outputs"]
+        assert store.get("../wfr-id", "../1-key") == '"value"'
+
+
+def test_store_must_implement_put_and_get() -> None:
+    class _PutOnlyStore(StepOutputStore):
+        def put(self, workflow_run_id: str, key: str, value: str) -> None:
+            return
+
+    with pytest.raises(TypeError):
+        _PutOnlyStore()  # type: ignore[abstract]
+
+
+def test_outputs_are_deleted_after_the_failure_function() -> None:
+    emulator = QStashEmulator()
+    store = InMemoryStepOutputStore(threshold=0)
+    failures: List[str] = []
+
+    def route(context: WorkflowContext[str]) -> None:
+        def fail() -> None:
+            raise ValueError("step failed")
+
+        context.run("ok", lambda: "ok")
+        context.run("fail", fail)
+
+    def failure_function(
+        context: WorkflowContext[str],
+        status: int,
+        response: str,
+        headers: Dict[str, str],
+    ) -> None:
+        failures.append(context.workflow_run_id)
+
+    handler = serve(
+        route,
+        qstash_client=cast(QStash, emulator.client),
+        env={},
+        retries=0,
+        failure_function=failure_function,
+        step_output_store=store,
+    )["handler"]
+    emulator.register(WORKFLOW_ENDPOINT, handler)
+    workflow_run_id = emulator.trigger(
+        WORKFLOW_ENDPOINT, "payload", retries=0, failure_url=WORKFLOW_ENDPOINT
+    )
+    emulator.run()
+
+    assert failures == [workflow_run_id]
+    with pytest.raises(KeyError):
+        store.get(workflow_run_id, "1-key")
+    assert workflow_run_id not in store._outputs
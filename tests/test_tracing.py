@@ -0,0 +1,178 @@
+from typing import Any, Callable, Dict, List, cast
+import pytest
+from qstash import QStash
+from upstash_workflow import WorkflowContext, serve
+from upstash_workflow.error import WorkflowError
+from upstash_workflow.tracing import (
+    InMemoryTracer,
+    OpenTelemetryTracer,
+    SpanContext,
+    SpanData,
+    _extract_trace_context,
+    _get_opentelemetry,
+    _inject_trace_context,
+    _strip_trace_context,
+)
+from upstash_workflow.testing import QStashEmulator
+from tests.utils import WORKFLOW_ENDPOINT
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+SPAN_ID = "00f067aa0ba902b7"
+
+
+def _serve(
+    emulator: QStashEmulator,
+    route: Callable[[WorkflowContext[Any]], None],
+    tracer: InMemoryTracer,
+) -> None:
+    handler = serve(
+        route,
+        qstash_client=cast(QStash, emulator.client),
+        env={},
+        tracer=tracer,
+    )["handler"]
+    emulator.register(WORKFLOW_ENDPOINT, handler)
+
+
+def _children(spans: List[SpanData], parent: SpanData) -> List[str]:
+    return [
+        span.name for span in spans if span.parent_span_id == parent.context.span_id
+    ]
+
+
+def test_extract_trace_context() -> None:
+    assert _extract_trace_context(
+        {"traceparent": f"00-{TRACE_ID}-{SPAN_ID}-01"}
+    ) == SpanContext(TRACE_ID, SPAN_ID, True)
+    assert _extract_trace_context(
+        {"Traceparent": f"00-{TRACE_ID.upper()}-{SPAN_ID}-00"}
+    ) == SpanContext(TRACE_ID, SPAN_ID, False)
+
+    for invalid in [
+        "",
+        "00-abc-def-01",
+        f"00-{'0' * 32}-{SPAN_ID}-01",
+        f"ff-{TRACE_ID}-{SPAN_ID}-01",
+        f"00-{'x' * 32}-{SPAN_ID}-01",
+    ]:
+        assert _extract_trace_context({"traceparent": invalid}) is None
+    assert _extract_trace_context(None) is None
+
+
+def test_trace_context_headers() -> None:
+    tracer = InMemoryTracer()
+    span = tracer.start_span("publish", SpanContext(TRACE_ID, SPAN_ID))
+    assert span.context is not None
+
+    headers = {"Upstash-Callback": WORKFLOW_ENDPOINT}
+    _inject_trace_context(headers, span)
+    assert headers == {
+        "Upstash-Callback": WORKFLOW_ENDPOINT,
+        "Upstash-Forward-traceparent": span.context.traceparent,
+        "Upstash-Callback-Forward-traceparent": span.context.traceparent,
+    }
+    assert span.context.traceparent.startswith(f"00-{TRACE_ID}-")
+
+    assert _strip_trace_context(
+        {"Traceparent": "value", "tracestate": "value", "Authorization": "token"}
+    ) == {"Authorization": "token"}
+
+
+def test_invocations_of_a_run_are_linked() -> None:
+    emulator = QStashEmulator()
+    tracer = InMemoryTracer()
+
+    def route(context: WorkflowContext[str]) -> None:
+        context.run("step-1", lambda: "one")
+        context.run("step-2", lambda: "two")
+
+    _serve(emulator, route, tracer)
+    emulator.trigger(
+        WORKFLOW_ENDPOINT, "payload", {"traceparent": f"00-{TRACE_ID}-{SPAN_ID}-01"}
+    )
+    emulator.run()
+
+    spans = tracer.spans
+    assert {span.context.trace_id for span in spans} == {TRACE_ID}
+
+    invocations = [span for span in spans if span.name == "workflow.invocation"]
+    assert len(invocations) == 3
+    assert invocations[0].parent_span_id == SPAN_ID
+    assert all(span.error is None for span in spans)
+
+    # each invocation is a child of the message published by the previous one
+    spans_by_id: Dict[str, SpanData] = {span.context.span_id: span for span in spans}
+    for previous, invocation in zip(invocations, invocations[1:]):
+        publish = spans_by_id[cast(str, invocation.parent_span_id)]
+        assert publish.name == "qstash.batch"
+        replay = spans_by_id[cast(str, publish.parent_span_id)]
+        assert replay.parent_span_id == previous.context.span_id
+
+    assert _children(spans, invocations[0]) == [
+        "workflow.parse",
+        "workflow.auth_dry_run",
+        "workflow.replay",
+    ]
+    first_replay = next(
+        span
+        for span in spans
+        if span.parent_span_id == invocations[0].context.span_id
+        and span.name == "workflow.replay"
+    )
+    assert _children(spans, first_replay) == ["workflow.step", "qstash.batch"]
+    assert first_replay.attributes["workflow.replayed_steps"] == 0
+
+    last_replay = next(
+        span
+        for span in spans
+        if span.parent_span_id == invocations[2].context.span_id
+        and span.name == "workflow.replay"
+    )
+    assert _children(spans, last_replay) == ["qstash.delete"]
+    assert last_replay.attributes["workflow.replayed_steps"] == 2
+    assert invocations[2].attributes["workflow.url"] == WORKFLOW_ENDPOINT
+
+
+def test_failed_step_is_recorded() -> None:
+    emulator = QStashEmulator()
+    tracer = InMemoryTracer()
+
+    def fail() -> None:
+        raise ValueError("step failed")
+
+    def route(context: WorkflowContext[str]) -> None:
+        context.run("step-1", fail)
+
+    _serve(emulator, route, tracer)
+    emulator.trigger(WORKFLOW_ENDPOINT, "payload", retries=0)
+    emulator.run()
+
+    (step,) = [span for span in tracer.spans if span.name == "workflow.step"]
+    assert step.error == "ValueError: step failed"
+    assert step.attributes["workflow.step.name"] == "step-1"
+    assert step.attributes["workflow.step.type"] == "Run"
+
+    spans_by_id = {span.context.span_id: span for span in tracer.spans}
+    replay = spans_by_id[cast(str, step.parent_span_id)]
+    invocation = spans_by_id[cast(str, replay.parent_span_id)]
+    assert replay.error == "ValueError: step failed"
+    assert invocation.error == "ValueError: step failed"
+
+
+def test_in_memory_tracer_keeps_recent_spans() -> None:
+    tracer = InMemoryTracer(max_spans=2)
+
+    for index in range(3):
+        tracer.start_span(f"span-{index}").end()
+
+    assert [span.name for span in tracer.spans] == ["span-1", "span-2"]
+    tracer.clear()
+    assert tracer.spans == []
+
+
+@pytest.mark.skipif(
+    _get_opentelemetry() is not None, reason="opentelemetry is installed"
+)
+def test_opentelemetry_tracer_without_opentelemetry() -> None:
+    with pytest.raises(WorkflowError, match="opentelemetry-api is not installed"):
+        OpenTelemetryTracer()
@@ -0,0 +1,224 @@
+import base64
+import dataclasses
+import hashlib
+import json
+import time
+from typing import Any, Dict, List
+import jwt
+import pytest
+from qstash import Receiver
+from upstash_workflow.error import WorkflowError
+from upstash_workflow.types import DefaultStep, Step, _ReplayStep
+from upstash_workflow.workflow_parser import _parse_payload, _parse_request
+from upstash_workflow.workflow_requests import _verify_request
+
+
+def _encode(value: str) -> str:
+    return base64.b64encode(value.encode()).decode()
+
+
+def _raw_step(step_id: int, out: Any) -> Dict[str, Any]:
+    body = {
+        "stepId": step_id,
+        "stepName": f"step-{step_id}",
+        "stepType": "Run",
+        "out": json.dumps(out),
+        "concurrent": 1,
+    }
+    return {
+        "messageId": f"msg-{step_id}",
+        "body": _encode(json.dumps(body)),
+        "callType": "step",
+    }
+
+
+def _payload(raw_steps: List[Dict[str, Any]]) -> str:
+    initial = {"messageId": "msg-0", "body": _encode('"initial"'), "callType": "step"}
+    return json.dumps([initial, *raw_steps])
+
+
+class TestParsePayload:
+    def test_parse_payload_returns_initial_payload_and_steps(self) -> None:
+        raw_initial_payload, steps = _parse_payload(
+            _payload([_raw_step(1, {"key": "value"}), _raw_step(2, "result")])
+        )
+
+        assert raw_initial_payload == '"initial"'
+        assert len(steps) == 3
+        assert list(steps) == [
+            Step(
+                step_id=0,
+                step_name="init",
+                step_type="Initial",
+                out='"initial"',
+                concurrent=1,
+            ),
+            Step(
+                step_id=1,
+                step_name="step-1",
+                step_type="Run",
+                out={"key": "value"},
+                concurrent=1,
+            ),
+            Step(
+                step_id=2,
+                step_name="step-2",
+                step_type="Run",
+                out="result",
+                concurrent=1,
+            ),
+        ]
+
+    def test_parse_payload_from_bytes(self) -> None:
+        payload = _payload([_raw_step(1, {"key": "välue"}), _raw_step(2, "result")])
+
+        raw_initial_payload, steps = _parse_payload(payload.encode())
+
+        assert raw_initial_payload == '"initial"'
+        assert list(steps) == list(_parse_payload(payload)[1])
+        assert steps[1].out == {"key": "välue"}
+
+    def test_parse_request_decodes_first_invocation_bytes(self) -> None:
+        response = _parse_request('{"key": "välue"}'.encode(), True)
+
+        assert response.raw_initial_payload == '{"key": "välue"}'
+        assert response.steps == []
+
+    def test_parse_payload_skips_non_step_call_types(self) -> None:
+        other = {"messageId": "msg-x", "body": _encode("{}"), "callType": "toCallback"}
+        _, steps = _parse_payload(_payload([other, _raw_step(1, "result")]))
+
+        assert len(steps) == 2
+        assert steps[1].out == "result"
+
+    def test_steps_are_decoded_on_access(self) -> None:
+        broken = {"messageId": "msg-2", "body": _encode("not-json"), "callType": "step"}
+        _, steps = _parse_payload(_payload([_raw_step(1, "result"), broken]))
+
+        # the broken step is only decoded once the executor reaches it
+        assert steps[1].out == "result"
+        with pytest.raises(json.JSONDecodeError):
+            steps[2]
+
+    def test_decoded_steps_are_cached(self) -> None:
+        _, steps = _parse_payload(_payload([_raw_step(1, {"key": "value"})]))
+
+        assert steps[1] is steps[1]
+        assert steps[-1] is steps[1]
+        assert steps[1:] == [steps[1]]
+
+    def test_fused_steps_are_expanded(self) -> None:
+        body = {
+            "stepId": 3,
+            "stepName": "step-3",
+            "stepType": "Run",
+            "out": json.dumps("result-3"),
+            "concurrent": 1,
+            "fusedSteps": [
+                {
+                    "stepId": step_id,
+                    "stepName": f"step-{step_id}",
+                    "stepType": "Run",
+                    "out": json.dumps(f"result-{step_id}"),
+                    "concurrent": 1,
+                }
+                for step_id in (1, 2)
+            ],
+        }
+        fused = {
+            "messageId": "msg-3",
+            "body": _encode(json.dumps(body)),
+            "callType": "step",
+        }
+        _, steps = _parse_payload(_payload([fused, _raw_step(4, "result-4")]))
+
+        assert steps[2].out == "result-2"
+        assert len(steps) == 5
+        assert [(step.step_id, step.out) for step in steps[1:]] == [
+            (1, "result-1"),
+            (2, "result-2"),
+            (3, "result-3"),
+            (4, "result-4"),
+        ]
+        with pytest.raises(IndexError):
+            steps[5]
+
+    def test_replayed_steps_are_compact(self) -> None:
+        _, steps = _parse_payload(_payload([_raw_step(1, {"key": "value"})]))
+        step = steps[1]
+        expected: DefaultStep = Step(
+            step_id=1,
+            step_name="step-1",
+            step_type="Run",
+            out={"key": "value"},
+            concurrent=1,
+        )
+
+        assert isinstance(step, _ReplayStep)
+        assert not hasattr(step, "__dict__") or not vars(step)
+        assert step == expected and expected == step
+        assert step != Step(
+            step_id=1, step_name="step-1", step_type="Run", concurrent=1
+        )
+        assert step.call_url is None and step.invoke_body is None
+        assert repr(step) == repr(expected)
+        assert type(step.to_step()) is Step
+        assert step.to_step() == expected
+
+        # fields which are not in the step history can still be set
+        step.call_url = "https://example.com"
+        assert step.to_step().call_url == "https://example.com"
+        assert step != expected
+
+    def test_replayed_steps_can_be_replaced(self) -> None:
+        _, steps = _parse_payload(_payload([_raw_step(1, {"key": "value"})]))
+        step = steps[1]
+        assert isinstance(step, _ReplayStep)
+
+        changes: Dict[str, Any] = {"out": "other", "call_url": "https://a.com"}
+        replaced = dataclasses.replace(step, **changes)
+
+        assert isinstance(replaced, _ReplayStep)
+        assert replaced.to_step() == dataclasses.replace(step.to_step(), **changes)
+        assert replaced.sleep_for is None
+        assert "sleep_for" not in vars(replaced)
+        assert step.out == {"key": "value"} and step.call_url is None
+        assert dataclasses.replace(step) == step
+        with pytest.raises(TypeError):
+            _ReplayStep(
+                step_id=1, step_name="step-1", step_type="Run", concurrent=1, other=1
+            )
+
+
+CURRENT_SIGNING_KEY = "sig_current_key_for_workflow_tests"
+NEXT_SIGNING_KEY = "sig_next_key_for_workflow_parser_tests"
+
+
+def _sign(body: bytes, key: str) -> str:
+    now = int(time.time())
+    return jwt.encode(
+        {
+            "iss": "Upstash",
+            "sub": "https://example.com/api/workflow",
+            "exp": now + 300,
+            "nbf": now,
+            "body": base64.urlsafe_b64encode(hashlib.sha256(body).digest()).decode(),
+        },
+        key,
+        algorithm="HS256",
+    )
+
+
+class TestVerifyRequest:
+    def test_bytes_body_is_verified(self) -> None:
+        body = _payload([_raw_step(1, "välue")]).encode()
+        receiver = Receiver(CURRENT_SIGNING_KEY, NEXT_SIGNING_KEY)
+
+        _verify_request(body, _sign(body, CURRENT_SIGNING_KEY), receiver)
+
+    def test_bytes_body_with_invalid_signature_fails(self) -> None:
+        body = _payload([_raw_step(1, "result")]).encode()
+        receiver = Receiver(CURRENT_SIGNING_KEY, NEXT_SIGNING_KEY)
+
+        with pytest.raises(WorkflowError):
+            _verify_request(body, _sign(b"other", CURRENT_SIGNING_KEY), receiver)
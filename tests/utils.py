@@ -1,8 +1,13 @@
+import base64
 import json
 import http.server
 import socketserver
 import threading
-from typing import Any, Dict, Optional, Union, Callable
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union, Callable, cast
+from qstash import QStash
+from upstash_workflow import WorkflowContext
+from upstash_workflow.types import DefaultStep
 
 WORKFLOW_ENDPOINT = "https://www.my-website.com/api"
 MOCK_QSTASH_SERVER_PORT = 8080
@@ -108,8 +113,11 @@ def mock_qstash_server(
                 )
                 return
 
+            # lists are returned as they are, like the steps of a workflow run
             response_data = json.dumps(
-                [{"messageId": response_fields.body, "deduplicated": False}]
+                response_fields.body
+                if isinstance(response_fields.body, list)
+                else [{"messageId": response_fields.body, "deduplicated": False}]
             )
 
             self.send_response(response_fields.status)
@@ -139,3 +147,86 @@ def mock_qstash_server(
 
         if server_thread and server_thread.is_alive():
             server_thread.join(timeout=1)
+
+
+class RecordingMessageApi:
+    def __init__(self, error: Optional[Exception] = None) -> None:
+        self.batches: List[List[Any]] = []
+        self.error = error
+
+    def batch_json(self, messages: List[Any]) -> List[Any]:
+        if self.error:
+            raise self.error
+        self.batches.append(messages)
+        return []
+
+
+class RecordingHttp:
+    def __init__(self, error: Optional[Exception] = None, delay: float = 0) -> None:
+        self.error = error
+        self.delay = delay
+        self.requests: List[Tuple[str, str]] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def request(self, path: str, method: str, **kwargs: Any) -> Any:
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self._lock:
+            self.in_flight -= 1
+            self.requests.append((method, path))
+        if self.error:
+            raise self.error
+        return ""
+
+
+class RecordingQStash:
+    """
+    QStash client which records the batches and requests sent by the SDK
+    instead of sending them
+
+    :param error: error raised by every batch and request
+    :param delay: seconds each request takes
+    """
+
+    def __init__(self, error: Optional[Exception] = None, delay: float = 0) -> None:
+        self.message = RecordingMessageApi(error)
+        self.http = RecordingHttp(error, delay)
+
+
+def encode_message(value: str) -> Dict[str, str]:
+    """
+    Creates a step message as it's returned by QStash in the request body
+    """
+    return {
+        "messageId": "msg",
+        "body": base64.b64encode(value.encode()).decode(),
+        "callType": "step",
+    }
+
+
+def create_context(
+    steps: Sequence[DefaultStep] = (),
+    qstash_client: Optional[RecordingQStash] = None,
+    **kwargs: Any,
+) -> Tuple[WorkflowContext[str], RecordingQStash]:
+    """
+    Creates a context of the run "wfr-id" sending its steps to a recording
+    client. Keyword arguments are passed to the context.
+    """
+    if qstash_client is None:
+        qstash_client = RecordingQStash()
+    context = WorkflowContext(
+        qstash_client=cast(QStash, qstash_client),
+        workflow_run_id=kwargs.pop("workflow_run_id", "wfr-id"),
+        headers={},
+        steps=steps,
+        url=WORKFLOW_ENDPOINT,
+        initial_payload="initial",
+        failure_url=None,
+        **kwargs,
+    )
+    return context, qstash_client
@@ -1,27 +1,92 @@
 __version__ = "0.2.0"
 
-from upstash_workflow.context.context import WorkflowContext
-from upstash_workflow.serve.serve import serve, serve_many
-from upstash_workflow.asyncio.context.context import (
-    WorkflowContext as AsyncWorkflowContext,
-)
-from upstash_workflow.asyncio.serve.serve import (
-    serve as async_serve,
-    serve_many as async_serve_many,
-)
-from upstash_workflow.types import (
-    CallResponse,
-    InvokeStepResponse,
-    InvokableWorkflow,
-    NotifyResponse,
-    Waiter,
-    WaitForEventResult,
-    NotifyResult,
-    create_workflow,
-    create_async_workflow,
-)
-from upstash_workflow.error import WorkflowError, WorkflowAbort
-from upstash_workflow.client import Client, AsyncClient
+import importlib
+import sys
+import types
+from typing import TYPE_CHECKING, Any, Dict, List, Tuple
+
+if TYPE_CHECKING:
+    from upstash_workflow.context.context import WorkflowContext
+    from upstash_workflow.serve.serve import serve, serve_many
+    from upstash_workflow.asyncio.context.context import (
+        WorkflowContext as AsyncWorkflowContext,
+    )
+    from upstash_workflow.asyncio.serve.serve import (
+        serve as async_serve,
+        serve_many as async_serve_many,
+    )
+    from upstash_workflow.types import (
+        CallResponse,
+        InvokeStepResponse,
+        InvokableWorkflow,
+        NotifyResponse,
+        NotifyManyResult,
+        Waiter,
+        WaitForEventResult,
+        NotifyResult,
+        create_workflow,
+        create_async_workflow,
+    )
+    from upstash_workflow.error import WorkflowError, WorkflowAbort
+    from upstash_workflow.client import Client, AsyncClient
+
+# public names are imported on first access (PEP 562), so an application using
+# only the async stack doesn't load the sync one, and importing the package
+# doesn't load the QStash client and httpx
+_LAZY_IMPORTS: Dict[str, Tuple[str, str]] = {
+    "WorkflowContext": ("upstash_workflow.context.context", "WorkflowContext"),
+    "serve": ("upstash_workflow.serve.serve", "serve"),
+    "serve_many": ("upstash_workflow.serve.serve", "serve_many"),
+    "AsyncWorkflowContext": (
+        "upstash_workflow.asyncio.context.context",
+        "WorkflowContext",
+    ),
+    "async_serve": ("upstash_workflow.asyncio.serve.serve", "serve"),
+    "async_serve_many": ("upstash_workflow.asyncio.serve.serve", "serve_many"),
+    "CallResponse": ("upstash_workflow.types", "CallResponse"),
+    "InvokeStepResponse": ("upstash_workflow.types", "InvokeStepResponse"),
+    "InvokableWorkflow": ("upstash_workflow.types", "InvokableWorkflow"),
+    "NotifyResponse": ("upstash_workflow.types", "NotifyResponse"),
+    "NotifyManyResult": ("upstash_workflow.types", "NotifyManyResult"),
+    "Waiter": ("upstash_workflow.types", "Waiter"),
+    "WaitForEventResult": ("upstash_workflow.types", "WaitForEventResult"),
+    "NotifyResult": ("upstash_workflow.types", "NotifyResult"),
+    "create_workflow": ("upstash_workflow.types", "create_workflow"),
+    "create_async_workflow": ("upstash_workflow.types", "create_async_workflow"),
+    "WorkflowError": ("upstash_workflow.error", "WorkflowError"),
+    "WorkflowAbort": ("upstash_workflow.error", "WorkflowAbort"),
+    "Client": ("upstash_workflow.client", "Client"),
+    "AsyncClient": ("upstash_workflow.client", "AsyncClient"),
+}
+
+
+def __getattr__(name: str) -> Any:
+    try:
+        module_name, attribute = _LAZY_IMPORTS[name]
+    except KeyError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
+
+    value = getattr(importlib.import_module(module_name), attribute)
+    # later accesses don't go through __getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> List[str]:
+    return sorted([*globals(), *_LAZY_IMPORTS])
+
+
+class _Module(types.ModuleType):
+    def __setattr__(self, name: str, value: Any) -> None:
+        # importing the `serve` subpackage sets the `serve` attribute of the
+        # package to the subpackage, which would hide the `serve` function
+        if name in _LAZY_IMPORTS and isinstance(value, types.ModuleType):
+            return
+        super().__setattr__(name, value)
+
+
+sys.modules[__name__].__class__ = _Module
+
 
 __all__ = [
     "WorkflowContext",
@@ -34,6 +99,7 @@ __all__ = [
     "InvokeStepResponse",
     "InvokableWorkflow",
     "NotifyResponse",
+    "NotifyManyResult",
     "Waiter",
     "WaitForEventResult",
     "NotifyResult",
@@ -0,0 +1,289 @@
+import json
+import logging
+import os
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    MutableMapping,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+    cast,
+)
+from urllib.parse import parse_qsl
+from qstash import AsyncQStash, Receiver
+from upstash_workflow.asyncio.context.context import WorkflowContext
+from upstash_workflow.asyncio.delete_queue import AsyncDeleteQueue
+from upstash_workflow.asyncio.outbox import BatchOutbox
+from upstash_workflow.asyncio.serve.serve import serve, serve_many
+from upstash_workflow.codec import JSONCodec
+from upstash_workflow.metrics import MetricsSink
+from upstash_workflow.store import StepOutputStore
+from upstash_workflow.replay_cache import ReplayCache
+from upstash_workflow.tracing import Tracer
+from upstash_workflow.types import InvokableWorkflow
+from upstash_workflow.workflow_types import _AsyncRequest, _Headers, _Response
+
+_logger = logging.getLogger(__name__)
+
+TInitialPayload = TypeVar("TInitialPayload")
+
+Scope = MutableMapping[str, Any]
+Message = MutableMapping[str, Any]
+Receive = Callable[[], Awaitable[Message]]
+Send = Callable[[Message], Awaitable[None]]
+ASGIApp = Callable[[Scope, Receive, Send], Awaitable[None]]
+
+AsyncRouteFunction = Callable[[WorkflowContext[TInitialPayload]], Awaitable[None]]
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def app(
+    workflows: Union[AsyncRouteFunction[Any], Dict[str, InvokableWorkflow]],
+    *,
+    qstash_client: Optional[AsyncQStash] = None,
+    initial_payload_parser: Optional[Callable[[str], Any]] = None,
+    receiver: Optional[Receiver] = None,
+    base_url: Optional[str] = None,
+    env: Optional[Dict[str, Optional[str]]] = None,
+    retries: Optional[int] = None,
+    url: Optional[str] = None,
+    failure_function: Optional[
+        Callable[[WorkflowContext, int, str, Dict[str, str]], Awaitable[Any]]
+    ] = None,
+    failure_url: Optional[str] = None,
+    invocation_time_budget: Optional[float] = None,
+    inline_authentication: bool = False,
+    json_codec: Optional[JSONCodec] = None,
+    step_output_store: Optional[StepOutputStore] = None,
+    compression_threshold: Optional[int] = None,
+    batch_outbox: Optional[BatchOutbox] = None,
+    delete_queue: Optional[AsyncDeleteQueue] = None,
+    metrics: Optional[MetricsSink] = None,
+    tracer: Optional[Tracer] = None,
+    replay_cache: Optional[ReplayCache] = None,
+) -> ASGIApp:
+    """
+    Creates an ASGI application serving workflows, without the request and
+    response handling of a web framework. The request body is passed to the
+    workflow as it is received and the JSON body of the response is sent as
+    it is produced by the workflow.
+
+    The application can be run with an ASGI server like uvicorn, or mounted
+    under FastAPI or Starlette:
+
+    ```python
+    from upstash_workflow.asgi import app as workflow_app
+
+    app.mount("/workflows", workflow_app({"order": order, "refund": refund}))
+    ```
+
+    When run standalone, pending batches of `batch_outbox` are sent and pending
+    deletes of `delete_queue` are waited for on shutdown.
+
+    :param workflows: An async route function, or a dict mapping workflow IDs to InvokableWorkflow instances. Requests for a dict are routed by the last URL path segment, like in `serve_many`.
+    :param qstash_client: AsyncQStash client
+    :param initial_payload_parser: Function to parse the initial payload passed by the user
+    :param receiver: Receiver to verify *all* requests by checking if they come from QStash. By default, a receiver is created from the env variables QSTASH_CURRENT_SIGNING_KEY and QSTASH_NEXT_SIGNING_KEY if they are set.
+    :param base_url: Base Url of the workflow endpoint. Can be used to set if there is a local tunnel or a proxy between QStash and the workflow endpoint. Will be set to the env variable UPSTASH_WORKFLOW_URL if not passed. If the env variable is not set, the url will be infered as usual from the request or the `url` parameter.
+    :param env: Optionally, one can pass an env object mapping environment variables to their keys.
+    :param retries: Number of retries to use in workflow requests, 3 by default
+    :param url: Url of the endpoint where the workflow is set up. If not set, url will be inferred from the request.
+    :param failure_function: Function called when the workflow fails. Only used with a single route function.
+    :param failure_url: Url to call if the workflow fails
+    :param invocation_time_budget: Seconds an invocation can spend running consecutive `context.run` steps before sending their results to QStash in a single message. By default, each step is sent to QStash as soon as it finishes.
+    :param inline_authentication: Check authentication while running the route function instead of running it once more beforehand.
+    :param json_codec: Codec to serialize and deserialize JSON with. By default, orjson or msgspec is used if installed, the json module of the standard library otherwise.
+    :param step_output_store: Store to keep step outputs larger than its threshold in. Only a reference to the output is sent to QStash.
+    :param compression_threshold: Step outputs longer than this many characters (after being serialized as JSON) are compressed before being sent to QStash.
+    :param batch_outbox: Outbox to send the steps of concurrent workflow runs in shared batch requests to QStash.
+    :param delete_queue: Queue to delete finished workflow runs in the background.
+    :param metrics: Sink receiving the timings and sizes measured while handling requests, like `InMemoryMetrics`. Nothing is reported by default.
+    :param tracer: Tracer creating a span per request, like `InMemoryTracer` or `OpenTelemetryTracer`. Tracing is disabled by default.
+    :param replay_cache: Cache of the steps read from the step history, like `InMemoryReplayCache`. Steps read in an earlier request of a workflow run are taken from the cache, and only their outputs are decoded again. Steps are read in every request by default.
+    :return: ASGI application
+    """
+    if not (
+        qstash_client
+        or (env is not None and env.get("QSTASH_TOKEN"))
+        or (env is None and os.getenv("QSTASH_TOKEN"))
+    ):
+        raise ValueError(
+            "QSTASH_TOKEN is missing. Make sure to set it in the environment variables or pass qstash_client or env as an argument."
+        )
+
+    if isinstance(workflows, dict):
+        if failure_function is not None:
+            raise ValueError(
+                "failure_function can't be used with multiple workflows. Pass it to create_async_workflow instead."
+            )
+        handler = serve_many(
+            workflows,
+            qstash_client=qstash_client,
+            initial_payload_parser=initial_payload_parser,
+            receiver=receiver,
+            base_url=base_url,
+            env=env,
+            retries=retries,
+            url=url,
+            failure_url=failure_url,
+            invocation_time_budget=invocation_time_budget,
+            inline_authentication=inline_authentication,
+            json_codec=json_codec,
+            step_output_store=step_output_store,
+            compression_threshold=compression_threshold,
+            batch_outbox=batch_outbox,
+            delete_queue=delete_queue,
+            metrics=metrics,
+            tracer=tracer,
+            replay_cache=replay_cache,
+        )["handler"]
+    else:
+        handler = serve(
+            workflows,
+            qstash_client=qstash_client,
+            initial_payload_parser=initial_payload_parser,
+            receiver=receiver,
+            base_url=base_url,
+            env=env,
+            retries=retries,
+            url=url,
+            failure_function=failure_function,
+            failure_url=failure_url,
+            invocation_time_budget=invocation_time_budget,
+            inline_authentication=inline_authentication,
+            json_codec=json_codec,
+            step_output_store=step_output_store,
+            compression_threshold=compression_threshold,
+            batch_outbox=batch_outbox,
+            delete_queue=delete_queue,
+            metrics=metrics,
+            tracer=tracer,
+            replay_cache=replay_cache,
+        )["handler"]
+
+    async def _app(scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "lifespan":
+            await _lifespan(receive, send, batch_outbox, delete_queue)
+            return
+        if scope["type"] != "http":
+            raise ValueError(f"Unsupported ASGI scope type: {scope['type']}")
+
+        if scope["method"] != "POST":
+            await _send_response(
+                send,
+                _Response(json.dumps({"error": "Method not allowed"}), status=405),
+            )
+            return
+
+        request = _AsyncRequest(
+            _body=await _read_body(receive),
+            headers=_get_headers(scope),
+            query=dict(parse_qsl(scope.get("query_string", b"").decode("latin-1"))),
+            method="POST",
+            url=_get_url(scope),
+        )
+        response = cast(_Response, await handler(request))
+        await _send_response(send, response)
+
+    return _app
+
+
+async def _read_body(receive: Receive) -> bytes:
+    chunks: List[bytes] = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            break
+    # most requests are received in a single message
+    return chunks[0] if len(chunks) == 1 else b"".join(chunks)
+
+
+def _get_headers(scope: Scope) -> _Headers:
+    headers = _Headers()
+    for raw_name, raw_value in scope["headers"]:
+        name = raw_name.decode("latin-1").lower()
+        value = raw_value.decode("latin-1")
+        headers[name] = f"{headers[name]}, {value}" if name in headers else value
+    return headers
+
+
+def _get_url(scope: Scope) -> str:
+    """
+    Reconstructs the url of the request like Starlette does, with the path
+    where the application is mounted.
+    """
+    scheme = scope.get("scheme", "http")
+    host = None
+    for name, value in scope["headers"]:
+        if name == b"host":
+            host = value.decode("latin-1")
+            break
+
+    if host is None:
+        server: Optional[Tuple[str, Optional[int]]] = scope.get("server")
+        if server is None:
+            host = "localhost"
+        else:
+            server_host, port = server
+            host = (
+                server_host
+                if port is None or _DEFAULT_PORTS.get(scheme) == port
+                else f"{server_host}:{port}"
+            )
+
+    root_path = scope.get("root_path", "")
+    path = scope.get("path", "/")
+    if root_path and not path.startswith(root_path):
+        path = root_path + path
+
+    query_string = scope.get("query_string", b"")
+    url = f"{scheme}://{host}{path}"
+    return f"{url}?{query_string.decode('latin-1')}" if query_string else url
+
+
+async def _send_response(send: Send, response: _Response) -> None:
+    body = response.body.encode()
+    headers = [
+        (name.lower().encode("latin-1"), value.encode("latin-1"))
+        for name, value in (response.headers or {}).items()
+        if name.lower() not in ("content-length", "content-type")
+    ]
+    headers.append((b"content-type", b"application/json"))
+    headers.append((b"content-length", str(len(body)).encode("latin-1")))
+    await send(
+        {"type": "http.response.start", "status": response.status, "headers": headers}
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _lifespan(
+    receive: Receive,
+    send: Send,
+    batch_outbox: Optional[BatchOutbox],
+    delete_queue: Optional[AsyncDeleteQueue],
+) -> None:
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            try:
+                if batch_outbox is not None:
+                    await batch_outbox.flush()
+                if delete_queue is not None:
+                    await delete_queue.drain()
+            except Exception as error:
+                _logger.exception(error)
+                await send({"type": "lifespan.shutdown.failed", "message": str(error)})
+            else:
+                await send({"type": "lifespan.shutdown.complete"})
+            return
@@ -1,14 +1,37 @@
 from __future__ import annotations
-from typing import TYPE_CHECKING, List, Union, Literal, cast, Any, TypeVar
+from typing import (
+    Dict,
+    TYPE_CHECKING,
+    List,
+    Optional,
+    Sequence,
+    Union,
+    Literal,
+    cast,
+    Any,
+    TypeVar,
+    Tuple,
+)
+import asyncio
 import json
+import time
 from qstash.message import BatchJsonRequest
-from upstash_workflow.constants import NO_CONCURRENCY
+from upstash_workflow.constants import NO_CONCURRENCY, FUSED_STEPS_FIELD
 from upstash_workflow.error import WorkflowError, WorkflowAbort
-from upstash_workflow.workflow_requests import _get_headers
-from upstash_workflow.types import DefaultStep, HTTPMethods
+from upstash_workflow.workflow_requests import _get_headers_template
+from upstash_workflow.store import _offload_step_output
+from upstash_workflow.compression import _compress_step_output
+from upstash_workflow.metrics import (
+    HEADER_BUILD_SECONDS,
+    QSTASH_PUBLISH_SECONDS,
+    STEP_FUNCTION_SECONDS,
+)
+from upstash_workflow.tracing import AttributeValue, _trace, _inject_trace_context
+from upstash_workflow.types import DefaultStep, HTTPMethods, _ParallelCallState
 from upstash_workflow.asyncio.context.steps import (
     _BaseLazyStep,
     _LazyCallStep,
+    _LazyFunctionStep,
     _LazyInvokeStep,
 )
 
@@ -19,24 +42,67 @@ TResult = TypeVar("TResult")
 
 
 class _AutoExecutor:
-    def __init__(self, context: AsyncWorkflowContext[Any], steps: List[DefaultStep]):
+    def __init__(
+        self, context: AsyncWorkflowContext[Any], steps: Sequence[DefaultStep]
+    ):
         self.context: AsyncWorkflowContext[Any] = context
-        self.steps: List[DefaultStep] = steps
-        self.non_plan_step_count: int = len(
-            [
-                step
-                for step in steps
-                if not (hasattr(step, "target_step") and step.target_step)
-            ]
-        )
+        self.steps: Sequence[DefaultStep] = steps
         self.step_count: int = 0
         self.plan_step_count: int = 0
-        self.executing_step: Union[str, Literal[False]] = False
-        self._already_executed: bool = False
+        self.executing_step: Union[asyncio.Future[Any], Literal[False]] = False
+        self.active_lazy_step_list: Optional[List[_BaseLazyStep[Any]]] = None
+        self.replayed_step_count: int = 0
+        self.fused_steps: List[Tuple[_BaseLazyStep[Any], DefaultStep]] = []
+        self.deadline: Optional[float] = (
+            None
+            if context.invocation_time_budget is None
+            else time.monotonic() + context.invocation_time_budget
+        )
 
     async def add_step(self, step_info: _BaseLazyStep[TResult]) -> TResult:
+        """
+        Adds a step to the list of steps to execute.
+
+        Steps which are awaited together (with `asyncio.gather` for instance) are
+        collected in the same list and executed as parallel steps. Otherwise, the
+        list will only contain the step itself and it is executed as a single step.
+
+        :param step_info: lazy step to execute
+        :return: step result
+        """
         self.step_count += 1
-        return cast(TResult, await self.run_single(step_info))
+
+        lazy_step_list = self.active_lazy_step_list
+        if lazy_step_list is None:
+            lazy_step_list = []
+            self.active_lazy_step_list = lazy_step_list
+        lazy_step_list.append(step_info)
+        index = len(lazy_step_list) - 1
+
+        # yield to the event loop once so that the other steps which are
+        # awaited together with this one can add themselves to the list
+        await asyncio.sleep(0)
+
+        if not self.executing_step:
+            self.executing_step = asyncio.ensure_future(self.run_steps(lazy_step_list))
+
+        result = await self.executing_step
+        return cast(TResult, result if len(lazy_step_list) == 1 else result[index])
+
+    async def run_steps(self, lazy_step_list: List[_BaseLazyStep[Any]]) -> Any:
+        """
+        Runs the collected steps as a single step or as parallel steps
+
+        :param lazy_step_list: steps added together
+        :return: step result or list of step results
+        """
+        try:
+            if len(lazy_step_list) == 1:
+                return await self.run_single(lazy_step_list[0])
+            return await self.run_parallel(lazy_step_list)
+        finally:
+            self.active_lazy_step_list = None
+            self.executing_step = False
 
     async def run_single(self, lazy_step: _BaseLazyStep[TResult]) -> Any:
         """
@@ -48,75 +114,358 @@ class _AutoExecutor:
         :param lazy_step: lazy step to execute
         :return: step result
         """
-        if self.step_count < self.non_plan_step_count:
-            step = self.steps[self.step_count + self.plan_step_count]
+        step = _get_step(self.steps, self.step_count + self.plan_step_count)
+        if step is not None and not step.target_step:
             _validate_step(lazy_step, step)
+            self.replayed_step_count += 1
             return step.out
 
-        if self._already_executed:
-            raise WorkflowError(
-                "Running parallel steps is not yet available in workflow-py. Ensure that you are awaiting the steps sequentially."
-            )
-        self._already_executed = True
+        if self.deadline is not None:
+            return await self.run_fused(lazy_step)
 
-        result_step = await lazy_step.get_result_step(NO_CONCURRENCY, self.step_count)
+        result_step = await self.get_result_step(
+            lazy_step, NO_CONCURRENCY, self.step_count
+        )
         await self.submit_steps_to_qstash([result_step], [lazy_step])
         return result_step.out
 
+    async def run_fused(self, lazy_step: _BaseLazyStep[TResult]) -> Any:
+        """
+        Executes a step when an invocation time budget is set.
+
+        Consecutive `context.run` steps are executed in the same invocation and
+        their results are kept until the time budget is exhausted or a different
+        kind of step is reached. Kept results are then sent to QStash as a single
+        message.
+
+        :param lazy_step: lazy step to execute
+        :return: step result
+        """
+        is_function_step = isinstance(lazy_step, _LazyFunctionStep)
+        if self.fused_steps and (
+            not is_function_step or time.monotonic() >= cast(float, self.deadline)
+        ):
+            await self.submit_fused_steps()
+
+        result_step: DefaultStep = await self.get_result_step(
+            lazy_step, NO_CONCURRENCY, self.step_count
+        )
+        if not is_function_step:
+            await self.submit_steps_to_qstash([result_step], [lazy_step])
+
+        # the result is returned as it would be parsed from the request
+        result_step.out = self.context.json_codec.dumps(result_step.out)
+        self.fused_steps.append((lazy_step, result_step))
+
+        if time.monotonic() >= cast(float, self.deadline):
+            await self.submit_fused_steps()
+        return self.context.json_codec.loads(cast(str, result_step.out))
+
+    async def submit_fused_steps(self) -> None:
+        """
+        Sends the results kept by `run_fused` to QStash as a single message.
+        Earlier steps are attached to the message of the last step.
+        """
+        if not self.fused_steps:
+            return
+
+        *fused_steps, (lazy_step, last_step) = self.fused_steps
+        self.fused_steps = []
+        last_step.out = self.context.json_codec.loads(cast(str, last_step.out))
+        await self.submit_steps_to_qstash(
+            [last_step], [lazy_step], [step for _, step in fused_steps]
+        )
+
+    async def run_parallel(self, parallel_steps: List[_BaseLazyStep[Any]]) -> List[Any]:
+        """
+        Runs steps in parallel.
+
+        Parallel steps are executed in multiple invocations:
+        - "first": plan steps are sent to QStash, one for each parallel step.
+        - "partial": QStash calls the endpoint with a plan step. The step it
+          targets is executed and its result is sent to QStash.
+        - "discard": QStash calls the endpoint with a result step while other
+          parallel steps are still running. Nothing is done.
+        - "last": results of all parallel steps are available. They are returned
+          and the workflow continues.
+
+        :param parallel_steps: lazy steps to execute in parallel
+        :return: list of step results
+        """
+        await self.submit_fused_steps()
+
+        initial_step_count = self.step_count - (len(parallel_steps) - 1)
+        parallel_call_state = self.get_parallel_call_state(
+            len(parallel_steps), initial_step_count
+        )
+
+        sorted_steps = _sort_steps(self.steps)
+
+        # expected concurrency. not available in the first parallel call
+        planned_step_index = initial_step_count + self.plan_step_count
+        planned_parallel_step_count = (
+            sorted_steps[planned_step_index].concurrent
+            if planned_step_index < len(sorted_steps)
+            else None
+        )
+
+        if parallel_call_state != "first" and planned_parallel_step_count != len(
+            parallel_steps
+        ):
+            raise WorkflowError(
+                f"Incompatible number of parallel steps when call state was '{parallel_call_state}'."
+                f" Expected {len(parallel_steps)}, got {planned_parallel_step_count} from the request."
+            )
+
+        if parallel_call_state == "first":
+            plan_steps = [
+                parallel_step.get_plan_step(
+                    len(parallel_steps), initial_step_count + index
+                )
+                for index, parallel_step in enumerate(parallel_steps)
+            ]
+            await self.submit_steps_to_qstash(plan_steps, parallel_steps)
+        elif parallel_call_state == "partial":
+            plan_step = self.steps[-1]
+            if plan_step.target_step is None:
+                raise WorkflowError(
+                    f"There must be a target step when call state is 'partial'. Plan step: {plan_step}"
+                )
+
+            step_index = plan_step.target_step - initial_step_count
+            if not 0 <= step_index < len(parallel_steps):
+                raise WorkflowError(
+                    f"Plan step '{plan_step.step_name}' targets step {plan_step.target_step},"
+                    f" which is not one of the {len(parallel_steps)} parallel steps"
+                    f" starting at step {initial_step_count}."
+                )
+            _validate_step(parallel_steps[step_index], plan_step)
+
+            try:
+                parallel_step = parallel_steps[step_index]
+                result_step = await self.get_result_step(
+                    parallel_step, len(parallel_steps), plan_step.target_step
+                )
+                await self.submit_steps_to_qstash([result_step], [parallel_step])
+            except Exception as error:
+                if isinstance(error, WorkflowAbort):
+                    raise error
+                raise WorkflowError(
+                    f"Error submitting steps to QStash in partial parallel step execution: {error}"
+                )
+        elif parallel_call_state == "discard":
+            raise WorkflowAbort("discarded parallel")
+        elif parallel_call_state == "last":
+            parallel_result_steps = [
+                step for step in sorted_steps if step.step_id >= initial_step_count
+            ][: len(parallel_steps)]
+            _validate_parallel_steps(parallel_steps, parallel_result_steps)
+
+            self.plan_step_count += len(parallel_steps)
+            self.replayed_step_count += len(parallel_result_steps)
+            return [step.out for step in parallel_result_steps]
+
+        return [None] * len(parallel_steps)
+
+    def get_parallel_call_state(
+        self, parallel_step_count: int, initial_step_count: int
+    ) -> _ParallelCallState:
+        """
+        Decides the state of the parallel call by checking the steps which
+        are related to the parallel steps.
+
+        :param parallel_step_count: number of parallel steps
+        :param initial_step_count: id of the first parallel step
+        :return: parallel call state
+        """
+        remaining_steps = [
+            step
+            for step in self.steps
+            if (step.target_step or step.step_id) >= initial_step_count
+        ]
+
+        if not remaining_steps:
+            return "first"
+        if len(remaining_steps) >= 2 * parallel_step_count:
+            return "last"
+        if remaining_steps[-1].target_step:
+            return "partial"
+        return "discard"
+
+    async def get_result_step(
+        self, lazy_step: _BaseLazyStep[Any], concurrent: int, step_id: int
+    ) -> DefaultStep:
+        """
+        Creates the result step of the lazy step, running its step function
+        if it has one. The duration of step functions is reported to the
+        metrics sink of the context, and a span is created for the step if
+        tracing is enabled.
+
+        :param lazy_step: lazy step to execute
+        :param concurrent: number of steps running in parallel with the step
+        :param step_id: id of the step
+        :return: result step
+        """
+        if self.context.tracer is None:
+            return await self.measure_result_step(lazy_step, concurrent, step_id)
+
+        with _trace(
+            self.context.tracer,
+            "workflow.step",
+            self.context.span,
+            self.get_span_attributes(lazy_step, step_id),
+        ):
+            return await self.measure_result_step(lazy_step, concurrent, step_id)
+
+    async def measure_result_step(
+        self, lazy_step: _BaseLazyStep[Any], concurrent: int, step_id: int
+    ) -> DefaultStep:
+        if not isinstance(lazy_step, _LazyFunctionStep):
+            return await lazy_step.get_result_step(concurrent, step_id)
+
+        start = time.perf_counter()
+        try:
+            return await lazy_step.get_result_step(concurrent, step_id)
+        finally:
+            self.context.metrics.observe(
+                STEP_FUNCTION_SECONDS,
+                time.perf_counter() - start,
+                self.get_step_tags(lazy_step),
+            )
+
+    def get_step_tags(self, lazy_step: _BaseLazyStep[Any]) -> Dict[str, str]:
+        return {
+            "workflow_url": self.context.url,
+            "step_name": lazy_step.step_name,
+            "step_type": lazy_step.step_type or "",
+        }
+
+    def get_span_attributes(
+        self, lazy_step: _BaseLazyStep[Any], step_id: int
+    ) -> Dict[str, AttributeValue]:
+        return {
+            "workflow.url": self.context.url,
+            "workflow.run_id": self.context.workflow_run_id,
+            "workflow.step.id": step_id,
+            "workflow.step.name": lazy_step.step_name,
+            "workflow.step.type": lazy_step.step_type or "",
+        }
+
+    def encode_step_output(self, step_id: int, out: str) -> str:
+        """
+        Compresses the serialized step output and writes it to the step output
+        store if they are enabled and the output is large enough.
+
+        :param step_id: id of the step
+        :param out: serialized step output
+        :return: step output to send to QStash
+        """
+        return _offload_step_output(
+            self.context.step_output_store,
+            self.context.workflow_run_id,
+            step_id,
+            _compress_step_output(out, self.context.compression_threshold),
+        )
+
     async def submit_steps_to_qstash(
-        self, steps: List[DefaultStep], lazy_steps: List[_BaseLazyStep[Any]]
+        self,
+        steps: List[DefaultStep],
+        lazy_steps: List[_BaseLazyStep[Any]],
+        fused_steps: Optional[List[DefaultStep]] = None,
     ) -> None:
         """
         sends the steps to QStash as batch
 
         :param steps: steps to send
+        :param fused_steps: steps executed before the steps to send in the same
+            invocation. Attached to the message of the step, outputs are expected
+            to be serialized.
         """
         if not steps:
             raise WorkflowError(
                 f"Unable to submit steps to QStash. Provided list is empty. Current step: {self.step_count}"
             )
 
+        fused_steps_body = (
+            {
+                FUSED_STEPS_FIELD: [
+                    {
+                        "stepId": fused_step.step_id,
+                        "stepName": fused_step.step_name,
+                        "stepType": fused_step.step_type,
+                        "out": self.encode_step_output(
+                            fused_step.step_id, cast(str, fused_step.out)
+                        ),
+                        "concurrent": fused_step.concurrent,
+                    }
+                    for fused_step in fused_steps
+                ]
+            }
+            if fused_steps
+            else {}
+        )
+
+        headers_template = _get_headers_template(
+            self.context.url,
+            self.context.headers,
+            self.context.retries,
+            self.context.failure_url,
+        )
+
         batch_requests = []
         for index, single_step in enumerate(steps):
             lazy_step = lazy_steps[index]
 
             # Invoke steps use publish_json directly instead of batch
+            step_tags = self.get_step_tags(lazy_step)
+            start = time.perf_counter()
             if isinstance(lazy_step, _LazyInvokeStep) and single_step.invoke_url:
-                headers = _get_headers(
+                headers = headers_template.get_headers(
                     "false",
                     self.context.workflow_run_id,
-                    self.context.url,
-                    self.context.headers,
                     single_step,
-                    self.context.retries,
                     invoke_retries=lazy_step.retries,
-                    workflow_failure_url=self.context.failure_url,
                 ).headers
-
-                await self.context.qstash_client.message.publish_json(
-                    url=single_step.invoke_url,
-                    body=single_step.invoke_body,
-                    headers=headers,
+                self.context.metrics.observe(
+                    HEADER_BUILD_SECONDS, time.perf_counter() - start, step_tags
                 )
+
+                with _trace(
+                    self.context.tracer,
+                    "qstash.publish",
+                    self.context.span,
+                    {"messaging.destination.name": single_step.invoke_url},
+                ) as span:
+                    _inject_trace_context(headers, span)
+                    start = time.perf_counter()
+                    await self.context.qstash_client.message.publish_json(
+                        url=single_step.invoke_url,
+                        body=single_step.invoke_body,
+                        headers=headers,
+                    )
+                    self.context.metrics.observe(
+                        QSTASH_PUBLISH_SECONDS, time.perf_counter() - start, step_tags
+                    )
                 raise WorkflowAbort(single_step.step_name, single_step)
 
-            headers = _get_headers(
+            headers = headers_template.get_headers(
                 "false",
                 self.context.workflow_run_id,
-                self.context.url,
-                self.context.headers,
                 single_step,
-                self.context.retries,
                 lazy_step.retries if isinstance(lazy_step, _LazyCallStep) else None,
                 lazy_step.timeout if isinstance(lazy_step, _LazyCallStep) else None,
-                self.context.failure_url,
             ).headers
+            self.context.metrics.observe(
+                HEADER_BUILD_SECONDS, time.perf_counter() - start, step_tags
+            )
 
             will_wait = (
                 single_step.concurrent == NO_CONCURRENCY or single_step.step_id == 0
             )
 
-            single_step.out = json.dumps(single_step.out)
+            single_step.out = self.encode_step_output(
+                single_step.step_id, self.context.json_codec.dumps(single_step.out)
+            )
 
             batch_requests.append(
                 BatchJsonRequest(
@@ -145,6 +494,7 @@ class _AutoExecutor:
                             "callHeaders": single_step.call_headers,
                             "waitEventId": single_step.wait_event_id,
                             "waitTimeout": single_step.wait_timeout,
+                            **fused_steps_body,
                         },
                         url=self.context.url,
                         not_before=cast(  # TODO: Change not_before type in BatchJsonRequest
@@ -154,10 +504,47 @@ class _AutoExecutor:
                     )
                 )
             )
-        await self.context.qstash_client.message.batch_json(batch_requests)
+        with _trace(
+            self.context.tracer,
+            "qstash.batch",
+            self.context.span,
+            {"messaging.batch.message_count": len(batch_requests)},
+        ) as span:
+            if span is not None:
+                for batch_request in batch_requests:
+                    _inject_trace_context(
+                        cast(Dict[str, str], batch_request["headers"]), span
+                    )
+            start = time.perf_counter()
+            if self.context.batch_outbox is not None:
+                await self.context.batch_outbox.submit(
+                    self.context.qstash_client, batch_requests
+                )
+            else:
+                await self.context.qstash_client.message.batch_json(batch_requests)
+            self.context.metrics.observe(
+                QSTASH_PUBLISH_SECONDS,
+                time.perf_counter() - start,
+                self.get_step_tags(lazy_steps[0]),
+            )
         raise WorkflowAbort(steps[0].step_name, steps[0])
 
 
+def _get_step(steps: Sequence[DefaultStep], index: int) -> Optional[DefaultStep]:
+    """
+    Returns the step at the index or None if there is no such step. Avoids
+    computing the length of lazily decoded steps.
+
+    :param steps: steps parsed from the incoming request
+    :param index: index of the step
+    :return: step or None
+    """
+    try:
+        return steps[index]
+    except IndexError:
+        return None
+
+
 def _validate_step(
     lazy_step: _BaseLazyStep[Any], step_from_request: DefaultStep
 ) -> None:
@@ -182,3 +569,42 @@ def _validate_step(
             f"Incompatible step type. Expected '{lazy_step.step_type}', "
             f"got '{step_from_request.step_type}' from the request"
         )
+
+
+def _validate_parallel_steps(
+    lazy_steps: List[_BaseLazyStep[Any]], steps_from_request: List[DefaultStep]
+) -> None:
+    """
+    Validates each parallel step against the corresponding step from the request.
+
+    Raises `WorkflowError` listing the expected and received steps if there is
+    a difference.
+
+    :param lazy_steps: lazy steps created during execution
+    :param steps_from_request: result steps parsed from incoming request
+    """
+    try:
+        for index, step_from_request in enumerate(steps_from_request):
+            _validate_step(lazy_steps[index], step_from_request)
+    except WorkflowError as error:
+        lazy_step_names = [lazy_step.step_name for lazy_step in lazy_steps]
+        lazy_step_types = [lazy_step.step_type for lazy_step in lazy_steps]
+        request_step_names = [step.step_name for step in steps_from_request]
+        request_step_types = [step.step_type for step in steps_from_request]
+        raise WorkflowError(
+            f"Incompatible steps detected in parallel execution: {error}"
+            f"\n  > Step Names from the request: {json.dumps(request_step_names)}"
+            f"\n    Step Types from the request: {json.dumps(request_step_types)}"
+            f"\n  > Step Names expected: {json.dumps(lazy_step_names)}"
+            f"\n    Step Types expected: {json.dumps(lazy_step_types)}"
+        )
+
+
+def _sort_steps(steps: Sequence[DefaultStep]) -> List[DefaultStep]:
+    """
+    Sorts the steps by their ids, placing plan steps next to the steps they target.
+
+    :param steps: steps from the request
+    :return: sorted steps
+    """
+    return sorted(steps, key=lambda step: step.target_step or step.step_id)
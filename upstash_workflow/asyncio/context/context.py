@@ -1,7 +1,6 @@
 import json
 import datetime
 from typing import (
-    List,
     Dict,
     Union,
     Optional,
@@ -11,9 +10,15 @@ from typing import (
     Any,
     cast,
     Generic,
+    Sequence,
 )
 from qstash import AsyncQStash
 from upstash_workflow.constants import DEFAULT_RETRIES
+from upstash_workflow.codec import JSONCodec, _get_default_json_codec
+from upstash_workflow.store import StepOutputStore
+from upstash_workflow.metrics import MetricsSink
+from upstash_workflow.tracing import Span, Tracer
+from upstash_workflow.asyncio.outbox import BatchOutbox
 from upstash_workflow.asyncio.context.auto_executor import _AutoExecutor
 from upstash_workflow.asyncio.context.steps import (
     _LazyFunctionStep,
@@ -62,22 +67,38 @@ class WorkflowContext(Generic[TInitialPayload]):
         qstash_client: AsyncQStash,
         workflow_run_id: str,
         headers: Dict[str, str],
-        steps: List[DefaultStep],
+        steps: Sequence[DefaultStep],
         url: str,
         failure_url: Optional[str],
         initial_payload: TInitialPayload,
         env: Optional[Dict[str, Optional[str]]] = None,
         retries: Optional[int] = None,
+        invocation_time_budget: Optional[float] = None,
+        json_codec: Optional[JSONCodec] = None,
+        step_output_store: Optional[StepOutputStore] = None,
+        compression_threshold: Optional[int] = None,
+        batch_outbox: Optional[BatchOutbox] = None,
+        metrics: Optional[MetricsSink] = None,
+        tracer: Optional[Tracer] = None,
     ):
         self.qstash_client: AsyncQStash = qstash_client
         self.workflow_run_id: str = workflow_run_id
-        self._steps: List[DefaultStep] = steps
+        self._steps: Sequence[DefaultStep] = steps
         self.url: str = url
         self.failure_url = failure_url
         self.headers: Dict[str, str] = headers
         self.request_payload: TInitialPayload = initial_payload
         self.env: Dict[str, Optional[str]] = env or {}
         self.retries: int = DEFAULT_RETRIES if retries is None else retries
+        self.invocation_time_budget: Optional[float] = invocation_time_budget
+        self.json_codec: JSONCodec = json_codec or _get_default_json_codec()
+        self.step_output_store: Optional[StepOutputStore] = step_output_store
+        self.compression_threshold: Optional[int] = compression_threshold
+        self.batch_outbox: Optional[BatchOutbox] = batch_outbox
+        self.metrics: MetricsSink = metrics or MetricsSink()
+        self.tracer: Optional[Tracer] = tracer
+        # parent of the spans of steps and QStash calls, set by serve
+        self.span: Optional[Span] = None
         self._executor: _AutoExecutor = _AutoExecutor(self, self._steps)
 
     async def run(
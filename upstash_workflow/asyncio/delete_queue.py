@@ -0,0 +1,80 @@
+import asyncio
+import logging
+from typing import Optional, Set
+from qstash import AsyncQStash
+from upstash_workflow.constants import DEFAULT_DELETE_QUEUE_WORKERS
+
+_logger = logging.getLogger(__name__)
+
+
+async def _delete_workflow_run(
+    qstash_client: AsyncQStash, workflow_run_id: str, cancel: bool = False
+) -> None:
+    """
+    Deletes the workflow run from QStash
+
+    :param qstash_client: QStash client
+    :param workflow_run_id: id of the workflow run
+    :param cancel: whether to cancel the run if it's still running
+    """
+    await qstash_client.http.request(
+        path=f"/v2/workflows/runs/{workflow_run_id}?cancel={str(cancel).lower()}",
+        method="DELETE",
+        parse_response=False,
+    )
+
+
+class AsyncDeleteQueue:
+    """
+    Deletes finished workflow runs in background tasks, so that the request
+    finishing a run can return without waiting for the delete request.
+
+    Up to `concurrency` delete requests are sent at a time. Failed deletes are
+    logged. Call `drain()` when the application shuts down, for example in the
+    lifespan of a FastAPI app, to send the pending deletes.
+
+    A queue should be used in a single event loop.
+
+    :param concurrency: maximum number of delete requests in flight
+    """
+
+    def __init__(self, concurrency: int = DEFAULT_DELETE_QUEUE_WORKERS):
+        self.concurrency = concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._tasks: Set["asyncio.Future[None]"] = set()
+
+    def enqueue(
+        self, qstash_client: AsyncQStash, workflow_run_id: str, cancel: bool = False
+    ) -> None:
+        """
+        Adds the workflow run to the queue
+
+        :param qstash_client: QStash client
+        :param workflow_run_id: id of the workflow run
+        :param cancel: whether to cancel the run if it's still running
+        """
+        task = asyncio.ensure_future(
+            self._delete(qstash_client, workflow_run_id, cancel)
+        )
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def drain(self) -> None:
+        """
+        Waits until the runs in the queue are deleted
+        """
+        while self._tasks:
+            await asyncio.wait(set(self._tasks))
+
+    async def _delete(
+        self, qstash_client: AsyncQStash, workflow_run_id: str, cancel: bool
+    ) -> None:
+        # created here since semaphores are bound to the event loop in python<3.10
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        async with self._semaphore:
+            try:
+                await _delete_workflow_run(qstash_client, workflow_run_id, cancel)
+            except Exception:
+                _logger.exception(f"Failed to delete workflow run {workflow_run_id}")
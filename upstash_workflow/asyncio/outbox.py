@@ -0,0 +1,183 @@
+import asyncio
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+from qstash import AsyncQStash
+from qstash.message import (
+    BatchJsonRequest,
+    convert_to_batch_messages,
+    prepare_batch_message_body,
+)
+from upstash_workflow.constants import (
+    DEFAULT_OUTBOX_MAX_BYTES,
+    DEFAULT_OUTBOX_MAX_MESSAGES,
+    DEFAULT_OUTBOX_WINDOW,
+)
+from upstash_workflow.error import WorkflowError
+
+
+@dataclass
+class _PendingBatch:
+    # messages of each submission in the batch, with the future it waits on
+    submissions: List[Tuple[List[BatchJsonRequest], "asyncio.Future[None]"]] = field(
+        default_factory=list
+    )
+    message_count: int = 0
+    size: int = 0
+    timer: Optional[asyncio.TimerHandle] = None
+
+
+def _get_message_size(message: BatchJsonRequest) -> int:
+    """
+    Returns the size of the message with its headers in the body of a batch
+    request, serialized the way `batch_json` does. The body of a batch request
+    is ASCII, and its size is the sum of the sizes of its messages.
+    """
+    return len(prepare_batch_message_body(convert_to_batch_messages([message])))
+
+
+class BatchOutbox:
+    """
+    Coalesces the step messages of concurrent workflow runs into shared batch
+    requests to QStash.
+
+    Messages submitted within `window` seconds of the first pending message are
+    sent together in one `batch_json` call, or earlier once `max_messages`
+    messages or `max_bytes` bytes of serialized messages are pending. The
+    messages of a submission are never split across batches, so that a step
+    retried after a failure doesn't send messages which were already accepted:
+    when a submission doesn't fit in the pending batch, the pending batch is
+    sent first. Each submission waits until its batch is accepted by QStash.
+
+    If a batch with the messages of several submissions fails, the messages
+    of each submission are sent again in a separate batch, so that only the
+    submissions whose messages are rejected fail.
+
+    An outbox should be used in a single event loop.
+
+    :param window: seconds to wait for more messages before sending a batch
+    :param max_messages: maximum number of messages in a batch. A submission
+        with more messages is sent in a batch of its own.
+    :param max_bytes: maximum size of the serialized messages in a batch,
+        headers included. A submission larger than this is sent in a batch of
+        its own.
+    """
+
+    def __init__(
+        self,
+        window: float = DEFAULT_OUTBOX_WINDOW,
+        max_messages: int = DEFAULT_OUTBOX_MAX_MESSAGES,
+        max_bytes: int = DEFAULT_OUTBOX_MAX_BYTES,
+    ):
+        if max_messages < 1:
+            raise WorkflowError(
+                f"max_messages should be at least 1, got {max_messages}."
+            )
+        if max_bytes < 1:
+            raise WorkflowError(f"max_bytes should be at least 1, got {max_bytes}.")
+        self.window = window
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self._pending: Dict[AsyncQStash, _PendingBatch] = {}
+        self._sending: Set["asyncio.Future[None]"] = set()
+
+    async def submit(
+        self, qstash_client: AsyncQStash, messages: List[BatchJsonRequest]
+    ) -> None:
+        """
+        Adds the messages to the pending batches of the client and waits until
+        they are sent.
+
+        :param qstash_client: client to send the batches with
+        :param messages: messages to send
+        """
+        loop = asyncio.get_running_loop()
+        size = sum(_get_message_size(message) for message in messages)
+
+        batch = self._pending.get(qstash_client)
+        if (
+            batch is not None
+            and batch.message_count
+            and (
+                batch.message_count + len(messages) > self.max_messages
+                or batch.size + size > self.max_bytes
+            )
+        ):
+            self._flush(qstash_client)
+            batch = None
+
+        if batch is None:
+            batch = _PendingBatch()
+            batch.timer = loop.call_later(self.window, self._flush, qstash_client)
+            self._pending[qstash_client] = batch
+
+        future: "asyncio.Future[None]" = loop.create_future()
+        batch.submissions.append((list(messages), future))
+        batch.message_count += len(messages)
+        batch.size += size
+
+        if batch.message_count >= self.max_messages or batch.size >= self.max_bytes:
+            self._flush(qstash_client)
+
+        await future
+
+    async def flush(self) -> None:
+        """
+        Sends the pending batches without waiting for the window to end and
+        waits until all batches are sent.
+        """
+        for qstash_client in list(self._pending):
+            self._flush(qstash_client)
+        if self._sending:
+            await asyncio.wait(self._sending)
+
+    def _flush(self, qstash_client: AsyncQStash) -> None:
+        batch = self._pending.pop(qstash_client, None)
+        if batch is None:
+            return
+
+        if batch.timer is not None:
+            batch.timer.cancel()
+
+        sending = asyncio.ensure_future(self._send(qstash_client, batch))
+        self._sending.add(sending)
+        sending.add_done_callback(self._sending.discard)
+
+    async def _send(self, qstash_client: AsyncQStash, batch: _PendingBatch) -> None:
+        try:
+            await qstash_client.message.batch_json(
+                [message for messages, _ in batch.submissions for message in messages]
+            )
+        except Exception as error:
+            if len(batch.submissions) == 1:
+                _, future = batch.submissions[0]
+                _set_exception(future, error)
+                return
+            await asyncio.gather(
+                *[
+                    self._send_submission(qstash_client, messages, future)
+                    for messages, future in batch.submissions
+                ]
+            )
+        else:
+            for _, future in batch.submissions:
+                if not future.done():
+                    future.set_result(None)
+
+    async def _send_submission(
+        self,
+        qstash_client: AsyncQStash,
+        messages: List[BatchJsonRequest],
+        future: "asyncio.Future[None]",
+    ) -> None:
+        try:
+            await qstash_client.message.batch_json(messages)
+        except Exception as error:
+            _set_exception(future, error)
+        else:
+            if not future.done():
+                future.set_result(None)
+
+
+def _set_exception(future: "asyncio.Future[None]", error: Exception) -> None:
+    if not future.done():
+        future.set_exception(error)
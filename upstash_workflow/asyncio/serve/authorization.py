@@ -1,3 +1,4 @@
+from functools import lru_cache
 from typing import Callable, Awaitable, Literal, TypeVar, Generic
 from qstash import AsyncQStash
 from upstash_workflow import AsyncWorkflowContext
@@ -8,6 +9,15 @@ TInitialPayload = TypeVar("TInitialPayload")
 TResult = TypeVar("TResult")
 
 
+@lru_cache(maxsize=None)
+def _get_disabled_qstash_client() -> AsyncQStash:
+    """
+    QStash client of the disabled context. It is never used to send requests,
+    so a single instance is shared by all dry runs.
+    """
+    return AsyncQStash(base_url="disabled-client", token="disabled-client")
+
+
 class _DisabledWorkflowContext(
     Generic[TInitialPayload], AsyncWorkflowContext[TInitialPayload]
 ):
@@ -28,9 +38,7 @@ class _DisabledWorkflowContext(
         context: AsyncWorkflowContext[TInitialPayload],
     ) -> Literal["run-ended", "step-found"]:
         disabled_context = _DisabledWorkflowContext(
-            qstash_client=AsyncQStash(
-                base_url="disabled-client", token="disabled-client"
-            ),
+            qstash_client=_get_disabled_qstash_client(),
             workflow_run_id=context.workflow_run_id,
             headers=context.headers,
             steps=[],
@@ -3,6 +3,13 @@ import json
 import logging
 from typing import Callable, Dict, Optional, cast, TypeVar, Any, Generic, Awaitable
 from qstash import AsyncQStash, Receiver
+from upstash_workflow.codec import JSONCodec, _get_default_json_codec
+from upstash_workflow.store import StepOutputStore
+from upstash_workflow.asyncio.delete_queue import AsyncDeleteQueue
+from upstash_workflow.metrics import MetricsSink
+from upstash_workflow.replay_cache import ReplayCache
+from upstash_workflow.tracing import Tracer
+from upstash_workflow.asyncio.outbox import BatchOutbox
 from upstash_workflow.workflow_types import _Response
 from upstash_workflow.constants import (
     DEFAULT_RETRIES,
@@ -34,6 +41,16 @@ class ServeOptions(Generic[TInitialPayload, TResponse]):
         Callable[[AsyncWorkflowContext, int, str, Dict[str, str]], Awaitable[Any]]
     ]
     failure_url: Optional[str]
+    invocation_time_budget: Optional[float]
+    inline_authentication: bool
+    json_codec: JSONCodec
+    step_output_store: Optional[StepOutputStore]
+    compression_threshold: Optional[int]
+    batch_outbox: Optional[BatchOutbox]
+    delete_queue: Optional[AsyncDeleteQueue]
+    metrics: MetricsSink
+    tracer: Optional[Tracer]
+    replay_cache: Optional[ReplayCache]
 
 
 @dataclass
@@ -57,9 +74,21 @@ def _process_options(
         Callable[[AsyncWorkflowContext, int, str, Dict[str, str]], Awaitable[Any]]
     ] = None,
     failure_url: Optional[str] = None,
+    invocation_time_budget: Optional[float] = None,
+    inline_authentication: bool = False,
+    json_codec: Optional[JSONCodec] = None,
+    step_output_store: Optional[StepOutputStore] = None,
+    compression_threshold: Optional[int] = None,
+    batch_outbox: Optional[BatchOutbox] = None,
+    delete_queue: Optional[AsyncDeleteQueue] = None,
+    metrics: Optional[MetricsSink] = None,
+    tracer: Optional[Tracer] = None,
+    replay_cache: Optional[ReplayCache] = None,
 ) -> ServeBaseOptions[TInitialPayload, TResponse]:
     environment = env if env is not None else dict(os.environ)
 
+    codec = json_codec or _get_default_json_codec()
+
     receiver_environment_variables_set = bool(
         environment.get("QSTASH_CURRENT_SIGNING_KEY")
         and environment.get("QSTASH_NEXT_SIGNING_KEY")
@@ -81,6 +110,7 @@ def _process_options(
                     headers={
                         WORKFLOW_PROTOCOL_VERSION_HEADER: WORKFLOW_PROTOCOL_VERSION
                     },
+                    json_codec=codec,
                 ),
             )
 
@@ -90,6 +120,7 @@ def _process_options(
                 body={"workflowRunId": workflow_run_id},
                 status=200,
                 headers={WORKFLOW_PROTOCOL_VERSION_HEADER: WORKFLOW_PROTOCOL_VERSION},
+                json_codec=codec,
             ),
         )
 
@@ -100,7 +131,7 @@ def _process_options(
 
         # Try to parse the payload
         try:
-            return cast(TInitialPayload, json.loads(initial_request))
+            return cast(TInitialPayload, codec.loads(initial_request))
         except json.JSONDecodeError:
             # If parsing fails, return the raw string
             return cast(TInitialPayload, initial_request)
@@ -135,6 +166,16 @@ def _process_options(
         url=url,
         failure_url=failure_url,
         failure_function=failure_function,
+        invocation_time_budget=invocation_time_budget,
+        inline_authentication=inline_authentication,
+        json_codec=codec,
+        step_output_store=step_output_store,
+        compression_threshold=compression_threshold,
+        batch_outbox=batch_outbox,
+        delete_queue=delete_queue,
+        metrics=metrics or MetricsSink(),
+        tracer=tracer,
+        replay_cache=replay_cache,
     )
 
 
@@ -1,8 +1,17 @@
-from typing import Optional, cast
+from typing import Optional, Union, cast
 from upstash_workflow.workflow_types import _AsyncRequest
-import json
-from typing import Callable, Dict, Any, Literal, Awaitable, TypeVar
-from upstash_workflow.utils import _decode_base64
+from typing import Callable, Dict, Any, List, Literal, Awaitable, TypeVar
+from upstash_workflow.utils import _decode_base64, _decode_text
+from upstash_workflow.codec import JSONCodec, _get_default_json_codec
+from upstash_workflow.store import StepOutputStore
+from upstash_workflow.replay_cache import ReplayCache
+from upstash_workflow.types import _ParseRequestResponse
+from upstash_workflow.workflow_parser import (
+    _decode_request_payload,
+    _filter_fetched_steps,
+    _is_not_found_error,
+    _parse_raw_steps,
+)
 from upstash_workflow.constants import (
     WORKFLOW_FAILURE_HEADER,
 )
@@ -10,29 +19,115 @@ from upstash_workflow.error import WorkflowError
 from upstash_workflow.workflow_requests import _recreate_user_headers
 from upstash_workflow.asyncio.serve.authorization import _DisabledWorkflowContext
 from qstash import AsyncQStash
+from qstash.errors import QStashError
 from upstash_workflow import AsyncWorkflowContext
 
 
-async def _get_payload(request: _AsyncRequest) -> Optional[str]:
+async def _get_payload(request: _AsyncRequest) -> Optional[bytes]:
     """
     Gets the request body. If that fails, returns None
 
+    The body is not decoded, since the JSON codec parses bytes directly.
+
     :param request: request received in the workflow api
     :return: request body
     """
     try:
-        return (await request.body()).decode()
+        return await request.body()
     except Exception:
         return None
 
 
+async def _get_steps(
+    qstash_client: AsyncQStash,
+    workflow_run_id: str,
+    message_id: Optional[str],
+    json_codec: JSONCodec,
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    Fetches the step history of the workflow run from QStash.
+
+    :param qstash_client: QStash client
+    :param workflow_run_id: id of the workflow run
+    :param message_id: id of the message delivered in the request
+    :param json_codec: codec to decode the response with
+    :return: steps, or None if the workflow run has already ended
+    """
+    try:
+        raw_payload = await qstash_client.http.request(
+            path=f"/v2/workflows/runs/{workflow_run_id}",
+            method="GET",
+            parse_response=False,
+        )
+    except QStashError as error:
+        if _is_not_found_error(error):
+            return None
+        raise
+
+    return _filter_fetched_steps(
+        json_codec.loads(raw_payload), workflow_run_id, message_id
+    )
+
+
+async def _parse_request(
+    request_payload: Optional[Union[str, bytes]],
+    is_first_invocation: bool,
+    json_codec: Optional[JSONCodec] = None,
+    step_output_store: Optional[StepOutputStore] = None,
+    workflow_run_id: Optional[str] = None,
+    message_id: Optional[str] = None,
+    qstash_client: Optional[AsyncQStash] = None,
+    replay_cache: Optional[ReplayCache] = None,
+) -> _ParseRequestResponse:
+    """
+    Returns the initial payload and the steps of the request. If the body is
+    empty or cut short, steps are fetched from QStash.
+
+    :param request_payload: body of the request
+    :param is_first_invocation: whether the request is the first invocation
+    :param json_codec: codec to decode the request body with
+    :param step_output_store: store to read offloaded step outputs from
+    :param workflow_run_id: id of the workflow run, used to fetch the steps
+    :param message_id: id of the message delivered in the request
+    :param qstash_client: QStash client to fetch the steps with
+    :param replay_cache: cache of steps decoded in earlier requests
+    :return: raw initial payload and the steps
+    """
+    if is_first_invocation:
+        return _ParseRequestResponse(
+            raw_initial_payload=_decode_text(request_payload or ""),
+            steps=[],
+        )
+
+    json_codec = json_codec or _get_default_json_codec()
+    raw_steps = _decode_request_payload(request_payload, json_codec)
+
+    if raw_steps is None:
+        if qstash_client is None or not workflow_run_id:
+            raise WorkflowError("Only first call can have an empty body")
+
+        raw_steps = await _get_steps(
+            qstash_client, workflow_run_id, message_id, json_codec
+        )
+        if raw_steps is None:
+            return _ParseRequestResponse(
+                raw_initial_payload="", steps=[], workflow_run_ended=True
+            )
+
+    raw_initial_payload, steps = _parse_raw_steps(
+        raw_steps, json_codec, step_output_store, workflow_run_id, replay_cache
+    )
+
+    return _ParseRequestResponse(raw_initial_payload=raw_initial_payload, steps=steps)
+
+
 TInitialPayload = TypeVar("TInitialPayload")
 TRequest = TypeVar("TRequest", bound=_AsyncRequest)
 
 
 async def _handle_failure(
     request: TRequest,
-    request_payload: str,
+    request_payload: Union[str, bytes],
     qstash_client: AsyncQStash,
     initial_payload_parser: Callable[[str], Any],
     route_function: Callable[[AsyncWorkflowContext[TInitialPayload]], Awaitable[None]],
@@ -44,6 +139,8 @@ async def _handle_failure(
     ],
     env: Dict[str, Any],
     retries: int,
+    json_codec: Optional[JSONCodec] = None,
+    step_output_store: Optional[StepOutputStore] = None,
 ) -> Literal["not-failure-callback", "is-failure-callback"]:
     if request.headers and request.headers.get(WORKFLOW_FAILURE_HEADER) != "true":
         return "not-failure-callback"
@@ -55,8 +152,9 @@ async def _handle_failure(
             "Either provide a failure_url or a failure_function."
         )
 
+    json_codec = json_codec or _get_default_json_codec()
     try:
-        payload = json.loads(request_payload)
+        payload = json_codec.loads(request_payload)
         status = payload["status"]
         header = payload["header"]
         body = payload["body"]
@@ -65,7 +163,7 @@ async def _handle_failure(
         workflow_run_id = payload["workflowRunId"]
 
         decoded_body = _decode_base64(body) if body else "{}"
-        error_payload = json.loads(decoded_body)
+        error_payload = json_codec.loads(decoded_body)
 
         # Create context
         workflow_context = AsyncWorkflowContext(
@@ -80,6 +178,7 @@ async def _handle_failure(
             failure_url=url,
             env=env,
             retries=retries,
+            json_codec=json_codec,
         )
 
         # Attempt running route_function until the first step
@@ -97,6 +196,10 @@ async def _handle_failure(
             error_payload.get("message"),
             header,
         )
+
+        # the run failed, so its step outputs are not read anymore
+        if step_output_store is not None:
+            step_output_store.delete(workflow_run_id)
     except Exception as error:
         raise error
 
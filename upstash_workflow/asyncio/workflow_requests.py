@@ -10,15 +10,22 @@ from typing import (
     Optional,
     cast,
     TypeVar,
+    Union,
 )
 from qstash import AsyncQStash
+from upstash_workflow.codec import JSONCodec, _get_default_json_codec
+from upstash_workflow.asyncio.delete_queue import AsyncDeleteQueue, _delete_workflow_run
 from upstash_workflow.error import WorkflowError, WorkflowAbort
+from upstash_workflow.tracing import _trace, _inject_trace_context
 from upstash_workflow.constants import (
     WORKFLOW_ID_HEADER,
 )
 from upstash_workflow.types import StepTypes
 from upstash_workflow.workflow_types import _AsyncRequest
-from upstash_workflow.workflow_requests import _get_headers, _recreate_user_headers
+from upstash_workflow.workflow_requests import (
+    _get_headers_template,
+    _recreate_user_headers,
+)
 
 if TYPE_CHECKING:
     from upstash_workflow import AsyncWorkflowContext
@@ -32,21 +39,27 @@ async def _trigger_first_invocation(
     workflow_context: AsyncWorkflowContext[TInitialPayload],
     retries: int,
 ) -> None:
-    headers = _get_headers(
-        "true",
-        workflow_context.workflow_run_id,
-        workflow_context.url,
-        workflow_context.headers,
-        None,
-        retries,
-    ).headers
-
-    await workflow_context.qstash_client.message.publish_json(
-        url=workflow_context.url,
-        body=workflow_context.request_payload,
-        headers=headers,
+    headers = (
+        _get_headers_template(
+            workflow_context.url, workflow_context.headers, retries, None
+        )
+        .get_headers("true", workflow_context.workflow_run_id)
+        .headers
     )
 
+    with _trace(
+        workflow_context.tracer,
+        "qstash.publish",
+        workflow_context.span,
+        {"messaging.destination.name": workflow_context.url},
+    ) as span:
+        _inject_trace_context(headers, span)
+        await workflow_context.qstash_client.message.publish_json(
+            url=workflow_context.url,
+            body=workflow_context.request_payload,
+            headers=headers,
+        )
+
 
 async def _trigger_route_function(
     on_step: Callable[[], Awaitable[None]], on_cleanup: Callable[[], Awaitable[None]]
@@ -66,21 +79,31 @@ async def _trigger_route_function(
 async def _trigger_workflow_delete(
     workflow_context: AsyncWorkflowContext[TInitialPayload],
     cancel: Optional[bool] = False,
+    delete_queue: Optional[AsyncDeleteQueue] = None,
 ) -> None:
-    await workflow_context.qstash_client.http.request(
-        path=f"/v2/workflows/runs/{workflow_context.workflow_run_id}?cancel={str(cancel).lower()}",
-        method="DELETE",
-        parse_response=False,
+    if delete_queue is not None:
+        delete_queue.enqueue(
+            workflow_context.qstash_client,
+            workflow_context.workflow_run_id,
+            bool(cancel),
+        )
+        return
+
+    await _delete_workflow_run(
+        workflow_context.qstash_client,
+        workflow_context.workflow_run_id,
+        bool(cancel),
     )
 
 
 async def _handle_third_party_call_result(
     request: _AsyncRequest,
-    request_payload: str,
+    request_payload: Union[str, bytes],
     client: AsyncQStash,
     workflow_url: str,
     workflow_failure_url: Optional[str],
     retries: int,
+    json_codec: Optional[JSONCodec] = None,
 ) -> Literal["call-will-retry", "is-call-return", "continue-workflow"]:
     """
     Check if the request is from a third party call result. If so,
@@ -102,8 +125,10 @@ async def _handle_third_party_call_result(
     :param client: QStash client
     :param workflow_url: Workflow URL
     :param retries: Number of retries
+    :param json_codec: codec to decode the call result and encode the result step with
     :return: "call-will-retry", "is-call-return" or "continue-workflow"
     """
+    json_codec = json_codec or _get_default_json_codec()
     try:
         if request.headers and request.headers.get("Upstash-Workflow-Callback"):
             if request_payload:
@@ -111,7 +136,7 @@ async def _handle_third_party_call_result(
             else:
                 raise NotImplementedError
 
-            callback_message = json.loads(callback_payload)
+            callback_message = json_codec.loads(callback_payload)
 
             if (
                 not (200 <= callback_message["status"] < 300)
@@ -167,15 +192,13 @@ async def _handle_third_party_call_result(
             content_type = cast(str, content_type)
 
             user_headers = _recreate_user_headers(headers)
-            request_headers = _get_headers(
-                "false",
-                workflow_run_id,
-                workflow_url,
-                user_headers,
-                None,
-                retries,
-                workflow_failure_url=workflow_failure_url,
-            ).headers
+            request_headers = (
+                _get_headers_template(
+                    workflow_url, user_headers, retries, workflow_failure_url
+                )
+                .get_headers("false", workflow_run_id)
+                .headers
+            )
 
             if step_type == "Invoke":
                 # Invoke results: extract body and derive status flags
@@ -192,7 +215,7 @@ async def _handle_third_party_call_result(
                     "stepId": int(step_id_str),
                     "stepName": step_name,
                     "stepType": step_type,
-                    "out": json.dumps(invoke_response),
+                    "out": json_codec.dumps(invoke_response),
                     "concurrent": int(concurrent_str),
                 }
             else:
@@ -205,7 +228,7 @@ async def _handle_third_party_call_result(
                     "stepId": int(step_id_str),
                     "stepName": step_name,
                     "stepType": step_type,
-                    "out": json.dumps(call_response),
+                    "out": json_codec.dumps(call_response),
                     "concurrent": int(concurrent_str),
                 }
 
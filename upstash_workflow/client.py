@@ -1,10 +1,46 @@
+import asyncio
 import json
-from typing import Any, Dict, List, Optional
+import os
+import threading
+import time
+import weakref
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from types import TracebackType
+from typing import (
+    Any,
+    AsyncIterator,
+    ClassVar,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Type,
+)
 import httpx
-from upstash_workflow.types import NotifyResponse, Waiter
+from qstash.message import BatchRequest, prepare_batch_message_body
+from upstash_workflow.codec import JSONCodec, _get_default_json_codec
+from upstash_workflow.constants import (
+    DEFAULT_NOTIFY_CONCURRENCY,
+    DEFAULT_RETRIES,
+    DEFAULT_TRIGGER_BATCH_BYTES,
+    DEFAULT_TRIGGER_BATCH_SIZE,
+    DEFAULT_TRIGGER_CHUNK_RETRIES,
+)
+from upstash_workflow.error import WorkflowError
+from upstash_workflow.types import NotifyManyResult, NotifyResponse, Waiter
+from upstash_workflow.utils import _nanoid
+from upstash_workflow.workflow_requests import _get_headers_template
 
 
 DEFAULT_BASE_URL = "https://qstash.upstash.io"
+DEFAULT_LIMITS = httpx.Limits(
+    max_connections=100, max_keepalive_connections=20, keepalive_expiry=30
+)
+# same as the default timeout of httpx
+DEFAULT_TIMEOUT = httpx.Timeout(timeout=5)
 
 
 def _parse_waiter(data: Dict[str, Any]) -> Waiter:
@@ -26,14 +62,190 @@ def _parse_notify_response(item: Dict[str, Any]) -> NotifyResponse:
     )
 
 
+def _get_default_credentials() -> Dict[str, Any]:
+    """
+    Returns the token and base url of the default client from the environment
+    """
+    token = os.environ.get("QSTASH_TOKEN")
+    if not token:
+        raise WorkflowError(
+            "QSTASH_TOKEN environment variable is required to create the default client."
+        )
+    return {"token": token, "base_url": os.environ.get("QSTASH_URL")}
+
+
+def _get_notify_request(
+    base_url: str,
+    event_id: str,
+    event_data: Any,
+    workflow_run_id: Optional[str],
+) -> Tuple[str, Optional[str]]:
+    """
+    Returns the url and the body of a notify request
+    """
+    if workflow_run_id:
+        url = f"{base_url}/v2/notify/{workflow_run_id}/{event_id}"
+    else:
+        url = f"{base_url}/v2/notify/{event_id}"
+
+    if isinstance(event_data, str):
+        body = event_data
+    elif event_data is not None:
+        body = json.dumps(event_data)
+    else:
+        body = None
+
+    return url, body
+
+
+def _validate_concurrency(concurrency: int) -> None:
+    if concurrency < 1:
+        raise WorkflowError(f"concurrency should be at least 1, got {concurrency}.")
+
+
+def _get_trigger_chunks(
+    url: str,
+    payloads: Iterable[Any],
+    headers: Optional[Dict[str, str]],
+    retries: int,
+    failure_url: Optional[str],
+    batch_size: int,
+    json_codec: JSONCodec,
+) -> Iterator[Tuple[List[str], str]]:
+    """
+    Creates the messages which start a workflow run for each payload, with the
+    headers the first invocation of the workflow endpoint would send.
+
+    Messages are grouped in batch request bodies of up to `batch_size` messages
+    and `DEFAULT_TRIGGER_BATCH_BYTES` bytes of message bodies. The run id is
+    used as the deduplication id, so that retrying a batch doesn't start a run
+    twice. Payloads are serialized with the codec, like the initial payloads
+    sent by the workflow endpoint.
+
+    :return: iterator of run ids and the batch request body for them
+    """
+    if batch_size < 1:
+        raise WorkflowError(f"batch_size should be at least 1, got {batch_size}.")
+
+    headers_template = _get_headers_template(url, headers, retries, failure_url)
+    workflow_run_ids: List[str] = []
+    messages: List[BatchRequest] = []
+    batch_bytes = 0
+    for payload in payloads:
+        body = json_codec.dumps(payload)
+        if messages and (
+            len(messages) >= batch_size
+            or batch_bytes + len(body) > DEFAULT_TRIGGER_BATCH_BYTES
+        ):
+            yield workflow_run_ids, prepare_batch_message_body(messages)
+            workflow_run_ids, messages, batch_bytes = [], [], 0
+
+        workflow_run_id = f"wfr_{_nanoid()}"
+        workflow_run_ids.append(workflow_run_id)
+        messages.append(
+            {
+                "url": url,
+                "body": body,
+                "content_type": "application/json",
+                "headers": headers_template.get_headers(
+                    "true", workflow_run_id
+                ).headers,
+                "deduplication_id": workflow_run_id,
+            }
+        )
+        batch_bytes += len(body)
+
+    if messages:
+        yield workflow_run_ids, prepare_batch_message_body(messages)
+
+
+def _is_retryable_error(error: Exception) -> bool:
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        return status == 429 or status >= 500
+    return isinstance(error, httpx.TransportError)
+
+
+def _get_chunk_backoff(attempt: int) -> float:
+    return float(min(0.1 * 2**attempt, 2))
+
+
+def _get_trigger_error(
+    error: Exception, workflow_run_ids: List[str], triggered_count: int
+) -> WorkflowError:
+    return WorkflowError(
+        f"Failed to trigger workflow runs {workflow_run_ids[0]}..{workflow_run_ids[-1]}: "
+        f"{error}. {triggered_count} runs were triggered before the failure."
+    )
+
+
 class Client:
+    """
+    Client for the QStash endpoints of Upstash Workflow.
+
+    Requests are sent over a pool of persistent connections owned by the
+    client. Close the client with `close()` or use it as a context manager
+    when it's no longer needed.
+
+    :param token: QStash token
+    :param base_url: QStash url. Defaults to https://qstash.upstash.io
+    :param limits: Connection pool limits. By default, up to 20 idle connections are kept alive for 30 seconds.
+    :param timeout: Request timeout. Defaults to 5 seconds, like httpx.
+    :param http2: Whether to use HTTP/2. Requires the `h2` package.
+    """
+
+    _default: ClassVar[Optional["Client"]] = None
+    _default_lock: ClassVar[threading.Lock] = threading.Lock()
+
     def __init__(
         self,
         token: str,
         base_url: Optional[str] = None,
+        *,
+        limits: Optional[httpx.Limits] = None,
+        timeout: Optional[httpx.Timeout] = None,
+        http2: bool = False,
     ):
         self._token = token
         self._base_url = base_url or DEFAULT_BASE_URL
+        self._http = httpx.Client(
+            headers={"Authorization": f"Bearer {token}"},
+            limits=limits or DEFAULT_LIMITS,
+            timeout=timeout or DEFAULT_TIMEOUT,
+            http2=http2,
+        )
+
+    @classmethod
+    def default(cls) -> "Client":
+        """
+        Returns a client shared in the process, created from the `QSTASH_TOKEN`
+        and `QSTASH_URL` environment variables on first use.
+        """
+        with cls._default_lock:
+            if cls._default is None or cls._default.is_closed:
+                cls._default = cls(**_get_default_credentials())
+            return cls._default
+
+    @property
+    def is_closed(self) -> bool:
+        return self._http.is_closed
+
+    def close(self) -> None:
+        """
+        Closes the connections of the client
+        """
+        self._http.close()
+
+    def __enter__(self) -> "Client":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self.close()
 
     def notify(
         self,
@@ -41,51 +253,210 @@ class Client:
         event_data: Any = None,
         workflow_run_id: Optional[str] = None,
     ) -> List[NotifyResponse]:
-        if workflow_run_id:
-            url = f"{self._base_url}/v2/notify/{workflow_run_id}/{event_id}"
-        else:
-            url = f"{self._base_url}/v2/notify/{event_id}"
-
-        headers = {
-            "Authorization": f"Bearer {self._token}",
-        }
-
-        if isinstance(event_data, str):
-            body = event_data
-        elif event_data is not None:
-            body = json.dumps(event_data)
-        else:
-            body = None
-
-        with httpx.Client() as client:
-            response = client.post(url, headers=headers, content=body)
-            response.raise_for_status()
-            data = response.json()
+        url, body = _get_notify_request(
+            self._base_url, event_id, event_data, workflow_run_id
+        )
+
+        response = self._http.post(url, content=body)
+        response.raise_for_status()
+        data = response.json()
 
         return [_parse_notify_response(item) for item in data]
 
+    def _notify_item(
+        self, index: int, notification: Tuple[str, Any, Optional[str]]
+    ) -> NotifyManyResult:
+        event_id, event_data, workflow_run_id = notification
+        try:
+            responses = self.notify(event_id, event_data, workflow_run_id)
+        except Exception as error:
+            return NotifyManyResult(index, event_id, workflow_run_id, error=error)
+        return NotifyManyResult(index, event_id, workflow_run_id, responses=responses)
+
+    def notify_many(
+        self,
+        notifications: Iterable[Tuple[str, Any, Optional[str]]],
+        *,
+        concurrency: int = DEFAULT_NOTIFY_CONCURRENCY,
+    ) -> Iterator[NotifyManyResult]:
+        """
+        Sends many notifications over the connection pool of the client, with up
+        to `concurrency` requests in flight at a time.
+
+        Results are yielded as the requests complete, so they may be out of
+        order. Failed notifications are yielded with the error instead of
+        raising it. The notifications are consumed lazily.
+
+        :param notifications: (event_id, event_data, workflow_run_id) tuples
+        :param concurrency: maximum number of requests in flight. Should not be larger than the connection limit of the client.
+        :return: iterator of results
+        """
+        _validate_concurrency(concurrency)
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            pending: Set[Future[NotifyManyResult]] = set()
+            for index, notification in enumerate(notifications):
+                if len(pending) >= concurrency:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+                pending.add(executor.submit(self._notify_item, index, notification))
+
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+
+    def trigger_many(
+        self,
+        url: str,
+        payloads: Iterable[Any],
+        *,
+        headers: Optional[Dict[str, str]] = None,
+        retries: int = DEFAULT_RETRIES,
+        failure_url: Optional[str] = None,
+        batch_size: int = DEFAULT_TRIGGER_BATCH_SIZE,
+        chunk_retries: int = DEFAULT_TRIGGER_CHUNK_RETRIES,
+        json_codec: Optional[JSONCodec] = None,
+    ) -> List[str]:
+        """
+        Starts a workflow run for each payload without calling the workflow
+        endpoint. Run ids are generated locally and the runs are published to
+        QStash in batches.
+
+        A batch which fails with a network error, a 429 or a 5xx response is
+        retried. Since the run id is used as the deduplication id of its
+        message, retrying doesn't start a run twice.
+
+        :param url: url of the workflow endpoint
+        :param payloads: initial payload of each run. Serialized as JSON.
+        :param headers: headers to forward to the workflow endpoint
+        :param retries: retries of the workflow requests
+        :param failure_url: url to call if a run fails
+        :param batch_size: maximum number of runs in a batch request
+        :param chunk_retries: how many times a failed batch request is retried
+        :param json_codec: codec to serialize the payloads with. By default, orjson or msgspec is used if installed, the json module of the standard library otherwise. Pass the codec of the workflow.
+        :return: ids of the runs, in the order of the payloads
+        """
+        workflow_run_ids: List[str] = []
+        for chunk_run_ids, body in _get_trigger_chunks(
+            url,
+            payloads,
+            headers,
+            retries,
+            failure_url,
+            batch_size,
+            json_codec or _get_default_json_codec(),
+        ):
+            for attempt in range(chunk_retries + 1):
+                try:
+                    response = self._http.post(
+                        f"{self._base_url}/v2/batch",
+                        content=body,
+                        headers={"Content-Type": "application/json"},
+                    )
+                    response.raise_for_status()
+                    break
+                except Exception as error:
+                    if attempt == chunk_retries or not _is_retryable_error(error):
+                        raise _get_trigger_error(
+                            error, chunk_run_ids, len(workflow_run_ids)
+                        ) from error
+                    time.sleep(_get_chunk_backoff(attempt))
+            workflow_run_ids.extend(chunk_run_ids)
+
+        return workflow_run_ids
+
     def get_waiters(self, event_id: str) -> List[Waiter]:
         url = f"{self._base_url}/v2/waiters/{event_id}"
-        headers = {
-            "Authorization": f"Bearer {self._token}",
-        }
-
-        with httpx.Client() as client:
-            response = client.get(url, headers=headers)
-            response.raise_for_status()
-            data = response.json()
+        response = self._http.get(url)
+        response.raise_for_status()
+        data = response.json()
 
         return [_parse_waiter(item) for item in data]
 
 
 class AsyncClient:
+    """
+    Async client for the QStash endpoints of Upstash Workflow.
+
+    Requests are sent over a pool of persistent connections owned by the
+    client. Close the client with `aclose()` or use it as an async context
+    manager when it's no longer needed. Connections are bound to the event
+    loop they are opened in, so a client should be used in a single event loop.
+
+    :param token: QStash token
+    :param base_url: QStash url. Defaults to https://qstash.upstash.io
+    :param limits: Connection pool limits. By default, up to 20 idle connections are kept alive for 30 seconds.
+    :param timeout: Request timeout. Defaults to 5 seconds, like httpx.
+    :param http2: Whether to use HTTP/2. Requires the `h2` package.
+    """
+
+    _defaults: ClassVar[
+        "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncClient]"
+    ] = weakref.WeakKeyDictionary()
+    _default_lock: ClassVar[threading.Lock] = threading.Lock()
+
     def __init__(
         self,
         token: str,
         base_url: Optional[str] = None,
+        *,
+        limits: Optional[httpx.Limits] = None,
+        timeout: Optional[httpx.Timeout] = None,
+        http2: bool = False,
     ):
         self._token = token
         self._base_url = base_url or DEFAULT_BASE_URL
+        self._http = httpx.AsyncClient(
+            headers={"Authorization": f"Bearer {token}"},
+            limits=limits or DEFAULT_LIMITS,
+            timeout=timeout or DEFAULT_TIMEOUT,
+            http2=http2,
+        )
+
+    @classmethod
+    def default(cls) -> "AsyncClient":
+        """
+        Returns a client shared by the tasks of the running event loop, created
+        from the `QSTASH_TOKEN` and `QSTASH_URL` environment variables on first
+        use in the loop. Each event loop gets its own client, since connections
+        can't be used in other loops.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            raise WorkflowError(
+                "AsyncClient.default() should be called in a running event loop."
+            ) from None
+
+        with cls._default_lock:
+            client = cls._defaults.get(loop)
+            if client is None or client.is_closed:
+                client = cls(**_get_default_credentials())
+                cls._defaults[loop] = client
+            return client
+
+    @property
+    def is_closed(self) -> bool:
+        return self._http.is_closed
+
+    async def aclose(self) -> None:
+        """
+        Closes the connections of the client
+        """
+        await self._http.aclose()
+
+    async def __aenter__(self) -> "AsyncClient":
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        await self.aclose()
 
     async def notify(
         self,
@@ -93,38 +464,134 @@ class AsyncClient:
         event_data: Any = None,
         workflow_run_id: Optional[str] = None,
     ) -> List[NotifyResponse]:
-        if workflow_run_id:
-            url = f"{self._base_url}/v2/notify/{workflow_run_id}/{event_id}"
-        else:
-            url = f"{self._base_url}/v2/notify/{event_id}"
-
-        headers = {
-            "Authorization": f"Bearer {self._token}",
-        }
-
-        if isinstance(event_data, str):
-            body = event_data
-        elif event_data is not None:
-            body = json.dumps(event_data)
-        else:
-            body = None
-
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, headers=headers, content=body)
-            response.raise_for_status()
-            data = response.json()
+        url, body = _get_notify_request(
+            self._base_url, event_id, event_data, workflow_run_id
+        )
+
+        response = await self._http.post(url, content=body)
+        response.raise_for_status()
+        data = response.json()
 
         return [_parse_notify_response(item) for item in data]
 
+    async def _notify_item(
+        self, index: int, notification: Tuple[str, Any, Optional[str]]
+    ) -> NotifyManyResult:
+        event_id, event_data, workflow_run_id = notification
+        try:
+            responses = await self.notify(event_id, event_data, workflow_run_id)
+        except Exception as error:
+            return NotifyManyResult(index, event_id, workflow_run_id, error=error)
+        return NotifyManyResult(index, event_id, workflow_run_id, responses=responses)
+
+    async def notify_many(
+        self,
+        notifications: Iterable[Tuple[str, Any, Optional[str]]],
+        *,
+        concurrency: int = DEFAULT_NOTIFY_CONCURRENCY,
+    ) -> AsyncIterator[NotifyManyResult]:
+        """
+        Sends many notifications over the connection pool of the client, with up
+        to `concurrency` requests in flight at a time.
+
+        Results are yielded as the requests complete, so they may be out of
+        order. Failed notifications are yielded with the error instead of
+        raising it. The notifications are consumed lazily.
+
+        :param notifications: (event_id, event_data, workflow_run_id) tuples
+        :param concurrency: maximum number of requests in flight. Should not be larger than the connection limit of the client.
+        :return: async iterator of results
+        """
+        _validate_concurrency(concurrency)
+
+        pending: Set[asyncio.Future[NotifyManyResult]] = set()
+        try:
+            for index, notification in enumerate(notifications):
+                if len(pending) >= concurrency:
+                    done, pending = await asyncio.wait(
+                        pending, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    for task in done:
+                        yield task.result()
+                pending.add(
+                    asyncio.ensure_future(self._notify_item(index, notification))
+                )
+
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    yield task.result()
+        finally:
+            # the consumer stopped early
+            for task in pending:
+                task.cancel()
+
+    async def trigger_many(
+        self,
+        url: str,
+        payloads: Iterable[Any],
+        *,
+        headers: Optional[Dict[str, str]] = None,
+        retries: int = DEFAULT_RETRIES,
+        failure_url: Optional[str] = None,
+        batch_size: int = DEFAULT_TRIGGER_BATCH_SIZE,
+        chunk_retries: int = DEFAULT_TRIGGER_CHUNK_RETRIES,
+        json_codec: Optional[JSONCodec] = None,
+    ) -> List[str]:
+        """
+        Starts a workflow run for each payload without calling the workflow
+        endpoint. Run ids are generated locally and the runs are published to
+        QStash in batches.
+
+        A batch which fails with a network error, a 429 or a 5xx response is
+        retried. Since the run id is used as the deduplication id of its
+        message, retrying doesn't start a run twice.
+
+        :param url: url of the workflow endpoint
+        :param payloads: initial payload of each run. Serialized as JSON.
+        :param headers: headers to forward to the workflow endpoint
+        :param retries: retries of the workflow requests
+        :param failure_url: url to call if a run fails
+        :param batch_size: maximum number of runs in a batch request
+        :param chunk_retries: how many times a failed batch request is retried
+        :param json_codec: codec to serialize the payloads with. By default, orjson or msgspec is used if installed, the json module of the standard library otherwise. Pass the codec of the workflow.
+        :return: ids of the runs, in the order of the payloads
+        """
+        workflow_run_ids: List[str] = []
+        for chunk_run_ids, body in _get_trigger_chunks(
+            url,
+            payloads,
+            headers,
+            retries,
+            failure_url,
+            batch_size,
+            json_codec or _get_default_json_codec(),
+        ):
+            for attempt in range(chunk_retries + 1):
+                try:
+                    response = await self._http.post(
+                        f"{self._base_url}/v2/batch",
+                        content=body,
+                        headers={"Content-Type": "application/json"},
+                    )
+                    response.raise_for_status()
+                    break
+                except Exception as error:
+                    if attempt == chunk_retries or not _is_retryable_error(error):
+                        raise _get_trigger_error(
+                            error, chunk_run_ids, len(workflow_run_ids)
+                        ) from error
+                    await asyncio.sleep(_get_chunk_backoff(attempt))
+            workflow_run_ids.extend(chunk_run_ids)
+
+        return workflow_run_ids
+
     async def get_waiters(self, event_id: str) -> List[Waiter]:
         url = f"{self._base_url}/v2/waiters/{event_id}"
-        headers = {
-            "Authorization": f"Bearer {self._token}",
-        }
-
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, headers=headers)
-            response.raise_for_status()
-            data = response.json()
+        response = await self._http.get(url)
+        response.raise_for_status()
+        data = response.json()
 
         return [_parse_waiter(item) for item in data]
@@ -0,0 +1,102 @@
+import json
+from functools import lru_cache
+from typing import Any, Union
+
+
+class JSONCodec:
+    """
+    Encodes and decodes the JSON sent to and received from QStash.
+
+    Uses the `json` module of the standard library. Subclasses can use faster
+    libraries. `loads` should raise `json.JSONDecodeError` for invalid JSON.
+    """
+
+    def dumps(self, value: Any) -> str:
+        """
+        Serializes the value as JSON
+
+        :param value: value to serialize
+        :return: JSON string
+        """
+        return json.dumps(value)
+
+    def loads(self, value: Union[str, bytes]) -> Any:
+        """
+        Deserializes the JSON string
+
+        :param value: JSON string
+        :return: deserialized value
+        """
+        return json.loads(value)
+
+
+class OrjsonCodec(JSONCodec):
+    """
+    JSON codec using `orjson`. Falls back to the standard library for values
+    orjson can't serialize, like integers larger than 64 bits or dictionaries
+    with non-string keys.
+
+    Unlike the standard library, NaN and infinity are serialized as `null`,
+    and datetimes, dates, UUIDs and dataclasses are serialized instead of
+    raising `TypeError`.
+    """
+
+    def __init__(self) -> None:
+        import orjson  # type: ignore[import-not-found]
+
+        self._orjson = orjson
+
+    def dumps(self, value: Any) -> str:
+        try:
+            return self._orjson.dumps(value).decode()
+        except TypeError:
+            return json.dumps(value)
+
+    def loads(self, value: Union[str, bytes]) -> Any:
+        # orjson.JSONDecodeError is a subclass of json.JSONDecodeError
+        return self._orjson.loads(value)
+
+
+class MsgspecCodec(JSONCodec):
+    """
+    JSON codec using `msgspec`. Falls back to the standard library for values
+    msgspec can't serialize.
+
+    Like `OrjsonCodec`, NaN and infinity are serialized as `null`, and
+    datetimes, dates, UUIDs and dataclasses are serialized instead of raising
+    `TypeError`.
+    """
+
+    def __init__(self) -> None:
+        import msgspec  # type: ignore[import-not-found]
+
+        self._msgspec = msgspec
+        self._encoder = msgspec.json.Encoder()
+        self._decoder = msgspec.json.Decoder()
+
+    def dumps(self, value: Any) -> str:
+        try:
+            return self._encoder.encode(value).decode()
+        except (TypeError, OverflowError):
+            return json.dumps(value)
+
+    def loads(self, value: Union[str, bytes]) -> Any:
+        try:
+            return self._decoder.decode(value)
+        except self._msgspec.DecodeError as error:
+            document = value if isinstance(value, str) else value.decode()
+            raise json.JSONDecodeError(str(error), document, 0) from error
+
+
+@lru_cache(maxsize=None)
+def _get_default_json_codec() -> JSONCodec:
+    """
+    Returns the codec used when a codec is not passed in serve options: orjson
+    or msgspec if one of them is installed, the standard library otherwise.
+    """
+    for codec_class in (OrjsonCodec, MsgspecCodec):
+        try:
+            return codec_class()
+        except ImportError:
+            continue
+    return JSONCodec()
@@ -0,0 +1,71 @@
+import base64
+import zlib
+from functools import lru_cache
+from typing import Any, Optional
+from upstash_workflow.constants import ZLIB_STEP_OUTPUT_PREFIX, ZSTD_STEP_OUTPUT_PREFIX
+from upstash_workflow.error import WorkflowError
+
+
+@lru_cache(maxsize=None)
+def _get_zstandard() -> Any:
+    """
+    Returns the `zstandard` module if it's installed, None otherwise.
+    """
+    try:
+        import zstandard  # type: ignore[import-not-found]
+    except ImportError:
+        return None
+    return zstandard
+
+
+def _compress_step_output(out: str, compression_threshold: Optional[int]) -> str:
+    """
+    Compresses the serialized step output if it's longer than the threshold.
+
+    Uses zstd if `zstandard` is installed and zlib otherwise. The compressed output
+    is base64 encoded and prefixed with a marker of the algorithm. If compressing
+    doesn't make the output shorter, the output is returned as it is.
+
+    :param out: serialized step output
+    :param compression_threshold: minimum length of the output to compress
+    :return: compressed or original output
+    """
+    if compression_threshold is None or len(out) <= compression_threshold:
+        return out
+
+    zstandard = _get_zstandard()
+    if zstandard is not None:
+        prefix = ZSTD_STEP_OUTPUT_PREFIX
+        compressed = zstandard.ZstdCompressor().compress(out.encode())
+    else:
+        prefix = ZLIB_STEP_OUTPUT_PREFIX
+        compressed = zlib.compress(out.encode())
+
+    compressed_out = prefix + base64.b64encode(compressed).decode()
+    return compressed_out if len(compressed_out) < len(out) else out
+
+
+def _decompress_step_output(out: str) -> str:
+    """
+    Decompresses the step output if it has the marker of a compression algorithm.
+
+    :param out: step output from the request
+    :return: serialized step output
+    """
+    if out.startswith(ZLIB_STEP_OUTPUT_PREFIX):
+        return zlib.decompress(
+            base64.b64decode(out[len(ZLIB_STEP_OUTPUT_PREFIX) :])
+        ).decode()
+
+    if out.startswith(ZSTD_STEP_OUTPUT_PREFIX):
+        zstandard = _get_zstandard()
+        if zstandard is None:
+            raise WorkflowError(
+                "Step output is compressed with zstd, but zstandard is not installed."
+            )
+        decompressed: bytes = zstandard.ZstdDecompressor().decompress(
+            base64.b64decode(out[len(ZSTD_STEP_OUTPUT_PREFIX) :])
+        )
+        return decompressed.decode()
+
+    return out
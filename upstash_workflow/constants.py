@@ -5,6 +5,7 @@ WORKFLOW_FAILURE_HEADER = "Upstash-Workflow-Is-Failure"
 WORKFLOW_INVOKE_HEADER = "Upstash-Workflow-Invoke"
 WORKFLOW_INVOKE_COUNT_HEADER = "Upstash-Workflow-Invoke-Count"
 WORKFLOW_FEATURE_HEADER = "Upstash-Feature-Set"
+WORKFLOW_MESSAGE_ID_HEADER = "Upstash-Message-Id"
 
 WORKFLOW_PROTOCOL_VERSION = "1"
 WORKFLOW_PROTOCOL_VERSION_HEADER = "Upstash-Workflow-Sdk-Version"
@@ -14,3 +15,18 @@ DEFAULT_CONTENT_TYPE = "application/json"
 NO_CONCURRENCY = 1
 NOT_SET = "not-set"
 DEFAULT_RETRIES = 3
+DEFAULT_PARALLEL_MAX_WORKERS = 8
+DEFAULT_NOTIFY_CONCURRENCY = 16
+# QStash accepts up to 100 messages and 1MB in a batch request
+DEFAULT_TRIGGER_BATCH_SIZE = 100
+DEFAULT_TRIGGER_BATCH_BYTES = 1024 * 1024
+DEFAULT_TRIGGER_CHUNK_RETRIES = 3
+DEFAULT_OUTBOX_WINDOW = 0.003
+DEFAULT_OUTBOX_MAX_MESSAGES = DEFAULT_TRIGGER_BATCH_SIZE
+DEFAULT_OUTBOX_MAX_BYTES = DEFAULT_TRIGGER_BATCH_BYTES
+DEFAULT_DELETE_QUEUE_WORKERS = 4
+FUSED_STEPS_FIELD = "fusedSteps"
+# step outputs never start with "@" since they are serialized as JSON
+STEP_OUTPUT_REFERENCE_PREFIX = "@store:"
+ZLIB_STEP_OUTPUT_PREFIX = "@zlib:"
+ZSTD_STEP_OUTPUT_PREFIX = "@zstd:"
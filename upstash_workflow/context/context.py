@@ -1,7 +1,6 @@
 import json
 import datetime
 from typing import (
-    List,
     Dict,
     Union,
     Optional,
@@ -10,9 +9,16 @@ from typing import (
     Any,
     cast,
     Generic,
+    Sequence,
+    List,
+    Tuple,
 )
 from qstash import QStash
 from upstash_workflow.constants import DEFAULT_RETRIES
+from upstash_workflow.codec import JSONCodec, _get_default_json_codec
+from upstash_workflow.store import StepOutputStore
+from upstash_workflow.metrics import MetricsSink
+from upstash_workflow.tracing import Span, Tracer
 from upstash_workflow.context.auto_executor import _AutoExecutor
 from upstash_workflow.context.steps import (
     _LazyFunctionStep,
@@ -61,22 +67,36 @@ class WorkflowContext(Generic[TInitialPayload]):
         qstash_client: QStash,
         workflow_run_id: str,
         headers: Dict[str, str],
-        steps: List[DefaultStep],
+        steps: Sequence[DefaultStep],
         url: str,
         failure_url: Optional[str],
         initial_payload: TInitialPayload,
         env: Optional[Dict[str, Optional[str]]] = None,
         retries: Optional[int] = None,
+        invocation_time_budget: Optional[float] = None,
+        json_codec: Optional[JSONCodec] = None,
+        step_output_store: Optional[StepOutputStore] = None,
+        compression_threshold: Optional[int] = None,
+        metrics: Optional[MetricsSink] = None,
+        tracer: Optional[Tracer] = None,
     ):
         self.qstash_client: QStash = qstash_client
         self.workflow_run_id: str = workflow_run_id
-        self._steps: List[DefaultStep] = steps
+        self._steps: Sequence[DefaultStep] = steps
         self.url: str = url
         self.failure_url = failure_url
         self.headers: Dict[str, str] = headers
         self.request_payload: TInitialPayload = initial_payload
         self.env: Dict[str, Optional[str]] = env or {}
         self.retries: int = DEFAULT_RETRIES if retries is None else retries
+        self.invocation_time_budget: Optional[float] = invocation_time_budget
+        self.json_codec: JSONCodec = json_codec or _get_default_json_codec()
+        self.step_output_store: Optional[StepOutputStore] = step_output_store
+        self.compression_threshold: Optional[int] = compression_threshold
+        self.metrics: MetricsSink = metrics or MetricsSink()
+        self.tracer: Optional[Tracer] = tracer
+        # parent of the spans of steps and QStash calls, set by serve
+        self.span: Optional[Span] = None
         self._executor: _AutoExecutor = _AutoExecutor(self, self._steps)
 
     def run(
@@ -98,6 +118,38 @@ class WorkflowContext(Generic[TInitialPayload]):
         """
         return self._add_step(_LazyFunctionStep(step_name, step_function))
 
+    def parallel(
+        self,
+        steps: List[Tuple[str, Callable[[], Any]]],
+        *,
+        max_workers: Optional[int] = None,
+    ) -> List[Any]:
+        """
+        Executes workflow steps in parallel. Each step function runs in a
+        separate call to the workflow endpoint and the results are returned in
+        the order of the steps once all of them finish.
+        ```python
+        result_a, result_b = context.parallel(
+            [
+                ("step-a", _step_a),
+                ("step-b", _step_b),
+            ]
+        )
+        ```
+
+        :param steps: list of step names and step functions to be executed
+        :param max_workers: maximum number of step functions of the call running at
+            the same time in the process
+        :return: list of results of the step functions
+        """
+        return self._add_parallel_steps(
+            [
+                _LazyFunctionStep(step_name, step_function)
+                for step_name, step_function in steps
+            ],
+            max_workers,
+        )
+
     def sleep(self, step_name: str, duration: Union[int, str]) -> None:
         """
         Stops the execution for the duration provided.
@@ -315,3 +367,12 @@ class WorkflowContext(Generic[TInitialPayload]):
         DisabledWorkflowContext.
         """
         return self._executor.add_step(step)
+
+    def _add_parallel_steps(
+        self, steps: List[_BaseLazyStep[Any]], max_workers: Optional[int]
+    ) -> List[Any]:
+        """
+        Adds parallel steps to the executor. Needed so that it can be overwritten
+        in DisabledWorkflowContext.
+        """
+        return self._executor.add_parallel_steps(steps, max_workers)
@@ -0,0 +1,100 @@
+import atexit
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Optional, Set
+from qstash import QStash
+from upstash_workflow.constants import DEFAULT_DELETE_QUEUE_WORKERS
+
+_logger = logging.getLogger(__name__)
+
+
+def _delete_workflow_run(
+    qstash_client: QStash, workflow_run_id: str, cancel: bool = False
+) -> None:
+    """
+    Deletes the workflow run from QStash
+
+    :param qstash_client: QStash client
+    :param workflow_run_id: id of the workflow run
+    :param cancel: whether to cancel the run if it's still running
+    """
+    qstash_client.http.request(
+        path=f"/v2/workflows/runs/{workflow_run_id}?cancel={str(cancel).lower()}",
+        method="DELETE",
+        parse_response=False,
+    )
+
+
+class DeleteQueue:
+    """
+    Deletes finished workflow runs in background threads, so that the request
+    finishing a run can return without waiting for the delete request.
+
+    Up to `max_workers` delete requests are sent at a time. Failed deletes are
+    logged. Pending deletes are sent before the interpreter exits, or when
+    `close()` is called.
+
+    :param max_workers: maximum number of delete requests in flight
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_DELETE_QUEUE_WORKERS):
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="upstash-workflow-delete"
+        )
+        self._lock = threading.Lock()
+        self._pending: Set["Future[None]"] = set()
+        atexit.register(self.close)
+
+    def enqueue(
+        self, qstash_client: QStash, workflow_run_id: str, cancel: bool = False
+    ) -> None:
+        """
+        Adds the workflow run to the queue. If the queue is closed, the run is
+        deleted right away.
+
+        :param qstash_client: QStash client
+        :param workflow_run_id: id of the workflow run
+        :param cancel: whether to cancel the run if it's still running
+        """
+        try:
+            future = self._executor.submit(
+                self._delete, qstash_client, workflow_run_id, cancel
+            )
+        except RuntimeError:
+            _delete_workflow_run(qstash_client, workflow_run_id, cancel)
+            return
+
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._discard)
+
+    def drain(self, timeout: Optional[float] = None) -> None:
+        """
+        Waits until the runs in the queue are deleted
+
+        :param timeout: maximum number of seconds to wait
+        """
+        with self._lock:
+            pending = set(self._pending)
+        if pending:
+            wait(pending, timeout=timeout)
+
+    def close(self) -> None:
+        """
+        Waits until the runs in the queue are deleted and stops the threads
+        """
+        self._executor.shutdown(wait=True)
+        atexit.unregister(self.close)
+
+    def _delete(
+        self, qstash_client: QStash, workflow_run_id: str, cancel: bool
+    ) -> None:
+        try:
+            _delete_workflow_run(qstash_client, workflow_run_id, cancel)
+        except Exception:
+            _logger.exception(f"Failed to delete workflow run {workflow_run_id}")
+
+    def _discard(self, future: "Future[None]") -> None:
+        with self._lock:
+            self._pending.discard(future)
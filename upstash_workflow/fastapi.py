@@ -1,12 +1,18 @@
 from inspect import iscoroutinefunction
-import json
 import os
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import Response
 from typing import Callable, Awaitable, cast, TypeVar, Optional, Dict, Any
 from qstash import AsyncQStash, Receiver
 from upstash_workflow import async_serve, AsyncWorkflowContext
 from upstash_workflow.asyncio.serve.serve import serve_many as _async_serve_many
+from upstash_workflow.codec import JSONCodec
+from upstash_workflow.store import StepOutputStore
+from upstash_workflow.asyncio.delete_queue import AsyncDeleteQueue
+from upstash_workflow.metrics import MetricsSink
+from upstash_workflow.replay_cache import ReplayCache
+from upstash_workflow.tracing import Tracer
+from upstash_workflow.asyncio.outbox import BatchOutbox
 from upstash_workflow.types import InvokableWorkflow
 from upstash_workflow.workflow_types import _Response as WorkflowResponse
 
@@ -35,6 +41,16 @@ class Serve:
             Callable[[AsyncWorkflowContext, int, str, Dict[str, str]], Awaitable[Any]]
         ] = None,
         failure_url: Optional[str] = None,
+        invocation_time_budget: Optional[float] = None,
+        inline_authentication: bool = False,
+        json_codec: Optional[JSONCodec] = None,
+        step_output_store: Optional[StepOutputStore] = None,
+        compression_threshold: Optional[int] = None,
+        batch_outbox: Optional[BatchOutbox] = None,
+        delete_queue: Optional[AsyncDeleteQueue] = None,
+        metrics: Optional[MetricsSink] = None,
+        tracer: Optional[Tracer] = None,
+        replay_cache: Optional[ReplayCache] = None,
     ) -> Callable[
         [AsyncRouteFunction[TInitialPayload]], AsyncRouteFunction[TInitialPayload]
     ]:
@@ -49,6 +65,16 @@ class Serve:
         :param env: Optionally, one can pass an env object mapping environment variables to their keys. Useful in cases like cloudflare with hono.
         :param retries: Number of retries to use in workflow requests, 3 by default
         :param url: Url of the endpoint where the workflow is set up. If not set, url will be inferred from the request.
+        :param invocation_time_budget: Seconds an invocation can spend running consecutive `context.run` steps before sending their results to QStash in a single message. By default, each step is sent to QStash as soon as it finishes.
+        :param inline_authentication: Check authentication while running the route function instead of running it once more beforehand. When enabled, a request which is not the first invocation or a third party call result fails authentication if the route function returns before reaching a step.
+        :param json_codec: Codec to serialize and deserialize JSON with. By default, orjson or msgspec is used if installed, the json module of the standard library otherwise.
+        :param step_output_store: Store to keep step outputs larger than its threshold in. Only a reference to the output is sent to QStash. The outputs of a workflow run are deleted from the store when the run finishes.
+        :param compression_threshold: Step outputs longer than this many characters (after being serialized as JSON) are compressed before being sent to QStash. zstd is used if `zstandard` is installed, zlib otherwise. Outputs are not compressed by default.
+        :param batch_outbox: Outbox to send the steps of concurrent workflow runs in shared batch requests to QStash. Each request still waits until its steps are accepted by QStash.
+        :param delete_queue: Queue to delete finished workflow runs in the background. When passed, the request finishing a run returns without waiting for the run to be deleted.
+        :param metrics: Sink receiving the timings and sizes measured while handling requests, like `InMemoryMetrics`. Nothing is reported by default.
+        :param tracer: Tracer creating a span per request, with child spans for parsing, authentication, replay, steps and QStash calls, like `InMemoryTracer` or `OpenTelemetryTracer`. The trace context is forwarded to the next request of the run in the `traceparent` header. Tracing is disabled by default.
+        :param replay_cache: Cache of the steps read from the step history, like `InMemoryReplayCache`. Steps read in an earlier request of a workflow run are taken from the cache, and only their outputs are decoded again. Steps are read in every request by default.
         :return:
         """
 
@@ -82,15 +108,27 @@ class Serve:
                         url=url,
                         failure_function=failure_function,
                         failure_url=failure_url,
+                        invocation_time_budget=invocation_time_budget,
+                        inline_authentication=inline_authentication,
+                        json_codec=json_codec,
+                        step_output_store=step_output_store,
+                        compression_threshold=compression_threshold,
+                        batch_outbox=batch_outbox,
+                        delete_queue=delete_queue,
+                        metrics=metrics,
+                        tracer=tracer,
+                        replay_cache=replay_cache,
                     ).get("handler"),
                 )
 
-                async def _async_handler_wrapper(request: Request) -> JSONResponse:
+                async def _async_handler_wrapper(request: Request) -> Response:
                     workflow_response: WorkflowResponse = await async_handler(request)
-                    return JSONResponse(
-                        content=json.loads(workflow_response.body),
+                    # body is already encoded as JSON
+                    return Response(
+                        content=workflow_response.body,
                         status_code=workflow_response.status,
                         headers=workflow_response.headers,
+                        media_type="application/json",
                     )
 
                 self.app.add_api_route(path, _async_handler_wrapper, methods=["POST"])
@@ -117,6 +155,16 @@ class Serve:
         retries: Optional[int] = None,
         url: Optional[str] = None,
         failure_url: Optional[str] = None,
+        invocation_time_budget: Optional[float] = None,
+        inline_authentication: bool = False,
+        json_codec: Optional[JSONCodec] = None,
+        step_output_store: Optional[StepOutputStore] = None,
+        compression_threshold: Optional[int] = None,
+        batch_outbox: Optional[BatchOutbox] = None,
+        delete_queue: Optional[AsyncDeleteQueue] = None,
+        metrics: Optional[MetricsSink] = None,
+        tracer: Optional[Tracer] = None,
+        replay_cache: Optional[ReplayCache] = None,
     ) -> None:
         """
         Registers multiple workflows under a single base path.
@@ -159,15 +207,26 @@ class Serve:
                 retries=retries,
                 url=url,
                 failure_url=failure_url,
+                invocation_time_budget=invocation_time_budget,
+                inline_authentication=inline_authentication,
+                json_codec=json_codec,
+                step_output_store=step_output_store,
+                compression_threshold=compression_threshold,
+                batch_outbox=batch_outbox,
+                delete_queue=delete_queue,
+                metrics=metrics,
+                tracer=tracer,
+                replay_cache=replay_cache,
             ).get("handler"),
         )
 
-        async def _handler_wrapper(request: Request) -> JSONResponse:
+        async def _handler_wrapper(request: Request) -> Response:
             workflow_response: WorkflowResponse = await handler(request)
-            return JSONResponse(
-                content=json.loads(workflow_response.body),
+            return Response(
+                content=workflow_response.body,
                 status_code=workflow_response.status,
                 headers=workflow_response.headers,
+                media_type="application/json",
             )
 
         # Register route with a path parameter for the workflow ID
@@ -6,6 +6,12 @@ from typing import Callable, cast, TypeVar, Optional, Dict, Any
 from qstash import QStash, Receiver
 from upstash_workflow import serve, WorkflowContext
 from upstash_workflow.serve.serve import serve_many as _sync_serve_many
+from upstash_workflow.codec import JSONCodec
+from upstash_workflow.store import StepOutputStore
+from upstash_workflow.delete_queue import DeleteQueue
+from upstash_workflow.metrics import MetricsSink
+from upstash_workflow.replay_cache import ReplayCache
+from upstash_workflow.tracing import Tracer
 from upstash_workflow.types import InvokableWorkflow
 from upstash_workflow.workflow_types import (
     _SyncRequest as WorkflowRequest,
@@ -38,6 +44,15 @@ class Serve:
             Callable[[WorkflowContext, int, str, Dict[str, str]], Any]
         ] = None,
         failure_url: Optional[str] = None,
+        invocation_time_budget: Optional[float] = None,
+        inline_authentication: bool = False,
+        json_codec: Optional[JSONCodec] = None,
+        step_output_store: Optional[StepOutputStore] = None,
+        compression_threshold: Optional[int] = None,
+        delete_queue: Optional[DeleteQueue] = None,
+        metrics: Optional[MetricsSink] = None,
+        tracer: Optional[Tracer] = None,
+        replay_cache: Optional[ReplayCache] = None,
     ) -> Callable[
         [RouteFunction[TInitialPayload]],
         RouteFunction[TInitialPayload],
@@ -53,6 +68,15 @@ class Serve:
         :param env: Optionally, one can pass an env object mapping environment variables to their keys. Useful in cases like cloudflare with hono.
         :param retries: Number of retries to use in workflow requests, 3 by default
         :param url: Url of the endpoint where the workflow is set up. If not set, url will be inferred from the request.
+        :param invocation_time_budget: Seconds an invocation can spend running consecutive `context.run` steps before sending their results to QStash in a single message. By default, each step is sent to QStash as soon as it finishes.
+        :param inline_authentication: Check authentication while running the route function instead of running it once more beforehand. When enabled, a request which is not the first invocation or a third party call result fails authentication if the route function returns before reaching a step.
+        :param json_codec: Codec to serialize and deserialize JSON with. By default, orjson or msgspec is used if installed, the json module of the standard library otherwise.
+        :param step_output_store: Store to keep step outputs larger than its threshold in. Only a reference to the output is sent to QStash. The outputs of a workflow run are deleted from the store when the run finishes.
+        :param compression_threshold: Step outputs longer than this many characters (after being serialized as JSON) are compressed before being sent to QStash. zstd is used if `zstandard` is installed, zlib otherwise. Outputs are not compressed by default.
+        :param delete_queue: Queue to delete finished workflow runs in the background. When passed, the request finishing a run returns without waiting for the run to be deleted.
+        :param metrics: Sink receiving the timings and sizes measured while handling requests, like `InMemoryMetrics`. Nothing is reported by default.
+        :param tracer: Tracer creating a span per request, with child spans for parsing, authentication, replay, steps and QStash calls, like `InMemoryTracer` or `OpenTelemetryTracer`. The trace context is forwarded to the next request of the run in the `traceparent` header. Tracing is disabled by default.
+        :param replay_cache: Cache of the steps read from the step history, like `InMemoryReplayCache`. Steps read in an earlier request of a workflow run are taken from the cache, and only their outputs are decoded again. Steps are read in every request by default.
         :return:
         """
 
@@ -91,13 +115,22 @@ class Serve:
                         url=url,
                         failure_function=failure_function,
                         failure_url=failure_url,
+                        invocation_time_budget=invocation_time_budget,
+                        inline_authentication=inline_authentication,
+                        json_codec=json_codec,
+                        step_output_store=step_output_store,
+                        compression_threshold=compression_threshold,
+                        delete_queue=delete_queue,
+                        metrics=metrics,
+                        tracer=tracer,
+                        replay_cache=replay_cache,
                     ).get("handler"),
                 )
 
                 def _sync_handler_wrapper() -> Response:
                     workflow_response: WorkflowResponse = sync_handler(
                         WorkflowRequest(
-                            body=request.data.decode("utf-8"),
+                            body=request.data,
                             headers=cast(Dict[str, str], request.headers),
                             method=request.method,
                             url=request.url,
@@ -134,6 +167,15 @@ class Serve:
         retries: Optional[int] = None,
         url: Optional[str] = None,
         failure_url: Optional[str] = None,
+        invocation_time_budget: Optional[float] = None,
+        inline_authentication: bool = False,
+        json_codec: Optional[JSONCodec] = None,
+        step_output_store: Optional[StepOutputStore] = None,
+        compression_threshold: Optional[int] = None,
+        delete_queue: Optional[DeleteQueue] = None,
+        metrics: Optional[MetricsSink] = None,
+        tracer: Optional[Tracer] = None,
+        replay_cache: Optional[ReplayCache] = None,
     ) -> None:
         """
         Registers multiple workflows under a single base path.
@@ -176,13 +218,22 @@ class Serve:
                 retries=retries,
                 url=url,
                 failure_url=failure_url,
+                invocation_time_budget=invocation_time_budget,
+                inline_authentication=inline_authentication,
+                json_codec=json_codec,
+                step_output_store=step_output_store,
+                compression_threshold=compression_threshold,
+                delete_queue=delete_queue,
+                metrics=metrics,
+                tracer=tracer,
+                replay_cache=replay_cache,
             ).get("handler"),
         )
 
         def _handler_wrapper(workflow_id: str) -> Response:
             workflow_response: WorkflowResponse = handler(
                 WorkflowRequest(
-                    body=request.data.decode("utf-8"),
+                    body=request.data,
                     headers=cast(Dict[str, str], request.headers),
                     method=request.method,
                     url=request.url,
@@ -0,0 +1,187 @@
+import bisect
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+REQUEST_PARSE_SECONDS = "request_parse_seconds"
+REPLAYED_STEPS = "replayed_steps"
+REPLAY_BYTES = "replay_bytes"
+AUTH_DRY_RUN_SECONDS = "auth_dry_run_seconds"
+STEP_FUNCTION_SECONDS = "step_function_seconds"
+HEADER_BUILD_SECONDS = "header_build_seconds"
+QSTASH_PUBLISH_SECONDS = "qstash_publish_seconds"
+DELETE_SECONDS = "delete_seconds"
+REPLAY_CACHE_HITS = "replay_cache_hits"
+REPLAY_CACHE_MISSES = "replay_cache_misses"
+
+_DESCRIPTIONS = {
+    REQUEST_PARSE_SECONDS: "Time spent parsing the request body into steps",
+    REPLAYED_STEPS: "Number of steps replayed from the history in a request",
+    REPLAY_BYTES: "Size of the request body carrying the step history",
+    AUTH_DRY_RUN_SECONDS: "Time spent running the route function to authenticate",
+    STEP_FUNCTION_SECONDS: "Time spent in step functions",
+    HEADER_BUILD_SECONDS: "Time spent building the headers of a step message",
+    QSTASH_PUBLISH_SECONDS: "Latency of publishing messages to QStash",
+    DELETE_SECONDS: "Latency of deleting finished workflow runs",
+    REPLAY_CACHE_HITS: "Number of messages of the step history found in the replay cache",
+    REPLAY_CACHE_MISSES: "Number of messages of the step history decoded in a request",
+}
+
+DEFAULT_SECONDS_BUCKETS = (
+    0.0001,
+    0.0005,
+    0.001,
+    0.005,
+    0.01,
+    0.05,
+    0.1,
+    0.5,
+    1.0,
+    5.0,
+    10.0,
+)
+DEFAULT_BUCKETS: Dict[str, Sequence[float]] = {
+    REPLAYED_STEPS: (0, 1, 5, 10, 50, 100, 500, 1000),
+    REPLAY_CACHE_HITS: (0, 1, 5, 10, 50, 100, 500, 1000),
+    REPLAY_CACHE_MISSES: (0, 1, 5, 10, 50, 100, 500, 1000),
+    REPLAY_BYTES: (1024, 10 * 1024, 100 * 1024, 1024 * 1024, 10 * 1024 * 1024),
+}
+
+
+class MetricsSink:
+    """
+    Receives measurements from the workflow handler. Does nothing by default.
+
+    Subclasses should implement `observe`. Measurements are tagged with
+    `workflow_url`, and with `step_name` and `step_type` when they belong to a
+    step. `observe` is called on the request path, from the threads running
+    parallel steps as well, so it should be fast and thread safe.
+    """
+
+    def observe(self, name: str, value: float, tags: Dict[str, str]) -> None:
+        """
+        Records a measurement
+
+        :param name: name of the metric, like `request_parse_seconds`
+        :param value: measured value. Durations are in seconds
+        :param tags: tags of the measurement
+        """
+        return
+
+
+@dataclass
+class Histogram:
+    """
+    Distribution of the values observed for a metric with the same tags.
+    `counts[i]` is the number of values less than or equal to `buckets[i]`
+    and greater than the previous bucket. Values above the last bucket are
+    only counted in `count`.
+    """
+
+    buckets: Sequence[float]
+    counts: List[int] = field(default_factory=list)
+    sum: float = 0
+    count: int = 0
+
+    def __post_init__(self) -> None:
+        if not self.counts:
+            self.counts = [0] * len(self.buckets)
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+class InMemoryMetrics(MetricsSink):
+    """
+    Keeps a histogram of the observed values per metric and tags in memory.
+    `export_prometheus` returns them in the Prometheus text format, to be
+    served from a metrics endpoint.
+
+    :param buckets: upper bounds of the histogram buckets per metric. Durations
+        use `DEFAULT_SECONDS_BUCKETS` unless they are given here.
+    """
+
+    def __init__(self, buckets: Optional[Dict[str, Sequence[float]]] = None):
+        self.buckets: Dict[str, Sequence[float]] = {
+            **DEFAULT_BUCKETS,
+            **(buckets or {}),
+        }
+        self._histograms: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Histogram] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, value: float, tags: Dict[str, str]) -> None:
+        key = (name, tuple(sorted(tags.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = Histogram(
+                    sorted(self.buckets.get(name, DEFAULT_SECONDS_BUCKETS))
+                )
+                self._histograms[key] = histogram
+            histogram.observe(value)
+
+    def get(self, name: str, **tags: str) -> Optional[Histogram]:
+        """
+        Returns the histogram of the metric with exactly the given tags
+
+        :param name: name of the metric
+        :param tags: tags of the measurements
+        :return: histogram, or None if nothing was observed
+        """
+        with self._lock:
+            return self._histograms.get((name, tuple(sorted(tags.items()))))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+
+    def export_prometheus(self, prefix: str = "upstash_workflow_") -> str:
+        """
+        Returns the histograms in the Prometheus text exposition format
+
+        :param prefix: prefix of the metric names
+        :return: metrics as text
+        """
+        lines: List[str] = []
+        previous_name = None
+        with self._lock:
+            for (name, tags), histogram in sorted(self._histograms.items()):
+                metric = f"{prefix}{name}"
+                if name != previous_name:
+                    lines.append(f"# HELP {metric} {_DESCRIPTIONS.get(name, name)}")
+                    lines.append(f"# TYPE {metric} histogram")
+                    previous_name = name
+
+                cumulative = 0
+                for bucket, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    labels = _format_labels(tags + (("le", _format_value(bucket)),))
+                    lines.append(f"{metric}_bucket{labels} {cumulative}")
+                labels = _format_labels(tags + (("le", "+Inf"),))
+                lines.append(f"{metric}_bucket{labels} {histogram.count}")
+                labels = _format_labels(tags)
+                lines.append(f"{metric}_sum{labels} {_format_value(histogram.sum)}")
+                lines.append(f"{metric}_count{labels} {histogram.count}")
+
+        return "\n".join(lines) + "\n" if lines else ""
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value))
+
+
+def _format_labels(tags: Tuple[Tuple[str, str], ...]) -> str:
+    if not tags:
+        return ""
+    labels = ",".join(
+        '{}="{}"'.format(
+            key,
+            value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'),
+        )
+        for key, value in tags
+    )
+    return f"{{{labels}}}"
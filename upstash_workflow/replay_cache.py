@@ -0,0 +1,555 @@
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, List, NamedTuple, Optional, Sequence, Tuple
+from upstash_workflow.codec import JSONCodec, _get_default_json_codec
+from upstash_workflow.error import WorkflowError
+from upstash_workflow.types import StepType
+
+DEFAULT_REPLAY_CACHE_MAX_ENTRIES = 10_000
+DEFAULT_REPLAY_CACHE_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_REPLAY_CACHE_TTL = 600.0
+
+ReplayCacheKey = Tuple[str, str, bytes]
+
+
+class CachedStep(NamedTuple):
+    """
+    Step of the step history as kept in a replay cache. The output is kept
+    serialized, after it's read from the step output store and decompressed,
+    and it's decoded in each request using the step.
+    """
+
+    step_id: int
+    step_name: str
+    step_type: StepType
+    concurrent: int
+    out: Any
+    target_step: Optional[int] = None
+    wait_event_id: Optional[str] = None
+    wait_timeout: Optional[str] = None
+
+
+class ReplayCache(ABC):
+    """
+    Keeps the steps read from the step history, so steps read in an earlier
+    request of a workflow run are not base64 decoded, parsed, fetched from the
+    step output store and decompressed again when the run is replayed.
+
+    Entries are the steps of one message of the history, keyed by the workflow
+    run id, the message id and a digest of the message body. Step outputs are
+    cached serialized and decoded in each request, so requests never share
+    decoded outputs, and cached steps decode to the same outputs as the
+    message itself.
+
+    Subclasses should implement `get` and `put`. Methods are called from both
+    sync and async workflows, and from several threads with threaded servers,
+    so they should be thread safe and should not block for long.
+    """
+
+    def key(self, workflow_run_id: str, message_id: str, body: str) -> ReplayCacheKey:
+        """
+        Returns the key of a message of the step history. The digest of the
+        body guards against reusing steps when a message id is delivered with
+        different content.
+
+        :param workflow_run_id: id of the workflow run
+        :param message_id: id of the message carrying the steps
+        :param body: base64 encoded body of the message
+        :return: cache key
+        """
+        return (
+            workflow_run_id,
+            message_id,
+            hashlib.blake2b(body.encode(), digest_size=16).digest(),
+        )
+
+    @abstractmethod
+    def get(self, key: ReplayCacheKey) -> Optional[List[CachedStep]]:
+        """
+        Returns the steps of a message
+
+        :param key: key of the message
+        :return: cached steps, or None if the message is not in the cache
+        """
+
+    @abstractmethod
+    def put(self, key: ReplayCacheKey, steps: Sequence[CachedStep], size: int) -> None:
+        """
+        Stores the steps of a message
+
+        :param key: key of the message
+        :param steps: steps read from the message
+        :param size: length of the encoded message body, used to bound the cache
+        """
+
+
+@dataclass
+class _ReplayCacheEntry:
+    steps: Tuple[CachedStep, ...]
+    size: int
+    expires_at: float
+
+
+class InMemoryReplayCache(ReplayCache):
+    """
+    Keeps the steps in the memory of the process, evicting the least
+    recently used entries once there are more than `max_entries` entries or
+    their encoded size exceeds `max_bytes`. Entries which are not used for
+    `ttl` seconds are dropped.
+
+    `hits` and `misses` count the lookups since the cache was created.
+
+    :param max_entries: maximum number of messages in the cache
+    :param max_bytes: maximum total length of the encoded messages in the cache
+    :param ttl: seconds an entry is kept after it was last used
+    """
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_REPLAY_CACHE_MAX_ENTRIES,
+        max_bytes: int = DEFAULT_REPLAY_CACHE_MAX_BYTES,
+        ttl: float = DEFAULT_REPLAY_CACHE_TTL,
+    ):
+        if max_entries < 1:
+            raise WorkflowError(f"max_entries should be at least 1, got {max_entries}.")
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[ReplayCacheKey, _ReplayCacheEntry]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    @property
+    def size(self) -> int:
+        """
+        Total length of the encoded messages in the cache
+        """
+        with self._lock:
+            return self._size
+
+    def get(self, key: ReplayCacheKey) -> Optional[List[CachedStep]]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires_at <= now:
+                # expired entries are evicted when entries are added
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            entry.expires_at = now + self.ttl
+            self._entries.move_to_end(key)
+            return list(entry.steps)
+
+    def put(self, key: ReplayCacheKey, steps: Sequence[CachedStep], size: int) -> None:
+        if size > self.max_bytes:
+            return
+
+        cached_steps = tuple(steps)
+        now = time.monotonic()
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= previous.size
+
+            self._entries[key] = _ReplayCacheEntry(cached_steps, size, now + self.ttl)
+            self._size += size
+            self._evict_expired(now)
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= evicted.size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _evict_expired(self, now: float) -> None:
+        # entries are ordered by their last use, so expired entries come first
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry.expires_at > now:
+                return
+            del self._entries[key]
+            self._size -= entry.size
+
+
+# layout of the file of SharedReplayCache: a header, an index of slots grouped
+# in sets of _SHARED_CACHE_WAYS slots, and a ring buffer with the encoded steps
+_SHARED_CACHE_MAGIC = b"UWRC"
+_SHARED_CACHE_VERSION = 2
+_SHARED_CACHE_WAYS = 8
+# magic, version, state, set count, data size, write position
+_HEADER = struct.Struct("<4sIIIQQ")
+_HEADER_SIZE = 64
+_STATE_OFFSET = 8
+_WRITE_POSITION_OFFSET = 24
+# digest of the key, position of the data, length of the data, last use
+_SLOT = struct.Struct("<16sQId")
+_LAST_USED = struct.Struct("<d")
+_LAST_USED_OFFSET = 28
+# length of the fields of the steps at the start of the data of an entry
+_DATA_HEADER = struct.Struct("<I")
+_STATE_CLEAN = 0
+_STATE_WRITING = 1
+
+
+class SharedReplayCache(ReplayCache):
+    """
+    Keeps the steps in a memory mapped file shared by the worker processes of
+    a server, like the workers of gunicorn or uvicorn, so the steps read by
+    one worker are reused by the others. Put the file on a memory backed file
+    system like `/dev/shm`. Requires `fcntl`, so it's not available on Windows.
+
+    The file holds an index of `max_entries` slots and a ring buffer of
+    `max_bytes` bytes with the steps. The fields of the steps are encoded as
+    JSON and the serialized outputs are kept as they are, so reading an entry
+    only parses the fields and copies the outputs. When the index is full,
+    the least recently used entry among the slots the key can be stored in is
+    replaced. Entries are dropped once the ring buffer wraps around over their
+    steps, or when they are not used for `ttl` seconds.
+
+    Access to the file is serialized with `flock`, which is released when a
+    process dies. If a process dies while adding an entry, the index is
+    cleared by the next process accessing it. All processes sharing the file
+    should use the same `max_entries` and `max_bytes`.
+
+    `hits` and `misses` count the lookups of this process.
+
+    :param path: path of the file, created if it doesn't exist
+    :param max_entries: number of slots in the index, rounded up to a multiple of 8
+    :param max_bytes: size of the ring buffer
+    :param ttl: seconds an entry is kept after it was last used
+    :param json_codec: codec to encode the fields of the steps with
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = DEFAULT_REPLAY_CACHE_MAX_ENTRIES,
+        max_bytes: int = DEFAULT_REPLAY_CACHE_MAX_BYTES,
+        ttl: float = DEFAULT_REPLAY_CACHE_TTL,
+        json_codec: Optional[JSONCodec] = None,
+    ):
+        try:
+            import fcntl
+        except ImportError:
+            raise WorkflowError(
+                "SharedReplayCache requires fcntl, which is not available on this platform."
+            ) from None
+
+        if max_entries < 1:
+            raise WorkflowError(f"max_entries should be at least 1, got {max_entries}.")
+        if max_bytes < 1:
+            raise WorkflowError(f"max_bytes should be at least 1, got {max_bytes}.")
+
+        self._fcntl = fcntl
+        self.path = path
+        self._set_count = -(-max_entries // _SHARED_CACHE_WAYS)
+        self.max_entries = self._set_count * _SHARED_CACHE_WAYS
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._json_codec = json_codec or _get_default_json_codec()
+        self._data_offset = _HEADER_SIZE + self.max_entries * _SLOT.size
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._fd = -1
+        self._mmap: Optional[mmap.mmap] = None
+        self._open()
+
+    def get(self, key: ReplayCacheKey) -> Optional[List[CachedStep]]:
+        digest = _key_digest(key)
+        set_offset = self._set_offset(digest)
+        now = time.time()
+        data = None
+        with self._lock:
+            shared = self._lock_file()
+            try:
+                slot_offset = self._find_slot(shared, digest, set_offset)
+                if slot_offset >= 0:
+                    _, position, length, last_used = _SLOT.unpack_from(
+                        shared, slot_offset
+                    )
+                    write_position = _HEADER.unpack_from(shared)[5]
+                    if length and self._is_live(
+                        position, last_used, write_position, now
+                    ):
+                        start = self._data_offset + position % self.max_bytes
+                        data = shared[start : start + length]
+                        _LAST_USED.pack_into(
+                            shared, slot_offset + _LAST_USED_OFFSET, now
+                        )
+            finally:
+                self._unlock_file()
+
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        return self._decode_steps(data)
+
+    def put(self, key: ReplayCacheKey, steps: Sequence[CachedStep], size: int) -> None:
+        data = self._encode_steps(steps)
+        if data is None or len(data) > self.max_bytes:
+            return
+
+        digest = _key_digest(key)
+        set_offset = self._set_offset(digest)
+        now = time.time()
+        with self._lock:
+            shared = self._lock_file()
+            try:
+                struct.pack_into("<I", shared, _STATE_OFFSET, _STATE_WRITING)
+
+                # entries are not split at the end of the ring buffer
+                position = _HEADER.unpack_from(shared)[5]
+                if position % self.max_bytes + len(data) > self.max_bytes:
+                    position += self.max_bytes - position % self.max_bytes
+                start = self._data_offset + position % self.max_bytes
+                shared[start : start + len(data)] = data
+                write_position = position + len(data)
+
+                slot_offset = set_offset
+                oldest_use = float("inf")
+                for way in range(_SHARED_CACHE_WAYS):
+                    offset = set_offset + way * _SLOT.size
+                    slot_digest, slot_position, length, last_used = _SLOT.unpack_from(
+                        shared, offset
+                    )
+                    if slot_digest == digest or not length:
+                        slot_offset = offset
+                        break
+                    if not self._is_live(slot_position, last_used, write_position, now):
+                        last_used = float("-inf")
+                    if last_used < oldest_use:
+                        slot_offset = offset
+                        oldest_use = last_used
+
+                _SLOT.pack_into(
+                    shared,
+                    slot_offset,
+                    digest,
+                    position,
+                    len(data),
+                    now,
+                )
+                struct.pack_into("<Q", shared, _WRITE_POSITION_OFFSET, write_position)
+                struct.pack_into("<I", shared, _STATE_OFFSET, _STATE_CLEAN)
+            finally:
+                self._unlock_file()
+
+    def _encode_steps(self, steps: Sequence[CachedStep]) -> Optional[bytes]:
+        """
+        Encodes the steps as the length of their fields, the fields without the
+        outputs as JSON, and the outputs one after another
+
+        :param steps: steps to encode
+        :return: encoded steps, or None if the steps can't be encoded
+        """
+        fields = []
+        outputs = []
+        for step in steps:
+            if not isinstance(step.out, str):
+                return None
+            out = step.out.encode()
+            outputs.append(out)
+            fields.append(
+                [
+                    step.step_id,
+                    step.step_name,
+                    step.step_type,
+                    step.concurrent,
+                    step.target_step,
+                    step.wait_event_id,
+                    step.wait_timeout,
+                    len(out),
+                ]
+            )
+        try:
+            encoded_fields = self._json_codec.dumps(fields).encode()
+        except (TypeError, ValueError):
+            return None
+        return b"".join(
+            [_DATA_HEADER.pack(len(encoded_fields)), encoded_fields, *outputs]
+        )
+
+    def _decode_steps(self, data: bytes) -> List[CachedStep]:
+        """
+        Decodes the steps written by `_encode_steps`. Outputs are copied from
+        the data without being parsed.
+
+        :param data: encoded steps
+        :return: steps
+        """
+        (fields_length,) = _DATA_HEADER.unpack_from(data)
+        position = _DATA_HEADER.size + fields_length
+        view = memoryview(data)
+        steps = []
+        for fields in self._json_codec.loads(data[_DATA_HEADER.size : position]):
+            (
+                step_id,
+                step_name,
+                step_type,
+                concurrent,
+                target_step,
+                wait_event_id,
+                wait_timeout,
+                out_length,
+            ) = fields
+            out = str(view[position : position + out_length], "utf-8")
+            position += out_length
+            steps.append(
+                CachedStep(
+                    step_id,
+                    step_name,
+                    step_type,
+                    concurrent,
+                    out,
+                    target_step,
+                    wait_event_id,
+                    wait_timeout,
+                )
+            )
+        return steps
+
+    def clear(self) -> None:
+        with self._lock:
+            shared = self._lock_file()
+            try:
+                self._reset(shared)
+            finally:
+                self._unlock_file()
+
+    def close(self) -> None:
+        """
+        Unmaps and closes the file. The file is not deleted.
+        """
+        with self._lock:
+            if self._mmap is not None:
+                self._mmap.close()
+                self._mmap = None
+            if self._fd >= 0:
+                os.close(self._fd)
+                self._fd = -1
+
+    def _open(self) -> None:
+        file_size = self._data_offset + self.max_bytes
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            self._fcntl.flock(fd, self._fcntl.LOCK_EX)
+            try:
+                existing_size = os.fstat(fd).st_size
+                if existing_size == 0:
+                    os.ftruncate(fd, file_size)
+                elif existing_size != file_size:
+                    raise self._layout_error()
+
+                shared = mmap.mmap(fd, file_size)
+                magic, version, _, set_count, data_size, _ = _HEADER.unpack_from(shared)
+                if magic != _SHARED_CACHE_MAGIC or version != _SHARED_CACHE_VERSION:
+                    # new file, or a process died while creating it
+                    self._reset(shared)
+                elif set_count != self._set_count or data_size != self.max_bytes:
+                    shared.close()
+                    raise self._layout_error()
+            finally:
+                self._fcntl.flock(fd, self._fcntl.LOCK_UN)
+        except BaseException:
+            os.close(fd)
+            raise
+
+        self._fd = fd
+        self._mmap = shared
+
+    def _layout_error(self) -> WorkflowError:
+        return WorkflowError(
+            f"{self.path} is not a replay cache created with the same max_entries "
+            "and max_bytes."
+        )
+
+    def _reset(self, shared: mmap.mmap) -> None:
+        shared[: self._data_offset] = bytes(self._data_offset)
+        _HEADER.pack_into(
+            shared,
+            0,
+            _SHARED_CACHE_MAGIC,
+            _SHARED_CACHE_VERSION,
+            _STATE_CLEAN,
+            self._set_count,
+            self.max_bytes,
+            0,
+        )
+
+    def _lock_file(self) -> mmap.mmap:
+        """
+        Locks the file for the process. Should be called while holding the
+        lock of the instance, and followed by `_unlock_file`.
+
+        :return: mapped file
+        """
+        if self._pid != os.getpid():
+            # a forked process shares the lock of the parent's file
+            # description, so the file is opened again
+            self._pid = os.getpid()
+            if self._mmap is not None:
+                self._mmap.close()
+            os.close(self._fd)
+            self._open()
+        if self._mmap is None:
+            raise WorkflowError("Replay cache is closed.")
+
+        self._fcntl.flock(self._fd, self._fcntl.LOCK_EX)
+        shared = self._mmap
+        if shared[_STATE_OFFSET] != _STATE_CLEAN:
+            # a process died while adding an entry
+            self._reset(shared)
+        return shared
+
+    def _unlock_file(self) -> None:
+        self._fcntl.flock(self._fd, self._fcntl.LOCK_UN)
+
+    def _find_slot(self, shared: mmap.mmap, digest: bytes, set_offset: int) -> int:
+        """
+        Returns the offset of the slot of the digest in the set, -1 if the
+        digest is not in the set
+        """
+        set_end = set_offset + _SHARED_CACHE_WAYS * _SLOT.size
+        offset = shared.find(digest, set_offset, set_end)
+        # the digest may also match the bytes of other fields
+        while offset >= 0 and (offset - set_offset) % _SLOT.size:
+            offset = shared.find(digest, offset + 1, set_end)
+        return offset
+
+    def _set_offset(self, digest: bytes) -> int:
+        set_index = int.from_bytes(digest[:8], "little") % self._set_count
+        return _HEADER_SIZE + set_index * _SHARED_CACHE_WAYS * _SLOT.size
+
+    def _is_live(
+        self, position: int, last_used: float, write_position: int, now: float
+    ) -> bool:
+        return (
+            write_position - position <= self.max_bytes and now - last_used <= self.ttl
+        )
+
+
+def _key_digest(key: ReplayCacheKey) -> bytes:
+    workflow_run_id, message_id, body_digest = key
+    return hashlib.blake2b(
+        f"{workflow_run_id}\0{message_id}\0".encode() + body_digest, digest_size=16
+    ).digest()
@@ -1,4 +1,5 @@
-from typing import Callable, Literal, TypeVar, Generic
+from functools import lru_cache
+from typing import Any, Callable, List, Literal, Optional, TypeVar, Generic
 from qstash import QStash
 from upstash_workflow import WorkflowContext
 from upstash_workflow.context.steps import _BaseLazyStep
@@ -8,6 +9,15 @@ TInitialPayload = TypeVar("TInitialPayload")
 TResult = TypeVar("TResult")
 
 
+@lru_cache(maxsize=None)
+def _get_disabled_qstash_client() -> QStash:
+    """
+    QStash client of the disabled context. It is never used to send requests,
+    so a single instance is shared by all dry runs.
+    """
+    return QStash(base_url="disabled-client", token="disabled-client")
+
+
 class _DisabledWorkflowContext(
     Generic[TInitialPayload], WorkflowContext[TInitialPayload]
 ):
@@ -44,6 +54,19 @@ class _DisabledWorkflowContext(
         """
         raise WorkflowAbort(self.__disabled_message)
 
+    def _add_parallel_steps(
+        self, _steps: List[_BaseLazyStep[Any]], _max_workers: Optional[int]
+    ) -> List[Any]:
+        """
+        Overwrite the `WorkflowContext._add_parallel_steps` method to always raise
+        `WorkflowAbort` error in order to stop the execution whenever we encounter
+        parallel steps.
+
+        :param _steps:
+        :param _max_workers:
+        """
+        raise WorkflowAbort(self.__disabled_message)
+
     def cancel(self) -> None:
         """
         overwrite cancel method to do nothing
@@ -68,7 +91,7 @@ class _DisabledWorkflowContext(
         :param route_function:
         """
         disabled_context = _DisabledWorkflowContext(
-            qstash_client=QStash(base_url="disabled-client", token="disabled-client"),
+            qstash_client=_get_disabled_qstash_client(),
             workflow_run_id=context.workflow_run_id,
             headers=context.headers,
             steps=[],
@@ -1,3 +1,4 @@
+from __future__ import annotations
 import os
 import json
 import re
@@ -13,8 +14,15 @@ from typing import (
     Any,
     Generic,
     Tuple,
+    TYPE_CHECKING,
 )
 from qstash import QStash, Receiver
+from upstash_workflow.codec import JSONCodec, _get_default_json_codec
+from upstash_workflow.store import StepOutputStore
+from upstash_workflow.delete_queue import DeleteQueue
+from upstash_workflow.metrics import MetricsSink
+from upstash_workflow.replay_cache import ReplayCache
+from upstash_workflow.tracing import Tracer
 from upstash_workflow.workflow_types import _Response, _SyncRequest, _AsyncRequest
 from upstash_workflow.constants import (
     DEFAULT_RETRIES,
@@ -24,9 +32,11 @@ from upstash_workflow.constants import (
 from upstash_workflow.types import (
     _FinishCondition,
 )
-from upstash_workflow import WorkflowContext
 from dataclasses import dataclass
 
+if TYPE_CHECKING:
+    from upstash_workflow import WorkflowContext
+
 _logger = logging.getLogger(__name__)
 
 TResponse = TypeVar("TResponse")
@@ -46,6 +56,15 @@ class ServeOptions(Generic[TInitialPayload, TResponse]):
         Callable[[WorkflowContext[TInitialPayload], int, str, Dict[str, str]], Any]
     ]
     failure_url: Optional[str]
+    invocation_time_budget: Optional[float]
+    inline_authentication: bool
+    json_codec: JSONCodec
+    step_output_store: Optional[StepOutputStore]
+    compression_threshold: Optional[int]
+    delete_queue: Optional[DeleteQueue]
+    metrics: MetricsSink
+    tracer: Optional[Tracer]
+    replay_cache: Optional[ReplayCache]
 
 
 @dataclass
@@ -69,6 +88,15 @@ def _process_options(
         Callable[[WorkflowContext, int, str, Dict[str, str]], Any]
     ] = None,
     failure_url: Optional[str] = None,
+    invocation_time_budget: Optional[float] = None,
+    inline_authentication: bool = False,
+    json_codec: Optional[JSONCodec] = None,
+    step_output_store: Optional[StepOutputStore] = None,
+    compression_threshold: Optional[int] = None,
+    delete_queue: Optional[DeleteQueue] = None,
+    metrics: Optional[MetricsSink] = None,
+    tracer: Optional[Tracer] = None,
+    replay_cache: Optional[ReplayCache] = None,
 ) -> ServeBaseOptions[TInitialPayload, TResponse]:
     """
     Fills the options with default values if they are not provided.
@@ -76,15 +104,21 @@ def _process_options(
     Default values for:
     - qstash_client: QStash client created with QSTASH_TOKEN env var
     - on_step_finish: returns a Response with workflowRunId in the body (status: 200)
-    - initial_payload_parser: calls json.loads if initial request body exists.
+    - initial_payload_parser: decodes the initial request body as JSON if it exists.
     - receiver: a Receiver if the required env vars are set
     - base_url: env variable UPSTASH_WORKFLOW_URL
     - env: os.environ
     - retries: DEFAULT_RETRIES
     - url: None
+    - json_codec: orjson or msgspec codec if installed, standard library codec otherwise
+    - metrics: a sink which does nothing
+    - tracer: None, tracing is disabled
+    - replay_cache: None, steps are decoded in every request
     """
     environment = env if env is not None else dict(os.environ)
 
+    codec = json_codec or _get_default_json_codec()
+
     receiver_environment_variables_set = bool(
         environment.get("QSTASH_CURRENT_SIGNING_KEY")
         and environment.get("QSTASH_NEXT_SIGNING_KEY")
@@ -106,6 +140,7 @@ def _process_options(
                     headers={
                         WORKFLOW_PROTOCOL_VERSION_HEADER: WORKFLOW_PROTOCOL_VERSION
                     },
+                    json_codec=codec,
                 ),
             )
 
@@ -115,6 +150,7 @@ def _process_options(
                 body={"workflowRunId": workflow_run_id},
                 status=200,
                 headers={WORKFLOW_PROTOCOL_VERSION_HEADER: WORKFLOW_PROTOCOL_VERSION},
+                json_codec=codec,
             ),
         )
 
@@ -125,7 +161,7 @@ def _process_options(
 
         # Try to parse the payload
         try:
-            return cast(TInitialPayload, json.loads(initial_request))
+            return cast(TInitialPayload, codec.loads(initial_request))
         except json.JSONDecodeError:
             # If parsing fails, return the raw string
             return cast(TInitialPayload, initial_request)
@@ -160,6 +196,15 @@ def _process_options(
         url=url,
         failure_url=failure_url,
         failure_function=failure_function,
+        invocation_time_budget=invocation_time_budget,
+        inline_authentication=inline_authentication,
+        json_codec=codec,
+        step_output_store=step_output_store,
+        compression_threshold=compression_threshold,
+        delete_queue=delete_queue,
+        metrics=metrics or MetricsSink(),
+        tracer=tracer,
+        replay_cache=replay_cache,
     )
 
 
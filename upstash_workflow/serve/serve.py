@@ -1,9 +1,33 @@
 import json
 import logging
+import time
 from typing import Optional, Callable, Dict, cast, TypeVar, Any
 from qstash import QStash, Receiver
+from upstash_workflow.codec import JSONCodec
+from upstash_workflow.store import StepOutputStore
+from upstash_workflow.delete_queue import DeleteQueue
+from upstash_workflow.replay_cache import ReplayCache
+from upstash_workflow.tracing import (
+    Span,
+    Tracer,
+    _trace,
+    _extract_trace_context,
+    _strip_trace_context,
+)
+from upstash_workflow.metrics import (
+    MetricsSink,
+    REQUEST_PARSE_SECONDS,
+    REPLAYED_STEPS,
+    REPLAY_BYTES,
+    AUTH_DRY_RUN_SECONDS,
+    QSTASH_PUBLISH_SECONDS,
+    DELETE_SECONDS,
+    REPLAY_CACHE_HITS,
+    REPLAY_CACHE_MISSES,
+)
 from upstash_workflow.workflow_types import _Response, _SyncRequest
 from upstash_workflow.workflow_parser import (
+    _LazySteps,
     _get_payload,
     _validate_request,
     _parse_request,
@@ -18,7 +42,8 @@ from upstash_workflow.workflow_requests import (
     _handle_third_party_call_result,
 )
 from upstash_workflow.serve.options import _process_options, _determine_urls
-from upstash_workflow.error import _format_workflow_error
+from upstash_workflow.constants import WORKFLOW_MESSAGE_ID_HEADER
+from upstash_workflow.error import WorkflowAbort, _format_workflow_error
 from upstash_workflow import WorkflowContext
 from upstash_workflow.types import _FinishCondition, InvokableWorkflow
 from upstash_workflow.serve.authorization import _DisabledWorkflowContext
@@ -45,6 +70,15 @@ def _serve_base(
         Callable[[WorkflowContext, int, str, Dict[str, str]], Any]
     ] = None,
     failure_url: Optional[str] = None,
+    invocation_time_budget: Optional[float] = None,
+    inline_authentication: bool = False,
+    json_codec: Optional[JSONCodec] = None,
+    step_output_store: Optional[StepOutputStore] = None,
+    compression_threshold: Optional[int] = None,
+    delete_queue: Optional[DeleteQueue] = None,
+    metrics: Optional[MetricsSink] = None,
+    tracer: Optional[Tracer] = None,
+    replay_cache: Optional[ReplayCache] = None,
 ) -> Dict[str, Callable[[TRequest], TResponse]]:
     processed_options = _process_options(
         qstash_client=qstash_client,
@@ -57,6 +91,15 @@ def _serve_base(
         url=url,
         failure_function=failure_function,
         failure_url=failure_url,
+        invocation_time_budget=invocation_time_budget,
+        inline_authentication=inline_authentication,
+        json_codec=json_codec,
+        step_output_store=step_output_store,
+        compression_threshold=compression_threshold,
+        delete_queue=delete_queue,
+        metrics=metrics,
+        tracer=tracer,
+        replay_cache=replay_cache,
     )
     qstash_client = processed_options.qstash_client
     on_step_finish = processed_options.on_step_finish
@@ -68,8 +111,19 @@ def _serve_base(
     url = processed_options.url
     failure_url = processed_options.failure_url
     failure_function = processed_options.failure_function
-
-    def _handler(request: TRequest) -> TResponse:
+    invocation_time_budget = processed_options.invocation_time_budget
+    inline_authentication = processed_options.inline_authentication
+    json_codec = processed_options.json_codec
+    step_output_store = processed_options.step_output_store
+    compression_threshold = processed_options.compression_threshold
+    delete_queue = processed_options.delete_queue
+    metrics = processed_options.metrics
+    tracer = processed_options.tracer
+    replay_cache = processed_options.replay_cache
+
+    def _handler(
+        request: TRequest, invocation_span: Optional[Span] = None
+    ) -> TResponse:
         """
         Handles the incoming request, triggering the appropriate workflow steps.
         Calls `trigger_first_invocation()` if it's the first invocation.
@@ -77,6 +131,7 @@ def _serve_base(
         Finally, calls `trigger_workflow_delete()` to remove the workflow from QStash.
 
         :param request: The incoming request to handle.
+        :param invocation_span: span of the request if tracing is enabled
         :return: A response.
         """
         workflow_url, workflow_failure_url = _determine_urls(
@@ -97,8 +152,36 @@ def _serve_base(
         validate_request_response = _validate_request(request)
         is_first_invocation = validate_request_response.is_first_invocation
         workflow_run_id = validate_request_response.workflow_run_id
+        if invocation_span is not None:
+            invocation_span.set_attribute("workflow.url", workflow_url)
+            invocation_span.set_attribute("workflow.run_id", workflow_run_id)
+            invocation_span.set_attribute(
+                "workflow.first_invocation", is_first_invocation
+            )
+
+        metric_tags = {"workflow_url": workflow_url}
+        metrics.observe(REPLAY_BYTES, len(request_payload), metric_tags)
+
+        with _trace(tracer, "workflow.parse", invocation_span):
+            parse_start = time.perf_counter()
+            parse_request_response = _parse_request(
+                request_payload,
+                is_first_invocation,
+                json_codec,
+                step_output_store,
+                workflow_run_id,
+                request.headers.get(WORKFLOW_MESSAGE_ID_HEADER)
+                if request.headers
+                else None,
+                qstash_client,
+                replay_cache,
+            )
+            metrics.observe(
+                REQUEST_PARSE_SECONDS, time.perf_counter() - parse_start, metric_tags
+            )
 
-        parse_request_response = _parse_request(request_payload, is_first_invocation)
+        if parse_request_response.workflow_run_ended:
+            return on_step_finish(workflow_run_id, "workflow-already-ended")
 
         raw_initial_payload = parse_request_response.raw_initial_payload
         steps = parse_request_response.steps
@@ -112,6 +195,8 @@ def _serve_base(
             failure_function,
             env,
             retries,
+            json_codec,
+            step_output_store,
         )
 
         if failure_check == "is-failure-callback":
@@ -123,28 +208,56 @@ def _serve_base(
             initial_payload=initial_payload_parser(raw_initial_payload),
             headers=_recreate_user_headers(
                 {} if not request.headers else request.headers
+            )
+            if tracer is None
+            else _strip_trace_context(
+                _recreate_user_headers({} if not request.headers else request.headers)
             ),
             steps=steps,
             url=workflow_url,
             env=env,
             retries=retries,
             failure_url=workflow_failure_url,
+            invocation_time_budget=invocation_time_budget,
+            json_codec=json_codec,
+            step_output_store=step_output_store,
+            compression_threshold=compression_threshold,
+            metrics=metrics,
+            tracer=tracer,
         )
-
-        auth_check = _DisabledWorkflowContext[Any].try_authentication(
-            route_function, workflow_context
+        workflow_context.span = invocation_span
+
+        # with inline authentication, replays are authenticated while running
+        # the route function. the first invocation and third party call results
+        # don't run the route function, so they are checked with a dry run.
+        authenticate_inline = (
+            inline_authentication
+            and not is_first_invocation
+            and not (
+                request.headers and request.headers.get("Upstash-Workflow-Callback")
+            )
         )
 
-        if auth_check == "run-ended":
-            return on_step_finish(
-                (
-                    "no-workflow-id"
-                    if is_first_invocation
-                    else workflow_context.workflow_run_id
-                ),
-                "auth-fail",
+        if not authenticate_inline:
+            auth_start = time.perf_counter()
+            with _trace(tracer, "workflow.auth_dry_run", invocation_span):
+                auth_check = _DisabledWorkflowContext[Any].try_authentication(
+                    route_function, workflow_context
+                )
+            metrics.observe(
+                AUTH_DRY_RUN_SECONDS, time.perf_counter() - auth_start, metric_tags
             )
 
+            if auth_check == "run-ended":
+                return on_step_finish(
+                    (
+                        "no-workflow-id"
+                        if is_first_invocation
+                        else workflow_context.workflow_run_id
+                    ),
+                    "auth-fail",
+                )
+
         call_return_check = _handle_third_party_call_result(
             request,
             raw_initial_payload,
@@ -152,20 +265,84 @@ def _serve_base(
             workflow_url,
             workflow_failure_url,
             retries,
+            json_codec,
         )
 
         if call_return_check == "continue-workflow":
             if is_first_invocation:
+                publish_start = time.perf_counter()
                 _trigger_first_invocation(workflow_context, retries)
+                metrics.observe(
+                    QSTASH_PUBLISH_SECONDS,
+                    time.perf_counter() - publish_start,
+                    {**metric_tags, "step_name": "init", "step_type": "Initial"},
+                )
             else:
 
                 def on_step() -> None:
-                    route_function(workflow_context)
+                    try:
+                        route_function(workflow_context)
+                    except WorkflowAbort:
+                        raise
+                    except Exception as error:
+                        if not workflow_context._executor.fused_steps:
+                            raise
+                        # send the steps kept for the invocation time budget
+                        # so that they don't run again. The failed step runs
+                        # again when the next step is delivered.
+                        _logger.warning(
+                            "A step of workflow run %s failed. Sending the steps "
+                            "completed before it, the failed step will be retried.",
+                            workflow_context.workflow_run_id,
+                            exc_info=error,
+                        )
+                        try:
+                            workflow_context._executor.submit_fused_steps()
+                        except WorkflowAbort as abort:
+                            raise abort from error
+                        raise
+                    # send the steps kept for the invocation time budget
+                    workflow_context._executor.submit_fused_steps()
 
                 def on_cleanup() -> None:
-                    _trigger_workflow_delete(workflow_context)
-
-                _trigger_route_function(on_step=on_step, on_cleanup=on_cleanup)
+                    # returning before reaching a step means authentication failed
+                    if (
+                        authenticate_inline
+                        and not workflow_context._executor.step_count
+                    ):
+                        return
+                    delete_start = time.perf_counter()
+                    with _trace(tracer, "qstash.delete", workflow_context.span):
+                        _trigger_workflow_delete(
+                            workflow_context, delete_queue=delete_queue
+                        )
+                    metrics.observe(
+                        DELETE_SECONDS, time.perf_counter() - delete_start, metric_tags
+                    )
+                    if step_output_store is not None:
+                        step_output_store.delete(workflow_context.workflow_run_id)
+
+                with _trace(tracer, "workflow.replay", invocation_span) as replay_span:
+                    workflow_context.span = replay_span
+                    _trigger_route_function(on_step=on_step, on_cleanup=on_cleanup)
+                    if replay_span is not None:
+                        replay_span.set_attribute(
+                            "workflow.replayed_steps",
+                            workflow_context._executor.replayed_step_count,
+                        )
+                metrics.observe(
+                    REPLAYED_STEPS,
+                    workflow_context._executor.replayed_step_count,
+                    metric_tags,
+                )
+                if replay_cache is not None and isinstance(steps, _LazySteps):
+                    metrics.observe(REPLAY_CACHE_HITS, steps.cache_hits, metric_tags)
+                    metrics.observe(
+                        REPLAY_CACHE_MISSES, steps.cache_misses, metric_tags
+                    )
+
+                if authenticate_inline and not workflow_context._executor.step_count:
+                    return on_step_finish(workflow_context.workflow_run_id, "auth-fail")
 
             return on_step_finish(workflow_context.workflow_run_id, "success")
 
@@ -173,7 +350,15 @@ def _serve_base(
 
     def _safe_handler(request: TRequest) -> TResponse:
         try:
-            return _handler(request)
+            if tracer is None:
+                return _handler(request)
+
+            with _trace(
+                tracer,
+                "workflow.invocation",
+                _extract_trace_context(request.headers),
+            ) as invocation_span:
+                return _handler(request, invocation_span)
         except Exception as error:
             _logger.exception(error)
             return cast(
@@ -198,6 +383,15 @@ def serve(
         Callable[[WorkflowContext, int, str, Dict[str, str]], Any]
     ] = None,
     failure_url: Optional[str] = None,
+    invocation_time_budget: Optional[float] = None,
+    inline_authentication: bool = False,
+    json_codec: Optional[JSONCodec] = None,
+    step_output_store: Optional[StepOutputStore] = None,
+    compression_threshold: Optional[int] = None,
+    delete_queue: Optional[DeleteQueue] = None,
+    metrics: Optional[MetricsSink] = None,
+    tracer: Optional[Tracer] = None,
+    replay_cache: Optional[ReplayCache] = None,
 ) -> Dict[str, Callable[[TRequest], TResponse]]:
     """
     Creates a method that handles incoming requests and runs the provided
@@ -212,6 +406,15 @@ def serve(
     :param env: Optionally, one can pass an env object mapping environment variables to their keys. Useful in cases like cloudflare with hono.
     :param retries: Number of retries to use in workflow requests, 3 by default
     :param url: Url of the endpoint where the workflow is set up. If not set, url will be inferred from the request.
+    :param invocation_time_budget: Seconds an invocation can spend running consecutive `context.run` steps before sending their results to QStash in a single message. By default, each step is sent to QStash as soon as it finishes.
+    :param inline_authentication: Check authentication while running the route function instead of running it once more beforehand. When enabled, a request which is not the first invocation or a third party call result fails authentication if the route function returns before reaching a step.
+    :param json_codec: Codec to serialize and deserialize JSON with. By default, orjson or msgspec is used if installed, the json module of the standard library otherwise.
+    :param step_output_store: Store to keep step outputs larger than its threshold in. Only a reference to the output is sent to QStash. The outputs of a workflow run are deleted from the store when the run finishes.
+    :param compression_threshold: Step outputs longer than this many characters (after being serialized as JSON) are compressed before being sent to QStash. zstd is used if `zstandard` is installed, zlib otherwise. Outputs are not compressed by default.
+    :param delete_queue: Queue to delete finished workflow runs in the background. When passed, the request finishing a run returns without waiting for the run to be deleted.
+    :param metrics: Sink receiving the timings and sizes measured while handling requests, like `InMemoryMetrics`. Nothing is reported by default.
+    :param tracer: Tracer creating a span per request, with child spans for parsing, authentication, replay, steps and QStash calls, like `InMemoryTracer` or `OpenTelemetryTracer`. The trace context is forwarded to the next request of the run in the `traceparent` header. Tracing is disabled by default.
+    :param replay_cache: Cache of the steps read from the step history, like `InMemoryReplayCache`. Steps read in an earlier request of a workflow run are taken from the cache, and only their outputs are decoded again. Steps are read in every request by default.
     :return: An method that consumes incoming requests and runs the workflow.
     """
     return _serve_base(
@@ -225,6 +428,15 @@ def serve(
         url=url,
         failure_function=failure_function,
         failure_url=failure_url,
+        invocation_time_budget=invocation_time_budget,
+        inline_authentication=inline_authentication,
+        json_codec=json_codec,
+        step_output_store=step_output_store,
+        compression_threshold=compression_threshold,
+        delete_queue=delete_queue,
+        metrics=metrics,
+        tracer=tracer,
+        replay_cache=replay_cache,
     )
 
 
@@ -239,6 +451,15 @@ def serve_many(
     retries: Optional[int] = None,
     url: Optional[str] = None,
     failure_url: Optional[str] = None,
+    invocation_time_budget: Optional[float] = None,
+    inline_authentication: bool = False,
+    json_codec: Optional[JSONCodec] = None,
+    step_output_store: Optional[StepOutputStore] = None,
+    compression_threshold: Optional[int] = None,
+    delete_queue: Optional[DeleteQueue] = None,
+    metrics: Optional[MetricsSink] = None,
+    tracer: Optional[Tracer] = None,
+    replay_cache: Optional[ReplayCache] = None,
 ) -> Dict[str, Callable[[TRequest], TResponse]]:
     """
     Creates a handler that routes incoming requests to the correct workflow
@@ -268,6 +489,15 @@ def serve_many(
     :param retries: Number of retries (default 3)
     :param url: URL of the endpoint
     :param failure_url: Failure callback URL
+    :param invocation_time_budget: Seconds to run consecutive steps in one invocation
+    :param inline_authentication: Check authentication during the run instead of a dry run
+    :param json_codec: Codec to serialize and deserialize JSON with
+    :param step_output_store: Store to keep large step outputs in
+    :param compression_threshold: Minimum length of step outputs to compress
+    :param delete_queue: Queue to delete finished runs in the background
+    :param metrics: Sink to report timings and sizes to
+    :param tracer: Tracer creating spans for requests
+    :param replay_cache: Cache of the steps decoded in earlier requests
     :return: A handler that routes to the correct workflow
     """
     # Assign workflow IDs
@@ -287,6 +517,15 @@ def serve_many(
             retries=retries,
             url=url,
             failure_url=failure_url,
+            invocation_time_budget=invocation_time_budget,
+            inline_authentication=inline_authentication,
+            json_codec=json_codec,
+            step_output_store=step_output_store,
+            compression_threshold=compression_threshold,
+            delete_queue=delete_queue,
+            metrics=metrics,
+            tracer=tracer,
+            replay_cache=replay_cache,
         )
         handlers[wf_id] = result["handler"]
 
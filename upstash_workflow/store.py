@@ -0,0 +1,209 @@
+import os
+import shutil
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, Optional
+from urllib.parse import quote
+from upstash_workflow.constants import STEP_OUTPUT_REFERENCE_PREFIX
+from upstash_workflow.error import WorkflowError
+from upstash_workflow.utils import _nanoid
+
+DEFAULT_STEP_OUTPUT_STORE_THRESHOLD = 64 * 1024
+
+
+class StepOutputStore(ABC):
+    """
+    Stores step outputs which are too large to be sent to QStash.
+
+    Outputs longer than `threshold` characters (after being serialized as JSON)
+    are written to the store and a short reference is sent to QStash instead.
+    References are resolved when the step is replayed.
+
+    Subclasses should implement `put` and `get`. `delete` is called after the
+    workflow run finishes, or after its failure function runs, and does nothing
+    by default. Outputs of runs which are canceled, or which fail without a
+    failure function, are not deleted, so stores kept across deployments should
+    also expire outputs, like with a lifecycle rule of a bucket.
+
+    Methods are called from both sync and async workflows, so they should not
+    block for long.
+    """
+
+    def __init__(self, threshold: int = DEFAULT_STEP_OUTPUT_STORE_THRESHOLD):
+        self.threshold = threshold
+
+    @abstractmethod
+    def put(self, workflow_run_id: str, key: str, value: str) -> None:
+        """
+        Stores the serialized output of a step
+
+        :param workflow_run_id: id of the workflow run
+        :param key: key of the output, unique in the workflow run
+        :param value: serialized output
+        """
+
+    @abstractmethod
+    def get(self, workflow_run_id: str, key: str) -> str:
+        """
+        Returns the serialized output of a step. Raises `KeyError` if the output
+        is not in the store.
+
+        :param workflow_run_id: id of the workflow run
+        :param key: key of the output
+        :return: serialized output
+        """
+
+    def delete(self, workflow_run_id: str) -> None:
+        """
+        Deletes the outputs of a workflow run
+
+        :param workflow_run_id: id of the workflow run
+        """
+        return
+
+
+class InMemoryStepOutputStore(StepOutputStore):
+    """
+    Keeps step outputs in the memory of the process. Only suitable when all
+    requests of a workflow run are handled by the same process, like in tests
+    or local development.
+    """
+
+    def __init__(self, threshold: int = DEFAULT_STEP_OUTPUT_STORE_THRESHOLD):
+        super().__init__(threshold)
+        self._outputs: Dict[str, Dict[str, str]] = {}
+        self._lock = threading.Lock()
+
+    def put(self, workflow_run_id: str, key: str, value: str) -> None:
+        with self._lock:
+            self._outputs.setdefault(workflow_run_id, {})[key] = value
+
+    def get(self, workflow_run_id: str, key: str) -> str:
+        with self._lock:
+            return self._outputs[workflow_run_id][key]
+
+    def delete(self, workflow_run_id: str) -> None:
+        with self._lock:
+            self._outputs.pop(workflow_run_id, None)
+
+
+class LocalStepOutputStore(StepOutputStore):
+    """
+    Keeps step outputs as files in a directory, one subdirectory per workflow
+    run. The directory should be shared by all processes serving the workflow.
+    """
+
+    def __init__(
+        self, directory: str, threshold: int = DEFAULT_STEP_OUTPUT_STORE_THRESHOLD
+    ):
+        super().__init__(threshold)
+        self.directory = directory
+
+    def _run_directory(self, workflow_run_id: str) -> str:
+        return os.path.join(self.directory, _get_file_name(workflow_run_id))
+
+    def put(self, workflow_run_id: str, key: str, value: str) -> None:
+        run_directory = self._run_directory(workflow_run_id)
+        os.makedirs(run_directory, exist_ok=True)
+
+        # write to a temporary file first so that readers never see a partial output
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=run_directory)
+        try:
+            with os.fdopen(file_descriptor, "w", encoding="utf-8") as file:
+                file.write(value)
+            os.replace(temporary_path, os.path.join(run_directory, _get_file_name(key)))
+        except BaseException:
+            os.unlink(temporary_path)
+            raise
+
+    def get(self, workflow_run_id: str, key: str) -> str:
+        path = os.path.join(self._run_directory(workflow_run_id), _get_file_name(key))
+        try:
+            with open(path, encoding="utf-8") as file:
+                return file.read()
+        except FileNotFoundError:
+            raise KeyError(key)
+
+    def delete(self, workflow_run_id: str) -> None:
+        shutil.rmtree(self._run_directory(workflow_run_id), ignore_errors=True)
+
+
+def _get_file_name(name: str) -> str:
+    """
+    Escapes a workflow run id or a key to use it as a file name. Separators
+    are escaped, and names which would point to the directory itself or to
+    its parent are rejected, since run ids are read from request headers.
+
+    :param name: workflow run id or key
+    :return: file name
+    """
+    file_name = quote(name, safe="")
+    if file_name in ("", ".", ".."):
+        raise WorkflowError(
+            f"'{name}' can't be used as a workflow run id or key in LocalStepOutputStore."
+        )
+    return file_name
+
+
+def _offload_step_output(
+    step_output_store: Optional[StepOutputStore],
+    workflow_run_id: str,
+    step_id: int,
+    out: str,
+) -> str:
+    """
+    Writes the serialized step output to the store if it's longer than the
+    threshold of the store.
+
+    :param step_output_store: store to write to
+    :param workflow_run_id: id of the workflow run
+    :param step_id: id of the step
+    :param out: serialized step output
+    :return: reference to the output if it's offloaded, the output otherwise
+    """
+    if step_output_store is None or len(out) <= step_output_store.threshold:
+        return out
+
+    key = f"{step_id}-{_nanoid()}"
+    step_output_store.put(workflow_run_id, key, out)
+    return f"{STEP_OUTPUT_REFERENCE_PREFIX}{workflow_run_id}/{key}"
+
+
+def _load_step_output(
+    step_output_store: Optional[StepOutputStore],
+    out: str,
+    workflow_run_id: Optional[str],
+) -> str:
+    """
+    Reads the serialized step output from the store if the output is a reference.
+    References are only resolved for the workflow run of the request, since the
+    run id of a reference is read from the request body.
+
+    :param step_output_store: store to read from
+    :param out: step output from the request
+    :param workflow_run_id: id of the workflow run of the request
+    :return: serialized step output
+    """
+    if not out.startswith(STEP_OUTPUT_REFERENCE_PREFIX):
+        return out
+
+    if step_output_store is None:
+        raise WorkflowError(
+            f"Step output '{out}' is kept in a step output store, "
+            "but step_output_store is not provided in serve options."
+        )
+
+    reference_run_id, key = out[len(STEP_OUTPUT_REFERENCE_PREFIX) :].rsplit("/", 1)
+    if reference_run_id != workflow_run_id:
+        raise WorkflowError(
+            f"Step output '{out}' belongs to another workflow run than "
+            f"'{workflow_run_id}'."
+        )
+
+    try:
+        return step_output_store.get(reference_run_id, key)
+    except KeyError:
+        raise WorkflowError(
+            f"Step output '{out}' is not found in the step output store."
+        )
@@ -0,0 +1,824 @@
+"""
+In-process emulator of the parts of QStash used by workflows.
+
+Workflow runs are driven end to end without a network: messages published
+with `publish_json` and `batch_json` are kept in a queue, appended to the step
+history of their workflow run and delivered back to the handler registered for
+their url, with the body format the request parser expects. Delays and
+`not_before` are honored with a virtual clock which jumps to the next message
+instead of sleeping, so sleeps and wait timeouts finish instantly.
+
+```python
+emulator = QStashEmulator()
+handler = serve(route, qstash_client=emulator.client, receiver=None)["handler"]
+emulator.register(WORKFLOW_ENDPOINT, handler)
+
+workflow_run_id = emulator.trigger(WORKFLOW_ENDPOINT, "payload")
+emulator.run()
+assert emulator.runs[workflow_run_id].state == "RUN_SUCCESS"
+```
+
+Handlers of async serve are registered the same way, with `async_client` as
+their client, and driven with `await emulator.arun()`. `start_http()` serves
+the emulator on localhost for clients talking to QStash over HTTP, like
+`Client.notify` and `Client.trigger_many`.
+
+Third party calls are sent to the handler registered for the call url and the
+result is delivered back to the workflow. Results of invoked workflows are not
+sent back to the invoking workflow.
+"""
+
+import asyncio
+import base64
+import heapq
+import http.server
+import itertools
+import json
+import re
+import socketserver
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+from urllib.parse import unquote
+from qstash.errors import QStashError
+from qstash.message import (
+    BatchJsonRequest,
+    convert_to_batch_messages,
+    prepare_batch_message_body,
+    prepare_headers,
+)
+from upstash_workflow.constants import (
+    DEFAULT_RETRIES,
+    WORKFLOW_FAILURE_HEADER,
+    WORKFLOW_ID_HEADER,
+    WORKFLOW_INIT_HEADER,
+    WORKFLOW_MESSAGE_ID_HEADER,
+    WORKFLOW_URL_HEADER,
+)
+from upstash_workflow.workflow_requests import _get_headers_template
+from upstash_workflow.workflow_types import _AsyncRequest, _SyncRequest
+
+_DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+_DURATION_PATTERN = re.compile(r"^(\d+)([smhd]?)$")
+_RUNS_PATH = re.compile(r"^/v2/workflows/runs/([^/?]+)(?:\?cancel=(true|false))?$")
+_NOTIFY_PATH = re.compile(r"^/v2/notify/(?:([^/]+)/)?([^/]+)$")
+
+
+def _parse_duration(duration: Union[int, str]) -> int:
+    if isinstance(duration, int):
+        return duration
+
+    match = _DURATION_PATTERN.match(duration.strip())
+    if not match:
+        raise ValueError(f"Invalid duration: {duration}")
+    return int(match.group(1)) * _DURATION_UNITS[match.group(2) or "s"]
+
+
+def _get_header(headers: Dict[str, str], name: str) -> Optional[str]:
+    name = name.lower()
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _strip_prefix(headers: Dict[str, str], prefix: str) -> Dict[str, str]:
+    """
+    Returns the headers starting with the prefix, without the prefix. Headers
+    of callbacks are passed with the `Upstash-Callback-` prefix and are sent
+    with the `Upstash-` prefix instead.
+    """
+    stripped = {}
+    for key, value in headers.items():
+        if key.lower().startswith(prefix.lower()):
+            stripped[f"Upstash-{key[len(prefix):]}"] = value
+    return stripped
+
+
+def _forwarded_headers(headers: Dict[str, str]) -> Dict[str, str]:
+    prefix = "upstash-forward-"
+    return {
+        key[len(prefix) :]: value
+        for key, value in headers.items()
+        if key.lower().startswith(prefix)
+    }
+
+
+def _encode(value: str) -> str:
+    return base64.b64encode(value.encode()).decode()
+
+
+class VirtualClock:
+    """
+    Clock of the emulator. Starts at the current time and only moves when
+    advanced, or when the emulator waits for a delayed message.
+    """
+
+    def __init__(self, now: Optional[float] = None):
+        self.now = time.time() if now is None else now
+
+    def time(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@dataclass
+class EmulatedMessage:
+    message_id: str
+    url: str
+    body: str
+    headers: Dict[str, str]
+    method: str = "POST"
+    attempt: int = 0
+    waited: bool = False
+    # position of the message in the step history of its run
+    position: Optional[int] = None
+
+
+@dataclass
+class _Waiter:
+    message: EmulatedMessage
+    event_id: str
+    workflow_run_id: str
+    deadline: float
+    step: Dict[str, Any]
+
+
+@dataclass
+class EmulatedRun:
+    workflow_run_id: str
+    url: str
+    history: List[Dict[str, Any]] = field(default_factory=list)
+    state: str = "RUN_STARTED"
+    deliveries: int = 0
+
+
+class _EmulatedMessageApi:
+    def __init__(self, emulator: "QStashEmulator"):
+        self._emulator = emulator
+
+    def publish_json(
+        self,
+        *,
+        url: str,
+        body: Optional[Any] = None,
+        method: Optional[str] = None,
+        headers: Optional[Dict[str, str]] = None,
+        delay: Optional[Union[str, int]] = None,
+        not_before: Optional[int] = None,
+        **kwargs: Any,
+    ) -> Dict[str, str]:
+        wire_headers = prepare_headers(
+            content_type="application/json",
+            method=method,  # type: ignore[arg-type]
+            headers=headers,
+            retries=kwargs.get("retries"),
+            callback=kwargs.get("callback"),
+            failure_callback=kwargs.get("failure_callback"),
+            delay=delay,
+            not_before=not_before,
+            deduplication_id=kwargs.get("deduplication_id"),
+            content_based_deduplication=None,
+            timeout=kwargs.get("timeout"),
+            flow_control=None,
+        )
+        return {
+            "messageId": self._emulator.publish(url, json.dumps(body), wire_headers)
+        }
+
+    def batch_json(self, messages: List[BatchJsonRequest]) -> List[Dict[str, str]]:
+        return self._emulator.batch(
+            json.loads(prepare_batch_message_body(convert_to_batch_messages(messages)))
+        )
+
+
+class _EmulatedHttp:
+    def __init__(self, emulator: "QStashEmulator"):
+        self._emulator = emulator
+
+    def request(
+        self,
+        *,
+        path: str,
+        method: str,
+        body: Optional[str] = None,
+        parse_response: bool = True,
+        **kwargs: Any,
+    ) -> Any:
+        status, response = self._emulator.handle_api_request(method, path, body)
+        if status >= 300:
+            raise QStashError(f"Request failed with status: {status}, body: {response}")
+        return json.loads(response) if parse_response and response else response
+
+
+class EmulatedQStash:
+    """
+    Stands in for `qstash.QStash` in workflows served by the emulator
+    """
+
+    def __init__(self, emulator: "QStashEmulator"):
+        self.message = _EmulatedMessageApi(emulator)
+        self.http = _EmulatedHttp(emulator)
+
+
+class _AsyncEmulatedMessageApi:
+    def __init__(self, emulator: "QStashEmulator"):
+        self._message = _EmulatedMessageApi(emulator)
+
+    async def publish_json(self, **kwargs: Any) -> Dict[str, str]:
+        return self._message.publish_json(**kwargs)
+
+    async def batch_json(
+        self, messages: List[BatchJsonRequest]
+    ) -> List[Dict[str, str]]:
+        return self._message.batch_json(messages)
+
+
+class _AsyncEmulatedHttp:
+    def __init__(self, emulator: "QStashEmulator"):
+        self._http = _EmulatedHttp(emulator)
+
+    async def request(self, **kwargs: Any) -> Any:
+        return self._http.request(**kwargs)
+
+
+class AsyncEmulatedQStash:
+    """
+    Stands in for `qstash.AsyncQStash` in workflows served by the emulator
+    """
+
+    def __init__(self, emulator: "QStashEmulator"):
+        self.message = _AsyncEmulatedMessageApi(emulator)
+        self.http = _AsyncEmulatedHttp(emulator)
+
+
+class QStashEmulator:
+    """
+    Keeps the queue of messages and the step histories of workflow runs.
+
+    :param clock: clock to schedule delayed messages with
+    """
+
+    def __init__(self, clock: Optional[VirtualClock] = None):
+        self.clock = clock or VirtualClock()
+        self.client = EmulatedQStash(self)
+        self.async_client = AsyncEmulatedQStash(self)
+        self.runs: Dict[str, EmulatedRun] = {}
+        self.failed: List[EmulatedMessage] = []
+        self._handlers: Dict[str, Callable[[Any], Any]] = {}
+        self._queue: List[Tuple[float, int, EmulatedMessage]] = []
+        self._waiters: Dict[str, List[_Waiter]] = {}
+        self._timeouts: List[Tuple[float, int, _Waiter]] = []
+        self._deduplication_ids: Dict[str, str] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.RLock()
+        self._server: Optional[socketserver.TCPServer] = None
+
+    def register(self, url: str, handler: Callable[[Any], Any]) -> None:
+        """
+        Delivers the messages sent to the url to the handler. Handlers receive
+        a `_SyncRequest` in `run` and an `_AsyncRequest` in `arun`.
+
+        :param url: url of the workflow endpoint or the third party api
+        :param handler: handler returned from serve, or any function taking a
+            request and returning a response with a `status` and a `body`
+        """
+        self._handlers[url] = handler
+
+    def trigger(
+        self,
+        url: str,
+        body: Any = None,
+        headers: Optional[Dict[str, str]] = None,
+        retries: int = DEFAULT_RETRIES,
+        failure_url: Optional[str] = None,
+    ) -> str:
+        """
+        Starts a workflow run, like `Client.trigger_many` does
+
+        :param url: url of the workflow endpoint
+        :param body: initial payload, serialized as JSON
+        :param headers: headers to forward to the workflow
+        :param retries: number of retries of the steps
+        :param failure_url: url to call if the first step fails
+        :return: id of the workflow run
+        """
+        workflow_run_id = f"wfr_emulated_{next(self._ids)}"
+        workflow_headers = (
+            _get_headers_template(url, headers, retries, failure_url)
+            .get_headers("true", workflow_run_id)
+            .headers
+        )
+        self.publish(url, json.dumps(body), workflow_headers)
+        return workflow_run_id
+
+    def publish(self, url: str, body: str, headers: Dict[str, str]) -> str:
+        """
+        Adds a message to the queue. Headers are in the format QStash receives
+        them, with `Upstash-Delay` and `Upstash-Not-Before` for delayed
+        messages.
+
+        :return: id of the message
+        """
+        with self._lock:
+            deduplication_id = _get_header(headers, "Upstash-Deduplication-Id")
+            if deduplication_id in self._deduplication_ids:
+                return self._deduplication_ids[deduplication_id]
+
+            message = EmulatedMessage(
+                message_id=f"msg_emulated_{next(self._ids)}",
+                url=url,
+                body=body,
+                headers=dict(headers),
+                method=_get_header(headers, "Upstash-Method") or "POST",
+            )
+            if deduplication_id:
+                self._deduplication_ids[deduplication_id] = message.message_id
+
+            deliver_at = self.clock.now
+            delay = _get_header(headers, "Upstash-Delay")
+            if delay:
+                deliver_at += _parse_duration(delay)
+            not_before = _get_header(headers, "Upstash-Not-Before")
+            if not_before:
+                deliver_at = max(deliver_at, float(not_before))
+
+            self._schedule(deliver_at, message)
+            return message.message_id
+
+    def batch(self, messages: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+        """
+        Adds the messages of a batch request to the queue
+
+        :param messages: messages with destination, headers and body fields
+        :return: message ids
+        """
+        return [
+            {
+                "messageId": self.publish(
+                    message["destination"],
+                    message.get("body") or "",
+                    message.get("headers") or {},
+                )
+            }
+            for message in messages
+        ]
+
+    def notify(
+        self,
+        event_id: str,
+        event_data: Optional[str] = None,
+        workflow_run_id: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Resumes the workflow runs waiting for the event
+
+        :param event_id: id of the event
+        :param event_data: data of the event, as sent in the notify request
+        :param workflow_run_id: only notify the waiter of this run
+        :return: notify responses, one per resumed waiter
+        """
+        with self._lock:
+            waiters = self._waiters.get(event_id, [])
+            notified = [
+                waiter
+                for waiter in waiters
+                if workflow_run_id is None or waiter.workflow_run_id == workflow_run_id
+            ]
+            self._waiters[event_id] = [
+                waiter for waiter in waiters if waiter not in notified
+            ]
+
+            responses = []
+            for waiter in notified:
+                self._resume(waiter, _encode(event_data) if event_data else None, False)
+                responses.append(
+                    {
+                        "waiter": {
+                            "url": waiter.message.url,
+                            "deadline": int(waiter.deadline),
+                            "headers": {
+                                key: [value]
+                                for key, value in waiter.message.headers.items()
+                            },
+                        },
+                        "messageId": waiter.message.message_id,
+                        "error": "",
+                    }
+                )
+            return responses
+
+    def handle_api_request(
+        self, method: str, path: str, body: Optional[str] = None
+    ) -> Tuple[int, str]:
+        """
+        Handles a request to the workflow runs and notify apis of QStash
+
+        :return: status and body of the response
+        """
+        runs_match = _RUNS_PATH.match(path)
+        if runs_match:
+            run = self.runs.get(unquote(runs_match.group(1)))
+            if run is None or run.state != "RUN_STARTED":
+                return 404, json.dumps({"error": "workflow run not found"})
+
+            if method == "GET":
+                return 200, json.dumps(run.history)
+            if method == "DELETE":
+                self._end_run(run, runs_match.group(2) == "true")
+                return 200, ""
+
+        notify_match = _NOTIFY_PATH.match(path)
+        if notify_match and method == "POST":
+            workflow_run_id, event_id = notify_match.groups()
+            responses = self.notify(
+                unquote(event_id),
+                body or None,
+                unquote(workflow_run_id) if workflow_run_id else None,
+            )
+            return 200, json.dumps(responses)
+
+        return 404, json.dumps({"error": f"{method} {path} is not emulated"})
+
+    def run(
+        self, max_deliveries: Optional[int] = None, until: Optional[float] = None
+    ) -> int:
+        """
+        Delivers messages to sync handlers until the queue is empty. The
+        clock jumps to the time of the next message when it's delayed.
+
+        :param max_deliveries: stop after this many deliveries
+        :param until: stop before the messages due after this time. Pass
+            `clock.now` to deliver only the messages which are due.
+        :return: number of delivered messages
+        """
+        delivered = 0
+        while max_deliveries is None or delivered < max_deliveries:
+            messages = self._next_messages(1, until)
+            if not messages:
+                break
+            self._deliver(messages[0])
+            delivered += 1
+        return delivered
+
+    async def arun(
+        self,
+        max_deliveries: Optional[int] = None,
+        until: Optional[float] = None,
+        concurrency: int = 1,
+    ) -> int:
+        """
+        Delivers messages to async handlers until the queue is empty. Up to
+        `concurrency` messages due at the same time are delivered concurrently.
+
+        :param max_deliveries: stop after this many deliveries
+        :param until: stop before the messages due after this time
+        :param concurrency: number of messages to deliver at the same time
+        :return: number of delivered messages
+        """
+        delivered = 0
+        while max_deliveries is None or delivered < max_deliveries:
+            limit = concurrency
+            if max_deliveries is not None:
+                limit = min(limit, max_deliveries - delivered)
+
+            messages = self._next_messages(limit, until)
+            if not messages:
+                break
+            await asyncio.gather(*(self._adeliver(message) for message in messages))
+            delivered += len(messages)
+        return delivered
+
+    def start_http(self, port: int = 0) -> str:
+        """
+        Serves the QStash api of the emulator on localhost
+
+        :param port: port to listen on, a free port if 0
+        :return: base url of the emulator
+        """
+        emulator = self
+
+        class RequestHandler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_GET(self) -> None:
+                self.handle_request()
+
+            def do_POST(self) -> None:
+                self.handle_request()
+
+            def do_DELETE(self) -> None:
+                self.handle_request()
+
+            def handle_request(self) -> None:
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                status, response = emulator._handle_http_request(
+                    self.command, self.path, body.decode(), dict(self.headers.items())
+                )
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(response.encode())))
+                self.end_headers()
+                self.wfile.write(response.encode())
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        class Server(socketserver.ThreadingMixIn, socketserver.TCPServer):
+            allow_reuse_address = True
+            daemon_threads = True
+
+        self._server = Server(("localhost", port), RequestHandler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return f"http://localhost:{self._server.server_address[1]}"
+
+    def stop_http(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def _handle_http_request(
+        self, method: str, path: str, body: str, headers: Dict[str, str]
+    ) -> Tuple[int, str]:
+        if method == "POST" and path == "/v2/batch":
+            return 200, json.dumps(self.batch(json.loads(body)))
+
+        if method == "POST" and path.startswith("/v2/publish/"):
+            message_id = self.publish(
+                unquote(path[len("/v2/publish/") :]), body, headers
+            )
+            return 200, json.dumps({"messageId": message_id})
+
+        return self.handle_api_request(method, path, body)
+
+    def _schedule(self, deliver_at: float, message: EmulatedMessage) -> None:
+        heapq.heappush(self._queue, (deliver_at, next(self._ids), message))
+
+    def _next_messages(
+        self, limit: int, until: Optional[float]
+    ) -> List[EmulatedMessage]:
+        """
+        Pops up to `limit` messages due at the earliest time, moving the clock
+        to that time. Expired waiters are resumed first.
+        """
+        with self._lock:
+            while True:
+                next_message = self._queue[0][0] if self._queue else None
+                next_timeout = self._timeouts[0][0] if self._timeouts else None
+                if next_message is None and next_timeout is None:
+                    return []
+                if (
+                    until is not None
+                    and min(
+                        time
+                        for time in (next_message, next_timeout)
+                        if time is not None
+                    )
+                    > until
+                ):
+                    return []
+
+                if next_timeout is not None and (
+                    next_message is None or next_timeout <= next_message
+                ):
+                    deadline, _, waiter = heapq.heappop(self._timeouts)
+                    if waiter in self._waiters.get(waiter.event_id, []):
+                        self._waiters[waiter.event_id].remove(waiter)
+                        self.clock.now = max(self.clock.now, deadline)
+                        self._resume(waiter, None, True)
+                    continue
+
+                deliver_at = self._queue[0][0]
+                self.clock.now = max(self.clock.now, deliver_at)
+                messages: List[EmulatedMessage] = []
+                while (
+                    self._queue
+                    and self._queue[0][0] <= deliver_at
+                    and len(messages) < limit
+                ):
+                    messages.append(heapq.heappop(self._queue)[2])
+                return messages
+
+    def _prepare(
+        self, message: EmulatedMessage
+    ) -> Optional[Tuple[Callable[[Any], Any], str, Dict[str, str]]]:
+        """
+        Updates the state of the run for the message and returns the handler,
+        body and headers to deliver it with. Returns None if the message
+        shouldn't be delivered.
+        """
+        with self._lock:
+            handler = self._handlers.get(message.url)
+            workflow_run_id = _get_header(message.headers, WORKFLOW_ID_HEADER)
+            headers = _forwarded_headers(message.headers)
+            headers[WORKFLOW_MESSAGE_ID_HEADER] = message.message_id
+            if workflow_run_id:
+                headers[WORKFLOW_ID_HEADER] = workflow_run_id
+                headers[WORKFLOW_URL_HEADER] = (
+                    _get_header(message.headers, WORKFLOW_URL_HEADER) or message.url
+                )
+
+            if handler is None:
+                self.failed.append(message)
+                return None
+
+            # third party calls and callbacks are delivered as they are
+            if _get_header(message.headers, "Upstash-Callback") or _get_header(
+                message.headers, "Upstash-Workflow-CallType"
+            ) in ("fromCallback", "failureCall"):
+                if _get_header(message.headers, WORKFLOW_INIT_HEADER) != "true":
+                    return handler, message.body, headers
+
+            if workflow_run_id is None:
+                return handler, message.body, headers
+
+            run = self.runs.get(workflow_run_id)
+            if _get_header(message.headers, WORKFLOW_INIT_HEADER) == "true":
+                if run is None:
+                    run = EmulatedRun(workflow_run_id, message.url)
+                    self.runs[workflow_run_id] = run
+            if run is None or run.state != "RUN_STARTED":
+                return None
+
+            if message.position is None:
+                step = self._decode_step(message.body) if run.history else None
+                if (
+                    not message.waited
+                    and step
+                    and step.get("waitEventId")
+                    and step.get("stepId")
+                ):
+                    self._wait(run, message, step)
+                    return None
+
+                message.position = len(run.history)
+                run.history.append(
+                    {
+                        "messageId": message.message_id,
+                        "body": _encode(message.body),
+                        "callType": "step",
+                    }
+                )
+
+            run.deliveries += 1
+            return handler, json.dumps(run.history[: message.position + 1]), headers
+
+    def _deliver(self, message: EmulatedMessage) -> None:
+        prepared = self._prepare(message)
+        if prepared is None:
+            return
+        handler, body, headers = prepared
+
+        try:
+            response = handler(
+                _SyncRequest(
+                    body=body,
+                    headers=headers,
+                    method=message.method,
+                    url=message.url,
+                )
+            )
+        except Exception as error:
+            response = error
+        self._complete(message, response)
+
+    async def _adeliver(self, message: EmulatedMessage) -> None:
+        prepared = self._prepare(message)
+        if prepared is None:
+            return
+        handler, body, headers = prepared
+
+        try:
+            response = await handler(
+                _AsyncRequest(
+                    _body=body.encode(),
+                    headers=headers,
+                    method=message.method,
+                    url=message.url,
+                )
+            )
+        except Exception as error:
+            response = error
+        self._complete(message, response)
+
+    def _complete(self, message: EmulatedMessage, response: Any) -> None:
+        """
+        Retries the message if the handler failed, and sends the response of
+        third party calls back to the workflow.
+        """
+        if isinstance(response, Exception):
+            status, body, headers = 500, str(response), {}
+        else:
+            status = getattr(response, "status", getattr(response, "status_code", 200))
+            body = getattr(response, "body", "") or ""
+            if isinstance(body, bytes):
+                body = body.decode()
+            headers = dict(getattr(response, "headers", None) or {})
+
+        with self._lock:
+            callback_url = _get_header(message.headers, "Upstash-Callback")
+            if callback_url and _get_header(message.headers, WORKFLOW_INIT_HEADER) != (
+                "true"
+            ):
+                self.publish(
+                    callback_url,
+                    json.dumps(
+                        {
+                            "status": status,
+                            "header": {key: [value] for key, value in headers.items()},
+                            "body": _encode(body),
+                        }
+                    ),
+                    _strip_prefix(message.headers, "Upstash-Callback-"),
+                )
+                return
+
+            if 200 <= status < 300:
+                return
+
+            retries = int(
+                _get_header(message.headers, "Upstash-Retries") or DEFAULT_RETRIES
+            )
+            if message.attempt < retries:
+                message.attempt += 1
+                self._schedule(self.clock.now, message)
+                return
+
+            self.failed.append(message)
+            self._send_failure_callback(message, status, body, headers)
+
+    def _send_failure_callback(
+        self,
+        message: EmulatedMessage,
+        status: int,
+        body: str,
+        headers: Dict[str, str],
+    ) -> None:
+        failure_url = _get_header(message.headers, "Upstash-Failure-Callback")
+        workflow_run_id = _get_header(message.headers, WORKFLOW_ID_HEADER)
+        run = self.runs.get(workflow_run_id or "")
+        if not failure_url or run is None:
+            return
+
+        failure_headers = _strip_prefix(message.headers, "Upstash-Failure-Callback-")
+        failure_headers.setdefault(f"Upstash-Forward-{WORKFLOW_FAILURE_HEADER}", "true")
+        self.publish(
+            failure_url,
+            json.dumps(
+                {
+                    "status": status,
+                    "header": {key: [value] for key, value in headers.items()},
+                    "body": _encode(body),
+                    "url": run.url,
+                    "sourceBody": run.history[0]["body"] if run.history else "",
+                    "workflowRunId": run.workflow_run_id,
+                }
+            ),
+            failure_headers,
+        )
+        self._end_run(run, True)
+
+    def _decode_step(self, body: str) -> Optional[Dict[str, Any]]:
+        try:
+            step = json.loads(body)
+        except json.JSONDecodeError:
+            return None
+        return step if isinstance(step, dict) else None
+
+    def _wait(
+        self, run: EmulatedRun, message: EmulatedMessage, step: Dict[str, Any]
+    ) -> None:
+        deadline = self.clock.now + _parse_duration(step.get("waitTimeout") or "7d")
+        waiter = _Waiter(
+            message=message,
+            event_id=step["waitEventId"],
+            workflow_run_id=run.workflow_run_id,
+            deadline=deadline,
+            step=step,
+        )
+        message.waited = True
+        self._waiters.setdefault(waiter.event_id, []).append(waiter)
+        heapq.heappush(self._timeouts, (deadline, next(self._ids), waiter))
+
+    def _resume(self, waiter: _Waiter, out: Optional[str], timeout: bool) -> None:
+        """
+        Delivers the step of the waiter with the event data, or as timed out
+        """
+        waiter.message.body = json.dumps(
+            {**waiter.step, "out": out, "waitTimeout": timeout}
+        )
+        self._schedule(self.clock.now, waiter.message)
+
+    def _end_run(self, run: EmulatedRun, cancel: bool) -> None:
+        run.state = "RUN_CANCELED" if cancel else "RUN_SUCCESS"
+        for waiters in self._waiters.values():
+            waiters[:] = [
+                waiter
+                for waiter in waiters
+                if waiter.workflow_run_id != run.workflow_run_id
+            ]
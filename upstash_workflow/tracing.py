@@ -0,0 +1,374 @@
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
+from types import TracebackType
+from typing import (
+    Any,
+    ContextManager,
+    Dict,
+    List,
+    Mapping,
+    Optional,
+    Type,
+    Union,
+)
+from contextlib import nullcontext
+from upstash_workflow.error import WorkflowAbort, WorkflowError
+
+TRACEPARENT_HEADER = "traceparent"
+TRACESTATE_HEADER = "tracestate"
+
+AttributeValue = Union[str, int, float, bool]
+
+
+@dataclass(frozen=True)
+class SpanContext:
+    """
+    Identifies a span across processes, as in the W3C trace context.
+
+    :param trace_id: 32 hex digits
+    :param span_id: 16 hex digits
+    :param sampled: whether the trace is recorded
+    """
+
+    trace_id: str
+    span_id: str
+    sampled: bool = True
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+
+class Span:
+    """
+    Span which records nothing. Tracers return subclasses of this class.
+    """
+
+    context: Optional[SpanContext] = None
+
+    def set_attribute(self, key: str, value: AttributeValue) -> None:
+        return
+
+    def record_exception(self, error: BaseException) -> None:
+        return
+
+    def end(self) -> None:
+        return
+
+
+class Tracer:
+    """
+    Creates the spans of workflow invocations. Records nothing by default.
+
+    Subclasses should implement `start_span`. Spans are started with an
+    explicit parent: a span of the same invocation, or the context of the
+    invocation which published the step, read from the `traceparent` header.
+    Spans may be started from the threads running parallel steps.
+    """
+
+    def start_span(
+        self,
+        name: str,
+        parent: Union[Span, SpanContext, None] = None,
+        attributes: Optional[Mapping[str, AttributeValue]] = None,
+    ) -> Span:
+        """
+        Starts a span
+
+        :param name: name of the span, like `workflow.invocation`
+        :param parent: parent span or remote span context
+        :param attributes: attributes of the span
+        :return: started span
+        """
+        return _NOOP_SPAN
+
+
+_NOOP_SPAN = Span()
+
+
+@dataclass
+class SpanData:
+    """
+    Span recorded by `InMemoryTracer`. Times are from `time.time()`.
+    """
+
+    name: str
+    context: SpanContext
+    parent_span_id: Optional[str]
+    attributes: Dict[str, AttributeValue] = field(default_factory=dict)
+    start_time: float = 0
+    end_time: Optional[float] = None
+    error: Optional[str] = None
+
+
+class _InMemorySpan(Span):
+    def __init__(self, tracer: "InMemoryTracer", data: SpanData):
+        self._tracer = tracer
+        self.data = data
+        self.context = data.context
+
+    def set_attribute(self, key: str, value: AttributeValue) -> None:
+        self.data.attributes[key] = value
+
+    def record_exception(self, error: BaseException) -> None:
+        self.data.error = f"{type(error).__name__}: {error}"
+
+    def end(self) -> None:
+        if self.data.end_time is None:
+            self.data.end_time = time.time()
+            self._tracer._finish(self.data)
+
+
+class InMemoryTracer(Tracer):
+    """
+    Keeps the finished spans in memory. Useful in tests and when
+    OpenTelemetry is not installed.
+
+    :param max_spans: number of finished spans to keep. Older spans are dropped.
+    """
+
+    def __init__(self, max_spans: int = 10_000):
+        self.max_spans = max_spans
+        self._spans: List[SpanData] = []
+        self._lock = threading.Lock()
+
+    def start_span(
+        self,
+        name: str,
+        parent: Union[Span, SpanContext, None] = None,
+        attributes: Optional[Mapping[str, AttributeValue]] = None,
+    ) -> Span:
+        parent_context = parent.context if isinstance(parent, Span) else parent
+        span_context = SpanContext(
+            trace_id=(
+                parent_context.trace_id
+                if parent_context is not None
+                else os.urandom(16).hex()
+            ),
+            span_id=os.urandom(8).hex(),
+        )
+        return _InMemorySpan(
+            self,
+            SpanData(
+                name=name,
+                context=span_context,
+                parent_span_id=(
+                    parent_context.span_id if parent_context is not None else None
+                ),
+                attributes=dict(attributes or {}),
+                start_time=time.time(),
+            ),
+        )
+
+    @property
+    def spans(self) -> List[SpanData]:
+        """
+        Finished spans, in the order they ended
+        """
+        with self._lock:
+            return list(self._spans)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._spans.clear()
+
+    def _finish(self, data: SpanData) -> None:
+        with self._lock:
+            self._spans.append(data)
+            if len(self._spans) > self.max_spans:
+                del self._spans[: len(self._spans) - self.max_spans]
+
+
+@lru_cache(maxsize=None)
+def _get_opentelemetry() -> Any:
+    """
+    Returns the `opentelemetry.trace` module if it's installed, None otherwise.
+    """
+    try:
+        from opentelemetry import trace  # type: ignore[import-not-found]
+    except ImportError:
+        return None
+    return trace
+
+
+class _OpenTelemetrySpan(Span):
+    def __init__(self, span: Any):
+        self.span = span
+        span_context = span.get_span_context()
+        self.context = SpanContext(
+            trace_id=format(span_context.trace_id, "032x"),
+            span_id=format(span_context.span_id, "016x"),
+            sampled=bool(span_context.trace_flags & 1),
+        )
+
+    def set_attribute(self, key: str, value: AttributeValue) -> None:
+        self.span.set_attribute(key, value)
+
+    def record_exception(self, error: BaseException) -> None:
+        trace = _get_opentelemetry()
+        self.span.record_exception(error)
+        self.span.set_status(trace.Status(trace.StatusCode.ERROR, str(error)))
+
+    def end(self) -> None:
+        self.span.end()
+
+
+class OpenTelemetryTracer(Tracer):
+    """
+    Creates the spans with an OpenTelemetry tracer, so they are exported with
+    the tracer provider configured in the application. Requires
+    `opentelemetry-api`.
+
+    :param tracer: OpenTelemetry tracer. Uses the tracer of the global tracer
+        provider if not passed.
+    """
+
+    def __init__(self, tracer: Any = None):
+        trace = _get_opentelemetry()
+        if trace is None:
+            raise WorkflowError(
+                "opentelemetry-api is not installed. Install it or use InMemoryTracer."
+            )
+        self.tracer = tracer or trace.get_tracer("upstash_workflow")
+
+    def start_span(
+        self,
+        name: str,
+        parent: Union[Span, SpanContext, None] = None,
+        attributes: Optional[Mapping[str, AttributeValue]] = None,
+    ) -> Span:
+        trace = _get_opentelemetry()
+        if isinstance(parent, _OpenTelemetrySpan):
+            context = trace.set_span_in_context(parent.span)
+        else:
+            parent_context = parent.context if isinstance(parent, Span) else parent
+            context = (
+                None
+                if parent_context is None
+                else trace.set_span_in_context(
+                    trace.NonRecordingSpan(
+                        trace.SpanContext(
+                            trace_id=int(parent_context.trace_id, 16),
+                            span_id=int(parent_context.span_id, 16),
+                            is_remote=True,
+                            trace_flags=trace.TraceFlags(
+                                1 if parent_context.sampled else 0
+                            ),
+                        )
+                    )
+                )
+            )
+
+        return _OpenTelemetrySpan(
+            self.tracer.start_span(name, context=context, attributes=attributes)
+        )
+
+
+class _SpanScope:
+    def __init__(self, span: Span):
+        self.span = span
+
+    def __enter__(self) -> Span:
+        return self.span
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        # steps end invocations with WorkflowAbort, which is not a failure
+        if exc_value is not None and not isinstance(exc_value, WorkflowAbort):
+            self.span.record_exception(exc_value)
+        self.span.end()
+
+
+_NO_SPAN_SCOPE: ContextManager[Optional[Span]] = nullcontext(None)
+
+
+def _trace(
+    tracer: Optional[Tracer],
+    name: str,
+    parent: Union[Span, SpanContext, None] = None,
+    attributes: Optional[Mapping[str, AttributeValue]] = None,
+) -> ContextManager[Optional[Span]]:
+    """
+    Returns a context manager which starts a span and ends it on exit, recording
+    the exception if one is raised. Yields None without a tracer.
+
+    :param tracer: tracer of the workflow, None if tracing is disabled
+    :param name: name of the span
+    :param parent: parent span or remote span context
+    :param attributes: attributes of the span
+    :return: span scope
+    """
+    if tracer is None:
+        return _NO_SPAN_SCOPE
+    return _SpanScope(tracer.start_span(name, parent, attributes))
+
+
+def _extract_trace_context(
+    headers: Optional[Mapping[str, str]],
+) -> Optional[SpanContext]:
+    """
+    Reads the span context from the `traceparent` header.
+
+    :param headers: request headers
+    :return: span context, or None if the header is missing or invalid
+    """
+    if not headers:
+        return None
+    traceparent = headers.get(TRACEPARENT_HEADER) or headers.get("Traceparent")
+    if not traceparent:
+        return None
+
+    parts = traceparent.strip().split("-")
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    version, trace_id, span_id, flags = parts[:4]
+    try:
+        int(trace_id, 16)
+        int(span_id, 16)
+        sampled = bool(int(flags, 16) & 1)
+    except ValueError:
+        return None
+    if version == "ff" or trace_id == "0" * 32 or span_id == "0" * 16:
+        return None
+    return SpanContext(trace_id.lower(), span_id.lower(), sampled)
+
+
+def _strip_trace_context(headers: Dict[str, str]) -> Dict[str, str]:
+    """
+    Removes the trace context headers from the user headers, since the
+    trace context of the next invocation is set when publishing the step.
+
+    :param headers: user headers
+    :return: headers without `traceparent` and `tracestate`
+    """
+    return {
+        header: value
+        for header, value in headers.items()
+        if header.lower() not in (TRACEPARENT_HEADER, TRACESTATE_HEADER)
+    }
+
+
+def _inject_trace_context(headers: Dict[str, str], span: Optional[Span]) -> None:
+    """
+    Forwards the context of the span in the `traceparent` header of the message,
+    so the invocation receiving the message is linked to the span.
+
+    :param headers: headers of the QStash message
+    :param span: span publishing the message
+    """
+    if span is None or span.context is None:
+        return
+    traceparent = span.context.traceparent
+    headers[f"Upstash-Forward-{TRACEPARENT_HEADER}"] = traceparent
+    # third party call and invoke results come back with the callback
+    if "Upstash-Callback" in headers:
+        headers[f"Upstash-Callback-Forward-{TRACEPARENT_HEADER}"] = traceparent
+    if "Upstash-Failure-Callback" in headers:
+        headers[f"Upstash-Failure-Callback-Forward-{TRACEPARENT_HEADER}"] = traceparent
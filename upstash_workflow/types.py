@@ -5,12 +5,13 @@ from typing import (
     List,
     Literal,
     Optional,
+    Sequence,
     TypedDict,
     TypeVar,
     Union,
     Any,
 )
-from dataclasses import dataclass
+from dataclasses import dataclass, field, fields
 
 _FinishCondition = Literal[
     "success",
@@ -18,8 +19,11 @@ _FinishCondition = Literal[
     "fromCallback",
     "auth-fail",
     "failure-callback",
+    "workflow-already-ended",
 ]
 
+_ParallelCallState = Literal["first", "partial", "discard", "last"]
+
 TInitialPayload = TypeVar("TInitialPayload")
 TResponse = TypeVar("TResponse")
 
@@ -81,6 +85,73 @@ class Step(Generic[TResult, TBody]):
 DefaultStep = Step[Any, Any]
 
 
+_STEP_FIELD_NAMES = tuple(step_field.name for step_field in fields(Step))
+
+
+class _ReplayStep(Step[Any, Any]):
+    """
+    Step decoded from the step history. Steps in the history only carry the
+    fields below, which are kept in slots. Other fields read as None from the
+    defaults of `Step` and are only stored in a `__dict__` if they are set, so
+    replayed steps take less memory than `Step` instances while comparing
+    equal to them. Other fields can also be passed to the constructor, as
+    `dataclasses.replace` does.
+    """
+
+    __slots__ = (
+        "step_id",
+        "step_name",
+        "step_type",
+        "concurrent",
+        "out",
+        "target_step",
+        "wait_event_id",
+        "wait_timeout",
+    )
+
+    def __init__(
+        self,
+        step_id: int,
+        step_name: str,
+        step_type: StepType,
+        concurrent: int,
+        out: Any = None,
+        target_step: Optional[int] = None,
+        wait_event_id: Optional[str] = None,
+        wait_timeout: Optional[str] = None,
+        **other_fields: Any,
+    ):
+        self.step_id = step_id
+        self.step_name = step_name
+        self.step_type = step_type
+        self.concurrent = concurrent
+        self.out = out
+        self.target_step = target_step
+        self.wait_event_id = wait_event_id
+        self.wait_timeout = wait_timeout
+        for name, value in other_fields.items():
+            if name not in _STEP_FIELD_NAMES:
+                raise TypeError(f"_ReplayStep got an unexpected field '{name}'")
+            if value is not None:
+                setattr(self, name, value)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Step):
+            return NotImplemented
+        return all(
+            getattr(self, name) == getattr(other, name) for name in _STEP_FIELD_NAMES
+        )
+
+    def __repr__(self) -> str:
+        return repr(self.to_step())
+
+    def to_step(self) -> DefaultStep:
+        """
+        Returns the step as a `Step` instance with all of its fields
+        """
+        return Step(**{name: getattr(self, name) for name in _STEP_FIELD_NAMES})
+
+
 @dataclass
 class _ValidateRequestResponse:
     is_first_invocation: bool
@@ -90,7 +161,8 @@ class _ValidateRequestResponse:
 @dataclass
 class _ParseRequestResponse:
     raw_initial_payload: str
-    steps: List[DefaultStep]
+    steps: Sequence[DefaultStep]
+    workflow_run_ended: bool = False
 
 
 @dataclass
@@ -154,6 +226,20 @@ class NotifyResponse:
     error: str
 
 
+@dataclass
+class NotifyManyResult:
+    """
+    Result of a notification sent with `notify_many`. If sending the
+    notification fails, `error` is set and `responses` is empty.
+    """
+
+    index: int
+    event_id: str
+    workflow_run_id: Optional[str]
+    responses: List[NotifyResponse] = field(default_factory=list)
+    error: Optional[Exception] = None
+
+
 def create_workflow(
     route_function: Callable[..., None],
 ) -> InvokableWorkflow:
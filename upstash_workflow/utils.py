@@ -1,6 +1,7 @@
 import secrets
 import base64
 import logging
+from typing import Union
 
 NANOID_CHARS = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-_"
 NANOID_LENGTH = 21
@@ -12,6 +13,16 @@ def _nanoid() -> str:
     return "".join([secrets.choice(NANOID_CHARS) for _ in range(NANOID_LENGTH)])
 
 
+def _decode_text(value: Union[str, bytes]) -> str:
+    """
+    Decodes a request body kept as bytes to a string
+
+    :param value: request body
+    :return: request body as a string
+    """
+    return value if isinstance(value, str) else value.decode("utf-8")
+
+
 def _decode_base64(base64_str: str) -> str:
     try:
         decoded_bytes = base64.b64decode(base64_str)
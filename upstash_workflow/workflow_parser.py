@@ -1,7 +1,12 @@
+from __future__ import annotations
+import base64
 import json
+import re
+import sys
 from typing import (
     Optional,
     List,
+    Sequence,
     Tuple,
     Union,
     Callable,
@@ -10,33 +15,45 @@ from typing import (
     Literal,
     TypeVar,
     cast,
+    overload,
+    TYPE_CHECKING,
 )
-from upstash_workflow.utils import _nanoid, _decode_base64
+from upstash_workflow.utils import _nanoid, _decode_base64, _decode_text
+from upstash_workflow.codec import JSONCodec, _get_default_json_codec
+from upstash_workflow.store import StepOutputStore, _load_step_output
+from upstash_workflow.replay_cache import CachedStep, ReplayCache
+from upstash_workflow.compression import _decompress_step_output
 from upstash_workflow.constants import (
     WORKFLOW_PROTOCOL_VERSION,
     WORKFLOW_PROTOCOL_VERSION_HEADER,
     WORKFLOW_FAILURE_HEADER,
     WORKFLOW_ID_HEADER,
     NO_CONCURRENCY,
+    FUSED_STEPS_FIELD,
 )
 from qstash import QStash
+from qstash.errors import QStashError
 from upstash_workflow.error import WorkflowError
 from upstash_workflow.types import (
-    Step,
     DefaultStep,
+    _ReplayStep,
     _ValidateRequestResponse,
     _ParseRequestResponse,
 )
 from upstash_workflow.workflow_types import _SyncRequest, _AsyncRequest
-from upstash_workflow import WorkflowContext
 from upstash_workflow.workflow_requests import _recreate_user_headers
-from upstash_workflow.serve.authorization import _DisabledWorkflowContext
 
+if TYPE_CHECKING:
+    from upstash_workflow import WorkflowContext
 
-def _get_payload(request: _SyncRequest) -> Optional[str]:
+
+def _get_payload(request: _SyncRequest) -> Optional[Union[str, bytes]]:
     """
     Gets the request body. If that fails, returns None
 
+    Bodies received as bytes are not decoded, since the JSON codec parses bytes
+    directly.
+
     :param request: request received in the workflow api
     :return: request body
     """
@@ -46,71 +63,405 @@ def _get_payload(request: _SyncRequest) -> Optional[str]:
         return None
 
 
-def _parse_payload(raw_payload: str) -> Tuple[str, List[DefaultStep]]:
+def _read_step_fields(
+    step: Dict[str, Any],
+    step_output_store: Optional[StepOutputStore],
+    workflow_run_id: Optional[str],
+) -> CachedStep:
+    """
+    Reads a step in Upstash Workflow Step format, resolving the output from the
+    step output store and decompressing it. The output is left serialized.
+
+    :param step: decoded step body
+    :param step_output_store: store to read offloaded step outputs from
+    :param workflow_run_id: id of the workflow run of the request
+    :return: step with its serialized output
+    """
+    out = step["out"]
+    if isinstance(out, str):
+        out = _decompress_step_output(
+            _load_step_output(step_output_store, out, workflow_run_id)
+        )
+
+    return CachedStep(
+        step_id=step["stepId"],
+        step_name=step["stepName"],
+        step_type=step["stepType"],
+        concurrent=step["concurrent"],
+        out=out,
+        target_step=step.get("targetStep"),
+        wait_event_id=step.get("waitEventId"),
+        wait_timeout=step.get("waitTimeout"),
+    )
+
+
+def _decode_step_output(step: CachedStep, json_codec: JSONCodec) -> DefaultStep:
+    """
+    Creates a step from a step read from the step history, decoding its output.
+
+    :param step: step with its serialized output
+    :param json_codec: codec to decode the step output with
+    :return: step
+    """
+    out = step.out
+    try:
+        out = json_codec.loads(out)
+    except json.JSONDecodeError:
+        pass
+
+    if step.wait_event_id:
+        out = {
+            "event_data": _decode_base64(out) if out else None,
+            "timeout": step.wait_timeout or False,
+        }
+
+    return _ReplayStep(
+        step_id=step.step_id,
+        step_name=step.step_name,
+        step_type=step.step_type,
+        out=out,
+        concurrent=step.concurrent,
+        target_step=step.target_step,
+        wait_event_id=step.wait_event_id,
+        wait_timeout=step.wait_timeout,
+    )
+
+
+def _read_steps(
+    raw_step: Dict[str, Any],
+    json_codec: JSONCodec,
+    step_output_store: Optional[StepOutputStore],
+    workflow_run_id: Optional[str],
+) -> List[CachedStep]:
+    """
+    Reads a message received from QStash. The body of the message is a base64
+    encoded JSON object in Upstash Workflow Step format.
+
+    When steps are fused, the message also carries the steps executed before it
+    in the same invocation under the `fusedSteps` field. These are returned
+    before the step of the message itself.
+
+    :param raw_step: item of the request body with messageId, body and callType fields
+    :param json_codec: codec to decode the message with
+    :param step_output_store: store to read offloaded step outputs from
+    :param workflow_run_id: id of the workflow run of the request
+    :return: steps with their serialized outputs
+    """
+    # parsed from the decoded bytes without decoding them to a string first
+    step = json_codec.loads(base64.b64decode(raw_step["body"]))
+    fused_steps = step.pop(FUSED_STEPS_FIELD, None) or []
+    return [
+        _read_step_fields(fused_step, step_output_store, workflow_run_id)
+        for fused_step in fused_steps
+    ] + [_read_step_fields(step, step_output_store, workflow_run_id)]
+
+
+_DECODED_MESSAGE: Dict[str, Any] = {}
+
+
+class _LazySteps(Sequence[DefaultStep]):
+    """
+    Steps of a workflow run, decoded on demand.
+
+    Only the outer JSON list of the request body is parsed up front. Messages are
+    decoded in order when a step in them is accessed for the first time and cached
+    afterwards. Since the route function replays the steps one at a time, steps
+    which are never reached in an invocation are never decoded.
+
+    A message may contain more than one step when steps are fused, so the length
+    is only known once all messages are decoded.
+
+    Decoded messages are dropped from the encoded steps, so their bodies can be
+    freed while the rest of the history is replayed. Steps are created as
+    `_ReplayStep` instances, which keep only the fields found in the history.
+
+    With a replay cache, the steps of a message are taken from the cache if they
+    were read in an earlier request of the workflow run, and only their outputs
+    are decoded. `cache_hits` and
+    `cache_misses` count the lookups.
+    """
+
+    def __init__(
+        self,
+        initial_step: DefaultStep,
+        encoded_steps: List[Dict[str, Any]],
+        json_codec: JSONCodec,
+        step_output_store: Optional[StepOutputStore] = None,
+        workflow_run_id: Optional[str] = None,
+        replay_cache: Optional[ReplayCache] = None,
+    ):
+        self._encoded_steps = encoded_steps
+        self._json_codec = json_codec
+        self._step_output_store = step_output_store
+        self._workflow_run_id = workflow_run_id
+        self._replay_cache = replay_cache if workflow_run_id else None
+        self._decoded_count = 0
+        self._steps: List[DefaultStep] = [initial_step]
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def _decode(self, raw_step: Dict[str, Any]) -> List[DefaultStep]:
+        """
+        Decodes the steps of a message. With a replay cache, the steps are read
+        from the cache and only their outputs are decoded.
+
+        :param raw_step: item of the request body with messageId, body and callType fields
+        :return: decoded steps
+        """
+        if self._replay_cache is None or not raw_step.get("messageId"):
+            steps = _read_steps(
+                raw_step,
+                self._json_codec,
+                self._step_output_store,
+                self._workflow_run_id,
+            )
+        else:
+            key = self._replay_cache.key(
+                cast(str, self._workflow_run_id),
+                raw_step["messageId"],
+                raw_step["body"],
+            )
+            cached_steps = self._replay_cache.get(key)
+            if cached_steps is not None:
+                self.cache_hits += 1
+                steps = cached_steps
+            else:
+                self.cache_misses += 1
+                steps = _read_steps(
+                    raw_step,
+                    self._json_codec,
+                    self._step_output_store,
+                    self._workflow_run_id,
+                )
+                self._replay_cache.put(key, steps, len(raw_step["body"]))
+
+        return [_decode_step_output(step, self._json_codec) for step in steps]
+
+    def _decode_until(self, index: int) -> bool:
+        """
+        Decodes messages until the step at the index is available.
+
+        :param index: non-negative index of the step
+        :return: whether the step exists
+        """
+        while len(self._steps) <= index and self._decoded_count < len(
+            self._encoded_steps
+        ):
+            raw_step = self._encoded_steps[self._decoded_count]
+            # the base64 body of a decoded message is not needed anymore
+            self._encoded_steps[self._decoded_count] = _DECODED_MESSAGE
+            self._steps.extend(self._decode(raw_step))
+            self._decoded_count += 1
+        return index < len(self._steps)
+
+    def __len__(self) -> int:
+        self._decode_until(sys.maxsize)
+        return len(self._steps)
+
+    @overload
+    def __getitem__(self, index: int) -> DefaultStep: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> List[DefaultStep]: ...
+
+    def __getitem__(
+        self, index: Union[int, slice]
+    ) -> Union[DefaultStep, List[DefaultStep]]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(len(self))[index]]
+
+        if index < 0:
+            index += len(self)
+        if index < 0 or not self._decode_until(index):
+            raise IndexError("step index out of range")
+        return self._steps[index]
+
+
+def _parse_raw_steps(
+    raw_steps: List[Dict[str, Any]],
+    json_codec: JSONCodec,
+    step_output_store: Optional[StepOutputStore] = None,
+    workflow_run_id: Optional[str] = None,
+    replay_cache: Optional[ReplayCache] = None,
+) -> Tuple[str, Sequence[DefaultStep]]:
+    """
+    Creates the initial payload and the steps from the decoded request body or
+    the step history fetched from QStash.
+
+    :param raw_steps: list of objects with messageId, body and callType fields
+    :param json_codec: codec to decode the steps with
+    :param step_output_store: store to read offloaded step outputs from
+    :param workflow_run_id: id of the workflow run, used in the replay cache keys
+    :param replay_cache: cache of steps decoded in earlier requests
+    :return: initial payload and sequence of steps
+    """
+    encoded_initial_payload, *encoded_steps = raw_steps
+
+    raw_initial_payload = _decode_base64(encoded_initial_payload["body"])
+
+    initial_step: DefaultStep = _ReplayStep(
+        step_id=0,
+        step_name="init",
+        step_type="Initial",
+        out=raw_initial_payload,
+        concurrent=NO_CONCURRENCY,
+    )
+
+    steps_to_decode = [step for step in encoded_steps if step["callType"] == "step"]
+
+    return raw_initial_payload, _LazySteps(
+        initial_step,
+        steps_to_decode,
+        json_codec,
+        step_output_store,
+        workflow_run_id,
+        replay_cache,
+    )
+
+
+def _parse_payload(
+    raw_payload: Union[str, bytes],
+    json_codec: Optional[JSONCodec] = None,
+    step_output_store: Optional[StepOutputStore] = None,
+    workflow_run_id: Optional[str] = None,
+    replay_cache: Optional[ReplayCache] = None,
+) -> Tuple[str, Sequence[DefaultStep]]:
     """
     Parses a request coming from QStash. First parses the string as JSON, which will result
     in a list of objects with messageId & body fields. Body will be base64 encoded.
 
     Body of the first item will be the body of the first request received in the workflow API.
-    Rest are steps in Upstash Workflow Step format.
+    Rest are steps in Upstash Workflow Step format. These are decoded lazily, when the
+    executor reaches them.
 
     When returning steps, we add the initial payload as initial step. This is to make it simpler
     in the rest of the code.
 
-    :param raw_payload: body of the request as a string as explained above
-    :return: initial payload and list of steps
+    :param raw_payload: body of the request as explained above, as a string or bytes
+    :param json_codec: codec to decode the payload with
+    :param step_output_store: store to read offloaded step outputs from
+    :param workflow_run_id: id of the workflow run, used in the replay cache keys
+    :param replay_cache: cache of steps decoded in earlier requests
+    :return: initial payload and sequence of steps
     """
-    raw_steps = [step for step in json.loads(raw_payload)]
+    json_codec = json_codec or _get_default_json_codec()
+    return _parse_raw_steps(
+        json_codec.loads(raw_payload),
+        json_codec,
+        step_output_store,
+        workflow_run_id,
+        replay_cache,
+    )
 
-    encoded_initial_payload, *encoded_steps = raw_steps
 
-    raw_initial_payload = _decode_base64(encoded_initial_payload["body"])
+def _decode_request_payload(
+    request_payload: Optional[Union[str, bytes]], json_codec: JSONCodec
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    Decodes the body of a request which is not the first invocation.
 
-    initial_step = {
-        "stepId": 0,
-        "stepName": "init",
-        "stepType": "Initial",
-        "out": raw_initial_payload,
-        "concurrent": NO_CONCURRENCY,
-    }
+    QStash omits the body when the step history is too large and may cut it
+    short, since the `LazyFetch` feature is enabled. In both cases the steps
+    should be fetched from QStash.
 
-    steps_to_decode = [step for step in encoded_steps if step["callType"] == "step"]
+    :param request_payload: body of the request
+    :param json_codec: codec to decode the body with
+    :return: decoded body, or None if the steps should be fetched
+    """
+    if not request_payload:
+        return None
 
-    other_steps = []
-    for raw_step in steps_to_decode:
-        step = json.loads(_decode_base64(raw_step["body"]))
-
-        try:
-            step["out"] = json.loads(step["out"])
-        except json.JSONDecodeError:
-            pass
-
-        if step.get("waitEventId", None):
-            new_out = {
-                "event_data": _decode_base64(step["out"]) if step["out"] else None,
-                "timeout": step.get("waitTimeout") or False,
-            }
-            step["out"] = new_out
-
-        other_steps.append(step)
-
-    all_steps = [initial_step] + other_steps
-
-    parsed_steps: List[DefaultStep] = []
-    for step in all_steps:
-        parsed_steps.append(
-            Step(
-                step_id=step["stepId"],
-                step_name=step["stepName"],
-                step_type=step["stepType"],
-                out=step["out"],
-                concurrent=step["concurrent"],
-                wait_event_id=step.get("waitEventId"),
-                wait_timeout=step.get("waitTimeout"),
-            )
+    try:
+        return cast(List[Dict[str, Any]], json_codec.loads(request_payload))
+    except json.JSONDecodeError:
+        return None
+
+
+def _filter_fetched_steps(
+    raw_steps: List[Dict[str, Any]], workflow_run_id: str, message_id: Optional[str]
+) -> List[Dict[str, Any]]:
+    """
+    Drops the steps fetched from QStash which come after the message delivered
+    in the current request. Steps of later messages may already be in the
+    history if the request is retried.
+
+    Raises `WorkflowError` if the message is not in the history, so that the
+    request fails and QStash delivers the message again.
+
+    :param raw_steps: steps fetched from QStash
+    :param workflow_run_id: id of the workflow run
+    :param message_id: id of the message delivered in the request
+    :return: steps up to and including the message
+    """
+    if not message_id:
+        return raw_steps
+
+    for index, raw_step in enumerate(raw_steps):
+        if raw_step.get("messageId") == message_id:
+            return raw_steps[: index + 1]
+    raise WorkflowError(
+        f"Message '{message_id}' is not in the step history fetched from QStash"
+        f" for workflow run '{workflow_run_id}'."
+    )
+
+
+_STATUS_PATTERN = re.compile(r"Request failed with status: (\d{3})\b")
+
+
+def _get_error_status(error: QStashError) -> Optional[int]:
+    """
+    Returns the HTTP status of the response which caused the error.
+
+    qstash-py raises `QStashError` for unsuccessful responses without keeping
+    the response, and only reports the status in the message of the error.
+
+    :param error: error raised by the QStash client
+    :return: status, or None if the error is not caused by a response
+    """
+    match = _STATUS_PATTERN.match(str(error))
+    return int(match.group(1)) if match else None
+
+
+def _is_not_found_error(error: QStashError) -> bool:
+    """
+    Returns whether the error is caused by a response with 404 status
+    """
+    return _get_error_status(error) == 404
+
+
+def _get_steps(
+    qstash_client: QStash,
+    workflow_run_id: str,
+    message_id: Optional[str],
+    json_codec: JSONCodec,
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    Fetches the step history of the workflow run from QStash.
+
+    The request is sent with the connection pool of the QStash client. Only the
+    outer list of the response is decoded here, steps are decoded lazily like
+    the steps in the request body.
+
+    :param qstash_client: QStash client
+    :param workflow_run_id: id of the workflow run
+    :param message_id: id of the message delivered in the request
+    :param json_codec: codec to decode the response with
+    :return: steps, or None if the workflow run has already ended
+    """
+    try:
+        raw_payload = qstash_client.http.request(
+            path=f"/v2/workflows/runs/{workflow_run_id}",
+            method="GET",
+            parse_response=False,
         )
+    except QStashError as error:
+        if _is_not_found_error(error):
+            return None
+        raise
 
-    return raw_initial_payload, parsed_steps
+    return _filter_fetched_steps(
+        json_codec.loads(raw_payload), workflow_run_id, message_id
+    )
 
 
 def _validate_request(
@@ -161,27 +512,55 @@ def _validate_request(
 
 
 def _parse_request(
-    request_payload: Optional[str], is_first_invocation: bool
+    request_payload: Optional[Union[str, bytes]],
+    is_first_invocation: bool,
+    json_codec: Optional[JSONCodec] = None,
+    step_output_store: Optional[StepOutputStore] = None,
+    workflow_run_id: Optional[str] = None,
+    message_id: Optional[str] = None,
+    qstash_client: Optional[QStash] = None,
+    replay_cache: Optional[ReplayCache] = None,
 ) -> _ParseRequestResponse:
     """
     Checks request headers and body
     - Reads the request body as raw text
     - Returns the steps. If it's the first invocation, steps are empty.
-      Otherwise, steps are generated from the request body.
+      Otherwise, steps are generated from the request body. If the body is
+      empty or cut short, steps are fetched from QStash.
 
     :param request: Request received
+    :param json_codec: codec to decode the request body with
+    :param step_output_store: store to read offloaded step outputs from
+    :param workflow_run_id: id of the workflow run, used to fetch the steps
+    :param message_id: id of the message delivered in the request
+    :param qstash_client: QStash client to fetch the steps with
+    :param replay_cache: cache of steps decoded in earlier requests
     :return: raw initial payload and the steps
     """
     if is_first_invocation:
         return _ParseRequestResponse(
-            raw_initial_payload=(request_payload or ""),
+            raw_initial_payload=_decode_text(request_payload or ""),
             steps=[],
         )
     else:
-        if not request_payload:
-            raise WorkflowError("Only first call can have an empty body")
+        json_codec = json_codec or _get_default_json_codec()
+        raw_steps = _decode_request_payload(request_payload, json_codec)
 
-        raw_initial_payload, steps = _parse_payload(request_payload)
+        if raw_steps is None:
+            if qstash_client is None or not workflow_run_id:
+                raise WorkflowError("Only first call can have an empty body")
+
+            raw_steps = _get_steps(
+                qstash_client, workflow_run_id, message_id, json_codec
+            )
+            if raw_steps is None:
+                return _ParseRequestResponse(
+                    raw_initial_payload="", steps=[], workflow_run_ended=True
+                )
+
+        raw_initial_payload, steps = _parse_raw_steps(
+            raw_steps, json_codec, step_output_store, workflow_run_id, replay_cache
+        )
 
         return _ParseRequestResponse(
             raw_initial_payload=raw_initial_payload, steps=steps
@@ -194,7 +573,7 @@ TRequest = TypeVar("TRequest", bound=_SyncRequest)
 
 def _handle_failure(
     request: TRequest,
-    request_payload: str,
+    request_payload: Union[str, bytes],
     qstash_client: QStash,
     initial_payload_parser: Callable[[str], Any],
     route_function: Callable[[WorkflowContext[TInitialPayload]], None],
@@ -203,6 +582,8 @@ def _handle_failure(
     ],
     env: Dict[str, Any],
     retries: int,
+    json_codec: Optional[JSONCodec] = None,
+    step_output_store: Optional[StepOutputStore] = None,
 ) -> Literal["not-failure-callback", "is-failure-callback"]:
     if request.headers and request.headers.get(WORKFLOW_FAILURE_HEADER) != "true":
         return "not-failure-callback"
@@ -214,8 +595,13 @@ def _handle_failure(
             "Either provide a failure_url or a failure_function."
         )
 
+    # imported here since the async stack uses the other helpers of this module
+    from upstash_workflow.context.context import WorkflowContext
+    from upstash_workflow.serve.authorization import _DisabledWorkflowContext
+
+    json_codec = json_codec or _get_default_json_codec()
     try:
-        payload = json.loads(request_payload)
+        payload = json_codec.loads(request_payload)
         status = payload["status"]
         header = payload["header"]
         body = payload["body"]
@@ -224,7 +610,7 @@ def _handle_failure(
         workflow_run_id = payload["workflowRunId"]
 
         decoded_body = _decode_base64(body) if body else "{}"
-        error_payload = json.loads(decoded_body)
+        error_payload = json_codec.loads(decoded_body)
 
         # Create context
         workflow_context = WorkflowContext(
@@ -239,22 +625,27 @@ def _handle_failure(
             failure_url=url,
             env=env,
             retries=retries,
+            json_codec=json_codec,
         )
 
         # Attempt running route_function until the first step
         auth_check = _DisabledWorkflowContext[Any].try_authentication(
-            route_function, cast(WorkflowContext[TInitialPayload], workflow_context)
+            route_function, cast("WorkflowContext[TInitialPayload]", workflow_context)
         )
 
         if auth_check == "run-ended":
             raise WorkflowError("Not authorized to run the failure function.")
 
         failure_function(
-            cast(WorkflowContext[TInitialPayload], workflow_context),
+            cast("WorkflowContext[TInitialPayload]", workflow_context),
             status,
             error_payload.get("message"),
             header,
         )
+
+        # the run failed, so its step outputs are not read anymore
+        if step_output_store is not None:
+            step_output_store.delete(workflow_run_id)
     except Exception as error:
         raise error
 
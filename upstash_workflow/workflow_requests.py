@@ -2,18 +2,23 @@ from __future__ import annotations
 import json
 import base64
 import logging
+from functools import lru_cache
 from typing import (
     TYPE_CHECKING,
     Callable,
     Literal,
     Optional,
+    Tuple,
     Union,
     cast,
     TypeVar,
     Dict,
 )
 from qstash import QStash, Receiver
+from upstash_workflow.codec import JSONCodec, _get_default_json_codec
+from upstash_workflow.delete_queue import DeleteQueue, _delete_workflow_run
 from upstash_workflow.error import WorkflowError, WorkflowAbort
+from upstash_workflow.tracing import _trace, _inject_trace_context
 from upstash_workflow.constants import (
     WORKFLOW_INIT_HEADER,
     WORKFLOW_ID_HEADER,
@@ -28,6 +33,7 @@ from upstash_workflow.constants import (
 )
 from upstash_workflow.types import StepTypes, DefaultStep, _HeadersResponse
 from upstash_workflow.workflow_types import _SyncRequest
+from upstash_workflow.utils import _decode_text
 
 if TYPE_CHECKING:
     from upstash_workflow import WorkflowContext
@@ -41,21 +47,27 @@ def _trigger_first_invocation(
     workflow_context: WorkflowContext[TInitialPayload],
     retries: int,
 ) -> None:
-    headers = _get_headers(
-        "true",
-        workflow_context.workflow_run_id,
-        workflow_context.url,
-        workflow_context.headers,
-        None,
-        retries,
-    ).headers
-
-    workflow_context.qstash_client.message.publish_json(
-        url=workflow_context.url,
-        body=workflow_context.request_payload,
-        headers=headers,
+    headers = (
+        _get_headers_template(
+            workflow_context.url, workflow_context.headers, retries, None
+        )
+        .get_headers("true", workflow_context.workflow_run_id)
+        .headers
     )
 
+    with _trace(
+        workflow_context.tracer,
+        "qstash.publish",
+        workflow_context.span,
+        {"messaging.destination.name": workflow_context.url},
+    ) as span:
+        _inject_trace_context(headers, span)
+        workflow_context.qstash_client.message.publish_json(
+            url=workflow_context.url,
+            body=workflow_context.request_payload,
+            headers=headers,
+        )
+
 
 def _trigger_route_function(
     on_step: Callable[[], None], on_cleanup: Callable[[], None]
@@ -75,11 +87,20 @@ def _trigger_route_function(
 def _trigger_workflow_delete(
     workflow_context: WorkflowContext[TInitialPayload],
     cancel: Optional[bool] = False,
+    delete_queue: Optional[DeleteQueue] = None,
 ) -> None:
-    workflow_context.qstash_client.http.request(
-        path=f"/v2/workflows/runs/{workflow_context.workflow_run_id}?cancel={str(cancel).lower()}",
-        method="DELETE",
-        parse_response=False,
+    if delete_queue is not None:
+        delete_queue.enqueue(
+            workflow_context.qstash_client,
+            workflow_context.workflow_run_id,
+            bool(cancel),
+        )
+        return
+
+    _delete_workflow_run(
+        workflow_context.qstash_client,
+        workflow_context.workflow_run_id,
+        bool(cancel),
     )
 
 
@@ -116,11 +137,12 @@ def _recreate_user_headers(headers: Dict[str, str]) -> Dict[str, str]:
 
 def _handle_third_party_call_result(
     request: _SyncRequest,
-    request_payload: str,
+    request_payload: Union[str, bytes],
     client: QStash,
     workflow_url: str,
     workflow_failure_url: Optional[str],
     retries: int,
+    json_codec: Optional[JSONCodec] = None,
 ) -> Literal["call-will-retry", "is-call-return", "continue-workflow"]:
     """
     Check if the request is from a third party call result. If so,
@@ -142,8 +164,10 @@ def _handle_third_party_call_result(
     :param client: QStash client
     :param workflow_url: Workflow URL
     :param retries: Number of retries
+    :param json_codec: codec to decode the call result and encode the result step with
     :return: "call-will-retry", "is-call-return" or "continue-workflow"
     """
+    json_codec = json_codec or _get_default_json_codec()
     try:
         if request.headers and request.headers.get("Upstash-Workflow-Callback"):
             if request_payload:
@@ -151,7 +175,7 @@ def _handle_third_party_call_result(
             else:
                 raise NotImplementedError
 
-            callback_message = json.loads(callback_payload)
+            callback_message = json_codec.loads(callback_payload)
 
             if (
                 not (200 <= callback_message["status"] < 300)
@@ -207,15 +231,13 @@ def _handle_third_party_call_result(
             content_type = cast(str, content_type)
 
             user_headers = _recreate_user_headers(headers)
-            request_headers = _get_headers(
-                "false",
-                workflow_run_id,
-                workflow_url,
-                user_headers,
-                None,
-                retries,
-                workflow_failure_url=workflow_failure_url,
-            ).headers
+            request_headers = (
+                _get_headers_template(
+                    workflow_url, user_headers, retries, workflow_failure_url
+                )
+                .get_headers("false", workflow_run_id)
+                .headers
+            )
 
             if step_type == "Invoke":
                 # Invoke results: extract body and derive status flags
@@ -232,7 +254,7 @@ def _handle_third_party_call_result(
                     "stepId": int(step_id_str),
                     "stepName": step_name,
                     "stepType": step_type,
-                    "out": json.dumps(invoke_response),
+                    "out": json_codec.dumps(invoke_response),
                     "concurrent": int(concurrent_str),
                 }
             else:
@@ -245,7 +267,7 @@ def _handle_third_party_call_result(
                     "stepId": int(step_id_str),
                     "stepName": step_name,
                     "stepType": step_type,
-                    "out": json.dumps(call_response),
+                    "out": json_codec.dumps(call_response),
                     "concurrent": int(concurrent_str),
                 }
 
@@ -460,8 +482,141 @@ def _get_headers(
     return _HeadersResponse(headers=base_headers)
 
 
+# never appears in a url or a header value
+_WORKFLOW_RUN_ID_PLACEHOLDER = "\x00workflow-run-id\x00"
+
+
+@lru_cache(maxsize=128)
+def _get_base_headers(
+    workflow_url: str,
+    retries: Optional[int],
+    workflow_failure_url: Optional[str],
+) -> Tuple[Dict[str, str], Tuple[str, ...]]:
+    """
+    Builds the headers of the steps which only depend on the options of the
+    workflow. These are the same for every request of every run, so they are
+    cached. User headers change between requests, since QStash sends a new
+    signature and message id with each of them, so they are not part of the key.
+
+    :param workflow_url: url of the workflow endpoint
+    :param retries: retries of the workflow requests
+    :param workflow_failure_url: url to call if the workflow fails
+    :return: headers without user headers and the headers holding the run id
+    """
+    headers = _get_headers(
+        "false",
+        _WORKFLOW_RUN_ID_PLACEHOLDER,
+        workflow_url,
+        None,
+        None,
+        retries,
+        workflow_failure_url=workflow_failure_url,
+    ).headers
+    run_id_headers = tuple(
+        header
+        for header, value in headers.items()
+        if value == _WORKFLOW_RUN_ID_PLACEHOLDER
+    )
+    return headers, run_id_headers
+
+
+class _HeadersTemplate:
+    """
+    Headers of the steps of a workflow request, for the workflow url, user
+    headers, retries and failure url.
+
+    Most headers are the same for every step of every run with the same
+    options. The template takes them from `_get_base_headers` and only adds
+    the run id, the init header and the forwarded user headers for each step.
+    Third party call and invoke steps have headers depending on the step, so
+    they are built with `_get_headers`.
+    """
+
+    def __init__(
+        self,
+        workflow_url: str,
+        user_headers: Optional[Dict[str, str]],
+        retries: Optional[int],
+        workflow_failure_url: Optional[str],
+    ):
+        self.workflow_url = workflow_url
+        self.user_headers = user_headers
+        self.retries = retries
+        self.workflow_failure_url = workflow_failure_url
+
+        self._headers, self._run_id_headers = _get_base_headers(
+            workflow_url, retries, workflow_failure_url
+        )
+
+    def get_headers(
+        self,
+        init_header_value: Literal["true", "false"],
+        workflow_run_id: str,
+        step: Optional[DefaultStep] = None,
+        call_retries: Optional[int] = None,
+        call_timeout: Optional[Union[int, str]] = None,
+        invoke_retries: Optional[int] = None,
+    ) -> _HeadersResponse:
+        """
+        Gets headers for calling QStash. Returns the same headers as
+        `_get_headers` with the options of the template.
+
+        :param init_header_value: Whether the invocation should create a new workflow
+        :param workflow_run_id: id of the workflow
+        :param step: step to get headers for
+        :param call_retries: retries of the third party call
+        :param call_timeout: timeout of the third party call
+        :param invoke_retries: retries for invoke steps
+        :return: headers to submit
+        """
+        if call_timeout or (step and (step.call_url or step.invoke_url)):
+            return _get_headers(
+                init_header_value,
+                workflow_run_id,
+                self.workflow_url,
+                self.user_headers,
+                step,
+                self.retries,
+                call_retries,
+                call_timeout,
+                self.workflow_failure_url,
+                invoke_retries,
+            )
+
+        headers = self._headers.copy()
+        headers[WORKFLOW_INIT_HEADER] = init_header_value
+        for header in self._run_id_headers:
+            headers[header] = workflow_run_id
+        if self.user_headers:
+            for header, value in self.user_headers.items():
+                if value is not None:
+                    headers[f"Upstash-Forward-{header}"] = value
+                    headers[f"Upstash-Failure-Callback-Forward-{header}"] = value
+        return _HeadersResponse(headers=headers)
+
+
+def _get_headers_template(
+    workflow_url: str,
+    user_headers: Optional[Dict[str, str]],
+    retries: Optional[int],
+    workflow_failure_url: Optional[str],
+) -> _HeadersTemplate:
+    """
+    Returns the headers template for the options. Headers which don't depend
+    on the user headers are cached, so templates of requests with the same
+    options share them.
+
+    :param workflow_url: url of the workflow endpoint
+    :param user_headers: headers to forward to the workflow endpoint
+    :param retries: retries of the workflow requests
+    :param workflow_failure_url: url to call if the workflow fails
+    :return: headers template
+    """
+    return _HeadersTemplate(workflow_url, user_headers, retries, workflow_failure_url)
+
+
 def _verify_request(
-    body: str, signature: Union[str, None], verifier: Optional[Receiver]
+    body: Union[str, bytes], signature: Union[str, None], verifier: Optional[Receiver]
 ) -> None:
     if not verifier:
         return
@@ -470,8 +625,9 @@ def _verify_request(
         if not signature:
             raise Exception("`Upstash-Signature` header is not passed.")
         try:
+            # the receiver hashes the body as a string
             verifier.verify(
-                body=body,
+                body=_decode_text(body),
                 signature=signature,
             )
         except Exception:
@@ -1,6 +1,6 @@
 from dataclasses import dataclass, field
-from typing import Any, Dict, Optional
-import json
+from typing import Any, Dict, Optional, Union
+from upstash_workflow.codec import JSONCodec, _get_default_json_codec
 
 
 @dataclass
@@ -10,16 +10,50 @@ class _Response:
     headers: Optional[Dict[str, str]] = None
 
     def __init__(
-        self, body: Any, status: int = 200, headers: Optional[Dict[str, str]] = None
+        self,
+        body: Any,
+        status: int = 200,
+        headers: Optional[Dict[str, str]] = None,
+        json_codec: Optional[JSONCodec] = None,
     ):
-        self.body = json.dumps(body) if not isinstance(body, str) else body
+        """
+        :param body: response body. Values other than strings are encoded as JSON.
+        :param status: status code
+        :param headers: response headers
+        :param json_codec: codec encoding the body. Uses the default codec if
+            not provided.
+        """
+        self.body = (
+            body
+            if isinstance(body, str)
+            else (json_codec or _get_default_json_codec()).dumps(body)
+        )
         self.status = status
         self.headers = headers or {"Content-Type": "application/json"}
 
 
+class _Headers(Dict[str, str]):
+    """
+    Request headers with case insensitive lookups. Names are kept in lower case,
+    as they are received in ASGI.
+    """
+
+    def __getitem__(self, key: str) -> str:
+        return super().__getitem__(key.lower())
+
+    def __setitem__(self, key: str, value: str) -> None:
+        super().__setitem__(key.lower(), value)
+
+    def __contains__(self, key: object) -> bool:
+        return super().__contains__(key.lower() if isinstance(key, str) else key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return super().get(key.lower(), default)
+
+
 @dataclass
 class _SyncRequest:
-    body: str = ""
+    body: Union[str, bytes] = ""
     headers: Optional[Dict[str, str]] = field(default_factory=dict)
     query: Optional[Dict[str, str]] = field(default_factory=dict)
     method: str = "GET"